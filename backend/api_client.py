@@ -8,6 +8,7 @@ import requests
 from typing import Dict, List, Optional
 from backend.config import settings
 from backend.models import CharacterSettings, RoleSetting, Message
+from backend.rate_limiter import get_rate_limiter, PRIORITY_FREE
 
 
 class SenseChatClient:
@@ -21,6 +22,7 @@ class SenseChatClient:
         self.endpoint = settings.CHARACTER_CHAT_ENDPOINT
         self._token = None
         self._token_expiry = 0
+        self.rate_limiter = get_rate_limiter()
 
     def _generate_jwt_token(self) -> str:
         """
@@ -58,7 +60,8 @@ class SenseChatClient:
         messages: List[Dict],
         max_new_tokens: int = 1024,
         n: int = 1,
-        know_ids: Optional[List[str]] = None
+        know_ids: Optional[List[str]] = None,
+        priority: int = PRIORITY_FREE
     ) -> Dict:
         """
         Create a character chat completion
@@ -70,12 +73,14 @@ class SenseChatClient:
             max_new_tokens: Maximum tokens to generate (default 1024)
             n: Number of responses to generate (default 1)
             know_ids: Optional list of knowledge base IDs to use
+            priority: Rate limiter queue priority (premium users go first)
 
         Returns:
             API response dictionary
 
         Raises:
             requests.RequestException: If API request fails
+            RateLimitExceeded: If no request slot became available in time
         """
         url = f"{self.base_url}{self.endpoint}"
         token = self._get_valid_token()
@@ -98,6 +103,8 @@ class SenseChatClient:
         if know_ids:
             payload["know_ids"] = know_ids
 
+        self.rate_limiter.acquire(priority)
+
         try:
             response = requests.post(url, json=payload, headers=headers, timeout=30)
             response.raise_for_status()
@@ -153,13 +160,14 @@ class SenseChatClient:
             print(f"Connection test failed: {e}")
             return False
 
-    def create_knowledge_file(self, file, description: str = "") -> Dict:
+    def create_knowledge_file(self, file, description: str = "", priority: int = PRIORITY_FREE) -> Dict:
         """
         Create and upload a knowledge base file
 
         Args:
             file: File object containing JSON knowledge data
             description: File description
+            priority: Rate limiter queue priority
 
         Returns:
             Response dict with file_id if successful
@@ -186,6 +194,7 @@ class SenseChatClient:
         }
 
         try:
+            self.rate_limiter.acquire(priority)
             response = requests.post(
                 url,
                 headers=headers,
@@ -211,7 +220,8 @@ class SenseChatClient:
     def create_knowledge_base(
         self,
         file_ids: List[str],
-        description: str = ""
+        description: str = "",
+        priority: int = PRIORITY_FREE
     ) -> Dict:
         """
         Create a knowledge base with uploaded files
@@ -219,6 +229,7 @@ class SenseChatClient:
         Args:
             file_ids: List of uploaded file IDs
             description: Knowledge base description
+            priority: Rate limiter queue priority
 
         Returns:
             Response dict with knowledge_base_id if successful
@@ -237,6 +248,7 @@ class SenseChatClient:
         }
 
         try:
+            self.rate_limiter.acquire(priority)
             response = requests.post(
                 url,
                 json=payload,
@@ -264,7 +276,8 @@ class SenseChatClient:
     def update_knowledge_base(
         self,
         knowledge_base_id: str,
-        file_ids: List[str]
+        file_ids: List[str],
+        priority: int = PRIORITY_FREE
     ) -> Dict:
         """
         Update an existing knowledge base
@@ -272,6 +285,7 @@ class SenseChatClient:
         Args:
             knowledge_base_id: Knowledge base ID to update
             file_ids: List of file IDs to use
+            priority: Rate limiter queue priority
 
         Returns:
             Response dict with success status
@@ -289,6 +303,7 @@ class SenseChatClient:
         }
 
         try:
+            self.rate_limiter.acquire(priority)
             response = requests.put(
                 url,
                 json=payload,
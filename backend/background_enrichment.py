@@ -0,0 +1,162 @@
+"""
+Background Enrichment - AI background stories generated off the request path
+Characters are created with the template background story; the SenseChat
+story is generated afterwards on a small worker pool and swapped into
+other_setting. The swap is a single compare-and-set against the
+settings_version the character was created with: if the user edited the
+character in the meantime, their edit wins and the AI story is dropped. The
+version bump refreshes cached chat payloads in every worker.
+
+Jobs live in memory: if the process restarts first, the character simply
+keeps its template story.
+"""
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional
+import json
+import logging
+
+from sqlalchemy import update, func
+from sqlalchemy.orm import Session
+
+from backend.config import settings
+from backend.database import SessionLocal, Character
+from backend.models import UserProfile
+from backend.character_generator import CharacterGenerator
+from backend import character_payload, mapping_cache, metrics
+
+logger = logging.getLogger(__name__)
+
+metrics.describe("background_enrichment_total", "AI background story jobs by result")
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Get or create the process-wide enrichment worker pool"""
+    global _executor
+
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.BACKGROUND_ENRICHMENT_WORKERS,
+            thread_name_prefix="background-enrichment"
+        )
+    return _executor
+
+
+def enqueue(
+    generator: CharacterGenerator,
+    character_id: int,
+    user_profile: UserProfile,
+    settings_version: int = 0
+) -> Future:
+    """
+    Queue AI background story generation for a freshly created character
+
+    Args:
+        generator: CharacterGenerator with a SenseChat client
+        character_id: Character to enrich
+        user_profile: Profile the character was generated from
+        settings_version: The character's settings_version when it was created
+    """
+    return get_executor().submit(enrich_character, generator, character_id, user_profile, settings_version)
+
+
+def store_background_story(db: Session, character_id: int, story: str, settings_version: int = 0) -> bool:
+    """
+    Replace background_story in a character's other_setting
+
+    Only if settings_version is still the one the story was generated for -
+    a user edit in the meantime is never overwritten.
+
+    Returns:
+        True if stored, False if the character is gone or was edited
+    """
+    character = db.get(Character, character_id, populate_existing=True)
+    if character is None or (character.settings_version or 0) != settings_version:
+        return False
+
+    other_setting = character.other_setting or {}
+    if isinstance(other_setting, str):
+        # Older rows hold other_setting as a JSON string
+        other_setting = json.loads(other_setting)
+
+    result = db.execute(
+        update(Character)
+        .where(
+            Character.character_id == character_id,
+            func.coalesce(Character.settings_version, 0) == settings_version
+        )
+        .values(
+            other_setting=CharacterGenerator.with_background_story(other_setting, story),
+            settings_version=settings_version + 1
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    if result.rowcount != 1:
+        return False
+
+    character_payload.invalidate(character_id)
+    mapping_cache.invalidate_character(character_id)
+    return True
+
+
+def enrich_character(
+    generator: CharacterGenerator,
+    character_id: int,
+    user_profile: UserProfile,
+    settings_version: int = 0,
+    session_factory: Callable[[], Session] = SessionLocal
+) -> bool:
+    """
+    Worker entry point - generate the AI story and store it
+
+    Args:
+        settings_version: The character's settings_version when it was created
+
+    Returns:
+        True if the character's story was replaced
+    """
+    try:
+        character_name = _character_name(session_factory, character_id)
+        if character_name is None:
+            metrics.increment("background_enrichment_total", result="missing")
+            return False
+
+        personality_type = generator._determine_personality_type(user_profile.dream_type)
+        story = generator._generate_background_story(
+            character_name,
+            user_profile.user_name,
+            user_profile.dream_type,
+            personality_type,
+            user_profile.custom_memory
+        )
+        # _generate_background_story falls back to the template story on errors
+        if story == generator._generate_simple_background_story(character_name, user_profile.dream_type):
+            metrics.increment("background_enrichment_total", result="fallback")
+            return False
+
+        db = session_factory()
+        try:
+            stored = store_background_story(db, character_id, story, settings_version)
+        finally:
+            db.close()
+
+        metrics.increment("background_enrichment_total", result="stored" if stored else "conflict")
+        if stored:
+            logger.info(f"Stored AI background story for character {character_id}")
+        return stored
+
+    except Exception as e:
+        metrics.increment("background_enrichment_total", result="error")
+        logger.error(f"Background enrichment failed for character {character_id}: {e}", exc_info=True)
+        return False
+
+
+def _character_name(session_factory: Callable[[], Session], character_id: int) -> Optional[str]:
+    db = session_factory()
+    try:
+        character = db.get(Character, character_id)
+        return character.name if character else None
+    finally:
+        db.close()
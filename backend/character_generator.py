@@ -39,6 +39,10 @@ class CharacterGenerator:
         }
     }
 
+    # Placeholders in pre-generated story templates (see backend.story_pool)
+    CHARACTER_NAME_PLACEHOLDER = "{character_name}"
+    USER_NAME_PLACEHOLDER = "{user_name}"
+
     # Nickname mappings
     NICKNAME_MAPPINGS = {
         PersonalityType.GENTLE: {
@@ -226,7 +230,9 @@ class CharacterGenerator:
         user_name: str,
         dream_type: DreamType,
         personality_type: PersonalityType,
-        custom_memory: CustomMemory
+        custom_memory: CustomMemory,
+        ai_background: bool = True,
+        background_story: Optional[str] = None
     ) -> str:
         """
         Generate other settings as JSON string (max 2000 chars)
@@ -237,18 +243,25 @@ class CharacterGenerator:
             dream_type: User's dream partner type
             personality_type: Determined personality type
             custom_memory: User's custom memory
+            ai_background: Ask SenseChat for the background story (False = template
+                story, no API call - see backend.background_enrichment)
+            background_story: Ready-made story to use instead (e.g. from backend.story_pool)
 
         Returns:
             JSON string of other settings
         """
-        # Generate AI-powered background story
-        background_story = self._generate_background_story(
-            character_name,
-            user_name,
-            dream_type,
-            personality_type,
-            custom_memory
-        )
+        if background_story is None:
+            if ai_background:
+                # Generate AI-powered background story
+                background_story = self._generate_background_story(
+                    character_name,
+                    user_name,
+                    dream_type,
+                    personality_type,
+                    custom_memory
+                )
+            else:
+                background_story = self._generate_simple_background_story(character_name, dream_type)
 
         other_settings = {
             "interests": dream_type.interests,
@@ -301,15 +314,39 @@ class CharacterGenerator:
             ]
         }
 
-        json_str = json.dumps(other_settings, ensure_ascii=False)
+        return json.dumps(self._fit_other_setting(other_settings), ensure_ascii=False)
+
+    @staticmethod
+    def _fit_other_setting(other_settings: Dict) -> Dict:
+        """
+        other_settings as is, or a copy with background_story shortened if its JSON is over 2000 chars
 
+        Args:
+            other_settings: Parsed other_setting (not modified)
+
+        Returns:
+            other_setting dict within the limit
+        """
         # Ensure within 2000 char limit
-        if len(json_str) > 2000:
-            # Reduce background story if too long
-            other_settings["background_story"] = other_settings["background_story"][:100] + "..."
-            json_str = json.dumps(other_settings, ensure_ascii=False)
+        if len(json.dumps(other_settings, ensure_ascii=False)) <= 2000:
+            return other_settings
 
-        return json_str
+        # Reduce background story if too long
+        return dict(other_settings, background_story=other_settings["background_story"][:100] + "...")
+
+    @classmethod
+    def with_background_story(cls, other_settings: Dict, background_story: str) -> Dict:
+        """
+        Copy of a parsed other_setting with background_story replaced (within the 2000 char limit)
+
+        Args:
+            other_settings: Parsed other_setting
+            background_story: Story to store
+
+        Returns:
+            New other_setting dict
+        """
+        return cls._fit_other_setting(dict(other_settings, background_story=background_story))
 
     def _generate_background_story(
         self,
@@ -415,6 +452,11 @@ class CharacterGenerator:
             # Fallback to simple story
             return self._generate_simple_background_story(character_name, dream_type)
 
+    @classmethod
+    def fill_story_template(cls, template: str, character_name: str, user_name: str) -> str:
+        """Put the character's and user's names into a pre-generated story template"""
+        return template.replace(cls.CHARACTER_NAME_PLACEHOLDER, character_name).replace(cls.USER_NAME_PLACEHOLDER, user_name)
+
     def _generate_simple_background_story(self, character_name: str, dream_type: DreamType) -> str:
         """Generate a simple fallback background story using third-person perspective"""
         story_parts = []
@@ -451,12 +493,20 @@ class CharacterGenerator:
         # based on user input or preferences
         return "女"
 
-    def generate_character(self, user_profile: UserProfile) -> Dict:
+    def generate_character(
+        self,
+        user_profile: UserProfile,
+        ai_background: bool = True,
+        story_template: Optional[str] = None
+    ) -> Dict:
         """
         Generate complete character settings from user profile
 
         Args:
             user_profile: User's complete profile
+            ai_background: Generate the background story with SenseChat (blocking call)
+            story_template: Pre-generated story with name placeholders, used instead of
+                generating one
 
         Returns:
             Dictionary with character settings ready for API
@@ -473,6 +523,7 @@ class CharacterGenerator:
         # Use user-provided character name if available, otherwise generate one
         name = user_profile.preferred_character_name if user_profile.preferred_character_name else self._generate_name(personality_type, gender)
         nickname = self._generate_nickname(personality_type, gender)
+        background_story = self.fill_story_template(story_template, name, user_profile.user_name) if story_template else None
 
         character_settings = {
             "name": name,
@@ -492,7 +543,9 @@ class CharacterGenerator:
                 user_profile.user_name,  # Pass user name
                 user_profile.dream_type,
                 personality_type,  # Pass personality type
-                user_profile.custom_memory
+                user_profile.custom_memory,
+                ai_background,
+                background_story
             ),
             "feeling_toward": [
                 {
@@ -0,0 +1,94 @@
+"""
+Character Payload - Cached SenseChat character_settings per character version
+The character's entry (including the serialized other_setting JSON) is built
+once per (character_id, created_at, settings_version) and reused on every
+turn; only feeling_toward changes per turn. Bumping Character.settings_version
+makes every worker rebuild, since the version is read with the character row.
+created_at keeps a new character that reuses a deleted one's id (SQLite does
+that for the highest id) from getting the old payload in other workers.
+"""
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import json
+import threading
+
+from backend.config import settings
+from backend.database import Character
+
+_cache: "OrderedDict[Tuple[int, str, int], Dict]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def _build_character_entry(character: Character) -> Dict:
+    """SenseChat settings entry for a character, without feeling_toward"""
+    return {
+        "name": character.name,
+        "gender": character.gender,
+        "identity": character.identity,
+        "nickname": character.nickname,
+        "detail_setting": character.detail_setting,
+        "other_setting": json.dumps(character.other_setting, ensure_ascii=False) if isinstance(
+            character.other_setting, dict
+        ) else character.other_setting,
+    }
+
+
+def get_character_entry(character: Character) -> Dict:
+    """
+    Cached settings entry for the character's current version
+
+    Returns:
+        Shared dict - copy before adding per-turn keys
+    """
+    key = (
+        character.character_id,
+        character.created_at.isoformat() if character.created_at else "",
+        character.settings_version or 0
+    )
+    with _lock:
+        entry = _cache.get(key)
+        if entry is not None:
+            _cache.move_to_end(key)
+            return entry
+
+    entry = _build_character_entry(character)
+    with _lock:
+        _cache[key] = entry
+        while len(_cache) > settings.CHARACTER_PAYLOAD_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return entry
+
+
+def build_character_settings(character: Character, user_name: str, level: int, memory: Optional[str] = None) -> List[Dict]:
+    """
+    character_settings for a chat turn
+
+    Args:
+        character: Character being talked to
+        user_name: User's name
+        level: Current favorability level
+        memory: Retrieved memory block for this turn, added to the user's entry (see backend.retrieval)
+    """
+    character_entry = dict(get_character_entry(character))
+    character_entry["feeling_toward"] = [{"name": user_name, "level": level}]
+    return [
+        {
+            "name": user_name,
+            "gender": "男",  # Default, can be customized
+            "detail_setting": f"用戶\n{memory}" if memory else "用戶"
+        },
+        character_entry
+    ]
+
+
+def bump_version(character: Character):
+    """Mark the character's settings as changed (caller commits)"""
+    character.settings_version = (character.settings_version or 0) + 1
+    invalidate(character.character_id)
+
+
+def invalidate(character_id: int):
+    """Drop every cached version of a character in this process"""
+    with _lock:
+        for key in [key for key in _cache if key[0] == character_id]:
+            del _cache[key]
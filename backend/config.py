@@ -20,15 +20,59 @@ class Settings(BaseSettings):
 
     # Database
     DATABASE_URL: str = "sqlite:///./dating_chatbot.db"
+    MIGRATE_ON_STARTUP: bool = True  # Run migrations in init_db; off when a release command runs them (Procfile)
 
     # API settings
     MAX_NEW_TOKENS: int = 1024
     RATE_LIMIT_RPM: int = 60
+    RATE_LIMIT_BURST: int = 10  # Requests allowed back-to-back before pacing kicks in
+    RATE_LIMIT_BACKEND: str = "memory"  # "memory" (per process) or "database" (shared by all workers)
+    RATE_LIMIT_MAX_WAIT_SECONDS: float = 30.0  # Give up if no slot frees up within this time
     TOKEN_EXPIRY_SECONDS: int = 1800  # 30 minutes
+    CHARACTER_PAYLOAD_CACHE_SIZE: int = 2048  # Characters whose chat settings payload is kept per process
+    BACKGROUND_ENRICHMENT_WORKERS: int = 2  # Threads generating AI background stories after creation
+    STORY_POOL_LOW_WATERMARK: int = 2  # Refill a pool key once fewer stories than this are left
+    STORY_POOL_TARGET_SIZE: int = 5  # Stories per pool key after a refill
+    CHARACTER_CREATE_PROFILE_TIMEOUT_SECONDS: float = 3.0  # LINE profile fetch (falls back to the entered name)
+    CHARACTER_CREATE_PICTURE_TIMEOUT_SECONDS: float = 2.0  # Picture pick (falls back to no picture)
+    CHARACTER_CREATE_PUSH_TIMEOUT_SECONDS: float = 10.0  # First LINE message push
+
+    # Bulk export jobs
+    EXPORT_DIR: str = "exports"  # Local directory for finished archives
+    EXPORT_JOB_WORKERS: int = 1  # Background export threads per process
+    EXPORT_RETENTION_HOURS: int = 24  # Archives and job rows are deleted after this
+    EXPORT_JOB_STALE_MINUTES: int = 60  # A running job with no heartbeat for this long was cut off by a restart
+    EXPORT_JOB_HEARTBEAT_SECONDS: int = 60  # How often a running job refreshes heartbeat_at
+    EXPORT_JOB_RECOVERY_INTERVAL_SECONDS: int = 600  # How often stranded jobs are requeued or failed
+    EXPORT_ZSTD_LEVEL: int = 10  # Only used when 'zstandard' is installed
+
+    # Knowledge base rebuild jobs
+    KNOWLEDGE_REBUILD_WORKERS: int = 4  # Characters synced concurrently per job
+    KNOWLEDGE_REBUILD_PAGE_SIZE: int = 500  # Characters read per grouped query
+    KNOWLEDGE_REBUILD_MAX_ATTEMPTS: int = 3  # Tries per character before counting it failed
+    KNOWLEDGE_REBUILD_CHECKPOINT_EVERY: int = 100  # Characters between checkpoint writes
+
+    # Local retrieval memory (replaces SenseChat know_ids)
+    RETRIEVAL_ENABLED: bool = True  # False = send the character's remote knowledge base instead
+    RETRIEVAL_TOP_K: int = 3  # Snippets injected per turn
+    RETRIEVAL_MAX_CHARS: int = 400  # Cap on the injected memory block
+    RETRIEVAL_CACHE_SIZE: int = 256  # Character indexes kept in memory per process
+    RETRIEVAL_INDEX_DIR: str = "retrieval_index"  # Snapshots for warm restarts
+    RETRIEVAL_FLUSH_INTERVAL_SECONDS: int = 60  # How often changed indexes are snapshotted
+
+    # Optional semantic memory (needs numpy)
+    SEMANTIC_MEMORY_ENABLED: bool = False  # Vector recall of old exchanges, added to the retrieval memory
+    SEMANTIC_MEMORY_TOP_K: int = 2  # Exchanges injected per turn
+    SEMANTIC_MEMORY_MIN_SCORE: float = 0.2  # Cosine similarity below this is not injected
+    SEMANTIC_MEMORY_CACHE_SIZE: int = 256  # Character matrices kept mapped per process
+    SEMANTIC_MEMORY_DIR: str = "semantic_memory"  # Embedding files, one directory per character
+    SEMANTIC_MEMORY_CATCH_UP_MAX_ROWS: int = 200  # Larger gaps before the history window are left to compaction
+    SEMANTIC_MEMORY_COMPACT_INTERVAL_SECONDS: int = 86400  # How often stores are compacted
 
     # LINE Bot Configuration
     LINE_CHANNEL_SECRET: str = ""
     LINE_CHANNEL_ACCESS_TOKEN: str = ""
+    LINE_API_ENDPOINT: str = "https://api.line.me"  # Override to point at a local fake LINE server
     LINE_BOT_NAME: str = "纏綿悱惻 - 聊出激情吧!"
     LINE_BOT_DESCRIPTION: str = "The most interesting dating chatbot on LINE"
 
@@ -42,8 +86,17 @@ class Settings(BaseSettings):
 
     # Feature Flags
     FREE_MESSAGES_PER_DAY: int = 20
+    DEFAULT_TIMEZONE: str = "Asia/Taipei"  # Daily quota rolls over at midnight here unless the user has their own
     PREMIUM_PRICE_USD: float = 9.99
     REFERRALS_FOR_UNLIMITED: int = 2  # Refer 2 friends → unlimited messages
+    MAPPING_CACHE_TTL_SECONDS: float = 30.0  # Max staleness of cached LINE mappings in other workers
+    ENTITLEMENT_CACHE_TTL_SECONDS: float = 60.0  # Max staleness of premium status in other workers
+    PREMIUM_SWEEP_INTERVAL_SECONDS: int = 300  # How often expired premium is switched off
+    OUTREACH_SWEEP_INTERVAL_SECONDS: int = 3600  # How often anniversaries / inactivity nudges are pushed
+    OUTREACH_START_HOUR: int = 10  # Local hours (DEFAULT_TIMEZONE) in which proactive pushes are allowed
+    OUTREACH_END_HOUR: int = 21
+    OUTREACH_BATCH_SIZE: int = 500  # Users claimed per batch (LINE multicast takes at most 500)
+    OUTREACH_PUSH_RPM: int = 120  # LINE multicast calls per minute, per process
 
     # CORS
     CORS_ORIGINS: list = ["*"]
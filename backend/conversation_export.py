@@ -0,0 +1,193 @@
+"""
+Conversation Export - Streaming transcript writers
+Renders a character's conversation as JSON, TXT or NDJSON in chunks, reading
+messages through a server-side cursor so memory stays constant for any
+history size.
+"""
+from datetime import datetime
+from typing import Dict, Iterator, Optional
+import json
+
+from sqlalchemy.orm import Session
+
+from backend.database import Character, FavorabilityTracking, ConversationStats
+from backend.conversation_stats import conversation_days
+from backend.message_reads import MessageRecord
+from backend import message_reads
+
+EXPORT_FORMATS = {
+    "json": ("application/json", "json"),
+    "txt": ("text/plain", "txt"),  # Starlette appends charset=utf-8
+    "ndjson": ("application/x-ndjson", "ndjson"),
+}
+
+# Rows fetched per round trip from the server-side cursor
+BATCH_SIZE = 1000
+
+LEVEL_NAMES = {1: "陌生期", 2: "熟悉期", 3: "親密期"}
+
+
+def iter_messages(db: Session, character_id: int, batch_size: int = BATCH_SIZE) -> Iterator[MessageRecord]:
+    """
+    Stream a character's messages in chronological order
+
+    Yields read-only MessageRecord tuples instead of ORM objects, batch_size at a time.
+    """
+    return message_reads.iter_history(db, character_id, by_timestamp=True, batch_size=batch_size)
+
+
+def build_header(
+    character: Character,
+    favorability: Optional[FavorabilityTracking],
+    stats: Optional[ConversationStats]
+) -> Dict:
+    """
+    Collect everything an export needs besides the messages
+
+    Built up front (on the request's session) so a missing character
+    fails before the response starts streaming.
+    """
+    other_setting = {}
+    try:
+        other_setting = json.loads(character.other_setting) if isinstance(character.other_setting, str) else (character.other_setting or {})
+    except (TypeError, ValueError):
+        pass
+
+    level = favorability.current_level if favorability else 1
+
+    return {
+        "character_id": character.character_id,
+        "total_messages": stats.total_messages if stats else 0,
+        "conversation_days": conversation_days(stats),
+        "character": {
+            "name": character.name,
+            "nickname": character.nickname,
+            "gender": character.gender,
+            "identity": character.identity,
+            "personality": character.detail_setting,
+            "background_story": other_setting.get("background_story", ""),
+            "interests": other_setting.get("interests", [])
+        },
+        "favorability": {
+            "level": level,
+            "level_name": LEVEL_NAMES.get(level, "陌生期"),
+            "message_count": favorability.message_count if favorability else 0
+        }
+    }
+
+
+def export_filename(character_name: str, export_format: str) -> str:
+    """Download filename for an export"""
+    extension = EXPORT_FORMATS[export_format][1]
+    return f"{character_name}_對話記錄_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+
+
+def _message_dict(row) -> Dict:
+    return {
+        "timestamp": row.timestamp.isoformat(),
+        "speaker": row.speaker_name,
+        "content": row.message_content,
+        "favorability_level": row.favorability_level
+    }
+
+
+def stream_json(db: Session, header: Dict) -> Iterator[str]:
+    """Pretty-printed JSON document, same layout as the old in-memory export"""
+    document = {
+        "export_info": {
+            "export_date": datetime.now().isoformat(),
+            "character_id": header["character_id"],
+            "total_messages": header["total_messages"],
+            "conversation_days": header["conversation_days"]
+        },
+        "character": header["character"],
+        "favorability": header["favorability"],
+        "messages": "__MESSAGES__"
+    }
+    prefix, suffix = json.dumps(document, ensure_ascii=False, indent=2).split('"__MESSAGES__"')
+
+    yield prefix + "["
+    first = True
+    for row in iter_messages(db, header["character_id"]):
+        item = json.dumps(_message_dict(row), ensure_ascii=False, indent=2).replace("\n", "\n    ")
+        yield ("\n    " if first else ",\n    ") + item
+        first = False
+    yield ("]" if first else "\n  ]") + suffix
+
+
+def stream_txt(db: Session, header: Dict) -> Iterator[str]:
+    """Human-readable transcript"""
+    character = header["character"]
+    favorability = header["favorability"]
+
+    lines = []
+    lines.append("=" * 60)
+    lines.append(f"💕 {character['name']} 的對話記錄")
+    lines.append("=" * 60)
+    lines.append(f"\n📊 統計資訊：")
+    lines.append(f"   總訊息數：{header['total_messages']} 條")
+    lines.append(f"   對話天數：{header['conversation_days']} 天")
+    lines.append(f"   好感度等級：{favorability['level']} - {favorability['level_name']}")
+    lines.append(f"\n✨ 角色資訊：")
+    lines.append(f"   名字：{character['name']} ({character['nickname']})")
+    lines.append(f"   性別：{character['gender']}")
+    lines.append(f"   身份：{character['identity']}")
+    lines.append(f"   性格：{character['personality']}")
+    if character["background_story"]:
+        lines.append(f"   背景故事：{character['background_story']}")
+
+    lines.append(f"\n" + "=" * 60)
+    lines.append("💬 對話內容")
+    lines.append("=" * 60 + "\n")
+    yield "\n".join(lines) + "\n"
+
+    for row in iter_messages(db, header["character_id"]):
+        timestamp = row.timestamp.strftime("%Y-%m-%d %H:%M:%S")
+        yield f"[{timestamp}] {row.speaker_name}：\n  {row.message_content}\n\n"
+
+    lines = []
+    lines.append("=" * 60)
+    lines.append(f"匯出時間：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    lines.append("🤖 Generated with Claude Code")
+    lines.append("=" * 60)
+    yield "\n".join(lines)
+
+
+def stream_ndjson(db: Session, header: Dict) -> Iterator[str]:
+    """One JSON message object per line, for bulk consumers"""
+    character_id = header["character_id"]
+    for row in iter_messages(db, character_id):
+        record = _message_dict(row)
+        record["character_id"] = character_id
+        yield json.dumps(record, ensure_ascii=False) + "\n"
+
+
+STREAMERS = {
+    "json": stream_json,
+    "txt": stream_txt,
+    "ndjson": stream_ndjson,
+}
+
+
+def stream_export(db: Session, header: Dict, export_format: str, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    """
+    Encode an export as UTF-8, coalescing small pieces into ~chunk_size writes
+
+    Args:
+        db: Database session used for the message cursor
+        header: Output of build_header
+        export_format: 'json', 'txt' or 'ndjson'
+        chunk_size: Target bytes per yielded chunk
+    """
+    buffer = []
+    size = 0
+    for piece in STREAMERS[export_format](db, header):
+        data = piece.encode("utf-8")
+        buffer.append(data)
+        size += len(data)
+        if size >= chunk_size:
+            yield b"".join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b"".join(buffer)
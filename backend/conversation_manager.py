@@ -3,13 +3,20 @@ Conversation Manager - Manages conversation history and favorability
 Phase 2: Complete conversation flow with persistence
 """
 from typing import List, Dict, Optional, Tuple
+from sqlalchemy import select, func
 from sqlalchemy.orm import Session
 from datetime import datetime
 import json
 
-from backend.database import User, Character, Message, FavorabilityTracking, UserPreference
+from backend.database import User, Character, Message, FavorabilityTracking, UserPreference, SPEAKER_USER, SPEAKER_CHARACTER
+from backend.conversation_stats import record_message
 from backend.api_client import SenseChatClient
+from backend.rate_limiter import PRIORITY_FREE
 from backend.tc_converter import convert_to_traditional
+from backend.character_payload import build_character_settings
+from backend.config import settings
+from backend.message_reads import MessageRecord
+from backend import special_events, retrieval, semantic_memory, message_reads, character_payload
 
 
 class ConversationManager:
@@ -95,10 +102,8 @@ class ConversationManager:
         return character
 
     def get_character(self, character_id: int) -> Optional[Character]:
-        """Get character by ID"""
-        return self.db.query(Character).filter(
-            Character.character_id == character_id
-        ).first()
+        """Get character by ID (identity map first - no SQL if already in the session)"""
+        return self.db.get(Character, character_id)
 
     def get_user_characters(self, user_id: int) -> List[Character]:
         """Get all characters for a user"""
@@ -106,13 +111,46 @@ class ConversationManager:
             Character.user_id == user_id
         ).order_by(Character.created_at.desc()).all()
 
+    def get_user_characters_overview(
+        self,
+        user_id: int
+    ) -> List[Tuple[Character, Optional[FavorabilityTracking], Optional[MessageRecord]]]:
+        """
+        Get all characters for a user with favorability and latest message
+
+        One query for any number of characters: favorability is outer-joined
+        and the latest message is joined through a correlated MAX(message_id),
+        projected as a read-only record.
+
+        Args:
+            user_id: User ID
+
+        Returns:
+            List of (character, favorability or None, latest message or None), newest character first
+        """
+        latest_message_id = select(func.max(Message.message_id)).where(
+            Message.character_id == Character.character_id
+        ).correlate(Character).scalar_subquery()
+
+        return [
+            (row[0], row[1], message_reads.record_from_row(row, 2))
+            for row in self.db.query(Character, FavorabilityTracking, *message_reads.COLUMNS).outerjoin(
+                FavorabilityTracking, FavorabilityTracking.character_id == Character.character_id
+            ).outerjoin(
+                Message, Message.message_id == latest_message_id
+            ).filter(
+                Character.user_id == user_id
+            ).order_by(Character.created_at.desc()).all()
+        ]
+
     def save_message(
         self,
         user_id: int,
         character_id: int,
         speaker_name: str,
         content: str,
-        favorability_level: int
+        favorability_level: int,
+        speaker_role: Optional[int] = None
     ) -> Message:
         """
         Save a message to database
@@ -120,24 +158,37 @@ class ConversationManager:
         Args:
             user_id: User ID
             character_id: Character ID
-            speaker_name: Who said the message
+            speaker_name: Who said the message (display name)
             content: Message content
             favorability_level: Current favorability level
+            speaker_role: SPEAKER_USER, SPEAKER_CHARACTER or SPEAKER_SYSTEM
+                (default: by comparing speaker_name with the character's name)
 
         Returns:
             Message object
         """
+        if speaker_role is None:
+            character = self.db.get(Character, character_id)
+            speaker_role = SPEAKER_CHARACTER if character is not None and speaker_name == character.name else SPEAKER_USER
+
         message = Message(
             user_id=user_id,
             character_id=character_id,
             speaker_name=speaker_name,
+            speaker_role=speaker_role,
             message_content=content,
+            timestamp=datetime.utcnow(),
             favorability_level=favorability_level
         )
 
         self.db.add(message)
+
+        # Keep per-character stats in the same transaction
+        record_message(self.db, message, is_character=speaker_role == SPEAKER_CHARACTER)
+
         self.db.commit()
         self.db.refresh(message)
+        retrieval.add_message(message)
 
         return message
 
@@ -145,7 +196,7 @@ class ConversationManager:
         self,
         character_id: int,
         limit: Optional[int] = None
-    ) -> List[Message]:
+    ) -> List[MessageRecord]:
         """
         Get conversation history for a character
 
@@ -154,19 +205,38 @@ class ConversationManager:
             limit: Maximum number of messages to retrieve
 
         Returns:
-            List of Message objects in chronological order
+            List of read-only MessageRecord tuples in chronological order
+        """
+        return message_reads.recent_history(self.db, character_id, limit)
+
+    def get_conversation_page(
+        self,
+        character_id: int,
+        before_message_id: Optional[int] = None,
+        after_message_id: Optional[int] = None,
+        page_size: int = 50
+    ) -> Tuple[List[MessageRecord], bool]:
         """
-        query = self.db.query(Message).filter(
-            Message.character_id == character_id
-        ).order_by(Message.timestamp.asc())
+        Keyset-paginated conversation history
 
-        if limit:
-            # Get the most recent N messages
-            total = query.count()
-            if total > limit:
-                query = query.offset(total - limit)
+        Pages by message_id over the (character_id, message_id) index, so every
+        page costs the same no matter how deep into the history it is.
 
-        return query.all()
+        Args:
+            character_id: Character ID
+            before_message_id: Return messages older than this one (default: latest page)
+            after_message_id: Return messages newer than this one
+            page_size: Messages per page
+
+        Returns:
+            (read-only records in chronological order, whether more exist in the paging direction)
+        """
+        return message_reads.history_page(
+            self.db, character_id,
+            before_message_id=before_message_id,
+            after_message_id=after_message_id,
+            page_size=page_size
+        )
 
     def get_favorability(self, character_id: int) -> Optional[FavorabilityTracking]:
         """Get favorability tracking for a character"""
@@ -188,6 +258,13 @@ class ConversationManager:
         if not favorability:
             return 1, False
 
+        level_increased = self._advance_favorability(favorability)
+        self.db.commit()
+
+        return favorability.current_level, level_increased
+
+    def _advance_favorability(self, favorability: FavorabilityTracking) -> bool:
+        """Count one exchange and recompute the level (caller commits); True if the level rose"""
         # Increment message count
         favorability.message_count += 1
         old_level = favorability.current_level
@@ -200,24 +277,30 @@ class ConversationManager:
         else:
             favorability.current_level = 1
 
-        level_increased = favorability.current_level > old_level
-        self.db.commit()
-
-        return favorability.current_level, level_increased
+        return favorability.current_level > old_level
 
-    def format_messages_for_api(self, messages: List[Message]) -> List[Dict]:
+    def format_messages_for_api(
+        self,
+        messages: List[MessageRecord],
+        user_name: Optional[str] = None,
+        character_name: Optional[str] = None
+    ) -> List[Dict]:
         """
         Format database messages for API request
 
         Args:
-            messages: List of Message objects
+            messages: Message records (or Message objects)
+            user_name: Name for the user's messages (default: the stored speaker_name)
+            character_name: Current character name, so messages from before a rename
+                aren't attributed to a stranger (default: the stored speaker_name)
 
         Returns:
             List of message dictionaries for API
         """
+        names = {SPEAKER_USER: user_name, SPEAKER_CHARACTER: character_name}
         return [
             {
-                "name": msg.speaker_name,
+                "name": names.get(msg.speaker_role) or msg.speaker_name,
                 "content": msg.message_content
             }
             for msg in messages
@@ -264,45 +347,17 @@ class ConversationManager:
         Returns:
             Special celebration message
         """
-        # Use template strings instead of f-strings to avoid premature evaluation
-        messages = {
-            "milestone": {
-                50: "哇！我們已經聊了{count}條訊息了！真開心能和你聊這麼多~ 💕",
-                100: "不知不覺已經{count}條訊息了呢！時間過得好快，和你聊天真的很開心~ ✨",
-                200: "天啊！{count}條訊息了！感覺我們之間越來越有默契了呢~ 💖",
-                500: "我們已經聊了{count}條訊息了！謝謝你一直陪著我~ 你對我來說很重要哦 💗",
-                1000: "一千條訊息！！！真的很感動...謝謝你願意花這麼多時間陪我聊天~ 你是我最珍惜的人 💝"
-            },
-            "anniversary": {
-                7: "我們認識一週了！這一週和你相處得很開心~ 💐",
-                30: "一個月了呢！這一個月裡，每天和你聊天都是我最期待的事~ 🌸",
-                100: "我們認識已經一百天了！感覺時間過得好快...謝謝你一直陪著我 🌹",
-                365: "一整年了！！！這一年裡有你陪伴，我真的很幸福~ 謝謝你~ 💕🎉"
-            },
-            "level_up": {
-                2: "我感覺我們越來越熟了呢~ 和你聊天的時候，我可以更放鬆地做自己了 😊",
-                3: "你知道嗎...我覺得你對我來說已經是很特別的存在了~ 有你在真好 💖"
-            }
-        }
-
-        message = ""
-        if event_type == "milestone":
-            template = messages["milestone"].get(event_data.get("count"), "")
-            if template:
-                message = template.format(count=event_data.get("count", 0))
-        elif event_type == "anniversary":
-            message = messages["anniversary"].get(event_data.get("days"), "")
-        elif event_type == "level_up":
-            message = messages["level_up"].get(event_data.get("level"), "")
-
-        # Convert to Traditional Chinese to ensure consistency
-        return convert_to_traditional(message) if message else ""
+        data_key = special_events.DATA_KEYS.get(event_type)
+        if data_key is None:
+            return ""
+        return special_events.render(event_type, event_data.get(data_key))
 
     def send_message(
         self,
         user_id: int,
         character_id: int,
-        user_message: str
+        user_message: str,
+        priority: int = PRIORITY_FREE
     ) -> Dict:
         """
         Send a message and get character's response
@@ -311,6 +366,7 @@ class ConversationManager:
             user_id: User ID
             character_id: Character ID
             user_message: User's message
+            priority: Rate limiter queue priority (premium users go first)
 
         Returns:
             Dictionary with character's response and metadata
@@ -320,7 +376,7 @@ class ConversationManager:
         if not character:
             raise ValueError(f"Character {character_id} not found")
 
-        user = self.db.query(User).filter(User.user_id == user_id).first()
+        user = self.db.get(User, user_id)
         if not user:
             raise ValueError(f"User {user_id} not found")
 
@@ -331,13 +387,18 @@ class ConversationManager:
         favorability = self.get_favorability(character_id)
         current_level = favorability.current_level if favorability else 1
 
+        # Cache when the relationship started (anniversaries count from it)
+        if favorability:
+            special_events.ensure_first_message_at(self.db, favorability, datetime.utcnow())
+
         # Save user's message
         self.save_message(
             user_id=user_id,
             character_id=character_id,
             speaker_name=user.username,
             content=user_message,
-            favorability_level=current_level
+            favorability_level=current_level,
+            speaker_role=SPEAKER_USER
         )
 
         # Get conversation history (limited)
@@ -347,32 +408,21 @@ class ConversationManager:
         )
 
         # Format messages for API
-        api_messages = self.format_messages_for_api(history)
-
-        # Prepare character settings with current favorability
-        character_settings_list = [
-            {
-                "name": user.username,
-                "gender": "男",  # Default, can be customized
-                "detail_setting": "用戶"
-            },
-            {
-                "name": character.name,
-                "gender": character.gender,
-                "identity": character.identity,
-                "nickname": character.nickname,
-                "detail_setting": character.detail_setting,
-                "other_setting": json.dumps(character.other_setting, ensure_ascii=False) if isinstance(
-                    character.other_setting, dict
-                ) else character.other_setting,
-                "feeling_toward": [
-                    {
-                        "name": user.username,
-                        "level": current_level
-                    }
-                ]
-            }
-        ]
+        api_messages = self.format_messages_for_api(history, user.username, character.name)
+
+        # Relevant older memories from the local index, instead of a remote knowledge base
+        memories = []
+        if settings.RETRIEVAL_ENABLED:
+            memories = retrieval.relevant_memories(self.db, character, user_message, history)
+        if settings.SEMANTIC_MEMORY_ENABLED:
+            memories += [
+                memory for memory in semantic_memory.relevant_memories(self.db, character, user_message, history)
+                if memory not in memories
+            ]
+        memory = retrieval.format_memories(memories) if memories else None
+
+        # Prepare character settings with current favorability (cached per character version)
+        character_settings_list = build_character_settings(character, user.username, current_level, memory)
 
         # Role setting
         role_setting = {
@@ -382,7 +432,7 @@ class ConversationManager:
 
         # Prepare knowledge base IDs if available
         know_ids = []
-        if character.knowledge_base_id:
+        if character.knowledge_base_id and not settings.RETRIEVAL_ENABLED:
             know_ids = [character.knowledge_base_id]
 
         # Call API
@@ -392,7 +442,8 @@ class ConversationManager:
                 role_setting=role_setting,
                 messages=api_messages,
                 max_new_tokens=1024,
-                know_ids=know_ids if know_ids else None
+                know_ids=know_ids if know_ids else None,
+                priority=priority
             )
 
             character_reply = response["data"]["reply"]
@@ -406,91 +457,23 @@ class ConversationManager:
                 character_id=character_id,
                 speaker_name=character.name,
                 content=character_reply,
-                favorability_level=current_level
+                favorability_level=current_level,
+                speaker_role=SPEAKER_CHARACTER
             )
 
-            # Update favorability
-            new_level, level_increased = self.update_favorability(character_id)
-
-            # Get updated favorability for accurate message count
-            updated_favorability = self.get_favorability(character_id)
-            current_message_count = updated_favorability.message_count if updated_favorability else 0
-
-            # Check for milestone achievements (50, 100, 200, 500 messages)
-            milestone_reached = False
-            milestone_number = 0
-            milestones = [50, 100, 200, 500, 1000]
-            for milestone in milestones:
-                if current_message_count == milestone:
-                    milestone_reached = True
-                    milestone_number = milestone
-                    break
-
-            # Check for conversation anniversary (days since first message)
-            anniversary_reached = False
-            anniversary_days = 0
-            first_message = self.db.query(Message).filter(
-                Message.character_id == character_id
-            ).order_by(Message.timestamp.asc()).first()
-
-            if first_message:
-                from datetime import datetime, timezone
-                now = datetime.now(timezone.utc)
-                first_date = first_message.timestamp
-                if first_date.tzinfo is None:
-                    from datetime import timezone
-                    first_date = first_date.replace(tzinfo=timezone.utc)
-                days_since_first = (now - first_date).days
-
-                # Check for anniversary milestones (7, 30, 100, 365 days)
-                anniversary_milestones = [7, 30, 100, 365]
-                for anniversary in anniversary_milestones:
-                    if days_since_first == anniversary:
-                        anniversary_reached = True
-                        anniversary_days = anniversary
-                        break
-
-            # Generate special event messages
-            special_messages = []
-
-            if milestone_reached:
-                msg = self.generate_special_event_message(
-                    character.name,
-                    "milestone",
-                    {"count": milestone_number}
-                )
-                if msg:
-                    special_messages.append({
-                        "type": "milestone",
-                        "message": msg,
-                        "data": {"count": milestone_number}
-                    })
-
-            if anniversary_reached:
-                msg = self.generate_special_event_message(
-                    character.name,
-                    "anniversary",
-                    {"days": anniversary_days}
-                )
-                if msg:
-                    special_messages.append({
-                        "type": "anniversary",
-                        "message": msg,
-                        "data": {"days": anniversary_days}
-                    })
-
-            if level_increased:
-                msg = self.generate_special_event_message(
-                    character.name,
-                    "level_up",
-                    {"level": new_level}
-                )
-                if msg:
-                    special_messages.append({
-                        "type": "level_up",
-                        "message": msg,
-                        "data": {"level": new_level}
-                    })
+            # Update favorability and detect events on the row already loaded, in one commit
+            if favorability:
+                level_increased = self._advance_favorability(favorability)
+                new_level = favorability.current_level
+            else:
+                new_level, level_increased = 1, False
+            special_messages = special_events.detect_turn_events(favorability, level_increased)
+            current_message_count = favorability.message_count if favorability else 0
+            self.db.commit()
+
+            events = {event["type"]: event["data"] for event in special_messages}
+            milestone_number = events.get("milestone", {}).get("count", 0)
+            anniversary_days = events.get("anniversary", {}).get("days", 0)
 
             return {
                 "success": True,
@@ -498,9 +481,9 @@ class ConversationManager:
                 "favorability_level": new_level,
                 "level_increased": level_increased,
                 "message_count": current_message_count,
-                "milestone_reached": milestone_reached,
+                "milestone_reached": "milestone" in events,
                 "milestone_number": milestone_number,
-                "anniversary_reached": anniversary_reached,
+                "anniversary_reached": "anniversary" in events,
                 "anniversary_days": anniversary_days,
                 "special_messages": special_messages,
                 "time_context": time_context,
@@ -525,14 +508,18 @@ class ConversationManager:
 
         self.db.delete(character)
         self.db.commit()
+        retrieval.forget(character_id)
+        semantic_memory.forget(character_id)
+        character_payload.invalidate(character_id)
         return True
 
     def get_conversation_summary(self, character_id: int) -> Dict:
         """Get conversation statistics and summary"""
         favorability = self.get_favorability(character_id)
-        message_count = self.db.query(Message).filter(
-            Message.character_id == character_id
-        ).count()
+        # COUNT over the (character_id, message_id) index - no row subquery
+        message_count = self.db.scalar(
+            select(func.count(Message.message_id)).where(Message.character_id == character_id)
+        )
 
         return {
             "character_id": character_id,
@@ -0,0 +1,309 @@
+"""
+Conversation Statistics - Denormalized per-character counters
+Keeps one conversation_stats row per character up to date on every saved message,
+so profile, analytics and export reads are a single-row lookup instead of
+loading the whole message history. Rebuilds aggregate in SQL (GROUP BY day/hour,
+ROW_NUMBER for level transitions) so they never pull messages into Python.
+
+Backfill existing data with:
+    python -m backend.conversation_stats
+"""
+from datetime import datetime, date, timedelta
+from typing import Dict, List, Optional
+import logging
+
+from sqlalchemy import func, case, extract, and_, Date
+from sqlalchemy.orm import Session
+
+from backend.database import ConversationStats, Message, Character, SPEAKER_CHARACTER
+
+logger = logging.getLogger(__name__)
+
+# Message counts at which the favorability level changes (see ConversationManager)
+LEVEL_TRANSITIONS = {20: 2, 50: 3}
+
+
+def _apply_message(stats: ConversationStats, timestamp: datetime, is_character: bool):
+    """Fold one message into the counters (messages must arrive in time order)"""
+    stats.total_messages += 1
+    if is_character:
+        stats.character_messages += 1
+    else:
+        stats.user_messages += 1
+
+    if stats.first_message_at is None:
+        stats.first_message_at = timestamp
+    stats.last_message_at = timestamp
+
+    # JSON columns are not mutation-tracked - assign new objects
+    day_key = timestamp.date().isoformat()
+    by_day = dict(stats.messages_by_day or {})
+    by_day[day_key] = by_day.get(day_key, 0) + 1
+    stats.messages_by_day = by_day
+
+    by_hour = list(stats.messages_by_hour or [0] * 24)
+    by_hour[timestamp.hour] += 1
+    stats.messages_by_hour = by_hour
+
+    if stats.total_messages in LEVEL_TRANSITIONS:
+        stats.level_progression = list(stats.level_progression or []) + [{
+            "message_count": stats.total_messages,
+            "level": LEVEL_TRANSITIONS[stats.total_messages],
+            "timestamp": timestamp.isoformat()
+        }]
+
+    # Consecutive-day streaks
+    day = timestamp.date()
+    if stats.last_active_date is None:
+        stats.current_streak = 1
+    elif day == stats.last_active_date + timedelta(days=1):
+        stats.current_streak += 1
+    elif day > stats.last_active_date:
+        stats.current_streak = 1
+
+    if stats.last_active_date is None or day > stats.last_active_date:
+        stats.last_active_date = day
+    stats.longest_streak = max(stats.longest_streak or 0, stats.current_streak)
+    stats.updated_at = datetime.utcnow()
+
+
+def record_message(db: Session, message: Message, is_character: bool):
+    """
+    Update the stats row for a newly added message (caller commits)
+
+    Args:
+        db: Database session
+        message: Message being saved (timestamp must be set)
+        is_character: True if the character said it, False for the user
+    """
+    stats = db.query(ConversationStats).filter(
+        ConversationStats.character_id == message.character_id
+    ).with_for_update().first()
+
+    if stats is None:
+        # First message, or a character created before stats existed.
+        # Flush so the new message has an ID the rebuild can leave out.
+        db.flush()
+        stats = rebuild_stats(db, message.character_id, exclude_message_id=message.message_id)
+        if stats is None:
+            return
+
+    _apply_message(stats, message.timestamp, is_character)
+
+
+def _message_filter(character_id: int, exclude_message_id: Optional[int]):
+    """WHERE clause for a character's messages, optionally leaving one out"""
+    criteria = [Message.character_id == character_id]
+    if exclude_message_id is not None:
+        criteria.append(Message.message_id != exclude_message_id)
+    return criteria
+
+
+def _streaks(active_days: List[date]):
+    """
+    Current and longest run of consecutive days
+
+    Args:
+        active_days: Distinct active dates in ascending order
+
+    Returns:
+        (current_streak, longest_streak) - current is the run ending on the last active day
+    """
+    current = longest = 0
+    previous = None
+    for day in active_days:
+        current = current + 1 if previous is not None and day == previous + timedelta(days=1) else 1
+        longest = max(longest, current)
+        previous = day
+    return current, longest
+
+
+def aggregate_stats(
+    db: Session,
+    character_id: int,
+    character_name: str,
+    exclude_message_id: Optional[int] = None
+) -> Dict:
+    """
+    Compute every conversation statistic with GROUP BY / window queries
+
+    Runs four queries whose result size depends on the number of active days
+    and level transitions, never on the number of messages. Works on both
+    SQLite (3.25+) and Postgres.
+
+    Args:
+        db: Database session
+        character_id: Character ID
+        character_name: Character name (only used for messages without a speaker_role)
+        exclude_message_id: Message to leave out
+
+    Returns:
+        Dict of ConversationStats column values
+    """
+    criteria = _message_filter(character_id, exclude_message_id)
+
+    # Totals and first/last timestamps
+    total, character_count, first_at, last_at = db.query(
+        func.count(Message.message_id),
+        func.coalesce(func.sum(case(
+            (Message.speaker_role == SPEAKER_CHARACTER, 1),
+            # Rows not backfilled yet (written during a rolling deploy)
+            (and_(Message.speaker_role.is_(None), Message.speaker_name == character_name), 1),
+            else_=0
+        )), 0),
+        func.min(Message.timestamp),
+        func.max(Message.timestamp)
+    ).filter(*criteria).one()
+
+    # Messages per calendar day
+    day_column = func.date(Message.timestamp, type_=Date)
+    by_day_rows = db.query(day_column, func.count(Message.message_id)).filter(
+        *criteria
+    ).group_by(day_column).order_by(day_column).all()
+
+    # Messages per hour of day
+    hour_column = extract("hour", Message.timestamp)
+    messages_by_hour = [0] * 24
+    for hour, count in db.query(hour_column, func.count(Message.message_id)).filter(
+        *criteria
+    ).group_by(hour_column):
+        messages_by_hour[int(hour)] = count
+
+    # Level transitions: the Nth message in time order, numbered by a window function
+    numbered = db.query(
+        Message.timestamp.label("timestamp"),
+        func.row_number().over(
+            order_by=(Message.timestamp.asc(), Message.message_id.asc())
+        ).label("position")
+    ).filter(*criteria).subquery()
+    transition_rows = db.query(numbered.c.position, numbered.c.timestamp).filter(
+        numbered.c.position.in_(list(LEVEL_TRANSITIONS))
+    ).order_by(numbered.c.position).all()
+
+    active_days = [day for day, _ in by_day_rows]
+    current, longest = _streaks(active_days)
+
+    return {
+        "total_messages": total,
+        "user_messages": total - int(character_count),
+        "character_messages": int(character_count),
+        "first_message_at": first_at,
+        "last_message_at": last_at,
+        "messages_by_day": {day.isoformat(): count for day, count in by_day_rows},
+        "messages_by_hour": messages_by_hour,
+        "level_progression": [
+            {
+                "message_count": position,
+                "level": LEVEL_TRANSITIONS[position],
+                "timestamp": timestamp.isoformat()
+            }
+            for position, timestamp in transition_rows
+        ],
+        "current_streak": current,
+        "longest_streak": longest,
+        "last_active_date": active_days[-1] if active_days else None,
+    }
+
+
+def rebuild_stats(
+    db: Session,
+    character_id: int,
+    exclude_message_id: Optional[int] = None
+) -> Optional[ConversationStats]:
+    """
+    Recompute the stats row for a character from its message history
+
+    Args:
+        db: Database session
+        character_id: Character ID
+        exclude_message_id: Message to leave out (one that is being recorded right now)
+
+    Returns:
+        The (unflushed) stats row, or None if the character doesn't exist
+    """
+    character = db.get(Character, character_id)
+    if character is None:
+        return None
+
+    stats = db.query(ConversationStats).filter(
+        ConversationStats.character_id == character_id
+    ).first()
+    if stats is None:
+        stats = ConversationStats(character_id=character_id, user_id=character.user_id)
+        db.add(stats)
+
+    for column, value in aggregate_stats(db, character_id, character.name, exclude_message_id).items():
+        setattr(stats, column, value)
+    stats.updated_at = datetime.utcnow()
+
+    return stats
+
+
+def get_stats(db: Session, character_id: int) -> Optional[ConversationStats]:
+    """
+    Get the stats row for a character, building it on first access
+
+    Returns:
+        ConversationStats or None if the character doesn't exist
+    """
+    stats = db.query(ConversationStats).filter(
+        ConversationStats.character_id == character_id
+    ).first()
+
+    if stats is None:
+        stats = rebuild_stats(db, character_id)
+        if stats is not None:
+            db.commit()
+
+    return stats
+
+
+def conversation_days(stats: ConversationStats) -> int:
+    """Calendar days from the first to the last message (inclusive)"""
+    if not stats or not stats.first_message_at:
+        return 0
+    return (stats.last_message_at.date() - stats.first_message_at.date()).days + 1
+
+
+def current_streak(stats: ConversationStats, today: Optional[date] = None) -> int:
+    """Current streak, or 0 if the user skipped yesterday and today"""
+    if not stats or not stats.last_active_date:
+        return 0
+    today = today or datetime.utcnow().date()
+    return stats.current_streak if stats.last_active_date >= today - timedelta(days=1) else 0
+
+
+def backfill_all(db: Session, batch_size: int = 100) -> int:
+    """
+    Rebuild stats for every character
+
+    Args:
+        db: Database session
+        batch_size: Characters committed per transaction
+
+    Returns:
+        Number of characters processed
+    """
+    character_ids = [row[0] for row in db.query(Character.character_id).order_by(Character.character_id)]
+
+    for i, character_id in enumerate(character_ids, 1):
+        rebuild_stats(db, character_id)
+        if i % batch_size == 0:
+            db.commit()
+            logger.info(f"Backfilled conversation stats for {i}/{len(character_ids)} characters")
+
+    db.commit()
+    return len(character_ids)
+
+
+if __name__ == "__main__":
+    from backend.database import SessionLocal, init_db
+
+    logging.basicConfig(level=logging.INFO)
+    init_db()
+    session = SessionLocal()
+    try:
+        count = backfill_all(session)
+        print(f"✅ Backfilled conversation stats for {count} characters")
+    finally:
+        session.close()
@@ -0,0 +1,80 @@
+"""
+Critical Path - Concurrent I/O branches with timeouts, and per-stage timings
+A request starts its independent blocking calls as branches (each runs in a
+worker thread with its own timeout and fallback value), does its own work in
+stages, and reports where the wall-clock time went to the log and /metrics.
+"""
+from contextlib import contextmanager
+from typing import Any, Callable, Dict
+import asyncio
+import functools
+import logging
+import time
+
+from backend import metrics
+
+logger = logging.getLogger(__name__)
+
+metrics.describe("critical_path_seconds_total", "Wall-clock seconds per flow and stage")
+metrics.describe("critical_path_runs_total", "Completed runs per flow")
+metrics.describe("critical_path_fallbacks_total", "Branches that timed out or failed and used their fallback")
+
+
+class CriticalPath:
+    """Timings of one run of a flow (e.g. one character creation)"""
+
+    def __init__(self, flow: str):
+        self.flow = flow
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time a synchronous stage run on the request itself"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = time.perf_counter() - started
+
+    def branch(self, name: str, func: Callable[..., Any], *args, timeout: float, fallback: Any = None) -> asyncio.Task:
+        """
+        Start a blocking call in a worker thread
+
+        Args:
+            name: Stage name in logs and metrics
+            func: Blocking callable
+            timeout: Seconds to wait once awaited before giving up (the thread is left to finish)
+            fallback: Result used on timeout or error
+
+        Returns:
+            Task resolving to func's result or the fallback
+        """
+        # Submit to the thread pool now - a task body would only start at the caller's next await
+        started = time.perf_counter()
+        future = asyncio.get_running_loop().run_in_executor(None, functools.partial(func, *args))
+
+        async def run():
+            try:
+                return await asyncio.wait_for(future, timeout)
+            except Exception as e:
+                reason = "timeout" if isinstance(e, asyncio.TimeoutError) else "error"
+                logger.warning(f"{self.flow}: {name} {reason} ({e!r}), using fallback")
+                metrics.increment("critical_path_fallbacks_total", flow=self.flow, stage=name, reason=reason)
+                return fallback
+            finally:
+                self.stages[name] = time.perf_counter() - started
+
+        return asyncio.create_task(run())
+
+    def report(self) -> float:
+        """Log and export the stage timings; returns total seconds"""
+        total = time.perf_counter() - self.started
+        for name, seconds in self.stages.items():
+            metrics.increment("critical_path_seconds_total", seconds, flow=self.flow, stage=name)
+        metrics.increment("critical_path_seconds_total", total, flow=self.flow, stage="total")
+        metrics.increment("critical_path_runs_total", flow=self.flow)
+
+        stages = " ".join(f"{name}={seconds * 1000:.0f}ms" for name, seconds in self.stages.items())
+        logger.info(f"{self.flow} critical path: total={total * 1000:.0f}ms {stages}")
+        return total
@@ -2,7 +2,7 @@
 Database setup and models for the dating chatbot
 Phase 2: Conversation persistence and history management
 """
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Date, ForeignKey, Text, JSON, Boolean
+from sqlalchemy import create_engine, Column, Integer, SmallInteger, String, DateTime, Date, ForeignKey, Text, JSON, Boolean, Float, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime, date
@@ -61,6 +61,8 @@ class Character(Base):
     detail_setting = Column(Text)  # Up to 500 chars
     other_setting = Column(JSON)  # JSON stored as text
     knowledge_base_id = Column(String(100))  # SenseChat knowledge base ID
+    knowledge_hash = Column(String(64))  # SHA-256 of the knowledge content last synced to knowledge_base_id
+    settings_version = Column(Integer, default=0)  # Bumped on every settings change (payload cache key)
     created_at = Column(DateTime, default=datetime.utcnow)
 
     # Relationships
@@ -72,6 +74,18 @@ class Character(Base):
         uselist=False,
         cascade="all, delete-orphan"
     )
+    stats = relationship(
+        "ConversationStats",
+        uselist=False,
+        cascade="all, delete-orphan"
+    )
+
+
+# Message.speaker_role values
+SPEAKER_USER = 0
+SPEAKER_CHARACTER = 1
+SPEAKER_SYSTEM = 2
+SPEAKER_ROLE_NAMES = {SPEAKER_USER: "user", SPEAKER_CHARACTER: "character", SPEAKER_SYSTEM: "system"}
 
 
 class Message(Base):
@@ -81,7 +95,8 @@ class Message(Base):
     message_id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.user_id"), nullable=False)
     character_id = Column(Integer, ForeignKey("characters.character_id"), nullable=False)
-    speaker_name = Column(String(50), nullable=False)  # Who said this message
+    speaker_name = Column(String(50), nullable=False)  # Display name at the time (not for attribution)
+    speaker_role = Column(SmallInteger)  # SPEAKER_USER / SPEAKER_CHARACTER / SPEAKER_SYSTEM; NULL until backfilled
     message_content = Column(Text, nullable=False)
     timestamp = Column(DateTime, default=datetime.utcnow, index=True)
     favorability_level = Column(Integer, default=1)  # 1, 2, or 3
@@ -90,6 +105,15 @@ class Message(Base):
     user = relationship("User", back_populates="messages")
     character = relationship("Character", back_populates="messages")
 
+    __table_args__ = (
+        # Per-character history and aggregation scans
+        Index("ix_messages_character_timestamp", "character_id", "timestamp"),
+        # Keyset pagination of history
+        Index("ix_messages_character_message", "character_id", "message_id"),
+        # Counting and filtering by who spoke
+        Index("ix_messages_character_role", "character_id", "speaker_role"),
+    )
+
 
 class UserPreference(Base):
     """User custom memory/preferences model"""
@@ -114,12 +138,34 @@ class FavorabilityTracking(Base):
     character_id = Column(Integer, ForeignKey("characters.character_id"), nullable=False, unique=True)
     current_level = Column(Integer, default=1)  # 1, 2, or 3
     message_count = Column(Integer, default=0)
+    first_message_at = Column(DateTime, index=True)  # Start of the relationship (anniversaries count from here)
+    last_anniversary_days = Column(Integer)  # Latest anniversary already celebrated (7, 30, ...)
     last_updated = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     # Relationships
     character = relationship("Character", back_populates="favorability")
 
 
+class ConversationStats(Base):
+    """Denormalized per-character conversation statistics (updated on every saved message)"""
+    __tablename__ = "conversation_stats"
+
+    character_id = Column(Integer, ForeignKey("characters.character_id", ondelete="CASCADE"), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.user_id"), nullable=False)
+    total_messages = Column(Integer, default=0)
+    user_messages = Column(Integer, default=0)
+    character_messages = Column(Integer, default=0)
+    first_message_at = Column(DateTime)
+    last_message_at = Column(DateTime)
+    messages_by_day = Column(JSON)  # {"2025-01-31": 12, ...}
+    messages_by_hour = Column(JSON)  # 24 counts, index = hour (UTC)
+    level_progression = Column(JSON)  # [{"message_count": 20, "level": 2, "timestamp": ...}, ...]
+    current_streak = Column(Integer, default=0)  # Consecutive active days ending at last_active_date
+    longest_streak = Column(Integer, default=0)
+    last_active_date = Column(Date)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
 class LineUserMapping(Base):
     """Maps LINE User IDs to internal user IDs for LINE integration"""
     __tablename__ = "line_user_mappings"
@@ -128,13 +174,14 @@ class LineUserMapping(Base):
     line_user_id = Column(String(100), unique=True, nullable=False, index=True)  # LINE's user ID (Uxxxxx)
     user_id = Column(Integer, ForeignKey("users.user_id", ondelete="CASCADE"), nullable=False)
     line_display_name = Column(String(100))  # User's display name from LINE
-    character_id = Column(Integer, ForeignKey("characters.character_id", ondelete="SET NULL"))  # Active character
+    character_id = Column(Integer, ForeignKey("characters.character_id", ondelete="SET NULL"), index=True)  # Active character
 
     # Message limits & premium features
-    daily_message_count = Column(Integer, default=0)  # Reset daily
-    last_message_date = Column(Date, default=date.today)  # Track daily reset
+    daily_message_count = Column(Integer, default=0)  # Reset daily; checked and counted atomically by backend.quota
+    last_message_date = Column(Date, default=date.today)  # Track daily reset (in the user's timezone)
+    timezone = Column(String(50), nullable=True)  # IANA name; NULL = settings.DEFAULT_TIMEZONE
     is_premium = Column(Boolean, default=False)  # Premium subscription status
-    premium_expires_at = Column(DateTime, nullable=True)  # Premium expiry date
+    premium_expires_at = Column(DateTime, nullable=True, index=True)  # Premium expiry date (swept by entitlements)
 
     # Referral system
     referral_count = Column(Integer, default=0)  # Number of friends referred
@@ -142,7 +189,8 @@ class LineUserMapping(Base):
 
     # Timestamps
     created_at = Column(DateTime, default=datetime.utcnow)
-    last_interaction = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    last_interaction = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    last_outreach_at = Column(DateTime, nullable=True)  # Last proactive push (see backend.outreach)
 
     # Relationships
     user = relationship("User", back_populates="line_mappings")
@@ -152,34 +200,256 @@ class LineUserMapping(Base):
         return f"<LineUserMapping(line_user_id='{self.line_user_id}', user_id={self.user_id})>"
 
     def is_unlimited(self):
-        """Check if user has unlimited messages (premium or referrals)"""
+        """Check if user has unlimited messages (unexpired premium or referrals)"""
         from backend.config import settings
-        return self.is_premium or self.referral_count >= settings.REFERRALS_FOR_UNLIMITED
+        premium_active = self.is_premium and (
+            self.premium_expires_at is None or self.premium_expires_at > datetime.utcnow()
+        )
+        return premium_active or (self.referral_count or 0) >= settings.REFERRALS_FOR_UNLIMITED
+
+
+class RateLimitState(Base):
+    """Shared rate limiter state (GCRA theoretical arrival time per bucket)"""
+    __tablename__ = "rate_limit_state"
+
+    bucket_key = Column(String(50), primary_key=True)
+    tat = Column(Float, nullable=False, default=0.0)  # Unix time when the bucket is fully drained
 
-    def can_send_message(self):
-        """Check if user can send a message today"""
-        from backend.config import settings
 
-        # Check if it's a new day - reset counter
-        today = date.today()
-        if self.last_message_date != today:
-            self.daily_message_count = 0
-            self.last_message_date = today
+class ExportJob(Base):
+    """Background bulk export of all of a user's transcripts"""
+    __tablename__ = "export_jobs"
 
-        # Unlimited users can always send
-        if self.is_unlimited():
-            return True
+    job_id = Column(String(32), primary_key=True)  # uuid4 hex
+    user_id = Column(Integer, ForeignKey("users.user_id", ondelete="CASCADE"), nullable=False, index=True)
+    export_format = Column(String(10), nullable=False, default="ndjson")  # json, txt, ndjson
+    compression = Column(String(10), nullable=False, default="gzip")  # gzip, zstd
+    status = Column(String(20), nullable=False, default="pending")  # pending, running, completed, failed
+    character_count = Column(Integer)
+    file_path = Column(String(500))
+    file_size = Column(Integer)
+    error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    started_at = Column(DateTime)
+    heartbeat_at = Column(DateTime)  # Refreshed by the worker while running (see export_jobs.recover_jobs)
+    completed_at = Column(DateTime)
 
-        # Free tier users check daily limit
-        return self.daily_message_count < settings.FREE_MESSAGES_PER_DAY
+
+class KnowledgeFile(Base):
+    """Uploaded SenseChat knowledge file per content hash (shared by characters with identical content)"""
+    __tablename__ = "knowledge_files"
+
+    content_hash = Column(String(64), primary_key=True)  # SHA-256 of the canonical knowledge JSON
+    file_id = Column(String(100), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class KnowledgeRebuildJob(Base):
+    """Batch knowledge base rebuild across all characters (see backend.knowledge_rebuild)"""
+    __tablename__ = "knowledge_rebuild_jobs"
+
+    job_id = Column(String(32), primary_key=True)  # uuid4 hex
+    status = Column(String(20), nullable=False, default="pending")  # pending, running, completed, failed
+    last_character_id = Column(Integer, default=0)  # Checkpoint: every character up to here is done
+    processed = Column(Integer, default=0)
+    created = Column(Integer, default=0)
+    updated = Column(Integer, default=0)
+    unchanged = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+    elapsed_seconds = Column(Float, default=0.0)  # Running time summed over resumes
+    error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    completed_at = Column(DateTime)
+
+
+class BackgroundStory(Base):
+    """Pre-generated background story waiting in the pool (see backend.story_pool)"""
+    __tablename__ = "background_stories"
+
+    story_id = Column(Integer, primary_key=True)
+    pool_key = Column(String(200), nullable=False, index=True)  # personality|age|occupation bucket|interest
+    template = Column(Text, nullable=False)  # Story with {character_name} / {user_name} placeholders
+    created_at = Column(DateTime, default=datetime.utcnow)
 
 
 # Create all tables
 def init_db():
-    """Initialize database tables"""
+    """
+    Initialize database tables
+
+    Migrations run here too unless MIGRATE_ON_STARTUP is off - in production
+    the Procfile runs them once as the release command instead of in every
+    web worker.
+    """
     Base.metadata.create_all(bind=engine)
+    if settings.MIGRATE_ON_STARTUP:
+        migrate()
     print("Database tables created successfully!")
 
 
+def migrate():
+    """
+    Bring an existing database up to date with the models
+
+    Every step checks what is already there, so re-running it - or two
+    processes running it at once - is harmless.
+    """
+    Base.metadata.create_all(bind=engine)
+    _add_missing_columns()
+    # Every run, not just the one that added the column - resumes a backfill cut off mid-way
+    backfill_speaker_roles()
+    _create_missing_indexes()
+
+    from backend import message_search
+    message_search.ensure_index(engine)
+
+
+def _add_missing_columns():
+    """
+    create_all skips columns added to existing tables - ALTER them in
+
+    New columns must be nullable; existing rows get NULL and code treats
+    NULL as the column's default. Each column is added in its own
+    transaction; if the ALTER fails because another process added the
+    column first, that counts as done.
+
+    Returns:
+        (table, column) pairs that were added by this call
+    """
+    from sqlalchemy import inspect, text
+    from sqlalchemy.exc import DBAPIError
+
+    def existing_columns(table_name):
+        return {column["name"] for column in inspect(engine).get_columns(table_name)}
+
+    added = set()
+    for table in Base.metadata.sorted_tables:
+        # Fresh inspection per table - another process may be migrating alongside us
+        if not inspect(engine).has_table(table.name):
+            continue
+        existing = existing_columns(table.name)
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=engine.dialect)
+            try:
+                with engine.begin() as conn:
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+            except DBAPIError:
+                # e.g. "duplicate column" - fine if the column is there now
+                if column.name not in existing_columns(table.name):
+                    raise
+                continue
+            added.add((table.name, column.name))
+            print(f"Added column {table.name}.{column.name}")
+    return added
+
+
+def backfill_speaker_roles(batch_size: int = 10000) -> int:
+    """
+    Set speaker_role on messages written before the column existed
+
+    Usernames never change, so a message whose speaker_name is its user's
+    username was said by the user; anything else - including names of a
+    character since renamed - was said by the character. A speaker_name equal
+    to both keeps the old name-comparison meaning (character). Runs in
+    message_id batches of one transaction each, starting from the oldest
+    unlabeled message, so a re-run after an interruption picks up where it
+    stopped and a run with nothing left to label is a single query.
+
+    Returns:
+        Number of rows updated
+    """
+    from sqlalchemy import text
+
+    with engine.connect() as conn:
+        first_id, max_id = conn.execute(text(
+            "SELECT MIN(message_id), MAX(message_id) FROM messages WHERE speaker_role IS NULL"
+        )).one()
+    if first_id is None:
+        return 0
+
+    updated = 0
+    for start in range(first_id - 1, max_id, batch_size):
+        with engine.begin() as conn:
+            updated += conn.execute(text("""
+                UPDATE messages SET speaker_role = CASE
+                    WHEN speaker_name = (SELECT name FROM characters WHERE characters.character_id = messages.character_id)
+                        THEN :character
+                    WHEN speaker_name = (SELECT username FROM users WHERE users.user_id = messages.user_id)
+                        THEN :user
+                    ELSE :character
+                END
+                WHERE message_id > :start AND message_id <= :end AND speaker_role IS NULL
+            """), {"character": SPEAKER_CHARACTER, "user": SPEAKER_USER, "start": start, "end": start + batch_size}).rowcount
+    print(f"Backfilled speaker_role on {updated} messages")
+    return updated
+
+
+def _create_missing_indexes():
+    """
+    create_all skips indexes on tables that already exist - add any new ones
+
+    Every CREATE is IF NOT EXISTS, and one that fails because another
+    process created the index first counts as done. On Postgres indexes are
+    built CONCURRENTLY, so a large table like messages keeps taking writes,
+    and an invalid index left by an interrupted build is rebuilt.
+    """
+    import re
+    from sqlalchemy import inspect, text
+    from sqlalchemy.exc import DBAPIError
+    from sqlalchemy.schema import CreateIndex
+
+    postgres = engine.dialect.name == "postgresql"
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            ddl = str(CreateIndex(index, if_not_exists=True).compile(dialect=engine.dialect))
+            try:
+                if postgres:
+                    ddl = re.sub(r"^CREATE (UNIQUE )?INDEX", r"CREATE \1INDEX CONCURRENTLY", ddl)
+                    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                        drop_invalid_index(conn, index.name)
+                        conn.execute(text(ddl))
+                else:
+                    with engine.begin() as conn:
+                        conn.execute(text(ddl))
+            except DBAPIError:
+                if index.name not in {existing["name"] for existing in inspect(engine).get_indexes(table.name)}:
+                    raise
+
+
+def drop_invalid_index(conn, name: str) -> bool:
+    """
+    Drop a Postgres index left INVALID by an interrupted CREATE INDEX CONCURRENTLY
+
+    IF NOT EXISTS would skip such an index forever while queries ignore it.
+    conn must be in AUTOCOMMIT mode.
+
+    Returns:
+        True if an invalid index was dropped
+    """
+    from sqlalchemy import text
+
+    invalid = conn.execute(text(
+        "SELECT 1 FROM pg_index JOIN pg_class ON pg_class.oid = pg_index.indexrelid "
+        "WHERE pg_class.relname = :name AND NOT pg_index.indisvalid "
+        # Still being built by another process - not ours to drop
+        "AND NOT EXISTS (SELECT 1 FROM pg_stat_progress_create_index p WHERE p.index_relid = pg_index.indexrelid)"
+    ), {"name": name}).first()
+    if invalid is None:
+        return False
+    conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"'))
+    print(f"Dropped invalid index {name}")
+    return True
+
+
 if __name__ == "__main__":
-    init_db()
+    import sys
+
+    if "--backfill-speaker-roles" in sys.argv:
+        backfill_speaker_roles()
+    elif "--migrate" in sys.argv:
+        migrate()
+    else:
+        init_db()
@@ -0,0 +1,191 @@
+"""
+Entitlements - Premium / unlimited-messaging checks
+Premium is valid only until premium_expires_at, independent of whether
+Stripe's cancellation webhook ever arrives. A periodic sweeper flips expired
+rows to is_premium = False in one indexed UPDATE, and a per-process cache
+keyed by line_user_id answers entitlement checks without touching the DB.
+
+Run one sweep manually (e.g. from Heroku Scheduler) with:
+    python -m backend.entitlements
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import logging
+import threading
+import time
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from backend.config import settings
+from backend.database import LineUserMapping
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Entitlement:
+    """Snapshot of what a LINE user is entitled to"""
+    is_premium: bool
+    premium_expires_at: Optional[datetime]
+    referral_count: int
+
+    @classmethod
+    def from_mapping(cls, mapping: LineUserMapping) -> "Entitlement":
+        return cls(
+            is_premium=bool(mapping.is_premium),
+            premium_expires_at=mapping.premium_expires_at,
+            referral_count=mapping.referral_count or 0
+        )
+
+    def premium_active(self, now: Optional[datetime] = None) -> bool:
+        """Premium flag set and not past its expiry"""
+        if not self.is_premium:
+            return False
+        if self.premium_expires_at is None:
+            return True
+        return self.premium_expires_at > (now or datetime.utcnow())
+
+    def is_unlimited(self, now: Optional[datetime] = None) -> bool:
+        """Unlimited messages through premium or enough referrals"""
+        return self.premium_active(now) or self.referral_count >= settings.REFERRALS_FOR_UNLIMITED
+
+
+class EntitlementCache:
+    """
+    Per-process entitlement cache keyed by line_user_id
+
+    The TTL bounds how long another worker can serve a stale entitlement
+    after a Stripe webhook invalidated it in this one.
+    """
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._entries: Dict[str, Tuple[float, Entitlement]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, line_user_id: str) -> Optional[Entitlement]:
+        with self._lock:
+            entry = self._entries.get(line_user_id)
+            if entry and entry[0] > time.monotonic():
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, line_user_id: str, entitlement: Entitlement):
+        with self._lock:
+            self._entries[line_user_id] = (time.monotonic() + self.ttl_seconds, entitlement)
+
+    def invalidate(self, line_user_id: str):
+        with self._lock:
+            self._entries.pop(line_user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_cache: Optional[EntitlementCache] = None
+
+
+def get_cache() -> EntitlementCache:
+    """Get or create the process-wide entitlement cache"""
+    global _cache
+
+    if _cache is None:
+        _cache = EntitlementCache(settings.ENTITLEMENT_CACHE_TTL_SECONDS)
+    return _cache
+
+
+def get_entitlement(db: Session, line_user_id: str, mapping: Optional[LineUserMapping] = None) -> Optional[Entitlement]:
+    """
+    Entitlement for a LINE user, from the cache when possible
+
+    Args:
+        db: Database session (only used on a cache miss without a mapping)
+        line_user_id: LINE user ID
+        mapping: Already-loaded mapping to build from on a miss
+
+    Returns:
+        Entitlement, or None if the user has no mapping
+    """
+    cache = get_cache()
+    entitlement = cache.get(line_user_id)
+    if entitlement is not None:
+        return entitlement
+
+    if mapping is None:
+        mapping = db.query(LineUserMapping).filter(
+            LineUserMapping.line_user_id == line_user_id
+        ).first()
+        if mapping is None:
+            return None
+
+    entitlement = Entitlement.from_mapping(mapping)
+    cache.put(line_user_id, entitlement)
+    return entitlement
+
+
+def invalidate(line_user_id: str):
+    """Drop a cached entitlement (call after changing premium or referral state)"""
+    get_cache().invalidate(line_user_id)
+
+
+def expire_premium(db: Session, now: Optional[datetime] = None) -> List[str]:
+    """
+    Turn off premium for every mapping past premium_expires_at
+
+    One UPDATE over the premium_expires_at index; rows without an expiry
+    are never touched.
+
+    Returns:
+        LINE user IDs that were expired
+    """
+    now = now or datetime.utcnow()
+    result = db.execute(
+        update(LineUserMapping)
+        .where(
+            LineUserMapping.premium_expires_at < now,
+            LineUserMapping.is_premium.is_(True)
+        )
+        # Keep last_interaction as-is - it's onupdate=utcnow and means "user wrote"
+        .values(is_premium=False, last_interaction=LineUserMapping.last_interaction)
+        .returning(LineUserMapping.line_user_id)
+        .execution_options(synchronize_session=False)
+    )
+    expired = [row[0] for row in result]
+    db.commit()
+
+    for line_user_id in expired:
+        invalidate(line_user_id)
+    if expired:
+        logger.info(f"Expired premium for {len(expired)} users")
+    return expired
+
+
+def sweep():
+    """Scheduler entry point - runs expire_premium on its own session"""
+    from backend.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        expire_premium(db)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    from backend.database import SessionLocal, init_db
+
+    logging.basicConfig(level=logging.INFO)
+    init_db()
+    session = SessionLocal()
+    try:
+        expired_users = expire_premium(session)
+        print(f"✅ Expired premium for {len(expired_users)} users")
+    finally:
+        session.close()
@@ -0,0 +1,416 @@
+"""
+Export Jobs - Background bulk export of all of a user's transcripts
+A job enumerates the user's characters and streams every transcript into one
+compressed tar archive on local disk, off the request path. Job state lives in
+the export_jobs table so any web worker can answer status polls.
+
+The worker pool is in-process, so a restart drops its queue. recover_jobs
+(on startup and then periodically) requeues pending jobs this process isn't
+already holding - a job is claimed with one conditional UPDATE, so a job
+queued by two workers still runs once - and fails running jobs whose
+heartbeat is older than EXPORT_JOB_STALE_MINUTES, so clients stop polling a
+job nobody is working on. A long export stays alive: its worker refreshes
+heartbeat_at between characters.
+
+zstd archives need the optional 'zstandard' package; gzip always works.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, List, Optional, Set, Tuple
+import json
+import logging
+import re
+import tarfile
+import tempfile
+import threading
+import time
+import uuid
+
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session
+
+from backend.config import settings
+from backend.database import SessionLocal, ExportJob, Character, FavorabilityTracking
+from backend import conversation_export, conversation_stats
+
+logger = logging.getLogger(__name__)
+
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_COMPLETED = "completed"
+STATUS_FAILED = "failed"
+
+COMPRESSIONS = {
+    "gzip": ("tar.gz", "application/gzip"),
+    "zstd": ("tar.zst", "application/zstd"),
+}
+
+# Transcripts are spooled to disk above this size before going into the tar
+SPOOL_MAX_BYTES = 8 * 1024 * 1024
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+# Jobs queued on or running in this process's pool - recover_jobs leaves them alone
+_active: Set[str] = set()
+_active_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Get or create the process-wide export worker pool"""
+    global _executor
+
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.EXPORT_JOB_WORKERS,
+            thread_name_prefix="export-job"
+        )
+    return _executor
+
+
+def _enqueue(job_id: str) -> bool:
+    """Queue a job on this process's pool unless it is already queued or running here"""
+    with _active_lock:
+        if job_id in _active:
+            return False
+        _active.add(job_id)
+    get_executor().submit(run_export_job, job_id)
+    return True
+
+
+def zstd_available() -> bool:
+    """True if the optional zstandard package is installed"""
+    try:
+        import zstandard  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def export_dir() -> Path:
+    path = Path(settings.EXPORT_DIR)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def submit_export_job(
+    db: Session,
+    user_id: int,
+    export_format: str = "ndjson",
+    compression: str = "gzip"
+) -> ExportJob:
+    """
+    Create an export job and queue it on the worker pool
+
+    Args:
+        db: Database session
+        user_id: User whose characters are exported
+        export_format: Transcript format inside the archive ('json', 'txt' or 'ndjson')
+        compression: 'gzip' or 'zstd'
+
+    Returns:
+        The pending ExportJob
+
+    Raises:
+        ValueError: Unknown format/compression, or zstd requested without zstandard installed
+    """
+    if export_format not in conversation_export.EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {export_format}")
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unsupported compression: {compression}")
+    if compression == "zstd" and not zstd_available():
+        raise ValueError("zstd compression requires the 'zstandard' package")
+
+    job = ExportJob(
+        job_id=uuid.uuid4().hex,
+        user_id=user_id,
+        export_format=export_format,
+        compression=compression,
+        status=STATUS_PENDING
+    )
+    db.add(job)
+    db.commit()
+
+    _enqueue(job.job_id)
+    logger.info(f"Queued export job {job.job_id} for user {user_id} ({export_format}, {compression})")
+    return job
+
+
+def _safe_name(name: str) -> str:
+    """Archive member name without path separators or control characters"""
+    return re.sub(r'[\\/:*?"<>|\x00-\x1f]', "_", name or "character")
+
+
+def _open_archive(path: Path, compression: str):
+    """
+    Open a streaming tar writer
+
+    Returns:
+        (tarfile, raw_file, compressor_stream_or_None) - close in reverse order
+    """
+    raw = open(path, "wb")
+    if compression == "zstd":
+        import zstandard
+        stream = zstandard.ZstdCompressor(level=settings.EXPORT_ZSTD_LEVEL).stream_writer(raw)
+        return tarfile.open(fileobj=stream, mode="w|"), raw, stream
+    return tarfile.open(fileobj=raw, mode="w|gz"), raw, None
+
+
+def _add_member(archive: tarfile.TarFile, name: str, chunks):
+    """Write an iterable of byte chunks as one archive member (size must be known up front)"""
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES) as spool:
+        for chunk in chunks:
+            spool.write(chunk)
+        info = tarfile.TarInfo(name)
+        info.size = spool.tell()
+        info.mtime = int(datetime.utcnow().timestamp())
+        spool.seek(0)
+        archive.addfile(info, spool)
+
+
+def write_archive(
+    db: Session,
+    user_id: int,
+    path: Path,
+    export_format: str,
+    compression: str,
+    heartbeat: Optional[Callable[[], None]] = None
+) -> int:
+    """
+    Stream every transcript of a user into a compressed tar archive
+
+    Args:
+        heartbeat: Called after each character, to show the job is still alive
+
+    Returns:
+        Number of characters exported
+    """
+    characters = db.query(Character).filter(
+        Character.user_id == user_id
+    ).order_by(Character.character_id).all()
+
+    manifest = {
+        "user_id": user_id,
+        "export_date": datetime.now().isoformat(),
+        "format": export_format,
+        "characters": []
+    }
+
+    archive, raw, stream = _open_archive(path, compression)
+    try:
+        for character in characters:
+            favorability = db.query(FavorabilityTracking).filter(
+                FavorabilityTracking.character_id == character.character_id
+            ).first()
+            stats = conversation_stats.get_stats(db, character.character_id)
+            header = conversation_export.build_header(character, favorability, stats)
+
+            extension = conversation_export.EXPORT_FORMATS[export_format][1]
+            member = f"{character.character_id}_{_safe_name(character.name)}.{extension}"
+            _add_member(archive, member, conversation_export.stream_export(db, header, export_format))
+
+            manifest["characters"].append({
+                "character_id": character.character_id,
+                "name": character.name,
+                "file": member,
+                "total_messages": header["total_messages"]
+            })
+            if heartbeat:
+                heartbeat()
+
+        _add_member(archive, "manifest.json", [json.dumps(manifest, ensure_ascii=False, indent=2).encode("utf-8")])
+    finally:
+        archive.close()
+        if stream is not None:
+            stream.close()
+        raw.close()
+
+    return len(characters)
+
+
+def _beat(job_id: str):
+    """Refresh heartbeat_at on a separate session, leaving the export's reads undisturbed"""
+    try:
+        with SessionLocal() as db:
+            db.execute(update(ExportJob).where(ExportJob.job_id == job_id).values(heartbeat_at=datetime.utcnow()))
+            db.commit()
+    except Exception as e:
+        logger.warning(f"Export job {job_id} heartbeat failed: {e}")
+
+
+def run_export_job(job_id: str):
+    """Worker entry point - runs one job on its own session"""
+    db = SessionLocal()
+    try:
+        # Claim the job - another worker may have queued it too (see recover_jobs)
+        now = datetime.utcnow()
+        claimed = db.execute(
+            update(ExportJob)
+            .where(ExportJob.job_id == job_id, ExportJob.status == STATUS_PENDING)
+            .values(status=STATUS_RUNNING, started_at=now, heartbeat_at=now)
+        ).rowcount
+        db.commit()
+        job = db.get(ExportJob, job_id) if claimed else None
+        if job is None:
+            return
+
+        last_beat = time.monotonic()
+
+        def heartbeat():
+            nonlocal last_beat
+            if time.monotonic() - last_beat >= settings.EXPORT_JOB_HEARTBEAT_SECONDS:
+                _beat(job_id)
+                last_beat = time.monotonic()
+
+        extension = COMPRESSIONS[job.compression][0]
+        path = export_dir() / f"{job.job_id}.{extension}"
+        try:
+            job.character_count = write_archive(
+                db, job.user_id, path, job.export_format, job.compression, heartbeat
+            )
+            job.file_path = str(path)
+            job.file_size = path.stat().st_size
+            job.status = STATUS_COMPLETED
+            logger.info(f"Export job {job_id} finished: {job.character_count} characters, {job.file_size} bytes")
+        except Exception as e:
+            logger.error(f"Export job {job_id} failed: {e}", exc_info=True)
+            db.rollback()
+            path.unlink(missing_ok=True)
+            job.status = STATUS_FAILED
+            job.error = str(e)[:500]
+
+        job.completed_at = datetime.utcnow()
+        db.commit()
+    finally:
+        db.close()
+        with _active_lock:
+            _active.discard(job_id)
+
+
+def recover_jobs(db: Session, now: Optional[datetime] = None) -> Tuple[List[str], List[str]]:
+    """
+    Requeue pending jobs and fail running ones whose worker has gone quiet
+
+    Jobs queued or running in this process are skipped: they are neither
+    queued again nor failed.
+
+    Args:
+        db: Database session
+        now: Current UTC time (for tests)
+
+    Returns:
+        (requeued job IDs, failed job IDs)
+    """
+    now = now or datetime.utcnow()
+    stale_before = now - timedelta(minutes=settings.EXPORT_JOB_STALE_MINUTES)
+
+    with _active_lock:
+        active = set(_active)
+
+    # Rows from before heartbeat_at existed fall back to started_at
+    last_seen = func.coalesce(ExportJob.heartbeat_at, ExportJob.started_at)
+    stale = [job_id for (job_id,) in db.query(ExportJob.job_id).filter(
+        ExportJob.status == STATUS_RUNNING,
+        last_seen < stale_before
+    ) if job_id not in active]
+    if stale:
+        db.execute(
+            update(ExportJob)
+            .where(ExportJob.job_id.in_(stale), ExportJob.status == STATUS_RUNNING, last_seen < stale_before)
+            .values(status=STATUS_FAILED, error="Interrupted by a server restart - please export again",
+                    completed_at=now)
+        )
+        db.commit()
+        logger.warning(f"Failed {len(stale)} export jobs interrupted by a restart")
+
+    pending = [job_id for (job_id,) in db.query(ExportJob.job_id).filter(
+        ExportJob.status == STATUS_PENDING
+    ).order_by(ExportJob.created_at)]
+    requeued = [job_id for job_id in pending if _enqueue(job_id)]
+    return requeued, stale
+
+
+def sweep():
+    """Scheduler entry point - runs recover_jobs on its own session"""
+    db = SessionLocal()
+    try:
+        recover_jobs(db)
+    finally:
+        db.close()
+
+
+def cleanup_expired_jobs(db: Session) -> int:
+    """
+    Delete archives and rows of finished jobs older than EXPORT_RETENTION_HOURS
+
+    Pending and running jobs are kept - their worker still writes to the row.
+
+    Returns:
+        Number of jobs removed
+    """
+    cutoff = datetime.utcnow() - timedelta(hours=settings.EXPORT_RETENTION_HOURS)
+    expired = db.query(ExportJob).filter(
+        ExportJob.created_at < cutoff,
+        ExportJob.status.in_((STATUS_COMPLETED, STATUS_FAILED))
+    ).all()
+    for job in expired:
+        if job.file_path:
+            Path(job.file_path).unlink(missing_ok=True)
+        db.delete(job)
+    db.commit()
+    return len(expired)
+
+
+def download_name(job: ExportJob) -> str:
+    """Filename offered to the browser"""
+    extension = COMPRESSIONS[job.compression][0]
+    return f"對話記錄_{job.user_id}_{job.created_at.strftime('%Y%m%d_%H%M%S')}.{extension}"
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range HTTP Range header
+
+    Args:
+        header: Range header value, e.g. 'bytes=0-1023', 'bytes=1024-' or 'bytes=-500'
+        size: File size in bytes
+
+    Returns:
+        (start, end) inclusive, or None to send the whole file
+
+    Raises:
+        ValueError: Range cannot be satisfied (respond 416)
+    """
+    if not header:
+        return None
+
+    match = re.fullmatch(r"\s*bytes=(\d*)-(\d*)\s*", header)
+    if not match or (not match.group(1) and not match.group(2)):
+        # Multiple or malformed ranges - RFC 9110 allows ignoring the header
+        return None
+
+    start_text, end_text = match.groups()
+    if start_text:
+        start = int(start_text)
+        end = min(int(end_text), size - 1) if end_text else size - 1
+    else:
+        # Suffix range: the last N bytes
+        start = max(size - int(end_text), 0)
+        end = size - 1
+
+    if start >= size or start > end:
+        raise ValueError(f"Range {header} not satisfiable for {size} bytes")
+    return start, end
+
+
+def iter_file(path: str, start: int, end: int, chunk_size: int = 64 * 1024):
+    """Yield bytes start..end (inclusive) of a file"""
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            data = f.read(min(chunk_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
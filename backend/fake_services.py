@@ -0,0 +1,203 @@
+"""
+Local fake SenseChat and LINE API servers
+Used by load tests and dry runs to measure our own overhead without touching real services
+
+Both servers speak the same request/response shapes that SenseChatClient and
+LineClient rely on, and inject configurable latency and errors.
+Point the app at them with:
+    API_BASE_URL=<FakeSenseChatServer.base_url>
+    LINE_API_ENDPOINT=<FakeLineServer.base_url>
+"""
+import json
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+
+@dataclass
+class FaultProfile:
+    """Latency and error distribution for a fake endpoint"""
+    latency_median_ms: float = 0.0  # Median response latency
+    latency_sigma: float = 0.0  # Log-normal spread (0 = constant latency)
+    error_rate: float = 0.0  # Fraction of requests that fail
+    error_status: int = 500  # HTTP status returned for failed requests
+
+    def sample_latency(self) -> float:
+        """Return a latency in seconds drawn from the log-normal distribution"""
+        if self.latency_median_ms <= 0:
+            return 0.0
+        if self.latency_sigma <= 0:
+            return self.latency_median_ms / 1000.0
+        return random.lognormvariate(0, self.latency_sigma) * self.latency_median_ms / 1000.0
+
+    def should_fail(self) -> bool:
+        return self.error_rate > 0 and random.random() < self.error_rate
+
+
+class _FakeServer:
+    """Threaded HTTP server running in a daemon thread on a free local port"""
+
+    def __init__(self, profile: Optional[FaultProfile] = None):
+        self.profile = profile or FaultProfile()
+        self.request_count = 0
+        self.error_count = 0
+        self._lock = threading.Lock()
+        self._httpd = None
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _handle(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+
+                with server._lock:
+                    server.request_count += 1
+
+                time.sleep(server.profile.sample_latency())
+
+                if server.profile.should_fail():
+                    with server._lock:
+                        server.error_count += 1
+                    status, payload = server.profile.error_status, {"message": "Injected failure", "details": []}
+                else:
+                    status, payload = server.route(self.command, self.path, self.headers, body)
+
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.send_header("X-Line-Request-Id", uuid.uuid4().hex)
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = _handle
+            do_POST = _handle
+            do_PUT = _handle
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def route(self, method: str, path: str, headers, body: bytes):
+        raise NotImplementedError
+
+
+class FakeSenseChatServer(_FakeServer):
+    """
+    Fake SenseChat-Character-Pro API
+
+    Serves the character chat, knowledge file and knowledge base endpoints
+    used by SenseChatClient.
+    """
+
+    DEFAULT_REPLIES = [
+        "(輕輕笑了笑)今天過得怎麼樣呀？想聽你說說~ 💕",
+        "(歪著頭看著你)真的嗎？那後來呢？快告訴我！",
+        "(托著下巴想了想)嗯…我覺得你說得很有道理呢 ✨",
+    ]
+
+    def __init__(self, profile: Optional[FaultProfile] = None, replies: Optional[List[str]] = None):
+        super().__init__(profile)
+        self.replies = replies or self.DEFAULT_REPLIES
+        self.chat_requests: List[Dict] = []
+
+    def route(self, method, path, headers, body):
+        if method == "POST" and path.endswith("/character/chat-completions"):
+            payload = json.loads(body or b"{}")
+            with self._lock:
+                self.chat_requests.append(payload)
+            return 200, {
+                "data": {
+                    "id": uuid.uuid4().hex,
+                    "reply": random.choice(self.replies),
+                    "choices": [],
+                    "usage": {"prompt_tokens": 100, "completion_tokens": 30, "total_tokens": 130}
+                }
+            }
+
+        if method == "POST" and path.endswith("/v1/files"):
+            return 200, {"id": f"file-{uuid.uuid4().hex[:12]}"}
+
+        if method == "POST" and path.endswith("/v1/knowledge-base"):
+            return 200, {"knowledge_base": {"id": f"kb-{uuid.uuid4().hex[:12]}"}}
+
+        if method == "PUT" and "/v1/knowledge-base/" in path:
+            return 200, {}
+
+        return 404, {"message": f"Unknown endpoint {method} {path}"}
+
+
+class FakeLineServer(_FakeServer):
+    """
+    Fake LINE Messaging API
+
+    Serves reply, push, multicast and profile endpoints used by LineClient, and
+    records when each reply token was answered so load tests can measure
+    end-to-end latency.
+    """
+
+    def __init__(self, profile: Optional[FaultProfile] = None):
+        super().__init__(profile)
+        self.replies: Dict[str, Dict] = {}  # reply_token -> {"time": ..., "messages": [...]}
+        self.pushes: List[Dict] = []
+        self._reply_events: Dict[str, threading.Event] = {}
+
+    def expect_reply(self, reply_token: str) -> threading.Event:
+        """Register a reply token and get an event that fires when it is answered"""
+        with self._lock:
+            return self._reply_events.setdefault(reply_token, threading.Event())
+
+    def route(self, method, path, headers, body):
+        if method == "POST" and path == "/v2/bot/message/reply":
+            payload = json.loads(body)
+            token = payload["replyToken"]
+            with self._lock:
+                self.replies[token] = {"time": time.perf_counter(), "messages": payload["messages"]}
+                event = self._reply_events.setdefault(token, threading.Event())
+            event.set()
+            return 200, {}
+
+        if method == "POST" and path in ("/v2/bot/message/push", "/v2/bot/message/multicast"):
+            payload = json.loads(body)
+            with self._lock:
+                self.pushes.append(payload)
+            return 200, {}
+
+        if method == "GET" and path.startswith("/v2/bot/profile/"):
+            user_id = path.rsplit("/", 1)[-1]
+            return 200, {
+                "userId": user_id,
+                "displayName": f"測試用戶{user_id[-4:]}",
+                "pictureUrl": "https://example.com/profile.png",
+                "statusMessage": ""
+            }
+
+        return 404, {"message": f"Unknown endpoint {method} {path}", "details": []}
@@ -1,24 +1,99 @@
 """
 Knowledge Base Management for SenseChat API
 Handles creation and management of knowledge bases for characters
+
+Knowledge content is content-addressed: each character stores the SHA-256 of
+the canonical JSON it last synced, so an unchanged rebuild makes no remote
+calls, and uploaded files are remembered per hash (knowledge_files table) so
+characters with identical content share one file.
 """
 import json
 import io
-from typing import Dict, List, Optional
+import hashlib
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
 from backend.api_client import SenseChatClient
+from backend.rate_limiter import PRIORITY_FREE
+from backend.database import Character, KnowledgeFile
+from backend import metrics
+
+metrics.describe("knowledge_base_syncs_total", "Character knowledge base syncs by result (created, updated, unchanged, failed)")
+metrics.describe("knowledge_files_total", "Knowledge files needed by source (uploaded, reused)")
+
+
+def content_hash(content: Dict) -> str:
+    """SHA-256 of the canonical JSON form of knowledge content"""
+    canonical = json.dumps(content, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def preferences_dict(rows: Iterable[Tuple[str, Any]]) -> Dict:
+    """
+    Build the preferences dict from (category, content) rows
+
+    The first row of each category wins (rows in preference_id order).
+    """
+    preferences = {}
+    for category, content in rows:
+        if category not in preferences:
+            preferences[category] = content
+    return preferences
 
 
 class KnowledgeBaseManager:
     """Manages knowledge base operations for SenseChat API"""
 
-    def __init__(self, api_client: SenseChatClient):
+    def __init__(self, api_client: SenseChatClient, db: Optional[Session] = None, priority: int = PRIORITY_FREE):
         """
         Initialize knowledge base manager
 
         Args:
             api_client: SenseChat API client instance
+            db: Database session for the hash -> file id cache (None = always upload)
+            priority: Rate limiter queue priority of the remote calls
         """
         self.api_client = api_client
+        self.db = db
+        self.priority = priority
+
+    def sync_character_knowledge(self, character: Character, user_preferences: Dict) -> Optional[str]:
+        """
+        Create or update a character's knowledge base, skipping unchanged content
+
+        Sets character.knowledge_base_id and knowledge_hash; the caller commits.
+
+        Args:
+            character: Character to sync (its detail_setting is the background info)
+            user_preferences: User's custom memory and preferences
+
+        Returns:
+            "created", "updated" or "unchanged"; None on failure
+        """
+        content = self._build_knowledge_content(character.name, user_preferences, character.detail_setting)
+        digest = content_hash(content)
+
+        if character.knowledge_base_id and character.knowledge_hash == digest:
+            result = "unchanged"
+        elif character.knowledge_base_id:
+            updated = self._with_file(content, digest, lambda file_id: self._update_knowledge_base(
+                knowledge_base_id=character.knowledge_base_id, file_id=file_id
+            ))
+            result = "updated" if updated else None
+        else:
+            knowledge_base_id = self._with_file(content, digest, lambda file_id: self._create_knowledge_base(
+                file_id=file_id, description=f"知識庫 - {character.name}"
+            ))
+            if knowledge_base_id:
+                character.knowledge_base_id = knowledge_base_id
+            result = "created" if knowledge_base_id else None
+
+        metrics.increment("knowledge_base_syncs_total", result=result or "failed")
+        if result:
+            character.knowledge_hash = digest
+        return result
 
     def create_character_knowledge(
         self,
@@ -45,19 +120,13 @@ class KnowledgeBaseManager:
                 background_info
             )
 
-            # Create file with knowledge content
-            file_id = self._create_knowledge_file(knowledge_content)
-            if not file_id:
-                return None
-
-            # Create knowledge base with the file
-            knowledge_base_id = self._create_knowledge_base(
-                file_id=file_id,
-                description=f"知識庫 - {character_name}"
+            # Create knowledge base with a file holding the content
+            return self._with_file(
+                knowledge_content,
+                content_hash(knowledge_content),
+                lambda file_id: self._create_knowledge_base(file_id=file_id, description=f"知識庫 - {character_name}")
             )
 
-            return knowledge_base_id
-
         except Exception as e:
             print(f"Error creating knowledge base: {e}")
             import traceback
@@ -91,16 +160,12 @@ class KnowledgeBaseManager:
                 background_info
             )
 
-            # Create new file
-            file_id = self._create_knowledge_file(knowledge_content)
-            if not file_id:
-                return False
-
-            # Update knowledge base
-            return self._update_knowledge_base(
-                knowledge_base_id=knowledge_base_id,
-                file_id=file_id
-            )
+            # Point the knowledge base at a file holding the content
+            return bool(self._with_file(
+                knowledge_content,
+                content_hash(knowledge_content),
+                lambda file_id: self._update_knowledge_base(knowledge_base_id=knowledge_base_id, file_id=file_id)
+            ))
 
         except Exception as e:
             print(f"Error updating knowledge base: {e}")
@@ -188,6 +253,54 @@ class KnowledgeBaseManager:
             "text_lst": text_lst
         }
 
+    def _with_file(self, content: Dict, digest: str, use: Callable[[str], Any]) -> Any:
+        """
+        Run use(file_id) with a file holding the content
+
+        Reuses the file already uploaded for this hash; if the remote call fails
+        with a reused file (e.g. deleted on the SenseChat side), the cache entry
+        is dropped and the content uploaded again once.
+
+        Returns:
+            use's result, or None if no file could be uploaded
+        """
+        file_id = self._cached_file_id(digest)
+        if file_id:
+            metrics.increment("knowledge_files_total", source="reused")
+            result = use(file_id)
+            if result:
+                return result
+            self._forget_file(digest)
+
+        file_id = self._create_knowledge_file(content)
+        if not file_id:
+            return None
+        metrics.increment("knowledge_files_total", source="uploaded")
+        self._remember_file(digest, file_id)
+        return use(file_id)
+
+    def _cached_file_id(self, digest: str) -> Optional[str]:
+        if self.db is None:
+            return None
+        cached = self.db.get(KnowledgeFile, digest)
+        return cached.file_id if cached else None
+
+    def _remember_file(self, digest: str, file_id: str):
+        if self.db is None:
+            return
+        try:
+            self.db.add(KnowledgeFile(content_hash=digest, file_id=file_id))
+            self.db.commit()
+        except IntegrityError:
+            # Another worker uploaded the same content first - either file works
+            self.db.rollback()
+
+    def _forget_file(self, digest: str):
+        if self.db is None:
+            return
+        self.db.query(KnowledgeFile).filter(KnowledgeFile.content_hash == digest).delete()
+        self.db.commit()
+
     def _create_knowledge_file(self, content: Dict) -> Optional[str]:
         """
         Create and upload a knowledge base file
@@ -208,7 +321,8 @@ class KnowledgeBaseManager:
             # Upload file using API client
             response = self.api_client.create_knowledge_file(
                 file=file_obj,
-                description="Character knowledge base"
+                description="Character knowledge base",
+                priority=self.priority
             )
 
             if response.get("success") and "file_id" in response:
@@ -238,7 +352,8 @@ class KnowledgeBaseManager:
         try:
             response = self.api_client.create_knowledge_base(
                 file_ids=[file_id],
-                description=description
+                description=description,
+                priority=self.priority
             )
 
             if response.get("success") and "knowledge_base_id" in response:
@@ -268,7 +383,8 @@ class KnowledgeBaseManager:
         try:
             response = self.api_client.update_knowledge_base(
                 knowledge_base_id=knowledge_base_id,
-                file_ids=[file_id]
+                file_ids=[file_id],
+                priority=self.priority
             )
 
             return response.get("success", False)
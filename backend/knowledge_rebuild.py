@@ -0,0 +1,290 @@
+"""
+Knowledge Rebuild - Batch knowledge base sync across every character
+Used after a preference schema change. Characters are read in pages of
+KNOWLEDGE_REBUILD_PAGE_SIZE together with their UserPreference rows (one
+grouped query per page) and synced on a bounded thread pool. Each character
+is retried with backoff, and its remote calls queue behind user traffic in
+the SenseChat rate limiter (PRIORITY_BATCH).
+
+Progress is checkpointed in the knowledge_rebuild_jobs table as the highest
+character id below which everything is done, so an interrupted job resumes
+where it stopped. Failed characters are counted and passed, not revisited: a
+completed job cannot be run again. To retry failures, start a new job -
+unchanged characters cost no remote calls (content hash, see
+backend.knowledge_base), so it only pays for the ones that still differ.
+
+Start a rebuild (also the way to retry a finished job's failures), or resume
+an interrupted one, with:
+    python -m backend.knowledge_rebuild [--workers 8]
+    python -m backend.knowledge_rebuild --resume <job_id>
+"""
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import datetime
+from itertools import groupby
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+import argparse
+import logging
+import time
+import uuid
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from backend.config import settings
+from backend.database import SessionLocal, Character, UserPreference, KnowledgeRebuildJob
+from backend.api_client import SenseChatClient
+from backend.knowledge_base import KnowledgeBaseManager, preferences_dict
+from backend.rate_limiter import PRIORITY_BATCH
+from backend import metrics
+
+logger = logging.getLogger(__name__)
+
+metrics.describe("knowledge_rebuild_characters_total", "Characters processed by rebuild jobs, by result")
+
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_COMPLETED = "completed"
+STATUS_FAILED = "failed"
+
+RESULTS = ("created", "updated", "unchanged", "failed")
+
+# First retry delay; doubles per attempt
+RETRY_BACKOFF_SECONDS = 0.5
+
+
+def create_job(db: Session) -> KnowledgeRebuildJob:
+    """Create a pending rebuild job starting from the first character"""
+    job = KnowledgeRebuildJob(job_id=uuid.uuid4().hex, status=STATUS_PENDING, last_character_id=0)
+    db.add(job)
+    db.commit()
+    return job
+
+
+def load_page(db: Session, after: int, limit: int) -> List[Tuple[Character, Dict]]:
+    """
+    Next characters after a checkpoint with their preferences, in one query
+
+    Returns:
+        (character, preferences) pairs in character_id order; the characters are
+        detached snapshots, safe to hand to worker threads
+    """
+    page = select(Character.character_id).where(
+        Character.character_id > after
+    ).order_by(Character.character_id).limit(limit).subquery()
+
+    rows = db.query(
+        Character.character_id,
+        Character.name,
+        Character.detail_setting,
+        Character.knowledge_base_id,
+        Character.knowledge_hash,
+        UserPreference.category,
+        UserPreference.content
+    ).join(
+        page, page.c.character_id == Character.character_id
+    ).outerjoin(
+        UserPreference, UserPreference.user_id == Character.user_id
+    ).order_by(Character.character_id, UserPreference.preference_id).all()
+
+    characters = []
+    for character_id, group in groupby(rows, key=lambda row: row.character_id):
+        group = list(group)
+        first = group[0]
+        character = Character(
+            character_id=character_id,
+            name=first.name,
+            detail_setting=first.detail_setting,
+            knowledge_base_id=first.knowledge_base_id,
+            knowledge_hash=first.knowledge_hash
+        )
+        preferences = preferences_dict((row.category, row.content) for row in group if row.category is not None)
+        characters.append((character, preferences))
+    return characters
+
+
+def rebuild_character(
+    api_client: SenseChatClient,
+    character: Character,
+    preferences: Dict,
+    session_factory: Callable[[], Session] = SessionLocal,
+    max_attempts: Optional[int] = None
+) -> str:
+    """
+    Worker entry point - sync one character's knowledge base with retries
+
+    Returns:
+        "created", "updated", "unchanged" or "failed"
+    """
+    max_attempts = max_attempts or settings.KNOWLEDGE_REBUILD_MAX_ATTEMPTS
+    db = session_factory()
+    try:
+        manager = KnowledgeBaseManager(api_client, db, priority=PRIORITY_BATCH)
+        for attempt in range(max_attempts):
+            result = manager.sync_character_knowledge(character, preferences)
+            if result:
+                break
+            if attempt + 1 < max_attempts:
+                time.sleep(RETRY_BACKOFF_SECONDS * 2 ** attempt)
+        else:
+            return "failed"
+
+        if result != "unchanged":
+            db.execute(
+                update(Character)
+                .where(Character.character_id == character.character_id)
+                .values(knowledge_base_id=character.knowledge_base_id, knowledge_hash=character.knowledge_hash)
+            )
+            db.commit()
+        return result
+
+    except Exception as e:
+        logger.error(f"Knowledge rebuild failed for character {character.character_id}: {e}", exc_info=True)
+        return "failed"
+    finally:
+        db.close()
+
+
+def _checkpoint(db: Session, job: KnowledgeRebuildJob, last_character_id: int, counts: Counter, elapsed: float):
+    job.last_character_id = last_character_id
+    for result in RESULTS:
+        setattr(job, result, counts[result])
+    job.processed = sum(counts[result] for result in RESULTS)
+    job.elapsed_seconds = elapsed
+    db.commit()
+
+
+def report(job: KnowledgeRebuildJob) -> Dict:
+    """Throughput summary of a job"""
+    seconds = job.elapsed_seconds or 0.0
+    return {
+        "job_id": job.job_id,
+        "status": job.status,
+        "processed": job.processed or 0,
+        **{result: getattr(job, result) or 0 for result in RESULTS},
+        "seconds": round(seconds, 3),
+        "per_second": round((job.processed or 0) / seconds, 2) if seconds else 0.0,
+    }
+
+
+def run_job(
+    job_id: str,
+    api_client: Optional[SenseChatClient] = None,
+    session_factory: Callable[[], Session] = SessionLocal,
+    workers: Optional[int] = None
+) -> Optional[Dict]:
+    """
+    Run or resume a rebuild job from its checkpoint
+
+    Args:
+        job_id: Job to run (pending, running after a crash, or failed)
+        api_client: SenseChat client (default: a new one)
+        session_factory: Session factory for the job and its workers
+        workers: Concurrent characters (default KNOWLEDGE_REBUILD_WORKERS)
+
+    Returns:
+        Throughput report, or None if the job doesn't exist or already completed
+    """
+    api_client = api_client or SenseChatClient()
+    workers = workers or settings.KNOWLEDGE_REBUILD_WORKERS
+    db = session_factory()
+    try:
+        job = db.get(KnowledgeRebuildJob, job_id)
+        if job is None or job.status == STATUS_COMPLETED:
+            return None
+
+        job.status = STATUS_RUNNING
+        job.started_at = job.started_at or datetime.utcnow()
+        job.error = None
+        db.commit()
+
+        counts = Counter({result: getattr(job, result) or 0 for result in RESULTS})
+        checkpoint = job.last_character_id or 0
+        elapsed_before = job.elapsed_seconds or 0.0
+        started = time.perf_counter()
+        since_checkpoint = 0
+
+        # Submission order; the checkpoint only advances past a contiguous done prefix
+        inflight: Deque[Tuple[int, Future]] = deque()
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="knowledge-rebuild")
+
+        def collect(block: bool):
+            nonlocal checkpoint, since_checkpoint
+            if block and inflight:
+                wait([future for _, future in inflight], return_when=FIRST_COMPLETED)
+            while inflight and inflight[0][1].done() and not inflight[0][1].cancelled():
+                character_id, future = inflight.popleft()
+                result = future.result()
+                counts[result] += 1
+                metrics.increment("knowledge_rebuild_characters_total", result=result)
+                checkpoint = character_id
+                since_checkpoint += 1
+
+            if since_checkpoint >= settings.KNOWLEDGE_REBUILD_CHECKPOINT_EVERY:
+                since_checkpoint = 0
+                _checkpoint(db, job, checkpoint, counts, elapsed_before + time.perf_counter() - started)
+                summary = report(job)
+                logger.info(f"Knowledge rebuild {job_id}: {summary['processed']} characters, {summary['per_second']}/s")
+
+        try:
+            after = checkpoint
+            while True:
+                page = load_page(db, after, settings.KNOWLEDGE_REBUILD_PAGE_SIZE)
+                if not page:
+                    break
+                for character, preferences in page:
+                    # Bounded window - a slow character can hold the checkpoint, not memory
+                    while len(inflight) >= workers * 4:
+                        collect(block=True)
+                    inflight.append((character.character_id, executor.submit(
+                        rebuild_character, api_client, character, preferences, session_factory
+                    )))
+                    collect(block=False)
+                after = page[-1][0].character_id
+                if len(page) < settings.KNOWLEDGE_REBUILD_PAGE_SIZE:
+                    break
+
+            while inflight:
+                collect(block=True)
+            job.status = STATUS_COMPLETED
+            job.completed_at = datetime.utcnow()
+
+        except BaseException as e:
+            db.rollback()
+            job.status = STATUS_FAILED
+            job.error = repr(e)[:500]
+            raise
+
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+            collect(block=False)
+            _checkpoint(db, job, checkpoint, counts, elapsed_before + time.perf_counter() - started)
+
+        summary = report(job)
+        logger.info(
+            f"Knowledge rebuild {job_id} finished: {summary['processed']} characters in {summary['seconds']}s "
+            f"({summary['per_second']}/s) - created {summary['created']}, updated {summary['updated']}, "
+            f"unchanged {summary['unchanged']}, failed {summary['failed']}"
+        )
+        return summary
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild every character's knowledge base")
+    parser.add_argument("--resume", metavar="JOB_ID",
+                        help="Continue an interrupted job from its checkpoint (completed jobs are not re-run)")
+    parser.add_argument("--workers", type=int, default=settings.KNOWLEDGE_REBUILD_WORKERS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.resume:
+        job_id = args.resume
+    else:
+        session = SessionLocal()
+        job_id = create_job(session).job_id
+        session.close()
+        print(f"Started knowledge rebuild job {job_id}")
+
+    print(run_job(job_id, workers=args.workers))
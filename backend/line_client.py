@@ -13,6 +13,7 @@ from linebot.models import (
     URIAction,
 )
 from linebot.exceptions import LineBotApiError
+from typing import List
 import logging
 
 from backend.config import settings
@@ -25,7 +26,7 @@ class LineClient:
 
     def __init__(self):
         """Initialize LINE Bot API and Webhook Handler"""
-        self.line_bot_api = LineBotApi(settings.LINE_CHANNEL_ACCESS_TOKEN)
+        self.line_bot_api = LineBotApi(settings.LINE_CHANNEL_ACCESS_TOKEN, endpoint=settings.LINE_API_ENDPOINT)
         self.handler = WebhookHandler(settings.LINE_CHANNEL_SECRET)
         logger.info("LINE client initialized")
 
@@ -73,6 +74,28 @@ class LineClient:
             logger.error(f"Failed to push message: {e.status_code} - {e.error.message}")
             return False
 
+    def multicast_message(self, user_ids: List[str], text: str) -> bool:
+        """
+        Push the same message to up to 500 users in one call
+
+        Args:
+            user_ids: LINE user IDs (at most 500)
+            text: Message text to send
+
+        Returns:
+            True if successful, False otherwise
+        """
+        try:
+            self.line_bot_api.multicast(
+                user_ids,
+                TextSendMessage(text=text)
+            )
+            logger.info(f"Multicast message to {len(user_ids)} users: {text[:50]}...")
+            return True
+        except LineBotApiError as e:
+            logger.error(f"Failed to multicast message: {e.status_code} - {e.error.message}")
+            return False
+
     def send_welcome_message(self, user_id: str, user_name: str = "朋友") -> bool:
         """
         Send welcome message with setup link when user follows bot
@@ -14,10 +14,11 @@ from datetime import datetime
 import logging
 
 from backend.line_client import line_client
-from backend.database import LineUserMapping
 from backend.conversation_manager import ConversationManager
 from backend.api_client import SenseChatClient
+from backend.rate_limiter import PRIORITY_PREMIUM, PRIORITY_FREE
 from backend.config import settings
+from backend import entitlements, quota, mapping_cache
 from backend.text_cleaner import clean_for_line
 
 logger = logging.getLogger(__name__)
@@ -54,9 +55,7 @@ class LineEventHandler:
             logger.info(f"User {line_user_id} ({display_name}) followed bot")
 
             # Check if user already exists (they might have unfollowed and re-followed)
-            existing_mapping = self.db.query(LineUserMapping).filter(
-                LineUserMapping.line_user_id == line_user_id
-            ).first()
+            existing_mapping = mapping_cache.get_mapping(self.db, line_user_id)
 
             if existing_mapping:
                 # User re-followed (they unfollowed then followed again)
@@ -103,10 +102,8 @@ class LineEventHandler:
         logger.info(f"Message from {line_user_id}: {user_message}")
 
         try:
-            # Get or create LINE user mapping
-            mapping = self.db.query(LineUserMapping).filter(
-                LineUserMapping.line_user_id == line_user_id
-            ).first()
+            # Get LINE user mapping (cached, with the active character prefetched)
+            mapping = mapping_cache.get_mapping(self.db, line_user_id)
 
             if not mapping:
                 # User hasn't started setup process yet
@@ -120,8 +117,17 @@ class LineEventHandler:
                 line_client.send_no_character_warning(line_user_id)
                 return
 
-            # Check if user can send message (daily limit)
-            if not mapping.can_send_message():
+            entitlement = entitlements.get_entitlement(self.db, line_user_id, mapping)
+
+            # Take one message from today's quota (atomic - concurrent messages can't overshoot)
+            quota_day = quota.local_today(mapping.timezone)
+            daily_count = quota.try_consume(
+                self.db,
+                line_user_id,
+                quota_day,
+                limit=None if entitlement.is_unlimited() else settings.FREE_MESSAGES_PER_DAY
+            )
+            if daily_count is None:
                 logger.info(f"User {line_user_id} reached daily limit")
                 line_client.send_daily_limit_reached(line_user_id)
                 return
@@ -132,7 +138,8 @@ class LineEventHandler:
             result = self.conversation_manager.send_message(
                 user_id=mapping.user_id,
                 character_id=mapping.character_id,
-                user_message=user_message
+                user_message=user_message,
+                priority=PRIORITY_PREMIUM if entitlement.premium_active() else PRIORITY_FREE
             )
 
             if result["success"]:
@@ -150,17 +157,16 @@ class LineEventHandler:
                 # Send response via LINE
                 line_client.reply_message(reply_token, reply_text)
 
-                # Update message count for daily limit tracking
-                mapping.daily_message_count += 1
                 mapping.last_interaction = datetime.utcnow()
                 self.db.commit()
 
-                logger.info(f"Sent response to {line_user_id}. Daily count: {mapping.daily_message_count}")
+                logger.info(f"Sent response to {line_user_id}. Daily count: {daily_count}")
 
             else:
-                # Error occurred in conversation
+                # Error occurred in conversation - don't charge the user for it
                 error = result.get('error', 'Unknown error')
                 logger.error(f"Conversation error for {line_user_id}: {error}")
+                quota.refund(self.db, line_user_id, quota_day)
 
                 line_client.reply_message(
                     reply_token,
@@ -4,8 +4,9 @@ Phase 1: User Onboarding & Character Generation
 Phase 2: LINE Integration
 """
 from fastapi import FastAPI, HTTPException, Request, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, Response
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 from typing import Dict, List, Optional
@@ -20,8 +21,10 @@ import stripe
 from backend.models import UserProfile, DreamType, CustomMemory
 from backend.character_generator import CharacterGenerator
 from backend.api_client import SenseChatClient
-from backend.database import get_db, init_db, LineUserMapping
+from backend.database import get_db, init_db, SessionLocal, LineUserMapping, Character, UserPreference, SPEAKER_CHARACTER, SPEAKER_ROLE_NAMES
 from backend.conversation_manager import ConversationManager
+from backend.critical_path import CriticalPath
+from backend import conversation_stats, conversation_export, export_jobs, entitlements, scheduler, metrics, mapping_cache, character_payload, outreach, background_enrichment, story_pool, retrieval, semantic_memory, message_search
 from backend.picture_utils import picture_manager
 from backend.tc_converter import convert_to_traditional
 from backend.config import settings
@@ -72,6 +75,34 @@ async def startup_event():
     init_db()
     print("Database initialized successfully")
 
+    # Switch off premium that has passed premium_expires_at
+    scheduler.schedule("premium-expiry", settings.PREMIUM_SWEEP_INTERVAL_SECONDS, entitlements.sweep)
+
+    # Requeue export jobs a restart dropped from the in-process pool, fail stranded ones
+    scheduler.schedule("export-job-recovery", settings.EXPORT_JOB_RECOVERY_INTERVAL_SECONDS, export_jobs.sweep)
+
+    # Push anniversaries and inactivity nudges to LINE users who haven't written
+    scheduler.schedule("outreach", settings.OUTREACH_SWEEP_INTERVAL_SECONDS, outreach.sweep)
+
+    # Snapshot changed retrieval indexes so restarts skip rebuilding them
+    scheduler.schedule("retrieval-flush", settings.RETRIEVAL_FLUSH_INTERVAL_SECONDS, retrieval.flush, run_immediately=False)
+
+    # Fill holes in semantic memory stores and drop rows of deleted messages
+    if semantic_memory.enabled():
+        scheduler.schedule(
+            "semantic-memory-compact",
+            settings.SEMANTIC_MEMORY_COMPACT_INTERVAL_SECONDS,
+            semantic_memory.compact_all,
+            run_immediately=False
+        )
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background schedulers"""
+    scheduler.stop_all()
+    retrieval.flush()
+
 
 @app.get("/", response_class=HTMLResponse)
 async def root():
@@ -97,6 +128,12 @@ async def health_check():
     return {"status": "healthy", "service": "dating-chatbot"}
 
 
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics for this worker process"""
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.post("/api/generate-character")
 async def generate_character(user_profile: UserProfile) -> Dict:
     """
@@ -273,18 +310,19 @@ async def process_line_event(event, db: Session):
         # Create event handler
         event_handler = create_event_handler(db)
 
-        # Route to appropriate handler
+        # Handlers are blocking (SenseChat calls, rate limiter waits) - run them
+        # in the threadpool so the event loop keeps serving other requests
         if isinstance(event, FollowEvent):
             logger.info(f"Processing FollowEvent")
-            event_handler.handle_follow(event)
+            await run_in_threadpool(event_handler.handle_follow, event)
 
         elif isinstance(event, UnfollowEvent):
             logger.info(f"Processing UnfollowEvent")
-            event_handler.handle_unfollow(event)
+            await run_in_threadpool(event_handler.handle_unfollow, event)
 
         elif isinstance(event, MessageEvent) and isinstance(event.message, TextMessage):
             logger.info(f"Processing MessageEvent")
-            event_handler.handle_message(event)
+            await run_in_threadpool(event_handler.handle_message, event)
 
         else:
             logger.info(f"Unhandled event type: {type(event)}")
@@ -312,9 +350,7 @@ async def create_checkout_session(
     """
     try:
         # Verify user exists
-        mapping = db.query(LineUserMapping).filter(
-            LineUserMapping.line_user_id == lineUserId
-        ).first()
+        mapping = mapping_cache.get_mapping(db, lineUserId)
 
         if not mapping:
             raise HTTPException(status_code=404, detail="User not found")
@@ -516,6 +552,8 @@ async def stripe_webhook(
                 mapping.is_premium = True
                 mapping.premium_expires_at = expiry
                 db.commit()
+                entitlements.invalidate(line_user_id)
+                mapping_cache.invalidate(line_user_id)
 
                 logger.info(f"Activated premium for user {line_user_id} until {expiry}")
 
@@ -552,6 +590,8 @@ async def stripe_webhook(
                 mapping.is_premium = False
                 mapping.premium_expires_at = None
                 db.commit()
+                entitlements.invalidate(line_user_id)
+                mapping_cache.invalidate(line_user_id)
 
                 logger.info(f"Deactivated premium for user {line_user_id}")
 
@@ -590,6 +630,7 @@ async def create_character_v2(
     Returns:
         Character with character_id for persistent conversations
     """
+    story_template = character = None
     try:
         # Extract LINE user ID from profile if present
         line_user_id = user_profile.line_user_id
@@ -613,71 +654,104 @@ async def create_character_v2(
                     detail=f"你已經有專屬伴侶「{char_name}」了！每位用戶只能擁有一個AI角色。"
                 )
 
+        # Independent I/O runs as concurrent branches while the request does its DB work
+        path = CriticalPath("create_character")
+        profile_task = None
+        if line_user_id:
+            profile_task = path.branch(
+                "line_profile", line_client.get_profile, line_user_id,
+                timeout=settings.CHARACTER_CREATE_PROFILE_TIMEOUT_SECONDS, fallback={}
+            )
+
         # Initialize conversation manager
         conv_manager = ConversationManager(db, api_client)
 
-        # Get or create user
-        user = conv_manager.get_or_create_user(user_profile.user_name)
-
-        # Generate character
-        character_settings = character_generator.generate_character(user_profile)
-
-        # Save character to database
-        character = conv_manager.save_character(user.user_id, character_settings)
-
-        # Generate initial message
-        initial_message = character_generator.create_initial_message(
-            character_settings["name"],
-            user_profile,
-            character_settings["gender"]
-        )
-
-        # Save initial message
-        conv_manager.save_message(
-            user_id=user.user_id,
-            character_id=character.character_id,
-            speaker_name=character.name,
-            content=initial_message,
-            favorability_level=1
-        )
+        with path.stage("generate"):
+            # Use a pre-generated story from the pool if one fits; otherwise the template
+            # story now and the AI story after the response (SenseChat can take up to 30s)
+            story_key = story_pool.story_key(character_generator, user_profile.dream_type)
+            story_template = story_pool.take(db, story_key)
+            character_settings = character_generator.generate_character(
+                user_profile, ai_background=False, story_template=story_template
+            )
 
         # Get character picture - use premade picture if provided, otherwise random based on gender
+        picture_task = None
         if user_profile.premade_character_picture:
             # Use specific picture for premade character
             # Map Chinese gender to English folder name
-            gender_folder = "female" if character.gender == "女" else "male"
+            gender_folder = "female" if character_settings["gender"] == "女" else "male"
             character_picture = f"/pictures/{gender_folder}/{user_profile.premade_character_picture}"
         else:
-            # Get random picture based on gender
-            character_picture = picture_manager.get_random_picture(character.gender)
+            # Get random picture based on gender (directory listing - off the event loop)
+            picture_task = path.branch(
+                "picture", picture_manager.get_random_picture, character_settings["gender"],
+                timeout=settings.CHARACTER_CREATE_PICTURE_TIMEOUT_SECONDS, fallback=None
+            )
+
+        with path.stage("db"):
+            # Get or create user
+            user = conv_manager.get_or_create_user(user_profile.user_name)
+
+            # Save character to database
+            character = conv_manager.save_character(user.user_id, character_settings)
+
+            # Generate initial message
+            initial_message = character_generator.create_initial_message(
+                character_settings["name"],
+                user_profile,
+                character_settings["gender"]
+            )
+
+            # Save initial message
+            conv_manager.save_message(
+                user_id=user.user_id,
+                character_id=character.character_id,
+                speaker_name=character.name,
+                content=initial_message,
+                favorability_level=1,
+                speaker_role=SPEAKER_CHARACTER
+            )
+        if story_template is None:
+            background_enrichment.enqueue(
+                character_generator, character.character_id, user_profile, character.settings_version or 0
+            )
+        else:
+            # Only keys already in the pool are topped up
+            story_pool.request_refill(character_generator, story_key)
+
+        if picture_task:
+            character_picture = await picture_task
 
         # ========== LINE INTEGRATION: Create mapping and send first message ==========
         if line_user_id:
             logger.info(f"Creating LINE mapping for user {line_user_id}")
 
             # Get LINE user profile
-            profile = line_client.get_profile(line_user_id)
+            profile = await profile_task
             display_name = profile.get("display_name", user_profile.user_name)
 
-            # Create or update LINE user mapping
-            if existing_mapping:
-                # Update existing mapping with new character
-                existing_mapping.user_id = user.user_id
-                existing_mapping.character_id = character.character_id
-                existing_mapping.line_display_name = display_name
-                logger.info(f"Updated existing mapping for {line_user_id}")
-            else:
-                # Create new mapping
-                new_mapping = LineUserMapping(
-                    line_user_id=line_user_id,
-                    user_id=user.user_id,
-                    character_id=character.character_id,
-                    line_display_name=display_name
-                )
-                db.add(new_mapping)
-                logger.info(f"Created new mapping for {line_user_id}")
+            with path.stage("mapping"):
+                # Create or update LINE user mapping
+                if existing_mapping:
+                    # Update existing mapping with new character
+                    existing_mapping.user_id = user.user_id
+                    existing_mapping.character_id = character.character_id
+                    existing_mapping.line_display_name = display_name
+                    logger.info(f"Updated existing mapping for {line_user_id}")
+                else:
+                    # Create new mapping
+                    new_mapping = LineUserMapping(
+                        line_user_id=line_user_id,
+                        user_id=user.user_id,
+                        character_id=character.character_id,
+                        line_display_name=display_name
+                    )
+                    db.add(new_mapping)
+                    logger.info(f"Created new mapping for {line_user_id}")
 
-            db.commit()
+                db.commit()
+                mapping_cache.invalidate(line_user_id)
 
             # Build full picture URL for LINE (LINE needs a publicly accessible URL)
             picture_url = f"{settings.APP_BASE_URL}{character_picture}" if character_picture else None
@@ -686,11 +760,10 @@ async def create_character_v2(
             cleaned_initial_message = clean_for_line(initial_message)
 
             # Send first message via LINE Push API with character picture
-            success = line_client.send_character_created_message(
-                user_id=line_user_id,
-                character_name=character.name,
-                initial_message=cleaned_initial_message,
-                picture_url=picture_url
+            success = await path.branch(
+                "line_push", line_client.send_character_created_message,
+                line_user_id, character.name, cleaned_initial_message, picture_url,
+                timeout=settings.CHARACTER_CREATE_PUSH_TIMEOUT_SECONDS, fallback=False
             )
 
             if success:
@@ -698,6 +771,8 @@ async def create_character_v2(
             else:
                 logger.warning(f"Failed to send first message to LINE user {line_user_id}")
 
+        path.report()
+
         return {
             "success": True,
             "user_id": user.user_id,
@@ -721,9 +796,28 @@ async def create_character_v2(
         raise
     except Exception as e:
         logger.error(f"Error creating character: {e}", exc_info=True)
+        if story_template is not None and character is None:
+            # take() already committed the story away - don't lose it with the character
+            story_pool.put_back(db, story_key, story_template)
         raise HTTPException(status_code=500, detail=f"角色創建失敗: {str(e)}")
 
 
+LAST_MESSAGE_PREVIEW_CHARS = 50
+
+
+def _last_message_preview(message) -> Optional[Dict]:
+    """Short preview of a character's latest message for list views"""
+    if message is None:
+        return None
+    content = message.message_content or ""
+    return {
+        "speaker_name": message.speaker_name,
+        "speaker_role": SPEAKER_ROLE_NAMES.get(message.speaker_role),
+        "preview": content[:LAST_MESSAGE_PREVIEW_CHARS] + ("…" if len(content) > LAST_MESSAGE_PREVIEW_CHARS else ""),
+        "timestamp": message.timestamp.isoformat() if message.timestamp else None
+    }
+
+
 @app.get("/api/v2/characters")
 async def get_characters(
     line_user_id: str,
@@ -741,9 +835,7 @@ async def get_characters(
     """
     try:
         # Get LINE user mapping
-        mapping = db.query(LineUserMapping).filter(
-            LineUserMapping.line_user_id == line_user_id
-        ).first()
+        mapping = mapping_cache.get_mapping(db, line_user_id)
 
         if not mapping:
             return {
@@ -752,13 +844,12 @@ async def get_characters(
                 "active_character_id": None
             }
 
-        # Get all characters for this user
-        characters = db.query(Character).filter(
-            Character.user_id == mapping.user_id
-        ).order_by(Character.created_at.desc()).all()
+        # Characters, favorability and latest message in one query
+        conv_manager = ConversationManager(db, api_client)
+        overview = conv_manager.get_user_characters_overview(mapping.user_id)
 
         character_list = []
-        for char in characters:
+        for char, favorability, last_message in overview:
             # Get character picture - use specific picture for premade characters
             if char.name == "覓甯":
                 picture = "/pictures/女/bdb67369-3e1a-45cb-93c9-a5d2a4718b19.png"
@@ -771,7 +862,9 @@ async def get_characters(
                 "gender": char.gender,
                 "identity": char.identity,
                 "picture": picture,
-                "created_at": char.created_at.isoformat() if char.created_at else None
+                "created_at": char.created_at.isoformat() if char.created_at else None,
+                "favorability": favorability.current_level if favorability else 1,
+                "last_message": _last_message_preview(last_message)
             })
 
         return {
@@ -826,6 +919,7 @@ async def set_active_character(
         # Update active character
         mapping.character_id = request.character_id
         db.commit()
+        mapping_cache.invalidate(request.line_user_id)
 
         logger.info(f"Set active character {request.character_id} for LINE user {request.line_user_id}")
 
@@ -879,27 +973,74 @@ async def send_message_v2(
         raise HTTPException(status_code=500, detail=f"發送訊息失敗: {str(e)}")
 
 
+HISTORY_MAX_PAGE_SIZE = 200
+
+
+def _encode_history_cursor(direction: str, message_id: int) -> str:
+    """Opaque pagination cursor ('before' or 'after' a message)"""
+    return base64.urlsafe_b64encode(f"{direction}:{message_id}".encode()).decode().rstrip("=")
+
+
+def _decode_history_cursor(cursor: str):
+    """Inverse of _encode_history_cursor - raises ValueError on a malformed cursor"""
+    padded = cursor + "=" * (-len(cursor) % 4)
+    direction, message_id = base64.urlsafe_b64decode(padded.encode()).decode().split(":")
+    if direction not in ("before", "after"):
+        raise ValueError(f"Unknown cursor direction: {direction}")
+    return direction, int(message_id)
+
+
 @app.get("/api/v2/conversation-history/{character_id}")
 async def get_conversation_history(
     character_id: int,
     limit: Optional[int] = 50,
+    cursor: Optional[str] = None,
+    before_message_id: Optional[int] = None,
+    after_message_id: Optional[int] = None,
+    page_size: Optional[int] = None,
     db: Session = Depends(get_db)
 ) -> Dict:
     """
-    Get conversation history for a character
+    Get conversation history for a character (keyset paginated)
+
+    Without paging parameters the latest page is returned. Pass
+    before_cursor back as `cursor` to scroll to older messages, or
+    after_cursor to fetch newer ones.
 
     Args:
         character_id: Character ID
-        limit: Maximum number of messages to return
+        limit: Page size (kept for older clients; page_size takes precedence)
+        cursor: Opaque cursor from a previous response
+        before_message_id: Return messages older than this message
+        after_message_id: Return messages newer than this message
+        page_size: Messages per page (max 200)
         db: Database session
 
     Returns:
-        List of messages
+        One page of messages in chronological order, with cursors
     """
     try:
+        if cursor:
+            try:
+                direction, message_id = _decode_history_cursor(cursor)
+            except (ValueError, UnicodeDecodeError):
+                raise HTTPException(status_code=400, detail="無效的分頁游標")
+            if direction == "before":
+                before_message_id, after_message_id = message_id, None
+            else:
+                before_message_id, after_message_id = None, message_id
+
+        size = max(1, min(page_size or limit or 50, HISTORY_MAX_PAGE_SIZE))
+
         conv_manager = ConversationManager(db, api_client)
-        messages = conv_manager.get_conversation_history(character_id, limit)
+        messages, has_more = conv_manager.get_conversation_page(
+            character_id,
+            before_message_id=before_message_id,
+            after_message_id=after_message_id,
+            page_size=size
+        )
 
+        paging_newer = after_message_id is not None
         return {
             "success": True,
             "character_id": character_id,
@@ -908,18 +1049,79 @@ async def get_conversation_history(
                 {
                     "message_id": msg.message_id,
                     "speaker_name": msg.speaker_name,
+                    "speaker_role": SPEAKER_ROLE_NAMES.get(msg.speaker_role),
                     "content": msg.message_content,
                     "timestamp": msg.timestamp.isoformat(),
                     "favorability_level": msg.favorability_level
                 }
                 for msg in messages
-            ]
+            ],
+            "page_size": size,
+            "has_more_before": has_more if not paging_newer else None,
+            "has_more_after": has_more if paging_newer else None,
+            "before_cursor": _encode_history_cursor("before", messages[0].message_id)
+            if messages and (paging_newer or has_more) else None,
+            # Always offered so clients can poll for new messages
+            "after_cursor": _encode_history_cursor("after", messages[-1].message_id)
+            if messages else (_encode_history_cursor("after", after_message_id) if paging_newer else None)
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"獲取歷史失敗: {str(e)}")
 
 
+SEARCH_MAX_PAGE_SIZE = 50
+
+
+@app.get("/api/v2/conversation-search/{character_id}")
+async def search_conversation(
+    character_id: int,
+    q: str,
+    page: int = 1,
+    page_size: int = 20,
+    db: Session = Depends(get_db)
+) -> Dict:
+    """
+    Search a character's conversation history
+
+    Every whitespace-separated term must appear in a message. Results are
+    ranked by relevance (newest first for terms shorter than three
+    characters) and `highlighted` wraps matches in <mark> over escaped HTML.
+
+    Args:
+        character_id: Character ID
+        q: Search text
+        page: 1-based page number
+        page_size: Results per page (max 50)
+        db: Database session
+
+    Returns:
+        One page of matching messages with has_more
+    """
+    terms = message_search.parse_terms(q)
+    if not terms:
+        raise HTTPException(status_code=400, detail="請輸入搜尋關鍵字")
+
+    try:
+        page = max(1, page)
+        size = max(1, min(page_size, SEARCH_MAX_PAGE_SIZE))
+        rows, has_more = message_search.search_messages(db, character_id, q, page=page, page_size=size)
+        return {
+            "success": True,
+            "character_id": character_id,
+            "query": q,
+            "page": page,
+            "page_size": size,
+            "has_more": has_more,
+            "results": [message_search.hit_dict(row, terms) for row in rows]
+        }
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"搜尋失敗: {str(e)}")
+
+
 @app.get("/api/v2/user-characters/{user_id}")
 async def get_user_characters(user_id: int, db: Session = Depends(get_db)) -> Dict:
     """
@@ -934,22 +1136,22 @@ async def get_user_characters(user_id: int, db: Session = Depends(get_db)) -> Di
     """
     try:
         conv_manager = ConversationManager(db, api_client)
-        characters = conv_manager.get_user_characters(user_id)
+        overview = conv_manager.get_user_characters_overview(user_id)
 
         return {
             "success": True,
             "user_id": user_id,
-            "character_count": len(characters),
+            "character_count": len(overview),
             "characters": [
                 {
                     "character_id": char.character_id,
                     "name": char.name,
                     "nickname": char.nickname,
                     "created_at": char.created_at.isoformat(),
-                    "favorability": conv_manager.get_favorability(char.character_id).current_level
-                    if conv_manager.get_favorability(char.character_id) else 1
+                    "favorability": favorability.current_level if favorability else 1,
+                    "last_message": _last_message_preview(last_message)
                 }
-                for char in characters
+                for char, favorability, last_message in overview
             ]
         }
 
@@ -1018,23 +1220,18 @@ async def get_character_profile(character_id: int, db: Session = Depends(get_db)
         # Get favorability
         favorability = conv_manager.get_favorability(character_id)
 
-        # Get conversation statistics
-        messages = conv_manager.get_conversation_history(character_id, limit=1000)
+        # Get conversation statistics (single-row lookup)
+        stats = conversation_stats.get_stats(db, character_id)
 
-        # Calculate statistics
-        total_messages = len(messages)
-        user_messages = sum(1 for msg in messages if msg.speaker_name != character.name)
-        character_messages = total_messages - user_messages
+        total_messages = stats.total_messages if stats else 0
+        user_messages = stats.user_messages if stats else 0
+        character_messages = stats.character_messages if stats else 0
 
-        first_message_date = messages[-1].timestamp.isoformat() if messages else None
-        last_message_date = messages[0].timestamp.isoformat() if messages else None
+        first_message_date = stats.first_message_at.isoformat() if stats and stats.first_message_at else None
+        last_message_date = stats.last_message_at.isoformat() if stats and stats.last_message_at else None
 
         # Calculate conversation days
-        conversation_days = 0
-        if messages and len(messages) > 1:
-            first_date = messages[-1].timestamp.date()
-            last_date = messages[0].timestamp.date()
-            conversation_days = (last_date - first_date).days + 1
+        conversation_days = conversation_stats.conversation_days(stats)
 
         # Favorability progress
         if favorability:
@@ -1118,6 +1315,7 @@ async def delete_character_endpoint(character_id: int, db: Session = Depends(get
         success = conv_manager.delete_character(character_id)
 
         if success:
+            mapping_cache.invalidate_character(character_id)
             return {
                 "success": True,
                 "message": "角色已成功刪除"
@@ -1176,7 +1374,9 @@ async def update_character_endpoint(
             else:
                 character.other_setting = character_data["other_setting"]
 
+        character_payload.bump_version(character)
         db.commit()
+        mapping_cache.invalidate_character(character_id)
         db.refresh(character)
 
         return {
@@ -1219,7 +1419,7 @@ async def create_knowledge_base_for_character(
         Success status with knowledge base ID
     """
     try:
-        from backend.knowledge_base import KnowledgeBaseManager
+        from backend.knowledge_base import KnowledgeBaseManager, preferences_dict
 
         # Get character
         character = db.query(Character).filter(
@@ -1230,59 +1430,30 @@ async def create_knowledge_base_for_character(
             raise HTTPException(status_code=404, detail="角色不存在")
 
         # Get user preferences
-        user_prefs = db.query(UserPreference).filter(
+        user_prefs = db.query(UserPreference.category, UserPreference.content).filter(
             UserPreference.user_id == character.user_id
-        ).all()
-
-        # Build preferences dict
-        preferences_dict = {}
-        for pref in user_prefs:
-            if pref.category not in preferences_dict:
-                preferences_dict[pref.category] = pref.content
-
-        # Create knowledge base manager
-        kb_manager = KnowledgeBaseManager(api_client)
-
-        # Create or update knowledge base
-        if character.knowledge_base_id:
-            # Update existing
-            success = kb_manager.update_character_knowledge(
-                knowledge_base_id=character.knowledge_base_id,
-                character_name=character.name,
-                user_preferences=preferences_dict,
-                background_info=character.detail_setting
-            )
-            if success:
-                message = "知識庫已更新"
-                kb_id = character.knowledge_base_id
-            else:
-                return {
-                    "success": False,
-                    "message": "知識庫更新失敗"
-                }
-        else:
-            # Create new
-            kb_id = kb_manager.create_character_knowledge(
-                character_name=character.name,
-                user_preferences=preferences_dict,
-                background_info=character.detail_setting
-            )
+        ).order_by(UserPreference.preference_id).all()
 
-            if kb_id:
-                # Save knowledge base ID to character
-                character.knowledge_base_id = kb_id
-                db.commit()
-                message = "知識庫已建立"
-            else:
-                return {
-                    "success": False,
-                    "message": "知識庫建立失敗"
-                }
+        # Create knowledge base manager (shares uploaded files by content hash)
+        kb_manager = KnowledgeBaseManager(api_client, db)
+
+        # Create or update knowledge base - no remote calls if the content is unchanged
+        existed = bool(character.knowledge_base_id)
+        result = kb_manager.sync_character_knowledge(character, preferences_dict(user_prefs))
+        if result is None:
+            return {
+                "success": False,
+                "message": "知識庫更新失敗" if existed else "知識庫建立失敗"
+            }
+
+        # Save knowledge base ID and content hash to character
+        db.commit()
+        messages = {"created": "知識庫已建立", "updated": "知識庫已更新", "unchanged": "知識庫內容未變更"}
 
         return {
             "success": True,
-            "message": message,
-            "knowledge_base_id": kb_id
+            "message": messages[result],
+            "knowledge_base_id": character.knowledge_base_id
         }
 
     except HTTPException:
@@ -1301,20 +1472,26 @@ async def export_conversation(
     db: Session = Depends(get_db)
 ):
     """
-    Export conversation history in JSON or TXT format
+    Export conversation history in JSON, TXT or NDJSON format
+
+    The transcript is streamed from a server-side cursor, so any history
+    size is exported with constant memory.
 
     Args:
         character_id: Character ID
-        format: Export format ('json' or 'txt')
+        format: Export format ('json', 'txt' or 'ndjson')
         db: Database session
 
     Returns:
-        File download with conversation history
+        Streaming file download with conversation history
     """
     try:
-        from fastapi.responses import Response
-        import json
-        from datetime import datetime
+        from fastapi.responses import StreamingResponse
+        from urllib.parse import quote
+
+        export_format = format.lower()
+        if export_format not in conversation_export.EXPORT_FORMATS:
+            export_format = "txt"
 
         conv_manager = ConversationManager(db, api_client)
 
@@ -1323,112 +1500,172 @@ async def export_conversation(
         if not character:
             raise HTTPException(status_code=404, detail="角色未找到")
 
-        # Get favorability
-        favorability = conv_manager.get_favorability(character_id)
+        header = conversation_export.build_header(
+            character,
+            conv_manager.get_favorability(character_id),
+            conversation_stats.get_stats(db, character_id)
+        )
+        filename = conversation_export.export_filename(character.name, export_format)
+
+        def generate():
+            # The request session may be closed once the handler returns -
+            # stream on a session owned by the response
+            export_db = SessionLocal()
+            try:
+                yield from conversation_export.stream_export(export_db, header, export_format)
+            finally:
+                export_db.close()
+
+        return StreamingResponse(
+            generate(),
+            media_type=conversation_export.EXPORT_FORMATS[export_format][0],
+            headers={
+                "Content-Disposition": f"attachment; filename*=UTF-8''{quote(filename)}"
+            }
+        )
 
-        # Get all conversation history
-        messages = conv_manager.get_conversation_history(character_id, limit=10000)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"匯出失敗: {str(e)}")
 
-        # Calculate statistics
-        total_messages = len(messages)
-        conversation_days = 0
-        if messages and len(messages) > 1:
-            first_date = messages[-1].timestamp.date()
-            last_date = messages[0].timestamp.date()
-            conversation_days = (last_date - first_date).days + 1
 
-        # Parse other_setting for background story
-        other_setting = {}
+class ExportJobRequest(BaseModel):
+    user_id: int
+    format: str = "ndjson"  # json, txt or ndjson
+    compression: str = "gzip"  # gzip or zstd
+
+
+def _export_job_status(job) -> Dict:
+    return {
+        "job_id": job.job_id,
+        "user_id": job.user_id,
+        "status": job.status,
+        "format": job.export_format,
+        "compression": job.compression,
+        "character_count": job.character_count,
+        "file_size": job.file_size,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "completed_at": job.completed_at.isoformat() if job.completed_at else None,
+        "download_url": f"/api/v2/export-jobs/{job.job_id}/download"
+        if job.status == export_jobs.STATUS_COMPLETED else None
+    }
+
+
+@app.post("/api/v2/export-jobs")
+async def create_export_job(request: ExportJobRequest, db: Session = Depends(get_db)) -> Dict:
+    """
+    Start a background export of all of a user's conversations
+
+    Args:
+        request: user_id, transcript format and archive compression
+        db: Database session
+
+    Returns:
+        Job ID and status - poll /api/v2/export-jobs/{job_id}
+    """
+    try:
+        from backend.database import User
+
+        if not db.get(User, request.user_id):
+            raise HTTPException(status_code=404, detail="用戶未找到")
+
+        export_jobs.cleanup_expired_jobs(db)
+
         try:
-            other_setting = json.loads(character.other_setting) if isinstance(character.other_setting, str) else character.other_setting
-        except:
-            pass
+            job = export_jobs.submit_export_job(
+                db, request.user_id, request.format.lower(), request.compression.lower()
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"匯出參數錯誤: {str(e)}")
 
-        if format.lower() == "json":
-            # Export as JSON
-            export_data = {
-                "export_info": {
-                    "export_date": datetime.now().isoformat(),
-                    "character_id": character_id,
-                    "total_messages": total_messages,
-                    "conversation_days": conversation_days
-                },
-                "character": {
-                    "name": character.name,
-                    "nickname": character.nickname,
-                    "gender": character.gender,
-                    "identity": character.identity,
-                    "personality": character.detail_setting,
-                    "background_story": other_setting.get("background_story", ""),
-                    "interests": other_setting.get("interests", [])
-                },
-                "favorability": {
-                    "level": favorability.current_level if favorability else 1,
-                    "level_name": "陌生期" if not favorability or favorability.current_level == 1 else ("熟悉期" if favorability.current_level == 2 else "親密期"),
-                    "message_count": favorability.message_count if favorability else 0
-                },
-                "messages": [
-                    {
-                        "timestamp": msg.timestamp.isoformat(),
-                        "speaker": msg.speaker_name,
-                        "content": msg.message_content,
-                        "favorability_level": msg.favorability_level
-                    }
-                    for msg in reversed(messages)  # Reverse to chronological order
-                ]
-            }
-
-            content = json.dumps(export_data, ensure_ascii=False, indent=2)
-            filename = f"{character.name}_對話記錄_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-            media_type = "application/json"
-
-        else:  # TXT format
-            lines = []
-            lines.append("=" * 60)
-            lines.append(f"💕 {character.name} 的對話記錄")
-            lines.append("=" * 60)
-            lines.append(f"\n📊 統計資訊：")
-            lines.append(f"   總訊息數：{total_messages} 條")
-            lines.append(f"   對話天數：{conversation_days} 天")
-            lines.append(f"   好感度等級：{favorability.current_level if favorability else 1} - {'陌生期' if not favorability or favorability.current_level == 1 else ('熟悉期' if favorability.current_level == 2 else '親密期')}")
-            lines.append(f"\n✨ 角色資訊：")
-            lines.append(f"   名字：{character.name} ({character.nickname})")
-            lines.append(f"   性別：{character.gender}")
-            lines.append(f"   身份：{character.identity}")
-            lines.append(f"   性格：{character.detail_setting}")
-            if other_setting.get("background_story"):
-                lines.append(f"   背景故事：{other_setting['background_story']}")
-
-            lines.append(f"\n" + "=" * 60)
-            lines.append("💬 對話內容")
-            lines.append("=" * 60 + "\n")
-
-            for msg in reversed(messages):  # Chronological order
-                timestamp = msg.timestamp.strftime("%Y-%m-%d %H:%M:%S")
-                lines.append(f"[{timestamp}] {msg.speaker_name}：")
-                lines.append(f"  {msg.message_content}\n")
-
-            lines.append("=" * 60)
-            lines.append(f"匯出時間：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-            lines.append("🤖 Generated with Claude Code")
-            lines.append("=" * 60)
-
-            content = "\n".join(lines)
-            filename = f"{character.name}_對話記錄_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
-            media_type = "text/plain; charset=utf-8"
-
-        return Response(
-            content=content.encode('utf-8'),
-            media_type=media_type,
-            headers={
-                "Content-Disposition": f'attachment; filename="{filename}"'
-            }
+        return {"success": True, **_export_job_status(job)}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"建立匯出工作失敗: {str(e)}")
+
+
+@app.get("/api/v2/export-jobs/{job_id}")
+async def get_export_job(job_id: str, db: Session = Depends(get_db)) -> Dict:
+    """
+    Poll the status of a bulk export job
+
+    Args:
+        job_id: Job ID returned by POST /api/v2/export-jobs
+        db: Database session
+
+    Returns:
+        Job status, with a download URL once completed
+    """
+    try:
+        from backend.database import ExportJob
+
+        job = db.get(ExportJob, job_id)
+        if not job:
+            raise HTTPException(status_code=404, detail="匯出工作未找到")
+
+        return {"success": True, **_export_job_status(job)}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"獲取匯出狀態失敗: {str(e)}")
+
+
+@app.get("/api/v2/export-jobs/{job_id}/download")
+async def download_export_job(job_id: str, request: Request, db: Session = Depends(get_db)):
+    """
+    Download a finished export archive (supports HTTP Range for resumable downloads)
+
+    Args:
+        job_id: Job ID
+        request: HTTP request (Range header)
+        db: Database session
+
+    Returns:
+        The archive, or the requested byte range (206)
+    """
+    try:
+        from fastapi.responses import StreamingResponse
+        from urllib.parse import quote
+        from backend.database import ExportJob
+
+        job = db.get(ExportJob, job_id)
+        if not job:
+            raise HTTPException(status_code=404, detail="匯出工作未找到")
+        if job.status != export_jobs.STATUS_COMPLETED or not job.file_path or not Path(job.file_path).exists():
+            raise HTTPException(status_code=409, detail=f"匯出尚未完成 (狀態: {job.status})")
+
+        size = Path(job.file_path).stat().st_size
+        headers = {
+            "Accept-Ranges": "bytes",
+            "Content-Disposition": f"attachment; filename*=UTF-8''{quote(export_jobs.download_name(job))}"
+        }
+
+        try:
+            byte_range = export_jobs.parse_range(request.headers.get("range"), size)
+        except ValueError:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+
+        start, end = byte_range or (0, size - 1)
+        headers["Content-Length"] = str(end - start + 1)
+        if byte_range:
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+        return StreamingResponse(
+            export_jobs.iter_file(job.file_path, start, end),
+            status_code=206 if byte_range else 200,
+            media_type=export_jobs.COMPRESSIONS[job.compression][1],
+            headers=headers
         )
 
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"匯出失敗: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"下載匯出檔案失敗: {str(e)}")
 
 
 @app.get("/api/v2/analytics/{character_id}")
@@ -1448,8 +1685,6 @@ async def get_analytics(
     """
     try:
         from datetime import datetime, timedelta
-        from collections import defaultdict
-        import json
 
         conv_manager = ConversationManager(db, api_client)
 
@@ -1461,10 +1696,10 @@ async def get_analytics(
         # Get favorability
         favorability = conv_manager.get_favorability(character_id)
 
-        # Get all messages
-        messages = conv_manager.get_conversation_history(character_id, limit=10000)
+        # Get conversation statistics (single-row lookup)
+        stats = conversation_stats.get_stats(db, character_id)
 
-        if not messages:
+        if not stats or not stats.total_messages:
             return {
                 "success": True,
                 "character_id": character_id,
@@ -1473,47 +1708,27 @@ async def get_analytics(
             }
 
         # Calculate basic statistics
-        total_messages = len(messages)
-        user_messages = sum(1 for msg in messages if msg.speaker_name != character.name)
-        character_messages = total_messages - user_messages
+        total_messages = stats.total_messages
+        user_messages = stats.user_messages
+        character_messages = stats.character_messages
 
         # Time-based statistics
-        first_message_time = messages[-1].timestamp
-        last_message_time = messages[0].timestamp
-        conversation_days = (last_message_time.date() - first_message_time.date()).days + 1
-
-        # Messages by day
-        messages_by_day = defaultdict(int)
-        for msg in messages:
-            date_key = msg.timestamp.date().isoformat()
-            messages_by_day[date_key] += 1
-
-        # Messages by hour of day
-        messages_by_hour = defaultdict(int)
-        for msg in messages:
-            hour = msg.timestamp.hour
-            messages_by_hour[hour] += 1
-
-        # Favorability progression
-        favorability_progression = []
-        current_level = 1
-        for i, msg in enumerate(reversed(messages), 1):
-            # Simulate favorability level progression based on message count
-            if i >= 50:
-                level = 3
-            elif i >= 20:
-                level = 2
-            else:
-                level = 1
+        first_message_time = stats.first_message_at
+        last_message_time = stats.last_message_at
+        conversation_days = conversation_stats.conversation_days(stats)
 
-            if level != current_level:
-                favorability_progression.append({
-                    "message_count": i,
-                    "level": level,
-                    "timestamp": msg.timestamp.isoformat(),
-                    "level_name": "陌生期" if level == 1 else ("熟悉期" if level == 2 else "親密期")
-                })
-                current_level = level
+        # Messages by day / hour of day
+        messages_by_day = stats.messages_by_day or {}
+        messages_by_hour = {hour: count for hour, count in enumerate(stats.messages_by_hour or []) if count}
+
+        # Favorability progression (recorded when the message count crossed each threshold)
+        favorability_progression = [
+            {
+                **transition,
+                "level_name": "陌生期" if transition["level"] == 1 else ("熟悉期" if transition["level"] == 2 else "親密期")
+            }
+            for transition in (stats.level_progression or [])
+        ]
 
         # Daily message trends (last 30 days)
         today = datetime.now().date()
@@ -1542,15 +1757,7 @@ async def get_analytics(
         avg_messages_per_day = total_messages / conversation_days if conversation_days > 0 else 0
 
         # Longest streak (consecutive days with messages)
-        dates_with_messages = sorted(set(msg.timestamp.date() for msg in messages))
-        longest_streak = 1
-        current_streak = 1
-        for i in range(1, len(dates_with_messages)):
-            if (dates_with_messages[i] - dates_with_messages[i-1]).days == 1:
-                current_streak += 1
-                longest_streak = max(longest_streak, current_streak)
-            else:
-                current_streak = 1
+        longest_streak = stats.longest_streak
 
         return {
             "success": True,
@@ -1566,7 +1773,8 @@ async def get_analytics(
                     "first_message": first_message_time.isoformat(),
                     "last_message": last_message_time.isoformat(),
                     "avg_messages_per_day": round(avg_messages_per_day, 1),
-                    "longest_streak_days": longest_streak
+                    "longest_streak_days": longest_streak,
+                    "current_streak_days": conversation_stats.current_streak(stats)
                 },
                 "favorability": {
                     "current_level": favorability.current_level if favorability else 1,
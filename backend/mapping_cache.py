@@ -0,0 +1,137 @@
+"""
+Mapping Cache - Read-through cache of LineUserMapping by line_user_id
+Caches the mapping together with its active Character (loaded in one joined
+query on a miss). Hits re-attach the cached rows to the caller's session
+with merge(load=False), so no SQL is issued and ORM updates still work.
+
+Writers must call invalidate()/invalidate_character(); other workers see
+changes after MAPPING_CACHE_TTL_SECONDS.
+"""
+from typing import Dict, Optional, Tuple
+import copy
+import logging
+import threading
+import time
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session, joinedload, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+
+from backend.config import settings
+from backend.database import LineUserMapping, Character
+
+logger = logging.getLogger(__name__)
+
+
+def _column_state(obj) -> Dict:
+    """Plain copy of an ORM object's column attributes"""
+    return {attr.key: getattr(obj, attr.key) for attr in inspect(type(obj)).column_attrs}
+
+
+def _detached(model, state: Dict):
+    """Rebuild a clean detached instance from a column copy"""
+    # Deep copy so in-place edits of JSON columns can't leak into the cache
+    obj = model(**copy.deepcopy(state))
+    make_transient_to_detached(obj)
+    return obj
+
+
+class MappingCache:
+    """TTL cache of (mapping columns, active character columns) keyed by line_user_id"""
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._entries: Dict[str, Tuple[float, Dict, Optional[Dict]]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, line_user_id: str) -> Optional[Tuple[Dict, Optional[Dict]]]:
+        with self._lock:
+            entry = self._entries.get(line_user_id)
+            if entry and entry[0] > time.monotonic():
+                self.hits += 1
+                return entry[1], entry[2]
+            self.misses += 1
+            return None
+
+    def put(self, line_user_id: str, mapping_state: Dict, character_state: Optional[Dict]):
+        with self._lock:
+            self._entries[line_user_id] = (time.monotonic() + self.ttl_seconds, mapping_state, character_state)
+
+    def invalidate(self, line_user_id: str):
+        with self._lock:
+            self._entries.pop(line_user_id, None)
+
+    def invalidate_character(self, character_id: int):
+        """Drop every entry whose active character is character_id"""
+        with self._lock:
+            stale = [
+                key for key, (_, mapping_state, _) in self._entries.items()
+                if mapping_state.get("character_id") == character_id
+            ]
+            for key in stale:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_cache: Optional[MappingCache] = None
+
+
+def get_cache() -> MappingCache:
+    """Get or create the process-wide mapping cache"""
+    global _cache
+
+    if _cache is None:
+        _cache = MappingCache(settings.MAPPING_CACHE_TTL_SECONDS)
+    return _cache
+
+
+def get_mapping(db: Session, line_user_id: str) -> Optional[LineUserMapping]:
+    """
+    LineUserMapping for a LINE user, with mapping.character already loaded
+
+    Args:
+        db: Database session the returned objects are attached to
+        line_user_id: LINE user ID
+
+    Returns:
+        Session-attached LineUserMapping, or None if the user has no mapping
+    """
+    cache = get_cache()
+    cached = cache.get(line_user_id)
+    if cached is not None:
+        mapping_state, character_state = cached
+        mapping = db.merge(_detached(LineUserMapping, mapping_state), load=False)
+        character = None
+        if character_state is not None:
+            character = db.merge(_detached(Character, character_state), load=False)
+        # Loaded-relationship semantics without history: no lazy load, no UPDATE on flush,
+        # and the mapping keeps the character alive in the (weak) identity map
+        set_committed_value(mapping, "character", character)
+        return mapping
+
+    mapping = db.query(LineUserMapping).options(
+        joinedload(LineUserMapping.character)
+    ).filter(
+        LineUserMapping.line_user_id == line_user_id
+    ).first()
+    if mapping is None:
+        return None
+
+    character = mapping.character
+    cache.put(line_user_id, _column_state(mapping), _column_state(character) if character else None)
+    return mapping
+
+
+def invalidate(line_user_id: str):
+    """Drop a cached mapping (call after changing it)"""
+    get_cache().invalidate(line_user_id)
+
+
+def invalidate_character(character_id: int):
+    """Drop cached mappings whose active character changed or was deleted"""
+    get_cache().invalidate_character(character_id)
@@ -0,0 +1,132 @@
+"""
+Message Reads - Read-only projections of conversation history
+Hot read paths (the model's history window, history pages, list previews,
+exports and index rebuilds) never change the messages they load, so they
+select the message columns directly and get immutable MessageRecord tuples
+back instead of ORM objects: no identity map entries, no instance state or
+change tracking, and less than half the memory per row.
+
+Records keep the Message attribute names, so code that only reads
+(format_messages_for_api, retrieval, semantic memory, the API
+serializers) accepts either.
+"""
+from datetime import datetime
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from backend.database import Message
+
+
+class MessageRecord(NamedTuple):
+    """One message as read from the database (a plain tuple - slotted and immutable)"""
+    message_id: int
+    character_id: int
+    speaker_name: str
+    speaker_role: Optional[int]
+    message_content: str
+    timestamp: datetime
+    favorability_level: int
+
+
+# Selected in MessageRecord field order
+COLUMNS = tuple(getattr(Message, field) for field in MessageRecord._fields)
+
+# Rows fetched per round trip when streaming
+BATCH_SIZE = 1000
+
+
+def _records(db: Session, statement) -> List[MessageRecord]:
+    return list(map(MessageRecord._make, db.execute(statement)))
+
+
+def recent_history(db: Session, character_id: int, limit: Optional[int] = None) -> List[MessageRecord]:
+    """
+    A character's messages in chronological order, or only the latest `limit` of them
+
+    Args:
+        db: Database session
+        character_id: Character ID
+        limit: Maximum number of (most recent) messages
+
+    Returns:
+        Records oldest first
+    """
+    statement = select(*COLUMNS).where(Message.character_id == character_id)
+    if limit:
+        # Most recent N via the (character_id, timestamp) index - no COUNT/OFFSET scan
+        statement = statement.order_by(Message.timestamp.desc(), Message.message_id.desc()).limit(limit)
+        return _records(db, statement)[::-1]
+    return _records(db, statement.order_by(Message.timestamp.asc(), Message.message_id.asc()))
+
+
+def history_page(
+    db: Session,
+    character_id: int,
+    before_message_id: Optional[int] = None,
+    after_message_id: Optional[int] = None,
+    page_size: int = 50
+) -> Tuple[List[MessageRecord], bool]:
+    """
+    Keyset page over the (character_id, message_id) index
+
+    Returns:
+        (records in chronological order, whether more exist in the paging direction)
+    """
+    statement = select(*COLUMNS).where(Message.character_id == character_id)
+
+    if after_message_id is not None:
+        rows = _records(db, statement.where(
+            Message.message_id > after_message_id
+        ).order_by(Message.message_id.asc()).limit(page_size + 1))
+        return rows[:page_size], len(rows) > page_size
+
+    if before_message_id is not None:
+        statement = statement.where(Message.message_id < before_message_id)
+    rows = _records(db, statement.order_by(Message.message_id.desc()).limit(page_size + 1))
+    return rows[:page_size][::-1], len(rows) > page_size
+
+
+def iter_history(
+    db: Session,
+    character_id: int,
+    after_message_id: int = 0,
+    before_message_id: Optional[int] = None,
+    by_timestamp: bool = False,
+    batch_size: int = BATCH_SIZE
+) -> Iterator[MessageRecord]:
+    """
+    Stream a character's messages in (after_message_id, before_message_id), batch_size at a time
+
+    Memory stays constant for any history size: rows come from a server-side
+    cursor and nothing is kept in the session.
+
+    Args:
+        db: Database session
+        character_id: Character ID
+        after_message_id: Only messages newer than this
+        before_message_id: Only messages older than this
+        by_timestamp: Order by time (exports) instead of by message_id (index rebuilds)
+        batch_size: Rows per round trip
+    """
+    statement = select(*COLUMNS).where(
+        Message.character_id == character_id,
+        Message.message_id > after_message_id
+    )
+    if before_message_id is not None:
+        statement = statement.where(Message.message_id < before_message_id)
+    if by_timestamp:
+        statement = statement.order_by(Message.timestamp.asc(), Message.message_id.asc())
+    else:
+        statement = statement.order_by(Message.message_id.asc())
+
+    result = db.execute(statement.execution_options(yield_per=batch_size))
+    for partition in result.partitions():
+        yield from map(MessageRecord._make, partition)
+
+
+def record_from_row(row, offset: int = 0) -> Optional[MessageRecord]:
+    """MessageRecord from COLUMNS selected at `offset` of a wider row; None if outer-joined and missing"""
+    values = tuple(row[offset:offset + len(COLUMNS)])
+    return MessageRecord._make(values) if values[0] is not None else None
@@ -0,0 +1,246 @@
+"""
+Message Search - Full-text search over one character's conversation history
+SQLite uses an FTS5 index with the trigram tokenizer (substring matching that
+works for Chinese without word segmentation), kept in sync by triggers on
+every insert, update and delete of a message. Its rowids are
+(character_id << 36) + message_id, so a search seeks straight to one
+character's range of every doclist instead of ranking matches across all
+characters and then filtering them. Postgres uses a pg_trgm GIN
+index on messages.message_content, which Postgres maintains itself. Other
+databases, or terms shorter than three characters (which trigrams cannot
+index), fall back to LIKE over the character's messages, newest first.
+
+Every whitespace-separated term must match. Hits are ranked by BM25 (FTS5)
+or trigram similarity (Postgres) and highlighted in Python, so both backends
+return the same markup.
+"""
+from html import escape
+from typing import Dict, List, Tuple
+import logging
+import re
+import weakref
+
+from sqlalchemy import DateTime, Float, Integer, String, Text, func, null, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from backend.database import Message, drop_invalid_index
+from backend import metrics
+
+logger = logging.getLogger(__name__)
+
+metrics.describe("message_search_queries_total", "History searches, by backend (fts5, trgm, like)")
+
+# Trigram indexes only help for terms at least this long
+MIN_INDEXED_TERM_LENGTH = 3
+
+# FTS5 rowid = (character_id << CHARACTER_SHIFT) + message_id; message ids
+# below 2**36 and character ids below 2**27 fit a signed 64-bit rowid
+CHARACTER_SHIFT = 36
+MAX_INDEXED_CHARACTER_ID = 2 ** 27
+
+MAX_TERMS = 8
+MAX_TERM_LENGTH = 64
+
+# Postgres trigram index on messages.message_content
+TRGM_INDEX = "ix_messages_content_trgm"
+
+HIGHLIGHT_OPEN = "<mark>"
+HIGHLIGHT_CLOSE = "</mark>"
+
+_SQLITE_DDL = [
+    # Contentless: the text lives in messages, the index only stores postings
+    """CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+        message_content, content='', tokenize='trigram'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+        INSERT INTO messages_fts(rowid, message_content)
+        VALUES ((new.character_id << {CHARACTER_SHIFT}) + new.message_id, new.message_content);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, message_content)
+        VALUES ('delete', (old.character_id << {CHARACTER_SHIFT}) + old.message_id, old.message_content);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF message_content ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, message_content)
+        VALUES ('delete', (old.character_id << {CHARACTER_SHIFT}) + old.message_id, old.message_content);
+        INSERT INTO messages_fts(rowid, message_content)
+        VALUES ((new.character_id << {CHARACTER_SHIFT}) + new.message_id, new.message_content);
+    END""",
+]
+
+# Which index each engine has - checked once per engine
+_backends: "weakref.WeakKeyDictionary[Engine, str]" = weakref.WeakKeyDictionary()
+
+
+def ensure_index(engine: Engine):
+    """
+    Create the search index if it's missing (called from database.migrate)
+
+    SQLite builds the FTS5 table from existing messages on first creation.
+    Postgres builds the trigram index CONCURRENTLY so a large messages table
+    keeps taking writes; an INVALID index left by an interrupted build is
+    dropped and built again rather than skipped by IF NOT EXISTS.
+    """
+    _backends.pop(engine, None)
+    try:
+        if engine.dialect.name == "sqlite":
+            with engine.begin() as conn:
+                existed = conn.execute(text(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'"
+                )).first() is not None
+                for statement in _SQLITE_DDL:
+                    conn.execute(text(statement))
+                if not existed:
+                    conn.execute(text(
+                        f"INSERT INTO messages_fts(rowid, message_content) "
+                        f"SELECT (character_id << {CHARACTER_SHIFT}) + message_id, message_content FROM messages"
+                    ))
+                    print("Built messages_fts search index")
+        elif engine.dialect.name == "postgresql":
+            with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+                drop_invalid_index(conn, TRGM_INDEX)
+                conn.execute(text(
+                    f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {TRGM_INDEX} "
+                    "ON messages USING gin (message_content gin_trgm_ops)"
+                ))
+    except Exception as e:
+        # e.g. SQLite older than 3.34 (no trigram tokenizer) or no rights to create pg_trgm
+        logger.warning(f"Message search index unavailable, searches will scan: {e}")
+
+
+def _backend(db: Session) -> str:
+    engine = db.get_bind()
+    backend = _backends.get(engine)
+    if backend is None:
+        backend = "like"
+        if engine.dialect.name == "sqlite":
+            if db.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'")).first():
+                backend = "fts5"
+        elif engine.dialect.name == "postgresql":
+            # Only a finished, valid index - an invalid one is ignored by the planner
+            if db.execute(text(
+                "SELECT 1 FROM pg_index JOIN pg_class ON pg_class.oid = pg_index.indexrelid "
+                "WHERE pg_class.relname = :name AND pg_index.indisvalid"
+            ), {"name": TRGM_INDEX}).first():
+                backend = "trgm"
+        _backends[engine] = backend
+    return backend
+
+
+def parse_terms(query: str) -> List[str]:
+    """Distinct whitespace-separated terms, capped in number and length"""
+    terms = []
+    for term in query.split():
+        term = term[:MAX_TERM_LENGTH]
+        if term.lower() not in (t.lower() for t in terms):
+            terms.append(term)
+    return terms[:MAX_TERMS]
+
+
+def _like_pattern(term: str) -> str:
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def search_messages(
+    db: Session,
+    character_id: int,
+    query: str,
+    page: int = 1,
+    page_size: int = 20
+) -> Tuple[List, bool]:
+    """
+    One page of a character's messages matching every term of a query
+
+    Args:
+        db: Database session
+        character_id: Character whose history is searched
+        query: Search text; whitespace separates terms
+        page: 1-based page number
+        page_size: Hits per page
+
+    Returns:
+        (rows, has_more) - rows have message_id, speaker_name, message_content,
+        timestamp and score (higher is better; None when ranked by recency)
+    """
+    terms = parse_terms(query)
+    if not terms:
+        return [], False
+
+    backend = _backend(db)
+    indexed = [term for term in terms if len(term) >= MIN_INDEXED_TERM_LENGTH]
+    if backend == "fts5" and (not indexed or character_id >= MAX_INDEXED_CHARACTER_ID):
+        backend = "like"
+    metrics.increment("message_search_queries_total", backend=backend)
+    offset = (page - 1) * page_size
+
+    if backend == "fts5":
+        # Short terms can't be trigram-matched; they filter the FTS hits instead
+        params = {
+            "match": " AND ".join('"' + term.replace('"', '""') + '"' for term in indexed),
+            "low": character_id << CHARACTER_SHIFT,
+            "high": ((character_id + 1) << CHARACTER_SHIFT) - 1,
+            "limit": page_size + 1,
+            "offset": offset,
+        }
+        short_filters = ""
+        for n, term in enumerate(term for term in terms if len(term) < MIN_INDEXED_TERM_LENGTH):
+            params[f"term{n}"] = _like_pattern(term)
+            short_filters += f" AND m.message_content LIKE :term{n} ESCAPE '\\'"
+        rows = db.execute(text(
+            "SELECT m.message_id, m.speaker_name, m.message_content, m.timestamp, "
+            "-bm25(messages_fts) AS score "
+            "FROM messages_fts JOIN messages m ON m.message_id = messages_fts.rowid - :low "
+            "WHERE messages_fts MATCH :match AND messages_fts.rowid BETWEEN :low AND :high" + short_filters +
+            " ORDER BY score DESC, m.message_id DESC LIMIT :limit OFFSET :offset"
+        ).columns(
+            message_id=Integer, speaker_name=String, message_content=Text, timestamp=DateTime, score=Float
+        ), params).all()
+    else:
+        filters = [Message.message_content.ilike(_like_pattern(term), escape="\\") for term in terms]
+        if backend == "trgm":
+            score = func.similarity(Message.message_content, " ".join(terms))
+            order = (score.desc(), Message.message_id.desc())
+        else:
+            score = null()
+            order = (Message.message_id.desc(),)
+        rows = db.query(
+            Message.message_id,
+            Message.speaker_name,
+            Message.message_content,
+            Message.timestamp,
+            score.label("score")
+        ).filter(Message.character_id == character_id, *filters).order_by(
+            *order
+        ).limit(page_size + 1).offset(offset).all()
+
+    return rows[:page_size], len(rows) > page_size
+
+
+def highlight(content: str, terms: List[str]) -> str:
+    """HTML-escaped content with every (case-insensitive) term match wrapped in <mark>"""
+    if not terms:
+        return escape(content)
+    pattern = re.compile("|".join(re.escape(term) for term in sorted(terms, key=len, reverse=True)), re.IGNORECASE)
+    parts = []
+    position = 0
+    for match in pattern.finditer(content):
+        parts.append(escape(content[position:match.start()]))
+        parts.append(HIGHLIGHT_OPEN + escape(match.group()) + HIGHLIGHT_CLOSE)
+        position = match.end()
+    parts.append(escape(content[position:]))
+    return "".join(parts)
+
+
+def hit_dict(row, terms: List[str]) -> Dict:
+    """API representation of a search hit"""
+    return {
+        "message_id": row.message_id,
+        "speaker_name": row.speaker_name,
+        "content": row.message_content,
+        "highlighted": highlight(row.message_content, terms),
+        "timestamp": row.timestamp.isoformat() if row.timestamp else None,
+        "score": round(row.score, 4) if row.score is not None else None,
+    }
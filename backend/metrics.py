@@ -0,0 +1,54 @@
+"""
+Metrics - In-process counters exposed in Prometheus text format
+Counters are per process; scrape every worker or sum in the dashboard.
+"""
+from typing import Dict, Tuple
+import threading
+
+_lock = threading.Lock()
+_counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+_help: Dict[str, str] = {}
+
+
+def describe(name: str, help_text: str):
+    """Register the HELP line for a counter"""
+    _help[name] = help_text
+
+
+def increment(name: str, amount: float = 1, **labels):
+    """Add to a counter (created on first use)"""
+    key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def get(name: str, **labels) -> float:
+    """Current value of a counter (0 if never incremented)"""
+    key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+    with _lock:
+        return _counters.get(key, 0)
+
+
+def reset():
+    """Clear all counters (tests)"""
+    with _lock:
+        _counters.clear()
+
+
+def render() -> str:
+    """All counters in Prometheus exposition format"""
+    with _lock:
+        items = sorted(_counters.items())
+
+    lines = []
+    seen = set()
+    for (name, labels), value in items:
+        if name not in seen:
+            seen.add(name)
+            if name in _help:
+                lines.append(f"# HELP {name} {_help[name]}")
+            lines.append(f"# TYPE {name} counter")
+        label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+        value_text = int(value) if float(value).is_integer() else value
+        lines.append(f"{name}{{{label_text}}} {value_text}" if label_text else f"{name} {value_text}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,215 @@
+"""
+Outreach - Proactive LINE pushes for anniversaries and inactive users
+A periodic sweep claims due users in indexed batches and multicasts one
+rendered message per batch, paced by a LINE push rate limiter:
+
+- anniversaries: the active character's relationship is exactly N days old
+  (first_message_at index, see special_events.claim_due_anniversaries)
+- inactivity: the user last wrote exactly N days ago (last_interaction index)
+
+A batch is committed only after LINE accepted the push, so a failed call
+leaves its users for the next sweep. last_outreach_at caps every user at one
+proactive message per day.
+
+Dry-run against a local fake LINE server (claims are rolled back) with:
+    python -m backend.outreach --dry-run
+Run one real sweep with:
+    python -m backend.outreach
+"""
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+from zoneinfo import ZoneInfo
+import logging
+
+from sqlalchemy import select, update, or_
+from sqlalchemy.orm import Session
+
+from backend.config import settings
+from backend.database import LineUserMapping
+from backend.rate_limiter import RateLimiter, InMemoryTokenBucket, DatabaseGCRA
+from backend import special_events, metrics
+
+logger = logging.getLogger(__name__)
+
+metrics.describe("outreach_messages_total", "Proactive messages pushed to LINE users")
+metrics.describe("outreach_push_failures_total", "LINE multicast calls that failed (users retried next sweep)")
+
+
+def time_slot(hour: int) -> str:
+    """Time-of-day bucket for a local hour (same boundaries as detect_time_based_context)"""
+    if 5 <= hour < 12:
+        return "morning"
+    if 12 <= hour < 18:
+        return "afternoon"
+    if 18 <= hour < 22:
+        return "evening"
+    return "night"
+
+
+def render_push(event_type: str, days: int, hour: int) -> str:
+    """Event template with a time-of-day opener"""
+    return special_events.TIME_GREETINGS[time_slot(hour)] + special_events.render(event_type, days)
+
+
+def create_push_limiter() -> RateLimiter:
+    """Limiter for LINE multicast calls (shared by workers with the database backend)"""
+    rpm = max(1, settings.OUTREACH_PUSH_RPM)
+    if settings.RATE_LIMIT_BACKEND == "database":
+        backend = DatabaseGCRA(rpm, 1, bucket_key="line_push")
+    else:
+        backend = InMemoryTokenBucket(rpm, 1)
+    return RateLimiter(backend, max_wait_seconds=max(60.0, 120.0 * 60 / rpm))
+
+
+def claim_inactive(db: Session, inactive_since: datetime, inactive_until: datetime,
+                   now: datetime, day_start: datetime, limit: int) -> List[str]:
+    """
+    Claim up to limit users whose last message falls in [inactive_since, inactive_until)
+    (caller commits)
+
+    Returns:
+        LINE user IDs to nudge
+    """
+    not_contacted_today = or_(
+        LineUserMapping.last_outreach_at.is_(None),
+        LineUserMapping.last_outreach_at < day_start
+    )
+    candidates = db.scalars(
+        select(LineUserMapping.mapping_id)
+        .where(
+            LineUserMapping.last_interaction >= inactive_since,
+            LineUserMapping.last_interaction < inactive_until,
+            LineUserMapping.character_id.isnot(None),
+            not_contacted_today
+        )
+        .limit(limit)
+    ).all()
+    if not candidates:
+        return []
+
+    return db.scalars(
+        update(LineUserMapping)
+        .where(LineUserMapping.mapping_id.in_(candidates), not_contacted_today)
+        # Keep last_interaction as-is - it's onupdate=utcnow and means "user wrote"
+        .values(last_outreach_at=now, last_interaction=LineUserMapping.last_interaction)
+        .returning(LineUserMapping.line_user_id)
+        .execution_options(synchronize_session=False)
+    ).all()
+
+
+def _mark_contacted(db: Session, line_user_ids: List[str], now: datetime):
+    """Record an anniversary push so the user isn't also nudged today"""
+    db.execute(
+        update(LineUserMapping)
+        .where(LineUserMapping.line_user_id.in_(line_user_ids))
+        .values(last_outreach_at=now, last_interaction=LineUserMapping.last_interaction)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def run_outreach(
+    db: Session,
+    multicast: Callable[[List[str], str], bool],
+    now: Optional[datetime] = None,
+    limiter: Optional[RateLimiter] = None,
+    dry_run: bool = False,
+    batch_size: Optional[int] = None
+) -> Dict[str, int]:
+    """
+    Push every due anniversary and inactivity message
+
+    Args:
+        db: Database session
+        multicast: Sends one text to a list of LINE user IDs (LineClient.multicast_message)
+        now: Current UTC time (for tests)
+        limiter: Paces multicast calls (defaults to OUTREACH_PUSH_RPM)
+        dry_run: Push, but roll back every claim at the end
+        batch_size: Users per claim and per multicast call (max 500)
+
+    Returns:
+        Messages pushed per event type
+    """
+    now = now or datetime.utcnow()
+    local_now = now.replace(tzinfo=ZoneInfo("UTC")).astimezone(ZoneInfo(settings.DEFAULT_TIMEZONE))
+    sent = {"anniversary": 0, "inactive": 0}
+    if not settings.OUTREACH_START_HOUR <= local_now.hour < settings.OUTREACH_END_HOUR:
+        return sent
+
+    limiter = limiter or create_push_limiter()
+    batch_size = min(batch_size or settings.OUTREACH_BATCH_SIZE, 500)
+    today = local_now.date()
+    day_start, _ = special_events.utc_day_bounds(today)
+
+    def claims():
+        for days in special_events.ANNIVERSARY_DAYS:
+            yield "anniversary", days, lambda days=days: special_events.claim_due_anniversaries(
+                db, today, days, batch_size
+            )
+        for days in special_events.INACTIVE_DAYS:
+            since, until = special_events.utc_day_bounds(today - timedelta(days=days))
+            yield "inactive", days, lambda since=since, until=until: claim_inactive(
+                db, since, until, now, day_start, batch_size
+            )
+
+    try:
+        for event_type, days, claim in claims():
+            text = render_push(event_type, days, local_now.hour)
+            while True:
+                line_user_ids = claim()
+                if not line_user_ids:
+                    break
+                if event_type == "anniversary":
+                    _mark_contacted(db, line_user_ids, now)
+
+                limiter.acquire()
+                if not multicast(line_user_ids, text):
+                    metrics.increment("outreach_push_failures_total", kind=event_type)
+                    db.rollback()
+                    break  # Retry these users next sweep
+
+                sent[event_type] += len(line_user_ids)
+                metrics.increment("outreach_messages_total", len(line_user_ids), kind=event_type)
+                if not dry_run:
+                    db.commit()
+    finally:
+        if dry_run:
+            db.rollback()
+
+    if any(sent.values()):
+        logger.info(f"Outreach pushed {sent['anniversary']} anniversary and {sent['inactive']} inactivity messages")
+    return sent
+
+
+def sweep():
+    """Scheduler entry point - runs one outreach pass on its own session"""
+    from backend.database import SessionLocal
+    from backend.line_client import line_client
+
+    db = SessionLocal()
+    try:
+        run_outreach(db, line_client.multicast_message)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    import sys
+    from backend.database import SessionLocal, init_db
+    from backend.line_client import LineClient, line_client
+    from backend.fake_services import FakeLineServer
+
+    logging.basicConfig(level=logging.INFO)
+    init_db()
+    session = SessionLocal()
+    try:
+        if "--dry-run" in sys.argv:
+            with FakeLineServer() as server:
+                client = LineClient()
+                client.line_bot_api.endpoint = server.base_url
+                result = run_outreach(session, client.multicast_message, dry_run=True)
+                print(f"✅ Dry run: {result} ({len(server.pushes)} multicast calls to {server.base_url})")
+        else:
+            result = run_outreach(session, line_client.multicast_message)
+            print(f"✅ Pushed {result}")
+    finally:
+        session.close()
@@ -3,9 +3,11 @@ Utility functions for managing character pictures
 """
 import os
 import random
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 from pathlib import Path
 
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
+
 
 class PictureManager:
     """Manages character pictures for different genders"""
@@ -27,12 +29,34 @@ class PictureManager:
         self.female_path = self.base_path / "female"
         self.male_path = self.base_path / "male"
 
+        # Directory listings keyed by path, reused until the directory's mtime changes
+        self._listing_cache: Dict[Path, Tuple[int, List[str]]] = {}
+
         # Debug logging
         print(f"📁 PictureManager initialized:")
         print(f"   Base path: {self.base_path}")
         print(f"   Female path exists: {self.female_path.exists()}")
         print(f"   Male path exists: {self.male_path.exists()}")
 
+    def _list_pictures(self, picture_dir: Path) -> List[str]:
+        """
+        Image filenames in a directory
+
+        Listing is cached and only refreshed when the directory changes, so
+        list endpoints cost one stat() per call instead of a full scan.
+        """
+        mtime = picture_dir.stat().st_mtime_ns
+        cached = self._listing_cache.get(picture_dir)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+        pictures = [
+            f for f in os.listdir(picture_dir)
+            if Path(f).suffix.lower() in IMAGE_EXTENSIONS
+        ]
+        self._listing_cache[picture_dir] = (mtime, pictures)
+        return pictures
+
     def get_random_picture(self, gender: str) -> Optional[str]:
         """
         Get a random picture path based on character gender
@@ -59,12 +83,8 @@ class PictureManager:
             return None
 
         # Get all image files (common extensions)
-        image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
         try:
-            pictures = [
-                f for f in os.listdir(picture_dir)
-                if Path(f).suffix.lower() in image_extensions
-            ]
+            pictures = self._list_pictures(picture_dir)
         except Exception as e:
             print(f"❌ Error listing directory {picture_dir}: {e}")
             return None
@@ -101,13 +121,7 @@ class PictureManager:
         if not picture_dir.exists():
             return False
 
-        image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
-        pictures = [
-            f for f in os.listdir(picture_dir)
-            if Path(f).suffix.lower() in image_extensions
-        ]
-
-        return len(pictures) > 0
+        return len(self._list_pictures(picture_dir)) > 0
 
 
 # Global instance
@@ -0,0 +1,107 @@
+"""
+Quota - Atomic daily message quota for LINE users
+Check-and-increment is a single conditional UPDATE, so concurrent messages
+from one user can never push daily_message_count past the limit. The day
+rolls over at midnight in the user's timezone.
+"""
+from datetime import date, datetime
+from typing import Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+import logging
+
+from sqlalchemy import update, case, or_
+from sqlalchemy.orm import Session
+
+from backend.config import settings
+from backend.database import LineUserMapping
+from backend import metrics
+
+logger = logging.getLogger(__name__)
+
+metrics.describe("quota_checks_total", "Daily quota check-and-increment attempts")
+metrics.describe("quota_rejections_total", "Messages rejected by the daily quota")
+metrics.describe("quota_refunds_total", "Quota slots returned after a failed reply")
+
+
+def local_today(timezone_name: Optional[str] = None, now: Optional[datetime] = None) -> date:
+    """
+    Today's date in a user's timezone
+
+    Args:
+        timezone_name: IANA timezone (None or unknown = settings.DEFAULT_TIMEZONE)
+        now: Aware or UTC-naive current time (for tests)
+    """
+    try:
+        zone = ZoneInfo(timezone_name or settings.DEFAULT_TIMEZONE)
+    except (ZoneInfoNotFoundError, ValueError):
+        zone = ZoneInfo(settings.DEFAULT_TIMEZONE)
+
+    now = now or datetime.utcnow()
+    if now.tzinfo is None:
+        now = now.replace(tzinfo=ZoneInfo("UTC"))
+    return now.astimezone(zone).date()
+
+
+def try_consume(db: Session, line_user_id: str, today: date, limit: Optional[int] = None) -> Optional[int]:
+    """
+    Atomically take one message from today's quota
+
+    Resets the counter when last_message_date is not today, otherwise
+    increments it only while it is below the limit - all in one UPDATE.
+
+    Args:
+        db: Database session - the UPDATE runs in its own short transaction on the
+            session's engine, so the row lock is released at once and objects
+            already loaded in the session are not expired
+        line_user_id: LINE user ID
+        today: The user's current local date (see local_today)
+        limit: Daily limit, or None for unlimited users (counted, never rejected)
+
+    Returns:
+        The new daily count, or None if the quota is exhausted
+    """
+    is_same_day = LineUserMapping.last_message_date == today
+    statement = update(LineUserMapping).where(
+        LineUserMapping.line_user_id == line_user_id
+    )
+    if limit is not None:
+        statement = statement.where(or_(
+            LineUserMapping.last_message_date.is_(None),
+            LineUserMapping.last_message_date != today,
+            LineUserMapping.daily_message_count < limit
+        ))
+    statement = statement.values(
+        daily_message_count=case(
+            (is_same_day, LineUserMapping.daily_message_count + 1),
+            else_=1
+        ),
+        last_message_date=today
+    ).returning(LineUserMapping.daily_message_count)
+
+    with db.get_bind().begin() as conn:
+        row = conn.execute(statement).first()
+
+    metrics.increment("quota_checks_total")
+    if row is None:
+        metrics.increment("quota_rejections_total")
+        return None
+    return row[0]
+
+
+def refund(db: Session, line_user_id: str, today: date):
+    """
+    Give back a slot taken by try_consume (the reply failed)
+
+    Only applies while it's still the same day, and never goes below zero.
+    """
+    with db.get_bind().begin() as conn:
+        conn.execute(
+            update(LineUserMapping).where(
+                LineUserMapping.line_user_id == line_user_id,
+                LineUserMapping.last_message_date == today,
+                LineUserMapping.daily_message_count > 0
+            ).values(
+                daily_message_count=LineUserMapping.daily_message_count - 1
+            )
+        )
+    metrics.increment("quota_refunds_total")
@@ -0,0 +1,219 @@
+"""
+Client-side rate limiting for SenseChat API calls
+Enforces settings.RATE_LIMIT_RPM so traffic bursts don't hit the provider quota (429s)
+
+Two backends are available:
+- memory: token bucket inside the current process (development, single worker)
+- database: GCRA state stored in the shared database, so every gunicorn worker
+  draws from one global budget
+
+Waiting requests are queued by priority - premium users are served before free users.
+"""
+import heapq
+import itertools
+import logging
+import threading
+import time
+from typing import Optional
+
+from sqlalchemy import case, select, update
+from sqlalchemy.exc import IntegrityError
+
+from backend.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Queue priorities (lower value is served first)
+PRIORITY_PREMIUM = 0
+PRIORITY_FREE = 1
+PRIORITY_BATCH = 2  # Background jobs - only served when no user request is waiting
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a request could not get a slot within the maximum wait time"""
+
+
+class InMemoryTokenBucket:
+    """Token bucket shared by all threads of the current process"""
+
+    def __init__(self, rate_per_minute: int, burst: int):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(max(1, burst))
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> float:
+        """
+        Try to take one token
+
+        Returns:
+            0 if a token was taken, otherwise seconds until one becomes available
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+
+            return (1 - self.tokens) / self.rate
+
+
+class DatabaseGCRA:
+    """
+    Generic Cell Rate Algorithm with state in the shared database
+
+    Each bucket is a single row holding the theoretical arrival time (TAT).
+    A request is admitted with one conditional UPDATE, so concurrent workers
+    can never overspend the budget.
+    """
+
+    def __init__(self, rate_per_minute: int, burst: int, bucket_key: str = "sensechat"):
+        self.interval = 60.0 / rate_per_minute
+        self.tolerance = self.interval * max(1, burst)
+        self.bucket_key = bucket_key
+        self._row_ready = False
+
+    def _ensure_row(self):
+        """Create the bucket row the first time this process uses it"""
+        from backend.database import engine, RateLimitState
+
+        if self._row_ready:
+            return
+
+        try:
+            with engine.begin() as conn:
+                exists = conn.execute(
+                    select(RateLimitState.bucket_key).where(RateLimitState.bucket_key == self.bucket_key)
+                ).first()
+                if not exists:
+                    conn.execute(RateLimitState.__table__.insert().values(bucket_key=self.bucket_key, tat=0.0))
+        except IntegrityError:
+            # Another worker created the row first
+            pass
+        self._row_ready = True
+
+    def try_acquire(self) -> float:
+        """
+        Try to admit one request against the global budget
+
+        Returns:
+            0 if admitted, otherwise seconds until the next request can be admitted
+        """
+        from backend.database import engine, RateLimitState
+
+        now = time.time()
+        tat = RateLimitState.tat
+        new_tat = case((tat > now, tat), else_=now) + self.interval
+
+        self._ensure_row()
+        with engine.begin() as conn:
+            result = conn.execute(
+                update(RateLimitState)
+                .where(RateLimitState.bucket_key == self.bucket_key)
+                .where(new_tat - now <= self.tolerance)
+                .values(tat=new_tat)
+            )
+            if result.rowcount == 1:
+                return 0.0
+
+            current_tat = conn.execute(
+                select(RateLimitState.tat).where(RateLimitState.bucket_key == self.bucket_key)
+            ).scalar() or now
+
+        return max(0.01, current_tat + self.interval - self.tolerance - now)
+
+
+class RateLimiter:
+    """
+    Blocking rate limiter with a priority wait queue
+
+    Requests wait in a heap ordered by (priority, arrival). Only the head of the
+    queue may take a slot from the backend, so a premium request that arrives
+    while free requests are waiting is served next.
+    """
+
+    def __init__(self, backend, max_wait_seconds: float = 30.0):
+        self.backend = backend
+        self.max_wait_seconds = max_wait_seconds
+        self._queue = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+
+    def acquire(self, priority: int = PRIORITY_FREE, timeout: Optional[float] = None):
+        """
+        Block until a request slot is available
+
+        Args:
+            priority: PRIORITY_PREMIUM or PRIORITY_FREE
+            timeout: Maximum seconds to wait (defaults to max_wait_seconds)
+
+        Raises:
+            RateLimitExceeded: If no slot became available in time
+        """
+        timeout = self.max_wait_seconds if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        entry = (priority, next(self._counter))
+
+        with self._cond:
+            heapq.heappush(self._queue, entry)
+        try:
+            while True:
+                with self._cond:
+                    is_head = self._queue[0] == entry
+
+                # Ask the backend outside the lock - a slow database round trip
+                # must not stop other requests from queuing or timing out
+                wait = self.backend.try_acquire() if is_head else None
+                if wait is not None and wait <= 0:
+                    return
+
+                with self._cond:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise RateLimitExceeded(
+                            f"SenseChat rate limit ({settings.RATE_LIMIT_RPM} RPM) - waited {timeout:.0f}s without a slot"
+                        )
+                    if wait is None:
+                        # Not our turn - wake up again when the queue moves (unless it already did)
+                        if self._queue[0] != entry:
+                            self._cond.wait(remaining)
+                    else:
+                        self._cond.wait(min(wait, remaining))
+        finally:
+            with self._cond:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                self._cond.notify_all()
+
+
+def create_rate_limiter() -> RateLimiter:
+    """Build the limiter configured in settings"""
+    rpm = max(1, settings.RATE_LIMIT_RPM)
+
+    if settings.RATE_LIMIT_BACKEND == "database":
+        backend = DatabaseGCRA(rpm, settings.RATE_LIMIT_BURST)
+    else:
+        backend = InMemoryTokenBucket(rpm, settings.RATE_LIMIT_BURST)
+
+    logger.info(f"SenseChat rate limiter: {rpm} RPM, burst {settings.RATE_LIMIT_BURST}, backend={settings.RATE_LIMIT_BACKEND}")
+    return RateLimiter(backend, max_wait_seconds=settings.RATE_LIMIT_MAX_WAIT_SECONDS)
+
+
+# Global instance (one queue per process, shared by every SenseChatClient)
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Get or initialize the process-wide rate limiter"""
+    global _rate_limiter
+
+    if _rate_limiter is None:
+        with _rate_limiter_lock:
+            if _rate_limiter is None:
+                _rate_limiter = create_rate_limiter()
+    return _rate_limiter
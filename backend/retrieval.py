@@ -0,0 +1,346 @@
+"""
+Retrieval - Local BM25 memory over user preferences and past messages
+Each character gets an in-process BM25 index over CJK bigrams (and lowercased
+Latin words) of its user's UserPreference rows and every past message. Each
+turn the top-k snippets for the user's message, older than the history
+window already sent, are injected into the prompt instead of a remote
+SenseChat knowledge base (know_ids).
+
+Indexes are kept per worker in an LRU cache and snapshotted to
+RETRIEVAL_INDEX_DIR (gzip JSON with postings) by a periodic flush, so a warm
+restart loads the snapshot instead of re-reading the whole history. Messages
+are added incrementally on save_message; anything another worker saved is
+picked up from the history the turn already loaded (plus one indexed range
+query if a gap is older than that window).
+"""
+from collections import Counter, OrderedDict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+import gzip
+import json
+import logging
+import math
+import os
+import re
+import threading
+
+from sqlalchemy.orm import Session
+
+from backend.config import settings
+from backend.database import Character, Message, UserPreference
+from backend.message_reads import MessageRecord
+from backend import metrics, message_reads
+
+logger = logging.getLogger(__name__)
+
+metrics.describe("retrieval_index_loads_total", "Per-character retrieval indexes loaded, by source (snapshot, rebuild)")
+
+# Snapshot layout version - bump when the tokenizer or format changes
+SNAPSHOT_FORMAT = 1
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+_CJK_RUN = re.compile(r"[㐀-鿿豈-﫿]+")
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """CJK character bigrams (single characters for one-character runs) and Latin words"""
+    tokens = []
+    for run in _CJK_RUN.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    tokens.extend(_WORD.findall(_CJK_RUN.sub(" ", text.lower())))
+    return tokens
+
+
+def preference_text(category: str, content) -> str:
+    """Flatten a UserPreference JSON value into one searchable line"""
+    if isinstance(content, dict):
+        parts = []
+        for key, value in content.items():
+            value = "、".join(map(str, value)) if isinstance(value, list) else str(value)
+            if value:
+                parts.append(f"{key}: {value}")
+        body = "；".join(parts)
+    elif isinstance(content, list):
+        body = "、".join(map(str, content))
+    else:
+        body = str(content)
+    return f"用戶{category} - {body}"
+
+
+class RetrievalIndex:
+    """BM25 index of one character's memory"""
+
+    def __init__(self, character_id: int, user_id: int, created_at: str):
+        self.character_id = character_id
+        self.user_id = user_id
+        self.created_at = created_at  # Guards snapshots against a reused character_id
+        self.last_message_id = 0  # Every message of the character up to here is indexed
+        self.docs: Dict[str, str] = {}  # "m<message_id>" / "p<category>" -> text
+        self.lengths: Dict[str, int] = {}
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.total_length = 0
+        self.dirty = False
+        self.lock = threading.Lock()
+
+    def add(self, doc_id: str, text: str):
+        """Index a document, replacing any previous version"""
+        if doc_id in self.docs:
+            if self.docs[doc_id] == text:
+                return
+            self.remove(doc_id)
+        counts = Counter(tokenize(text))
+        self.docs[doc_id] = text
+        self.lengths[doc_id] = sum(counts.values())
+        self.total_length += self.lengths[doc_id]
+        for token, tf in counts.items():
+            self.postings.setdefault(token, {})[doc_id] = tf
+        self.dirty = True
+
+    def remove(self, doc_id: str):
+        text = self.docs.pop(doc_id, None)
+        if text is None:
+            return
+        self.total_length -= self.lengths.pop(doc_id)
+        for token in set(tokenize(text)):
+            posting = self.postings.get(token)
+            if posting is not None:
+                posting.pop(doc_id, None)
+                if not posting:
+                    del self.postings[token]
+        self.dirty = True
+
+    def add_message(self, message: Message):
+        self.add(f"m{message.message_id}", f"{message.speaker_name}: {message.message_content}")
+
+    def search(self, query: str, k: int, before_message_id: Optional[int] = None) -> List[Tuple[float, str]]:
+        """
+        Top-k documents for a query
+
+        Args:
+            query: Text to match (the user's message)
+            k: Number of results
+            before_message_id: Only messages older than this (preferences always qualify)
+
+        Returns:
+            (score, text) pairs, best first
+        """
+        if not self.docs:
+            return []
+        n = len(self.docs)
+        average_length = self.total_length / n or 1.0
+        scores: Dict[str, float] = {}
+        for token in set(tokenize(query)):
+            posting = self.postings.get(token)
+            if not posting:
+                continue
+            idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+            for doc_id, tf in posting.items():
+                if before_message_id is not None and doc_id[0] == "m" and int(doc_id[1:]) >= before_message_id:
+                    continue
+                norm = K1 * (1 - B + B * self.lengths[doc_id] / average_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (K1 + 1) / (tf + norm)
+
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(score, self.docs[doc_id]) for doc_id, score in best]
+
+    def to_snapshot(self) -> Dict:
+        return {
+            "format": SNAPSHOT_FORMAT,
+            "character_id": self.character_id,
+            "user_id": self.user_id,
+            "created_at": self.created_at,
+            "last_message_id": self.last_message_id,
+            "docs": self.docs,
+            "lengths": self.lengths,
+            "postings": self.postings,
+        }
+
+    @classmethod
+    def from_snapshot(cls, data: Dict) -> "RetrievalIndex":
+        index = cls(data["character_id"], data["user_id"], data["created_at"])
+        index.last_message_id = data["last_message_id"]
+        index.docs = data["docs"]
+        index.lengths = data["lengths"]
+        index.postings = data["postings"]
+        index.total_length = sum(index.lengths.values())
+        return index
+
+
+_cache: "OrderedDict[int, RetrievalIndex]" = OrderedDict()
+_evicted: List[RetrievalIndex] = []  # Dirty indexes pushed out of the cache, saved on the next flush
+_lock = threading.Lock()
+
+
+def _snapshot_path(character_id: int) -> Path:
+    return Path(settings.RETRIEVAL_INDEX_DIR) / f"{character_id}.json.gz"
+
+
+def _character_stamp(character: Character) -> str:
+    return character.created_at.isoformat() if character.created_at else ""
+
+
+def save_snapshot(index: RetrievalIndex):
+    """Write an index snapshot atomically (temp file + rename)"""
+    path = _snapshot_path(index.character_id)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with index.lock:
+        data = json.dumps(index.to_snapshot(), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        index.dirty = False
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    with gzip.open(tmp, "wb", compresslevel=1) as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _load_snapshot(character: Character) -> Optional[RetrievalIndex]:
+    path = _snapshot_path(character.character_id)
+    try:
+        with gzip.open(path, "rb") as f:
+            data = json.loads(f.read())
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable retrieval snapshot {path}: {e}")
+        return None
+
+    if (data.get("format") != SNAPSHOT_FORMAT or data.get("user_id") != character.user_id
+            or data.get("created_at") != _character_stamp(character)):
+        return None
+    return RetrievalIndex.from_snapshot(data)
+
+
+def _add_preferences(db: Session, index: RetrievalIndex):
+    """(Re)index the user's preferences - first row per category, like the knowledge base"""
+    rows = db.query(UserPreference.category, UserPreference.content).filter(
+        UserPreference.user_id == index.user_id
+    ).order_by(UserPreference.preference_id).all()
+    seen = set()
+    for category, content in rows:
+        if category not in seen:
+            seen.add(category)
+            index.add(f"p{category}", preference_text(category, content))
+    for doc_id in [doc_id for doc_id in index.docs if doc_id[0] == "p" and doc_id[1:] not in seen]:
+        index.remove(doc_id)
+
+
+def _add_messages_after(db: Session, index: RetrievalIndex, after_id: int, before_id: Optional[int] = None):
+    """Index the character's messages in (after_id, before_id) - range scan on (character_id, message_id)"""
+    for message in message_reads.iter_history(db, index.character_id, after_id, before_id):
+        index.add_message(message)
+        index.last_message_id = max(index.last_message_id, message.message_id)
+
+
+def get_index(db: Session, character: Character) -> RetrievalIndex:
+    """Cached index for a character, loaded from its snapshot or rebuilt from the database"""
+    with _lock:
+        index = _cache.get(character.character_id)
+        if index is not None and (index.user_id, index.created_at) == (character.user_id, _character_stamp(character)):
+            _cache.move_to_end(character.character_id)
+            return index
+        _cache.pop(character.character_id, None)  # a deleted character's id was reused
+
+    index = _load_snapshot(character)
+    if index is not None:
+        metrics.increment("retrieval_index_loads_total", source="snapshot")
+    else:
+        metrics.increment("retrieval_index_loads_total", source="rebuild")
+        index = RetrievalIndex(character.character_id, character.user_id, _character_stamp(character))
+        _add_messages_after(db, index, 0)
+    # Preferences are few and rarely change - always re-read them on load
+    _add_preferences(db, index)
+
+    with _lock:
+        index = _cache.setdefault(character.character_id, index)
+        _cache.move_to_end(character.character_id)
+        while len(_cache) > settings.RETRIEVAL_CACHE_SIZE:
+            _, old = _cache.popitem(last=False)
+            if old.dirty:
+                _evicted.append(old)
+    return index
+
+
+def relevant_memories(
+    db: Session,
+    character: Character,
+    query: str,
+    history: List[MessageRecord],
+    k: Optional[int] = None
+) -> List[str]:
+    """
+    Snippets relevant to the user's message that the history window doesn't already contain
+
+    Args:
+        db: Database session (only used on load or to fill a gap older than history)
+        character: Character being talked to
+        query: User's message
+        history: Recent messages already sent to the model, oldest first
+        k: Number of snippets (default RETRIEVAL_TOP_K)
+
+    Returns:
+        Snippet texts, best first
+    """
+    k = k or settings.RETRIEVAL_TOP_K
+    index = get_index(db, character)
+    window_start = history[0].message_id if history else None
+
+    with index.lock:
+        if window_start is not None and index.last_message_id < window_start - 1:
+            _add_messages_after(db, index, index.last_message_id, window_start)
+        for message in history:
+            index.add_message(message)
+        if history:
+            index.last_message_id = max(index.last_message_id, history[-1].message_id)
+        return [text for _, text in index.search(query, k, before_message_id=window_start)]
+
+
+def add_message(message: Message):
+    """Index a freshly saved message if its character's index is loaded in this process"""
+    with _lock:
+        index = _cache.get(message.character_id)
+    if index is not None:
+        with index.lock:
+            index.add_message(message)
+
+
+def flush() -> int:
+    """
+    Snapshot every changed index (scheduler task and shutdown hook)
+
+    Returns:
+        Number of snapshots written
+    """
+    with _lock:
+        pending = [index for index in _cache.values() if index.dirty] + _evicted
+        _evicted.clear()
+    for index in pending:
+        try:
+            save_snapshot(index)
+        except OSError as e:
+            logger.error(f"Could not save retrieval snapshot for character {index.character_id}: {e}")
+    return len(pending)
+
+
+def forget(character_id: int):
+    """Drop a deleted character's index and snapshot"""
+    with _lock:
+        _cache.pop(character_id, None)
+    _snapshot_path(character_id).unlink(missing_ok=True)
+
+
+def format_memories(memories: Iterable[str], max_chars: Optional[int] = None) -> str:
+    """Prompt block for retrieved snippets, cut to max_chars (default RETRIEVAL_MAX_CHARS)"""
+    max_chars = max_chars or settings.RETRIEVAL_MAX_CHARS
+    block = "相關記憶："
+    for memory in memories:
+        line = f"\n- {memory}"
+        if len(block) + len(line) > max_chars:
+            break
+        block += line
+    return block
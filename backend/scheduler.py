@@ -0,0 +1,80 @@
+"""
+Scheduler - Periodic background tasks inside the web process
+Each task runs on its own daemon thread. Tasks must be idempotent: every
+gunicorn worker runs its own copy of the schedule.
+"""
+from typing import Callable, Dict
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicTask:
+    """Calls a function every interval_seconds until stopped"""
+
+    def __init__(self, name: str, interval_seconds: float, func: Callable[[], object], run_immediately: bool = True):
+        """
+        Args:
+            name: Task name (used for logging and the thread name)
+            interval_seconds: Delay between runs
+            func: Zero-argument callable; exceptions are logged, not raised
+            run_immediately: Run once at start instead of waiting a full interval
+        """
+        self.name = name
+        self.interval_seconds = interval_seconds
+        self.func = func
+        self.run_immediately = run_immediately
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"periodic-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def run_once(self):
+        """Run the task now, logging any exception"""
+        try:
+            self.func()
+        except Exception as e:
+            logger.error(f"Periodic task {self.name} failed: {e}", exc_info=True)
+
+    def _run(self):
+        if self.run_immediately:
+            self.run_once()
+        while not self._stop.wait(self.interval_seconds):
+            self.run_once()
+
+
+_tasks: Dict[str, PeriodicTask] = {}
+
+
+def schedule(name: str, interval_seconds: float, func: Callable[[], object], run_immediately: bool = True) -> PeriodicTask:
+    """
+    Register and start a periodic task (no-op if a task with this name is already running)
+
+    Returns:
+        The PeriodicTask
+    """
+    task = _tasks.get(name)
+    if task is None:
+        task = PeriodicTask(name, interval_seconds, func, run_immediately)
+        _tasks[name] = task
+    task.start()
+    logger.info(f"Scheduled {name} every {interval_seconds}s")
+    return task
+
+
+def stop_all():
+    """Stop every scheduled task (app shutdown / tests)"""
+    for task in _tasks.values():
+        task.stop()
+    _tasks.clear()
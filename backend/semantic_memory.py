@@ -0,0 +1,543 @@
+"""
+Semantic Memory - Optional vector recall of old exchanges (needs numpy)
+Each character's messages are embedded by a local hashing embedder (signed
+feature hashing of CJK bigrams, single characters and Latin words - no model
+download, CPU only) into a float32 matrix on disk, one row per message, that
+is memory-mapped for search. Each turn the user's message is embedded and one
+matrix-vector product scores every message older than the history window; the
+best matches are injected together with the reply that followed them. This
+complements backend.retrieval: partial wording overlaps (夕陽 / 陽光) still
+score, where BM25 needs a shared bigram.
+
+Per character, under SEMANTIC_MEMORY_DIR/<character_id>/:
+    meta.json           format, dimensions, owner guard and current generation
+    ids.<gen>.i64       message ids, ascending
+    vectors.<gen>.f32   rows aligned with ids
+
+New messages are appended on the turn path from the history it already
+loaded (plus one range query for a small gap older than the window - at
+most SEMANTIC_MEMORY_CATCH_UP_MAX_ROWS; a longer one, such as a character's
+whole history when the feature is first enabled, is left as a hole for
+compaction to fill, so a turn never embeds thousands of rows). Appends hold
+an exclusive file lock so both gunicorn workers can write; readers only trust
+rows present in both files, so a torn append is never seen. Compaction
+writes a new generation that fills holes (messages committed out of id
+order, or gaps a turn deferred), drops rows of messages that are gone, and then swaps meta.json.
+
+Enable with SEMANTIC_MEMORY_ENABLED=true after `pip install numpy`, then
+backfill existing histories (or let the daily compaction catch up) with:
+    python -m backend.semantic_memory [--all]
+"""
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import argparse
+import json
+import logging
+import os
+import shutil
+import threading
+import zlib
+
+from sqlalchemy.orm import Session
+
+from backend.config import settings
+from backend.database import SessionLocal, Character, Message
+from backend.message_reads import MessageRecord
+from backend.retrieval import _CJK_RUN, tokenize
+from backend import metrics
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import fcntl
+except ImportError:  # Windows - appends are only serialised within one process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+metrics.describe("semantic_memory_embedded_total", "Messages embedded into semantic memory, by source (turn, compaction)")
+metrics.describe("semantic_memory_catch_up_deferred_total", "Turns that left a gap too long to embed inline to compaction")
+
+# Store layout version - bump when the embedder or file format changes
+STORE_FORMAT = 1
+
+# Embedding width; a power of two so buckets are a bit mask
+DIMENSIONS = 256
+ROW_BYTES = DIMENSIONS * 4
+
+# Single characters add fuzziness on top of bigrams, at a lower weight
+CHARACTER_WEIGHT = 0.5
+
+# Message ids per IN (...) query when compaction fetches missing messages
+FETCH_CHUNK = 500
+
+_warned_missing_numpy = False
+
+
+def numpy_available() -> bool:
+    """True if the optional numpy package is installed"""
+    return np is not None
+
+
+def enabled() -> bool:
+    """SEMANTIC_MEMORY_ENABLED and numpy installed (warns once if numpy is missing)"""
+    global _warned_missing_numpy
+
+    if not settings.SEMANTIC_MEMORY_ENABLED:
+        return False
+    if np is None:
+        if not _warned_missing_numpy:
+            _warned_missing_numpy = True
+            logger.warning("SEMANTIC_MEMORY_ENABLED is set but numpy is not installed - semantic memory is off")
+        return False
+    return True
+
+
+@lru_cache(maxsize=65536)
+def _feature(token: str) -> Tuple[int, float]:
+    """Bucket and sign of a token (crc32 is stable across processes, unlike hash())"""
+    h = zlib.crc32(token.encode("utf-8"))
+    return h & (DIMENSIONS - 1), 1.0 if h & 0x80000000 else -1.0
+
+
+def embed(text: str) -> "np.ndarray":
+    """L2-normalised hashed bag of bigrams/words and CJK characters"""
+    weights: Dict[int, float] = {}
+    for token in tokenize(text):
+        bucket, sign = _feature(token)
+        weights[bucket] = weights.get(bucket, 0.0) + sign
+    for run in _CJK_RUN.findall(text):
+        for char in run:
+            bucket, sign = _feature(char)
+            weights[bucket] = weights.get(bucket, 0.0) + CHARACTER_WEIGHT * sign
+
+    vector = np.zeros(DIMENSIONS, dtype=np.float32)
+    if weights:
+        vector[list(weights)] = list(weights.values())
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+    return vector
+
+
+def embed_many(texts: Iterable[str]) -> "np.ndarray":
+    """Embeddings as an (n, DIMENSIONS) float32 matrix"""
+    vectors = [embed(text) for text in texts]
+    return np.vstack(vectors) if vectors else np.empty((0, DIMENSIONS), dtype=np.float32)
+
+
+def store_dir(character_id: int) -> Path:
+    return Path(settings.SEMANTIC_MEMORY_DIR) / str(character_id)
+
+
+def _character_stamp(character: Character) -> str:
+    return character.created_at.isoformat() if character.created_at else ""
+
+
+class VectorStore:
+    """One character's memory-mapped embedding matrix"""
+
+    def __init__(self, character_id: int, user_id: int, created_at: str):
+        self.character_id = character_id
+        self.user_id = user_id
+        self.created_at = created_at  # Guards the files against a reused character_id
+        self.path = store_dir(character_id)
+        self.lock = threading.RLock()
+        self.generation = 0
+        self.ids = np.empty(0, dtype=np.int64)
+        self.matrix = np.empty((0, DIMENSIONS), dtype=np.float32)
+        self._mapped: Optional[Tuple[int, int, int]] = None  # (generation, ids bytes, vectors bytes)
+
+    @property
+    def last_message_id(self) -> int:
+        return int(self.ids[-1]) if len(self.ids) else 0
+
+    def _files(self, generation: int) -> Tuple[Path, Path]:
+        return self.path / f"ids.{generation}.i64", self.path / f"vectors.{generation}.f32"
+
+    def _read_meta(self) -> Optional[Dict]:
+        try:
+            meta = json.loads((self.path / "meta.json").read_text())
+        except FileNotFoundError:
+            return None
+        except ValueError as e:
+            logger.warning(f"Ignoring unreadable semantic memory metadata in {self.path}: {e}")
+            return None
+        if (meta.get("format") != STORE_FORMAT or meta.get("dimensions") != DIMENSIONS
+                or meta.get("user_id") != self.user_id or meta.get("created_at") != self.created_at):
+            return None
+        return meta
+
+    def _write_meta(self, generation: int):
+        meta = {
+            "format": STORE_FORMAT,
+            "dimensions": DIMENSIONS,
+            "user_id": self.user_id,
+            "created_at": self.created_at,
+            "generation": generation,
+        }
+        tmp = self.path / f"meta.{os.getpid()}.tmp"
+        tmp.write_text(json.dumps(meta))
+        os.replace(tmp, self.path / "meta.json")
+
+    def _unmap(self):
+        self.generation = 0
+        self.ids = np.empty(0, dtype=np.int64)
+        self.matrix = np.empty((0, DIMENSIONS), dtype=np.float32)
+        self._mapped = None
+
+    def refresh(self):
+        """Re-map the files if this or another process appended or compacted since the last look"""
+        with self.lock:
+            meta = self._read_meta()
+            if meta is None:
+                self._unmap()
+                return
+            generation = meta["generation"]
+            ids_path, vectors_path = self._files(generation)
+            try:
+                mapped = (generation, ids_path.stat().st_size, vectors_path.stat().st_size)
+            except FileNotFoundError:  # compacted between reading meta and the files
+                self._unmap()
+                return
+            if mapped == self._mapped:
+                return
+
+            rows = min(mapped[1] // 8, mapped[2] // ROW_BYTES)
+            if rows:
+                self.ids = np.memmap(ids_path, dtype=np.int64, mode="r", shape=(rows,))
+                self.matrix = np.memmap(vectors_path, dtype=np.float32, mode="r", shape=(rows, DIMENSIONS))
+            else:
+                self.ids = np.empty(0, dtype=np.int64)
+                self.matrix = np.empty((0, DIMENSIONS), dtype=np.float32)
+            self.generation = generation
+            self._mapped = mapped
+
+    @contextmanager
+    def _exclusive(self):
+        """Thread lock plus an exclusive file lock shared with other processes"""
+        with self.lock:
+            self.path.mkdir(parents=True, exist_ok=True)
+            with open(self.path / "lock", "a") as handle:
+                if fcntl is not None:
+                    fcntl.flock(handle, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def _prepare(self) -> int:
+        """
+        Under the file lock: the writable generation, after starting a fresh
+        store (missing, old format, or a reused character_id) or cutting off
+        a torn tail left by a crashed append
+        """
+        meta = self._read_meta()
+        if meta is None:
+            for path in self.path.iterdir():
+                if path.name != "lock":
+                    path.unlink()
+            self._write_meta(1)
+            for path in self._files(1):
+                path.touch()
+            self.refresh()
+            return 1
+
+        self.refresh()
+        rows = len(self.ids)
+        ids_path, vectors_path = self._files(self.generation)
+        for path, size in ((ids_path, rows * 8), (vectors_path, rows * ROW_BYTES)):
+            if path.stat().st_size != size:
+                os.truncate(path, size)
+        return self.generation
+
+    def append(self, rows: Sequence[Tuple[int, str]], source: str = "turn") -> int:
+        """
+        Embed and append messages newer than the last stored one
+
+        Args:
+            rows: (message_id, message_content) pairs
+            source: Metric label
+
+        Returns:
+            Number of rows appended
+        """
+        with self._exclusive():
+            generation = self._prepare()
+            last = self.last_message_id
+            rows = sorted(row for row in rows if row[0] > last)
+            if not rows:
+                return 0
+
+            ids_path, vectors_path = self._files(generation)
+            # Vectors first: a crash in between leaves only an unreferenced tail
+            with open(vectors_path, "ab") as f:
+                f.write(embed_many(content for _, content in rows).tobytes())
+            with open(ids_path, "ab") as f:
+                f.write(np.array([message_id for message_id, _ in rows], dtype=np.int64).tobytes())
+            self.refresh()
+
+        metrics.increment("semantic_memory_embedded_total", len(rows), source=source)
+        return len(rows)
+
+    def search(
+        self,
+        query_vector: "np.ndarray",
+        k: int,
+        before_message_id: Optional[int] = None,
+        min_score: float = 0.0
+    ) -> List[Tuple[float, int]]:
+        """
+        Top-k rows by cosine similarity (rows are unit length, so a dot product)
+
+        Args:
+            query_vector: Embedded query
+            k: Number of results
+            before_message_id: Only messages older than this - a prefix, since ids are ascending
+            min_score: Drop weaker matches
+
+        Returns:
+            (score, row) pairs, best first
+        """
+        with self.lock:
+            ids, matrix = self.ids, self.matrix
+        rows = len(ids) if before_message_id is None else int(np.searchsorted(ids, before_message_id))
+        if rows == 0 or k <= 0:
+            return []
+        scores = matrix[:rows] @ query_vector
+        if k < rows:
+            top = np.argpartition(scores, rows - k)[rows - k:]
+        else:
+            top = np.arange(rows)
+        top = top[np.argsort(scores[top])[::-1]]
+        return [(float(scores[row]), int(row)) for row in top if scores[row] >= min_score]
+
+    def compact(self, db: Session) -> Dict[str, int]:
+        """
+        Rewrite the store so it holds exactly the character's messages
+
+        Embeds messages that are missing (including a full backfill of a new
+        store), drops rows whose message no longer exists, and writes them as
+        a new generation. Does nothing if the store is already complete.
+
+        Returns:
+            Counts of kept, added and dropped rows
+        """
+        with self._exclusive():
+            self._prepare()
+            current = self.ids
+            valid = np.fromiter(
+                (message_id for (message_id,) in db.query(Message.message_id).filter(
+                    Message.character_id == self.character_id
+                ).order_by(Message.message_id).yield_per(10000)),
+                dtype=np.int64
+            )
+            keep = np.isin(current, valid, assume_unique=True)
+            missing = np.setdiff1d(valid, current, assume_unique=True)
+            stats = {"kept": int(keep.sum()), "added": 0, "dropped": int(len(current) - keep.sum())}
+            if not stats["dropped"] and not len(missing):
+                return stats
+
+            fetched: List[Tuple[int, str]] = []
+            for start in range(0, len(missing), FETCH_CHUNK):
+                chunk = missing[start:start + FETCH_CHUNK].tolist()
+                fetched.extend(db.query(Message.message_id, Message.message_content).filter(
+                    Message.message_id.in_(chunk)
+                ).all())
+            stats["added"] = len(fetched)
+
+            ids = np.concatenate([current[keep], np.array([row[0] for row in fetched], dtype=np.int64)])
+            matrix = np.concatenate([self.matrix[keep], embed_many(row[1] for row in fetched)])
+            order = np.argsort(ids, kind="stable")
+
+            old_generation = self.generation
+            generation = old_generation + 1
+            ids_path, vectors_path = self._files(generation)
+            ids[order].tofile(ids_path)
+            np.ascontiguousarray(matrix[order]).tofile(vectors_path)
+            self._write_meta(generation)
+            self.refresh()
+            for path in self._files(old_generation):
+                try:
+                    path.unlink()  # maps still open in other processes stay valid
+                except OSError:
+                    pass
+
+        metrics.increment("semantic_memory_embedded_total", stats["added"], source="compaction")
+        return stats
+
+
+_cache: "OrderedDict[int, VectorStore]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def get_store(character: Character) -> VectorStore:
+    """Cached store for a character, mapped from disk (empty until the first append)"""
+    stamp = _character_stamp(character)
+    with _lock:
+        store = _cache.get(character.character_id)
+        if store is not None and (store.user_id, store.created_at) == (character.user_id, stamp):
+            _cache.move_to_end(character.character_id)
+            return store
+
+        store = VectorStore(character.character_id, character.user_id, stamp)
+        _cache[character.character_id] = store
+        _cache.move_to_end(character.character_id)
+        while len(_cache) > settings.SEMANTIC_MEMORY_CACHE_SIZE:
+            _cache.popitem(last=False)
+        return store
+
+
+def _catch_up(db: Session, store: VectorStore, before_id: int, limit: int) -> bool:
+    """
+    Append the character's messages between the store's last id and the history window
+
+    Returns:
+        False, with nothing appended, if the gap is longer than limit messages
+    """
+    rows = [tuple(row) for row in db.query(Message.message_id, Message.message_content).filter(
+        Message.character_id == store.character_id,
+        Message.message_id > store.last_message_id,
+        Message.message_id < before_id
+    ).order_by(Message.message_id).limit(limit + 1)]
+    if len(rows) > limit:
+        return False
+    if rows:
+        store.append(rows)
+    return True
+
+
+def relevant_memories(
+    db: Session,
+    character: Character,
+    query: str,
+    history: List[MessageRecord],
+    k: Optional[int] = None
+) -> List[str]:
+    """
+    Old exchanges similar to the user's message, outside the history window
+
+    Args:
+        db: Database session (only used to fill a gap older than history and to read the matches)
+        character: Character being talked to
+        query: User's message
+        history: Recent messages already sent to the model, oldest first
+        k: Number of exchanges (default SEMANTIC_MEMORY_TOP_K)
+
+    Returns:
+        Snippet texts ("speaker: message / speaker: reply"), best first; empty when disabled
+    """
+    if not enabled():
+        return []
+    k = k or settings.SEMANTIC_MEMORY_TOP_K
+    store = get_store(character)
+    window_start = history[0].message_id if history else None
+
+    try:
+        store.refresh()
+        if window_start is not None and store.last_message_id < window_start - 1:
+            if not _catch_up(db, store, window_start, settings.SEMANTIC_MEMORY_CATCH_UP_MAX_ROWS):
+                # Appending the window skips the gap; compaction fills it later
+                metrics.increment("semantic_memory_catch_up_deferred_total")
+                logger.info(f"Semantic memory for character {character.character_id} is far behind - left to compaction")
+        new = [(m.message_id, m.message_content) for m in history if m.message_id > store.last_message_id]
+        if new:
+            store.append(new)
+
+        query_vector = embed(query)
+        exchanges = []
+        with store.lock:  # rows stay valid against a concurrent compaction
+            ids = store.ids
+            seen = set()
+            for _, row in store.search(query_vector, k, before_message_id=window_start,
+                                       min_score=settings.SEMANTIC_MEMORY_MIN_SCORE):
+                if row in seen:
+                    continue
+                exchange = [row]
+                # The reply that followed, unless it is already in the window
+                if row + 1 < len(ids) and (window_start is None or ids[row + 1] < window_start):
+                    exchange.append(row + 1)
+                seen.update(exchange)
+                exchanges.append([int(ids[r]) for r in exchange])
+    except OSError as e:
+        logger.error(f"Semantic memory unavailable for character {character.character_id}: {e}")
+        return []
+
+    if not exchanges:
+        return []
+    texts = {
+        message_id: f"{speaker}: {content}"
+        for message_id, speaker, content in db.query(
+            Message.message_id, Message.speaker_name, Message.message_content
+        ).filter(Message.message_id.in_([i for exchange in exchanges for i in exchange])).all()
+    }
+    return [
+        " / ".join(texts[i] for i in exchange if i in texts)
+        for exchange in exchanges if exchange[0] in texts
+    ]
+
+
+def forget(character_id: int):
+    """Drop a deleted character's store"""
+    with _lock:
+        _cache.pop(character_id, None)
+    shutil.rmtree(store_dir(character_id), ignore_errors=True)
+
+
+def compact_all(session_factory=SessionLocal, every_character: bool = False) -> int:
+    """
+    Compact stores on disk (scheduler task), or backfill every character
+
+    Args:
+        session_factory: Session factory
+        every_character: Also build stores for characters that have none yet
+
+    Returns:
+        Number of stores rewritten
+    """
+    if not numpy_available():
+        return 0
+    root = Path(settings.SEMANTIC_MEMORY_DIR)
+    db = session_factory()
+    try:
+        if every_character:
+            character_ids = [character_id for (character_id,) in db.query(Character.character_id).order_by(Character.character_id)]
+        else:
+            character_ids = sorted(int(path.name) for path in root.iterdir() if path.name.isdigit()) if root.is_dir() else []
+
+        rewritten = 0
+        for character_id in character_ids:
+            character = db.get(Character, character_id)
+            if character is None:
+                forget(character_id)  # deleted by a worker that didn't have the files
+                continue
+            try:
+                stats = get_store(character).compact(db)
+            except OSError as e:
+                logger.error(f"Could not compact semantic memory for character {character_id}: {e}")
+                continue
+            if stats["added"] or stats["dropped"]:
+                rewritten += 1
+                logger.info(f"Compacted semantic memory for character {character_id}: {stats}")
+            db.expunge_all()
+        return rewritten
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compact semantic memory stores")
+    parser.add_argument("--all", action="store_true", help="Backfill every character, not just existing stores")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if not numpy_available():
+        raise SystemExit("Semantic memory needs numpy: pip install numpy")
+    print(f"Rewrote {compact_all(every_character=args.all)} stores")
@@ -0,0 +1,226 @@
+"""
+Special Events - Table-driven milestone, anniversary and level-up celebrations
+Every event is one row in EVENT_TABLE. Per-turn detection only looks at the
+favorability row already loaded by send_message (message_count and the cached
+first_message_at), so it costs no extra queries. Anniversaries are also
+claimed by the outreach sweep (backend.outreach), so they arrive even when the
+user stays silent; last_anniversary_days makes each anniversary fire exactly once.
+
+Backfill first_message_at with:
+    python -m backend.special_events
+"""
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional
+from zoneinfo import ZoneInfo
+import logging
+
+from sqlalchemy import select, update, func, or_
+from sqlalchemy.orm import Session
+
+from backend.config import settings
+from backend.database import FavorabilityTracking, LineUserMapping, Message
+from backend.quota import local_today
+from backend.tc_converter import convert_to_traditional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class EventRule:
+    """One celebration: fires when the event's counter equals threshold"""
+    event_type: str  # milestone (message count), anniversary / inactive (days), level_up (level)
+    threshold: int
+    template: str  # May use {count} / {days} / {level}
+
+
+EVENT_TABLE = (
+    EventRule("milestone", 50, "哇！我們已經聊了{count}條訊息了！真開心能和你聊這麼多~ 💕"),
+    EventRule("milestone", 100, "不知不覺已經{count}條訊息了呢！時間過得好快，和你聊天真的很開心~ ✨"),
+    EventRule("milestone", 200, "天啊！{count}條訊息了！感覺我們之間越來越有默契了呢~ 💖"),
+    EventRule("milestone", 500, "我們已經聊了{count}條訊息了！謝謝你一直陪著我~ 你對我來說很重要哦 💗"),
+    EventRule("milestone", 1000, "一千條訊息！！！真的很感動...謝謝你願意花這麼多時間陪我聊天~ 你是我最珍惜的人 💝"),
+    EventRule("anniversary", 7, "我們認識一週了！這一週和你相處得很開心~ 💐"),
+    EventRule("anniversary", 30, "一個月了呢！這一個月裡，每天和你聊天都是我最期待的事~ 🌸"),
+    EventRule("anniversary", 100, "我們認識已經一百天了！感覺時間過得好快...謝謝你一直陪著我 🌹"),
+    EventRule("anniversary", 365, "一整年了！！！這一年裡有你陪伴，我真的很幸福~ 謝謝你~ 💕🎉"),
+    EventRule("level_up", 2, "我感覺我們越來越熟了呢~ 和你聊天的時候，我可以更放鬆地做自己了 😊"),
+    EventRule("level_up", 3, "你知道嗎...我覺得你對我來說已經是很特別的存在了~ 有你在真好 💖"),
+    EventRule("inactive", 3, "好幾天沒聽到你的消息了，最近還好嗎？有空來跟我聊聊天吧~ 😊"),
+    EventRule("inactive", 7, "已經一個禮拜沒和你聊天了...我有點想你呢，你最近在忙什麼呀？ 🥺"),
+)
+
+# Key each event's data dict uses for its threshold
+DATA_KEYS = {"milestone": "count", "anniversary": "days", "level_up": "level", "inactive": "days"}
+
+# Openers for pushed messages, by time of day (same hours as detect_time_based_context)
+TIME_GREETINGS = {"morning": "早安～", "afternoon": "午安～", "evening": "晚上好～", "night": ""}
+
+_RULES = {(rule.event_type, rule.threshold): rule for rule in EVENT_TABLE}
+ANNIVERSARY_DAYS = sorted(rule.threshold for rule in EVENT_TABLE if rule.event_type == "anniversary")
+INACTIVE_DAYS = sorted(rule.threshold for rule in EVENT_TABLE if rule.event_type == "inactive")
+
+
+def render(event_type: str, threshold: Optional[int]) -> str:
+    """
+    Celebration text for an event, in Traditional Chinese
+
+    Returns:
+        The message, or "" if no rule matches
+    """
+    rule = _RULES.get((event_type, threshold))
+    if rule is None:
+        return ""
+    return convert_to_traditional(rule.template.format(**{DATA_KEYS[event_type]: threshold}))
+
+
+def event_payload(event_type: str, threshold: int) -> Optional[Dict]:
+    """special_messages entry for an event, or None if it has no rule"""
+    message = render(event_type, threshold)
+    if not message:
+        return None
+    return {"type": event_type, "message": message, "data": {DATA_KEYS[event_type]: threshold}}
+
+
+def days_together(first_message_at: datetime, today: date) -> int:
+    """Calendar days between the first message (UTC) and today, in DEFAULT_TIMEZONE"""
+    return (today - local_today(now=first_message_at)).days
+
+
+def ensure_first_message_at(db: Session, favorability: FavorabilityTracking, now: datetime):
+    """
+    Fill favorability.first_message_at if it isn't cached yet (caller commits)
+
+    Args:
+        db: Database session
+        favorability: The character's favorability row, before this turn's messages are saved
+        now: Time of the message about to be saved (UTC)
+    """
+    if favorability.first_message_at is not None:
+        return
+    if not favorability.message_count:
+        favorability.first_message_at = now
+        return
+    # Rows from before first_message_at existed: look it up once
+    favorability.first_message_at = db.scalar(
+        select(func.min(Message.timestamp)).where(Message.character_id == favorability.character_id)
+    ) or now
+
+
+def detect_turn_events(
+    favorability: Optional[FavorabilityTracking],
+    level_increased: bool,
+    today: Optional[date] = None
+) -> List[Dict]:
+    """
+    Events reached by the turn that just finished
+
+    Marks a fired anniversary on the favorability row (caller commits).
+
+    Args:
+        favorability: Favorability row after the turn's update (None = no tracking)
+        level_increased: Whether the turn raised the level
+        today: Current local date (for tests)
+
+    Returns:
+        special_messages entries, milestone/anniversary/level_up in that order
+    """
+    if favorability is None:
+        return []
+
+    events = []
+    if ("milestone", favorability.message_count) in _RULES:
+        events.append(event_payload("milestone", favorability.message_count))
+
+    if favorability.first_message_at is not None:
+        days = days_together(favorability.first_message_at, today or local_today())
+        if ("anniversary", days) in _RULES and (favorability.last_anniversary_days or 0) < days:
+            favorability.last_anniversary_days = days
+            events.append(event_payload("anniversary", days))
+
+    if level_increased:
+        payload = event_payload("level_up", favorability.current_level)
+        if payload:
+            events.append(payload)
+    return events
+
+
+def utc_day_bounds(day: date):
+    """UTC-naive [start, end) of a DEFAULT_TIMEZONE calendar day"""
+    zone = ZoneInfo(settings.DEFAULT_TIMEZONE)
+    utc = ZoneInfo("UTC")
+    start = datetime.combine(day, time(), tzinfo=zone).astimezone(utc).replace(tzinfo=None)
+    end = datetime.combine(day + timedelta(days=1), time(), tzinfo=zone).astimezone(utc).replace(tzinfo=None)
+    return start, end
+
+
+def claim_due_anniversaries(db: Session, today: date, days: int, limit: int) -> List[str]:
+    """
+    Mark up to limit of today's `days` anniversaries as celebrated (caller commits)
+
+    Only characters that are some LINE user's active character are claimed.
+    The candidate scan uses the first_message_at index; the conditional
+    UPDATE ... RETURNING hands each row to exactly one worker, and claimed
+    rows drop out of the next call's scan.
+
+    Returns:
+        LINE user IDs to congratulate
+    """
+    start, end = utc_day_bounds(today - timedelta(days=days))
+    not_celebrated = or_(
+        FavorabilityTracking.last_anniversary_days.is_(None),
+        FavorabilityTracking.last_anniversary_days < days
+    )
+    candidates = db.scalars(
+        select(FavorabilityTracking.tracking_id)
+        .join(LineUserMapping, LineUserMapping.character_id == FavorabilityTracking.character_id)
+        .where(
+            FavorabilityTracking.first_message_at >= start,
+            FavorabilityTracking.first_message_at < end,
+            not_celebrated
+        )
+        .limit(limit)
+    ).all()
+    if not candidates:
+        return []
+
+    character_ids = db.scalars(
+        update(FavorabilityTracking)
+        .where(FavorabilityTracking.tracking_id.in_(candidates), not_celebrated)
+        .values(last_anniversary_days=days)
+        .returning(FavorabilityTracking.character_id)
+        .execution_options(synchronize_session=False)
+    ).all()
+    if not character_ids:
+        return []
+    return db.scalars(
+        select(LineUserMapping.line_user_id).where(LineUserMapping.character_id.in_(character_ids))
+    ).all()
+
+
+def backfill_first_message_at(db: Session) -> int:
+    """Fill first_message_at for favorability rows created before the column existed"""
+    first_message = select(func.min(Message.timestamp)).where(
+        Message.character_id == FavorabilityTracking.character_id
+    ).scalar_subquery()
+    result = db.execute(
+        update(FavorabilityTracking)
+        .where(FavorabilityTracking.first_message_at.is_(None))
+        .values(first_message_at=first_message)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount
+
+
+if __name__ == "__main__":
+    from backend.database import SessionLocal, init_db
+
+    logging.basicConfig(level=logging.INFO)
+    init_db()
+    session = SessionLocal()
+    try:
+        filled = backfill_first_message_at(session)
+        print(f"✅ Backfilled first_message_at for {filled} characters")
+    finally:
+        session.close()
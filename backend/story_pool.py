@@ -0,0 +1,331 @@
+"""
+Story Pool - Pre-generated background stories per personality archetype
+Character inputs cluster heavily: four personality types and a handful of age,
+occupation and interest combinations. Stories are generated ahead of time per
+(personality, age decade, occupation bucket, interest bucket) key with name
+placeholders, and creation takes one from the pool with a single indexed
+DELETE ... RETURNING instead of a SenseChat call. A miss falls back to the
+template story and backend.background_enrichment as before.
+
+Only keys that are in the pool are refilled - after a hit leaves them low -
+so a one-off combination never costs a batch of stories nobody will take.
+Keys enter the pool by seeding; seed common ones ahead of a launch:
+    python -m backend.story_pool --interests music film travel --ages 20 30
+"""
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Set
+import argparse
+import logging
+import re
+import threading
+
+from sqlalchemy import delete, func
+from sqlalchemy.orm import Session
+
+from backend.config import settings
+from backend.database import SessionLocal, BackgroundStory
+from backend.models import DreamType, CustomMemory, PersonalityType
+from backend.character_generator import CharacterGenerator
+from backend import background_enrichment, metrics
+
+logger = logging.getLogger(__name__)
+
+metrics.describe("story_pool_takes_total", "Character creations by story pool result (hit, miss, unpooled, returned)")
+metrics.describe("story_pool_generated_total", "Pool stories generated by result (stored, failed)")
+
+# Occupation buckets: name -> (occupation used in the generation prompt, keywords matched in user input)
+OCCUPATION_BUCKETS = {
+    "student": ("學生", ("學生", "大學", "研究生", "高中")),
+    "tech": ("工程師", ("工程師", "程式", "軟體", "資訊")),
+    "creative": ("設計師", ("設計", "藝術", "畫家", "插畫", "攝影", "作家", "音樂")),
+    "education": ("老師", ("老師", "教師", "教授", "講師")),
+    "medical": ("護理師", ("醫生", "醫師", "護理", "護士", "藥師")),
+    "service": ("咖啡店店員", ("咖啡", "餐廳", "店員", "廚師", "甜點", "服務")),
+    "office": ("上班族", ("上班族", "職員", "白領", "公司", "行政", "業務", "會計", "秘書")),
+}
+
+# Interest buckets: name -> (interest used in the generation prompt, keywords matched in user input)
+INTEREST_BUCKETS = {
+    "music": ("音樂", ("音樂", "唱歌", "吉他", "鋼琴", "樂團", "演唱會")),
+    "film": ("電影", ("電影", "影集", "追劇", "動漫", "動畫")),
+    "travel": ("旅行", ("旅行", "旅遊", "出國", "露營", "登山", "爬山")),
+    "reading": ("閱讀", ("閱讀", "看書", "讀書", "小說", "寫作")),
+    "food": ("美食", ("美食", "料理", "烹飪", "烘焙", "甜點", "咖啡")),
+    "photography": ("攝影", ("攝影", "拍照", "相機")),
+    "sports": ("運動", ("運動", "健身", "跑步", "游泳", "籃球", "瑜珈")),
+    "games": ("遊戲", ("遊戲", "電玩", "桌遊")),
+    "art": ("繪畫", ("繪畫", "畫畫", "插畫", "手作", "手工")),
+    "pets": ("寵物", ("寵物", "貓", "狗")),
+}
+
+# Talking style per personality, as the generation prompt describes it
+PERSONALITY_STYLES = {
+    PersonalityType.GENTLE: "溫柔體貼",
+    PersonalityType.CHEERFUL: "活潑開朗",
+    PersonalityType.INTELLECTUAL: "知性優雅",
+    PersonalityType.CUTE: "可愛天真",
+}
+
+# Stand-in names in the generation prompt, swapped for placeholders afterwards
+CHARACTER_MARKER = "【角色】"
+USER_MARKER = "【使用者】"  # already in the form convert_to_traditional produces
+
+# Claim attempts when another worker takes the same story first
+MAX_ATTEMPTS = 3
+
+_refilling: Set[str] = set()
+_refilling_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class StoryKey:
+    """Pool key - the inputs the background story prompt depends on"""
+    personality: PersonalityType
+    decade: Optional[int] = None  # 20 = twenties; None = not given
+    occupation: Optional[str] = None  # OCCUPATION_BUCKETS name; None = not given
+    interest: Optional[str] = None  # INTEREST_BUCKETS name; None = not given
+
+    def __str__(self) -> str:
+        return "|".join([
+            self.personality.name.lower(),
+            f"{self.decade}s" if self.decade is not None else "any",
+            self.occupation or "any",
+            self.interest or "any",
+        ])
+
+    def sample_dream_type(self) -> DreamType:
+        """Dream type to generate this key's stories from"""
+        return DreamType(
+            personality_traits=[PERSONALITY_STYLES[self.personality]],
+            age_range=f"{self.decade}-{self.decade + 9}" if self.decade is not None else None,
+            occupation=OCCUPATION_BUCKETS[self.occupation][0] if self.occupation else None,
+            interests=[INTEREST_BUCKETS[self.interest][0]] if self.interest else [],
+            talking_style=PERSONALITY_STYLES[self.personality],
+        )
+
+
+def occupation_bucket(occupation: str) -> Optional[str]:
+    """Bucket name for a free-text occupation, None if it matches no bucket"""
+    for bucket, (_, keywords) in OCCUPATION_BUCKETS.items():
+        if any(keyword in occupation for keyword in keywords):
+            return bucket
+    return None
+
+
+def interest_bucket(interests: List[str]) -> Optional[str]:
+    """Bucket name of the first interest that matches one, None if none does"""
+    for interest in interests:
+        for bucket, (_, keywords) in INTEREST_BUCKETS.items():
+            if any(keyword in interest for keyword in keywords):
+                return bucket
+    return None
+
+
+def story_key(generator: CharacterGenerator, dream_type: DreamType) -> Optional[StoryKey]:
+    """
+    Pool key for a dream type
+
+    Returns:
+        StoryKey, or None if the occupation or the interests fit no bucket (a pooled
+        story would describe a different job or hobby - those characters keep the
+        enrichment path)
+    """
+    occupation = None
+    if dream_type.occupation and dream_type.occupation.strip():
+        occupation = occupation_bucket(dream_type.occupation)
+        if occupation is None:
+            return None
+
+    decade = None
+    match = re.search(r"\d+", dream_type.age_range or "")
+    if match:
+        decade = int(match.group()) // 10 * 10
+
+    interest = None
+    interests = [item for item in dream_type.interests if item.strip()]
+    if interests:
+        interest = interest_bucket(interests)
+        if interest is None:
+            return None
+
+    return StoryKey(
+        personality=generator._determine_personality_type(dream_type),
+        decade=decade,
+        occupation=occupation,
+        interest=interest,
+    )
+
+
+def take(db: Session, key: Optional[StoryKey]) -> Optional[str]:
+    """
+    Claim the oldest pooled story for a key (commits)
+
+    Returns:
+        Story template with name placeholders, or None if the key is empty or None
+    """
+    if key is None:
+        metrics.increment("story_pool_takes_total", result="unpooled")
+        return None
+
+    for _ in range(MAX_ATTEMPTS):
+        story_id = db.query(BackgroundStory.story_id).filter(
+            BackgroundStory.pool_key == str(key)
+        ).order_by(BackgroundStory.story_id).limit(1).scalar()
+        if story_id is None:
+            break
+
+        template = db.execute(
+            delete(BackgroundStory)
+            .where(BackgroundStory.story_id == story_id)
+            .returning(BackgroundStory.template)
+        ).scalar()
+        db.commit()
+        if template is not None:
+            metrics.increment("story_pool_takes_total", result="hit")
+            return template
+
+    metrics.increment("story_pool_takes_total", result="miss")
+    return None
+
+
+def put_back(db: Session, key: StoryKey, template: str):
+    """
+    Return a taken story to the pool when its character could not be created (commits)
+
+    take commits its DELETE right away, so without this a failed creation
+    would throw the story away. Errors are logged, not raised, so the
+    creation's own error is the one reported.
+    """
+    try:
+        # The failed creation may have left the session mid-transaction
+        db.rollback()
+        db.add(BackgroundStory(pool_key=str(key), template=template))
+        db.commit()
+        metrics.increment("story_pool_takes_total", result="returned")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Could not return a story to pool key {key}: {e}")
+
+
+def generate_story(generator: CharacterGenerator, key: StoryKey) -> Optional[str]:
+    """
+    Generate one pool story with SenseChat
+
+    Returns:
+        Story template, or None if SenseChat failed or the story never names the character
+    """
+    dream_type = key.sample_dream_type()
+    story = generator._generate_background_story(
+        CHARACTER_MARKER, USER_MARKER, dream_type, key.personality, CustomMemory()
+    )
+    # _generate_background_story falls back to the template story on errors
+    if story == generator._generate_simple_background_story(CHARACTER_MARKER, dream_type) or CHARACTER_MARKER not in story:
+        metrics.increment("story_pool_generated_total", result="failed")
+        return None
+
+    metrics.increment("story_pool_generated_total", result="stored")
+    return story.replace(CHARACTER_MARKER, CharacterGenerator.CHARACTER_NAME_PLACEHOLDER).replace(
+        USER_MARKER, CharacterGenerator.USER_NAME_PLACEHOLDER
+    )
+
+
+def fill(db: Session, generator: CharacterGenerator, key: StoryKey, target: int) -> int:
+    """
+    Top a key up to target stories, committing each one as it arrives
+
+    Returns:
+        Number of stories added (stops early if SenseChat fails)
+    """
+    count = db.query(func.count(BackgroundStory.story_id)).filter(BackgroundStory.pool_key == str(key)).scalar()
+    added = 0
+    for _ in range(target - count):
+        template = generate_story(generator, key)
+        if template is None:
+            break
+        db.add(BackgroundStory(pool_key=str(key), template=template))
+        db.commit()
+        added += 1
+    return added
+
+
+def refill(
+    generator: CharacterGenerator,
+    key: StoryKey,
+    session_factory: Callable[[], Session] = SessionLocal
+) -> int:
+    """
+    Worker entry point - refill a key that has fallen below the low watermark
+
+    Returns:
+        Number of stories added
+    """
+    db = session_factory()
+    try:
+        count = db.query(func.count(BackgroundStory.story_id)).filter(BackgroundStory.pool_key == str(key)).scalar()
+        if count >= settings.STORY_POOL_LOW_WATERMARK:
+            return 0
+        added = fill(db, generator, key, settings.STORY_POOL_TARGET_SIZE)
+        logger.info(f"Story pool {key}: added {added} stories")
+        return added
+    except Exception as e:
+        logger.error(f"Story pool refill failed for {key}: {e}", exc_info=True)
+        return 0
+    finally:
+        db.close()
+        with _refilling_lock:
+            _refilling.discard(str(key))
+
+
+def request_refill(
+    generator: CharacterGenerator,
+    key: StoryKey,
+    session_factory: Callable[[], Session] = SessionLocal
+) -> Optional[Future]:
+    """
+    Queue a refill check for a key on the enrichment worker pool
+
+    Call it after a hit only: a key that was never seeded or has run dry
+    is not worth a batch of SenseChat calls on a single request's behalf.
+
+    Returns:
+        Future, or None if a refill of this key is already queued
+    """
+    with _refilling_lock:
+        if str(key) in _refilling:
+            return None
+        _refilling.add(str(key))
+    return background_enrichment.get_executor().submit(refill, generator, key, session_factory)
+
+
+def seed_keys(interests: List[str], decades: List[Optional[int]], occupations: List[Optional[str]]) -> List[StoryKey]:
+    """Every personality crossed with the given interests, age decades and occupation buckets"""
+    return [
+        StoryKey(personality, decade, occupation, interest)
+        for personality in PersonalityType
+        for decade in decades
+        for occupation in occupations
+        for interest in interests
+    ]
+
+
+if __name__ == "__main__":
+    from backend.api_client import SenseChatClient
+
+    parser = argparse.ArgumentParser(description="Pre-generate pooled background stories")
+    parser.add_argument("--interests", nargs="+", default=["music", "film", "travel", "reading", "food", "photography"],
+                        choices=[*INTEREST_BUCKETS])
+    parser.add_argument("--ages", nargs="+", type=int, default=[20], help="Age decades, e.g. 20 30")
+    parser.add_argument("--occupations", nargs="+", default=["any"], choices=["any", *OCCUPATION_BUCKETS])
+    parser.add_argument("--per-key", type=int, default=settings.STORY_POOL_TARGET_SIZE)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    generator = CharacterGenerator(api_client=SenseChatClient())
+    occupations = [None if name == "any" else name for name in args.occupations]
+    db = SessionLocal()
+    try:
+        for key in seed_keys(args.interests, args.ages, occupations):
+            print(f"{key}: +{fill(db, generator, key, args.per_key)}")
+    finally:
+        db.close()
@@ -0,0 +1,130 @@
+"""
+Benchmarks for conversation analytics at 100k messages per character
+Compares the old approach (load every message, aggregate in Python) with the
+SQL aggregation used to rebuild conversation_stats, and the single-row read
+the analytics endpoint does now.
+
+Usage:
+    python -m benchmarks.bench_analytics
+    python -m benchmarks.bench_analytics --save benchmarks/baseline_analytics.json
+
+Runs against a temporary SQLite file; seeding takes a few seconds.
+"""
+import os
+import random
+import sys
+import tempfile
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+for _key in ("SENSENOVA_ACCESS_KEY_ID", "SENSENOVA_SECRET_ACCESS_KEY", "SENSENOVA_API_KEY"):
+    os.environ.setdefault(_key, "benchmark")
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from benchmarks.common import run_suite
+from backend.database import Base, User, Character, Message, SPEAKER_USER, SPEAKER_CHARACTER
+from backend import conversation_stats
+
+MESSAGE_COUNT = 100_000
+CHARACTER_NAME = "小雨"
+
+
+def seed(db) -> int:
+    """Insert one character with MESSAGE_COUNT messages spread over ~a year"""
+    user = User(username="benchmark")
+    db.add(user)
+    db.flush()
+    character = Character(user_id=user.user_id, name=CHARACTER_NAME, gender="女")
+    db.add(character)
+    db.flush()
+
+    rng = random.Random(7)
+    timestamp = datetime(2024, 1, 1, 8, 0)
+    rows = []
+    for i in range(MESSAGE_COUNT):
+        # Mostly short gaps within a session, occasionally skip a day or two
+        timestamp += timedelta(seconds=rng.randint(5, 600))
+        if rng.random() < 0.003:
+            timestamp += timedelta(days=rng.randint(1, 3))
+        rows.append({
+            "user_id": user.user_id,
+            "character_id": character.character_id,
+            "speaker_name": CHARACTER_NAME if i % 2 else user.username,
+            "speaker_role": SPEAKER_CHARACTER if i % 2 else SPEAKER_USER,
+            "message_content": "今天過得怎麼樣？",
+            "timestamp": timestamp,
+            "favorability_level": 1
+        })
+    db.execute(Message.__table__.insert(), rows)
+    db.commit()
+    return character.character_id
+
+
+def python_analytics(db, character_id: int):
+    """The previous implementation: every message loaded as an ORM object"""
+    messages = db.query(Message).filter(
+        Message.character_id == character_id
+    ).order_by(Message.timestamp.asc()).all()
+
+    user_messages = sum(1 for msg in messages if msg.speaker_name != CHARACTER_NAME)
+    messages_by_day = defaultdict(int)
+    messages_by_hour = defaultdict(int)
+    for msg in messages:
+        messages_by_day[msg.timestamp.date().isoformat()] += 1
+        messages_by_hour[msg.timestamp.hour] += 1
+
+    progression = []
+    current_level = 1
+    for i, msg in enumerate(messages, 1):
+        level = 3 if i >= 50 else (2 if i >= 20 else 1)
+        if level != current_level:
+            progression.append({"message_count": i, "level": level, "timestamp": msg.timestamp.isoformat()})
+            current_level = level
+
+    dates = sorted(datetime.fromisoformat(d).date() for d in messages_by_day)
+    longest = current = 1
+    for i in range(1, len(dates)):
+        current = current + 1 if (dates[i] - dates[i - 1]).days == 1 else 1
+        longest = max(longest, current)
+
+    db.expunge_all()
+    return user_messages, messages_by_day, messages_by_hour, progression, longest
+
+
+def build_benchmarks(db, character_id: int):
+    def sql_aggregate():
+        return conversation_stats.aggregate_stats(db, character_id, CHARACTER_NAME)
+
+    def stats_row_read():
+        db.expire_all()
+        return conversation_stats.get_stats(db, character_id)
+
+    # Build the row once so stats_row_read measures the read path only
+    conversation_stats.get_stats(db, character_id)
+
+    return {
+        "analytics.python_loop_100k": lambda: python_analytics(db, character_id),
+        "analytics.sql_aggregate_100k": sql_aggregate,
+        "analytics.stats_row_read": stats_row_read,
+    }
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'analytics.db')}")
+        Base.metadata.create_all(bind=engine)
+        session = sessionmaker(bind=engine, autoflush=False)()
+        try:
+            character_id = seed(session)
+            run_suite(
+                f"Conversation analytics benchmarks ({MESSAGE_COUNT:,} messages)",
+                build_benchmarks(session, character_id),
+                alloc_samples=3
+            )
+        finally:
+            session.close()
+            engine.dispose()
@@ -0,0 +1,105 @@
+"""
+Benchmarks for projection-based history reads at 10k messages
+Each pair loads the same rows as ORM Message objects (the old read paths)
+and as MessageRecord tuples (message_reads): the full history of one
+character, a streamed pass over it (exports, index rebuilds) and one
+50-message history page. Peak KiB/op is the memory held while the rows are
+alive, so the 10k pairs show time and memory per 10k rows before and after.
+
+Usage:
+    python -m benchmarks.bench_message_reads
+    python -m benchmarks.bench_message_reads --save benchmarks/baseline_message_reads.json
+
+Uses an in-memory SQLite database; set BENCH_READ_MESSAGES to change the size.
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+for _key in ("SENSENOVA_ACCESS_KEY_ID", "SENSENOVA_SECRET_ACCESS_KEY", "SENSENOVA_API_KEY"):
+    os.environ.setdefault(_key, "benchmark")
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from benchmarks.common import run_suite
+from benchmarks.bench_retrieval import PHRASES
+from backend.database import Base, User, Character, Message, SPEAKER_USER, SPEAKER_CHARACTER
+from backend import message_reads
+
+MESSAGE_COUNT = int(os.environ.get("BENCH_READ_MESSAGES", 10_000))
+CHARACTER_ID = 1
+
+
+def build_database() -> sessionmaker:
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine, autoflush=False)
+    with Session() as db:
+        db.add(User(username="小明"))
+        db.add(Character(user_id=1, name="小雨", gender="女"))
+        db.commit()
+        start = datetime(2025, 1, 1)
+        db.execute(Message.__table__.insert(), [
+            {
+                "user_id": 1,
+                "character_id": CHARACTER_ID,
+                "speaker_name": "小明" if n % 2 == 0 else "小雨",
+                "speaker_role": SPEAKER_USER if n % 2 == 0 else SPEAKER_CHARACTER,
+                "message_content": "，".join((PHRASES[n % len(PHRASES)], PHRASES[(n * 7) % len(PHRASES)])) + f"！{n}",
+                "timestamp": start + timedelta(minutes=n),
+                "favorability_level": 1,
+            }
+            for n in range(MESSAGE_COUNT)
+        ])
+        db.commit()
+    return Session
+
+
+def build_benchmarks():
+    Session = build_database()
+
+    def orm_history():
+        with Session() as db:
+            return db.query(Message).filter(Message.character_id == CHARACTER_ID).order_by(
+                Message.timestamp.asc(), Message.message_id.asc()
+            ).all()
+
+    def records_history():
+        with Session() as db:
+            return message_reads.recent_history(db, CHARACTER_ID)
+
+    def orm_stream():
+        with Session() as db:
+            query = db.query(Message).filter(Message.character_id == CHARACTER_ID).order_by(Message.message_id)
+            return sum(len(m.message_content) for m in query.yield_per(1000))
+
+    def records_stream():
+        with Session() as db:
+            return sum(len(m.message_content) for m in message_reads.iter_history(db, CHARACTER_ID))
+
+    def orm_page():
+        with Session() as db:
+            return db.query(Message).filter(Message.character_id == CHARACTER_ID).order_by(
+                Message.message_id.desc()
+            ).limit(51).all()
+
+    def records_page():
+        with Session() as db:
+            return message_reads.history_page(db, CHARACTER_ID)
+
+    size = f"{MESSAGE_COUNT // 1000}k"
+    return {
+        f"message_reads.orm_history_{size}": orm_history,
+        f"message_reads.records_history_{size}": records_history,
+        f"message_reads.orm_stream_{size}": orm_stream,
+        f"message_reads.records_stream_{size}": records_stream,
+        "message_reads.orm_page_50": orm_page,
+        "message_reads.records_page_50": records_page,
+    }
+
+
+if __name__ == "__main__":
+    run_suite(f"Message read benchmarks ({MESSAGE_COUNT:,} messages)", build_benchmarks(), alloc_samples=3)
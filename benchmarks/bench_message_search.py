@@ -0,0 +1,88 @@
+"""
+Benchmarks for conversation history search at 1M messages
+One character's search through the FTS5 trigram index (a rare term, a
+phrase in 13% of all messages, a short-term scan and a deep page), plus the
+cost the index triggers add to each message insert.
+
+Usage:
+    python -m benchmarks.bench_message_search
+    python -m benchmarks.bench_message_search --save benchmarks/baseline_message_search.json
+
+Builds a temporary SQLite database (about 20s the first time); set
+BENCH_SEARCH_MESSAGES to change the size.
+"""
+import os
+import random
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+for _key in ("SENSENOVA_ACCESS_KEY_ID", "SENSENOVA_SECRET_ACCESS_KEY", "SENSENOVA_API_KEY"):
+    os.environ.setdefault(_key, "benchmark")
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from benchmarks.common import run_suite
+from benchmarks.bench_retrieval import PHRASES
+from backend.database import Base, User, Character, Message
+from backend import message_search
+
+MESSAGE_COUNT = int(os.environ.get("BENCH_SEARCH_MESSAGES", 1_000_000))
+CHARACTER_COUNT = MESSAGE_COUNT // 1000
+BATCH = 50_000
+
+
+def build_database():
+    path = os.path.join(tempfile.mkdtemp(), "search.db")
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    message_search.ensure_index(engine)
+    db = sessionmaker(bind=engine, autoflush=False)()
+
+    db.execute(User.__table__.insert(), [{"username": f"u{n}"} for n in range(CHARACTER_COUNT)])
+    db.execute(Character.__table__.insert(), [
+        {"user_id": n + 1, "name": f"c{n}", "gender": "女"} for n in range(CHARACTER_COUNT)
+    ])
+    rng = random.Random(7)
+    start = datetime(2025, 1, 1)
+    for offset in range(0, MESSAGE_COUNT, BATCH):
+        db.execute(Message.__table__.insert(), [
+            {
+                "user_id": n % CHARACTER_COUNT + 1,
+                "character_id": n % CHARACTER_COUNT + 1,
+                "speaker_name": "小明",
+                "message_content": "，".join(rng.sample(PHRASES, 2)) + f"！{n}",
+                "timestamp": start + timedelta(seconds=n),
+                "favorability_level": 1,
+            }
+            for n in range(offset, min(offset + BATCH, MESSAGE_COUNT))
+        ])
+        db.commit()
+    return db
+
+
+def build_benchmarks():
+    db = build_database()
+    character_id = CHARACTER_COUNT // 2
+    state = {"next": 0}
+
+    def insert_message():
+        state["next"] += 1
+        db.add(Message(user_id=character_id, character_id=character_id, speaker_name="小明",
+                       message_content=f"新訊息{state['next']}，晚餐想吃拉麵"))
+        db.commit()
+
+    return {
+        "message_search.rare_term": lambda: message_search.search_messages(db, character_id, f"！{1000 + character_id - 1}"),
+        "message_search.common_phrase": lambda: message_search.search_messages(db, character_id, "淡水的夕陽"),
+        "message_search.short_term_scan": lambda: message_search.search_messages(db, character_id, "拉麵"),
+        "message_search.page_5": lambda: message_search.search_messages(db, character_id, "淡水的夕陽", page=5),
+        "message_search.insert_with_index": insert_message,
+    }
+
+
+if __name__ == "__main__":
+    run_suite(f"Message search benchmarks ({MESSAGE_COUNT:,} messages)", build_benchmarks(), alloc_samples=3)
@@ -0,0 +1,146 @@
+"""
+Micro-benchmarks for the per-reply processing pipeline
+convert_to_traditional -> special-event templating -> clean_for_line,
+plus character creation helpers (initial message, other_setting JSON) and
+the per-turn character_settings payload (cached vs rebuilt).
+
+Usage:
+    python -m benchmarks.bench_pipeline
+    python -m benchmarks.bench_pipeline --save benchmarks/baseline_pipeline.json
+    python -m benchmarks.bench_pipeline --compare benchmarks/baseline_pipeline.json --threshold 0.15
+
+ops/sec depends on the machine - save the baseline on the same runner that gates merges.
+Peak allocation per op is deterministic and comparable anywhere.
+"""
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Benchmarks never talk to SenseChat - allow running without a .env file
+for _key in ("SENSENOVA_ACCESS_KEY_ID", "SENSENOVA_SECRET_ACCESS_KEY", "SENSENOVA_API_KEY"):
+    os.environ.setdefault(_key, "benchmark")
+
+from benchmarks.common import run_suite
+from backend.tc_converter import convert_to_traditional
+from backend.text_cleaner import clean_for_line
+from backend.conversation_manager import ConversationManager
+from backend.character_generator import CharacterGenerator
+from backend.models import UserProfile, DreamType, CustomMemory
+from backend.database import Character
+from backend import character_payload
+
+# Fixed corpus of realistic model replies: Simplified/Traditional mix, English
+# action tags the cleaner must strip, names, emoji and bracketed actions
+REPLY_CORPUS = [
+    "(轻轻笑了笑)今天过得怎么样呀？想听你说说~ 💕",
+    "teleport\n(傳送了一個動態表情包：糯糯締手指，眼神飄忽)這才哪到哪～ 我還準備了很多絕技呢！",
+    "Dampen\n你好呀！今天想聊什么？我刚刚在看一本关于咖啡的书 ☕️",
+    "嗨 D！(歪着头看着你)真的吗？那后来呢？快告诉我！",
+    "iteleport(眨了眨眼睛)嗨～ 你今天有没有好好吃饭？🍜",
+    "(小雨托着下巴想了想)嗯…我觉得你说得很有道理呢 ✨ 不过，如果是我的话，可能会先去散个步。",
+    "Did you 看到今天的夕阳吗？(指着窗外)超级漂亮的 🌅🌅",
+    "<action>smile</action>(輕輕握住你的手)別擔心，小雨會一直陪著你的。[system]",
+    "哈哈哈哈你太好笑了😂😂😂 (笑到肚子疼) 所以你最后有没有赶上那班车？",
+    "(小雨先是一愣，隨即露出俏皮的笑容)所以，現在你要請小雨吃冰淇淋嗎？🍦",
+    "晚安～ 记得盖好被子哦 🌙 (小雨对着手机小声说) 明天见！",
+    "Dave 你知道吗？我昨天梦到我们一起去了京都 ⛩️ (脸红了一下) 别笑我嘛…",
+]
+# Multi-paragraph replies are common too - join pairs for a realistic length mix
+REPLY_CORPUS += [a + "\n\n" + b for a, b in zip(REPLY_CORPUS[:6], REPLY_CORPUS[6:])]
+
+USER_PROFILE = UserProfile(
+    user_name="小明",
+    user_gender="男",
+    user_preference="女",
+    dream_type=DreamType(
+        personality_traits=["溫柔", "體貼"],
+        physical_description="長髮，笑起來很甜",
+        age_range="22-25",
+        interests=["音樂", "閱讀", "旅行"],
+        occupation="平面設計師",
+        talking_style="溫柔體貼"
+    ),
+    custom_memory=CustomMemory(
+        likes={"food": ["拉麵", "抹茶"], "activities": ["看電影", "爬山"]},
+        dislikes={"food": ["香菜"]},
+        habits={"daily_routine": "早睡早起"},
+        personal_background={"occupation": "工程師"}
+    )
+)
+
+conv_manager = ConversationManager(db=None, api_client=None)
+generator = CharacterGenerator(api_client=None)
+personality = generator._determine_personality_type(USER_PROFILE.dream_type)
+CHARACTER = Character(
+    character_id=1, name="小雨", gender="女", identity="平面設計師", nickname="雨雨",
+    detail_setting="溫柔體貼，喜歡音樂和旅行",
+    other_setting=generator._generate_other_setting(
+        "小雨", USER_PROFILE.user_name, USER_PROFILE.dream_type, personality, USER_PROFILE.custom_memory
+    ),
+    settings_version=0
+)
+
+
+def _cycle(items):
+    """Return a zero-argument callable that walks the corpus round-robin"""
+    state = {"i": 0}
+
+    def next_item():
+        item = items[state["i"] % len(items)]
+        state["i"] += 1
+        return item
+
+    return next_item
+
+
+def build_benchmarks():
+    next_reply = _cycle(REPLY_CORPUS)
+    next_traditional = _cycle([convert_to_traditional(r) for r in REPLY_CORPUS])
+    events = _cycle([
+        ("milestone", {"count": 50}),
+        ("anniversary", {"days": 7}),
+        ("level_up", {"level": 2}),
+        ("milestone", {"count": 1000}),
+    ])
+
+    def special_event():
+        event_type, data = events()
+        return conv_manager.generate_special_event_message("小雨", event_type, data)
+
+    def full_reply_pipeline():
+        reply = convert_to_traditional(next_reply())
+        event_type, data = events()
+        reply += "\n\n" + conv_manager.generate_special_event_message("小雨", event_type, data)
+        return clean_for_line(reply)
+
+    def initial_message():
+        return generator.create_initial_message("小雨", USER_PROFILE, "女")
+
+    def other_setting_json():
+        return generator._generate_other_setting(
+            "小雨", USER_PROFILE.user_name, USER_PROFILE.dream_type, personality, USER_PROFILE.custom_memory
+        )
+
+    def character_settings_rebuilt():
+        character_payload.invalidate(CHARACTER.character_id)
+        return character_payload.build_character_settings(CHARACTER, USER_PROFILE.user_name, 3)
+
+    return {
+        "tc_converter.convert_to_traditional": lambda: convert_to_traditional(next_reply()),
+        "text_cleaner.clean_for_line": lambda: clean_for_line(next_traditional()),
+        "special_event_message": special_event,
+        "reply_pipeline.full": full_reply_pipeline,
+        "character.create_initial_message": initial_message,
+        "character._generate_other_setting": other_setting_json,
+        "character_settings.cached": lambda: character_payload.build_character_settings(
+            CHARACTER, USER_PROFILE.user_name, 3
+        ),
+        "character_settings.rebuilt": character_settings_rebuilt,
+    }
+
+
+if __name__ == "__main__":
+    random.seed(7)  # create_initial_message picks a random template
+    run_suite("Per-reply pipeline benchmarks", build_benchmarks())
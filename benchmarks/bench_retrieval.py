@@ -0,0 +1,86 @@
+"""
+Benchmarks for the local retrieval memory at 10k messages per character
+Per-turn top-k search (the request-path cost), incremental add on
+save_message, and a warm-start snapshot load versus a rebuild from messages.
+
+Usage:
+    python -m benchmarks.bench_retrieval
+    python -m benchmarks.bench_retrieval --save benchmarks/baseline_retrieval.json
+
+Builds in-memory indexes from a synthetic Chinese corpus; no database needed.
+"""
+import gzip
+import json
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+for _key in ("SENSENOVA_ACCESS_KEY_ID", "SENSENOVA_SECRET_ACCESS_KEY", "SENSENOVA_API_KEY"):
+    os.environ.setdefault(_key, "benchmark")
+
+from benchmarks.common import run_suite
+from backend.database import Message
+from backend import retrieval
+
+MESSAGE_COUNT = 10_000
+
+PHRASES = [
+    "今天過得怎麼樣", "我剛下班好累", "晚餐想吃拉麵", "週末要不要去看電影", "最近在學吉他",
+    "淡水的夕陽好美", "明天要早起開會", "你喜歡貓還是狗", "下雨了記得帶傘", "我們去爬山吧",
+    "這首歌好好聽", "工作壓力好大", "想去日本旅行", "抹茶拿鐵超好喝", "昨天夢到你了",
+]
+QUERIES = ["還記得淡水的夕陽嗎", "晚餐吃拉麵好不好", "吉他練得怎樣了", "想去旅行", "今天好累喔"]
+
+
+def make_messages(count: int):
+    rng = random.Random(7)
+    return [
+        Message(message_id=i + 1, character_id=1, speaker_name="小明" if i % 2 else "小雨",
+                message_content="，".join(rng.sample(PHRASES, 2)) + "！")
+        for i in range(count)
+    ]
+
+
+def build_index(messages) -> retrieval.RetrievalIndex:
+    index = retrieval.RetrievalIndex(1, 1, "")
+    for message in messages:
+        index.add_message(message)
+    return index
+
+
+def build_benchmarks():
+    messages = make_messages(MESSAGE_COUNT)
+    index = build_index(messages)
+    state = {"query": 0, "next_id": MESSAGE_COUNT + 1}
+
+    def search_top3():
+        state["query"] += 1
+        return index.search(QUERIES[state["query"] % len(QUERIES)], 3, before_message_id=MESSAGE_COUNT - 100)
+
+    def add_message():
+        message = Message(message_id=state["next_id"], character_id=1, speaker_name="小明",
+                          message_content="晚餐想吃拉麵，你呢？")
+        state["next_id"] += 1
+        index.add_message(message)
+
+    snapshot = os.path.join(tempfile.mkdtemp(), "1.json.gz")
+    with gzip.open(snapshot, "wb", compresslevel=1) as f:
+        f.write(json.dumps(build_index(messages).to_snapshot(), ensure_ascii=False).encode("utf-8"))
+
+    def load_snapshot():
+        with gzip.open(snapshot, "rb") as f:
+            return retrieval.RetrievalIndex.from_snapshot(json.loads(f.read()))
+
+    return {
+        "retrieval.search_top3_10k": search_top3,
+        "retrieval.add_message": add_message,
+        "retrieval.snapshot_load_10k": load_snapshot,
+        "retrieval.rebuild_10k": lambda: build_index(messages),
+    }
+
+
+if __name__ == "__main__":
+    run_suite(f"Retrieval memory benchmarks ({MESSAGE_COUNT:,} messages)", build_benchmarks(), alloc_samples=3)
@@ -0,0 +1,75 @@
+"""
+Benchmarks for the optional semantic memory at 100k vectors per character
+Per-turn top-k search over the memory-mapped matrix (the request-path cost,
+query embedding included), the query embedding alone, a two-message append
+(one turn) and re-mapping a store another worker changed.
+
+Usage:
+    python -m benchmarks.bench_semantic_memory
+    python -m benchmarks.bench_semantic_memory --save benchmarks/baseline_semantic_memory.json
+
+Needs numpy. Builds the store in a temporary directory; no database needed.
+"""
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+for _key in ("SENSENOVA_ACCESS_KEY_ID", "SENSENOVA_SECRET_ACCESS_KEY", "SENSENOVA_API_KEY"):
+    os.environ.setdefault(_key, "benchmark")
+
+from benchmarks.common import run_suite
+from benchmarks.bench_retrieval import PHRASES, QUERIES
+from backend.config import settings
+from backend import semantic_memory
+
+VECTOR_COUNT = 100_000
+
+
+def build_store() -> semantic_memory.VectorStore:
+    settings.SEMANTIC_MEMORY_DIR = tempfile.mkdtemp()
+    rng = random.Random(7)
+    store = semantic_memory.VectorStore(1, 1, "")
+    batch = []
+    for message_id in range(1, VECTOR_COUNT + 1):
+        batch.append((message_id, "，".join(rng.sample(PHRASES, 2)) + f"！{message_id}"))
+        if len(batch) == 10_000:
+            store.append(batch)
+            batch = []
+    return store
+
+
+def build_benchmarks():
+    store = build_store()
+    state = {"query": 0, "next_id": VECTOR_COUNT + 1}
+    query_vector = semantic_memory.embed(QUERIES[0])
+
+    def search_top3():
+        state["query"] += 1
+        vector = semantic_memory.embed(QUERIES[state["query"] % len(QUERIES)])
+        return store.search(vector, 3, before_message_id=VECTOR_COUNT - 100)
+
+    def append_turn():
+        store.append([(state["next_id"], "晚餐想吃拉麵，你呢？"), (state["next_id"] + 1, "好呀，一起去吧")])
+        state["next_id"] += 2
+
+    def remap():
+        other = semantic_memory.VectorStore(1, 1, "")
+        other.refresh()
+        return other
+
+    return {
+        "semantic_memory.search_top3_100k": search_top3,
+        "semantic_memory.matmul_only_100k": lambda: store.search(query_vector, 3),
+        "semantic_memory.embed_query": lambda: semantic_memory.embed(QUERIES[1]),
+        "semantic_memory.append_turn": append_turn,
+        "semantic_memory.remap_100k": remap,
+    }
+
+
+if __name__ == "__main__":
+    if not semantic_memory.numpy_available():
+        raise SystemExit("Semantic memory benchmarks need numpy: pip install numpy")
+    run_suite(f"Semantic memory benchmarks ({VECTOR_COUNT:,} vectors)", build_benchmarks(), alloc_samples=3)
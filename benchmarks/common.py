@@ -0,0 +1,157 @@
+"""
+Shared micro-benchmark helpers
+Measures ops/sec and peak allocation per operation, and compares results
+against a saved baseline so CI can fail a merge on regressions.
+"""
+import argparse
+import gc
+import json
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict
+
+
+def measure(func: Callable[[], object], min_time: float = 0.2, repeat: int = 7, alloc_samples: int = 48) -> Dict:
+    """
+    Benchmark a zero-argument callable
+
+    Args:
+        func: Operation to measure (one call = one op)
+        min_time: Minimum seconds per timing round (loop count is calibrated to this)
+        repeat: Number of timing rounds; the fastest is reported (least disturbed by noise)
+        alloc_samples: Number of traced calls used to find the peak allocation
+
+    Returns:
+        Dict with ops_per_sec, peak_bytes (transient allocation of one op) and loops
+    """
+    # Warm up caches (converter dictionaries, compiled regexes, ...)
+    for _ in range(3):
+        func()
+
+    # Calibrate the loop count
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        if time.perf_counter() - start >= min_time / 4:
+            break
+        loops *= 2
+    loops *= 4
+
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        rounds = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(loops):
+                func()
+            rounds.append(time.perf_counter() - start)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    # Peak transient allocation of a single op - worst case over a sweep of
+    # calls so corpus-cycling benchmarks report the same number every run
+    peak_bytes = 0
+    tracemalloc.start()
+    try:
+        for _ in range(alloc_samples):
+            tracemalloc.reset_peak()
+            base, _ = tracemalloc.get_traced_memory()
+            func()
+            _, peak = tracemalloc.get_traced_memory()
+            peak_bytes = max(peak_bytes, peak - base)
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "ops_per_sec": round(loops / min(rounds), 1),
+        "peak_bytes": peak_bytes,
+        "loops": loops
+    }
+
+
+def print_results(title: str, results: Dict[str, Dict]):
+    """Print a results table"""
+    print("\n" + "=" * 72)
+    print(f"⏱️  {title}")
+    print("=" * 72)
+    print(f"{'benchmark':<40}{'ops/sec':>16}{'peak KiB/op':>16}")
+    print("-" * 72)
+    for name, result in results.items():
+        print(f"{name:<40}{result['ops_per_sec']:>16,.1f}{result['peak_bytes'] / 1024:>16,.1f}")
+    print("=" * 72)
+
+
+def compare_to_baseline(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float) -> list:
+    """
+    Compare results with a baseline
+
+    Returns:
+        List of regression descriptions (empty if everything is within threshold)
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+
+        if result["ops_per_sec"] < base["ops_per_sec"] * (1 - threshold):
+            regressions.append(
+                f"{name}: {result['ops_per_sec']:,.1f} ops/sec vs baseline {base['ops_per_sec']:,.1f}"
+            )
+        # Ignore tiny absolute changes in allocation (interpreter noise)
+        if result["peak_bytes"] > base["peak_bytes"] * (1 + threshold) + 1024:
+            regressions.append(
+                f"{name}: {result['peak_bytes']:,} peak bytes/op vs baseline {base['peak_bytes']:,}"
+            )
+    return regressions
+
+
+def run_suite(title: str, benchmarks: Dict[str, Callable[[], object]], argv=None, alloc_samples: int = 48):
+    """
+    Command line entry point shared by the benchmark scripts
+
+    Options:
+        --save PATH        Write results as the new baseline
+        --compare PATH     Compare with a baseline; exit code 1 on regression
+        --threshold FLOAT  Allowed regression ratio (default 0.2 = 20%)
+        --filter TEXT      Only run benchmarks whose name contains TEXT
+
+    Slow, deterministic benchmarks (database scans) can lower alloc_samples.
+    """
+    parser = argparse.ArgumentParser(description=title)
+    parser.add_argument("--save", help="Save results to this baseline file")
+    parser.add_argument("--compare", help="Compare results with this baseline file")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed regression ratio")
+    parser.add_argument("--filter", default="", help="Only run benchmarks containing this text")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Seconds per timing round")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name, func in benchmarks.items():
+        if args.filter in name:
+            results[name] = measure(func, min_time=args.min_time, alloc_samples=alloc_samples)
+
+    print_results(title, results)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"💾 Baseline saved to {args.save}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline, args.threshold)
+        if regressions:
+            print(f"❌ {len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+            for regression in regressions:
+                print(f"   - {regression}")
+            sys.exit(1)
+        print(f"✅ No regressions beyond {args.threshold:.0%}")
+
+    return results
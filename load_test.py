@@ -0,0 +1,304 @@
+"""
+End-to-end load test for the LINE webhook
+Runs the real FastAPI app against in-process fake SenseChat and LINE servers,
+drives signed /webhook/line traffic at a target RPS and reports:
+- throughput (completed turns per second)
+- p50/p95/p99 end-to-end latency (webhook POST -> reply received by LINE)
+- webhook acknowledgement latency
+- database queries per turn
+
+Usage:
+    python load_test.py --rps 20 --duration 30 --users 50
+    python load_test.py --rps 5 --sensechat-latency-ms 800 --sensechat-sigma 0.5 --sensechat-error-rate 0.02
+"""
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend.fake_services import FakeSenseChatServer, FakeLineServer, FaultProfile
+
+CHANNEL_SECRET = "load-test-channel-secret"
+
+SAMPLE_MESSAGES = [
+    "早安！今天天氣真好",
+    "我剛下班，好累喔 😮‍💨",
+    "你今天在做什麼？",
+    "晚餐吃了拉麵，超好吃的",
+    "Did you watch the game last night?",
+    "想聽你唱歌 🎵",
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="LINE webhook load test with fake upstream services")
+    parser.add_argument("--rps", type=float, default=10, help="Target webhook requests per second")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds to generate load")
+    parser.add_argument("--users", type=int, default=20, help="Number of seeded LINE users")
+    parser.add_argument("--database-url", default=None, help="Database to test against (default: temp SQLite file)")
+    parser.add_argument("--sensechat-latency-ms", type=float, default=300)
+    parser.add_argument("--sensechat-sigma", type=float, default=0.3)
+    parser.add_argument("--sensechat-error-rate", type=float, default=0.0)
+    parser.add_argument("--line-latency-ms", type=float, default=30)
+    parser.add_argument("--line-sigma", type=float, default=0.2)
+    parser.add_argument("--line-error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rpm", type=int, default=100000,
+                        help="SenseChat client rate limit (default: effectively off, to measure our own overhead)")
+    parser.add_argument("--reply-timeout", type=float, default=60, help="Seconds to wait for each reply")
+    return parser.parse_args()
+
+
+def configure_environment(args, sensechat: FakeSenseChatServer, line: FakeLineServer):
+    """Point the app at the fake services - must run before importing backend.config"""
+    # Everything the run writes (database, index snapshots, embeddings) stays out of the working tree
+    scratch_dir = tempfile.mkdtemp(prefix="load_test-")
+    database_url = args.database_url or f"sqlite:///{scratch_dir}/load_test.db"
+    os.environ.update({
+        "API_BASE_URL": sensechat.base_url,
+        "LINE_API_ENDPOINT": line.base_url,
+        "LINE_CHANNEL_SECRET": CHANNEL_SECRET,
+        "LINE_CHANNEL_ACCESS_TOKEN": "load-test-token",
+        "DATABASE_URL": database_url,
+        "RETRIEVAL_INDEX_DIR": os.path.join(scratch_dir, "retrieval_index"),
+        "SEMANTIC_MEMORY_DIR": os.path.join(scratch_dir, "semantic_memory"),
+        "EXPORT_DIR": os.path.join(scratch_dir, "exports"),
+        "RATE_LIMIT_RPM": str(args.rate_limit_rpm),
+    })
+    for key in ("SENSENOVA_ACCESS_KEY_ID", "SENSENOVA_SECRET_ACCESS_KEY", "SENSENOVA_API_KEY"):
+        os.environ.setdefault(key, "load-test")
+    return database_url
+
+
+def seed_users(count: int):
+    """Create users with an active character and a LINE mapping"""
+    from backend.database import SessionLocal, User, Character, FavorabilityTracking, LineUserMapping
+
+    db = SessionLocal()
+    line_user_ids = []
+    try:
+        for i in range(count):
+            user = User(username=f"壓測用戶{i}_{uuid.uuid4().hex[:6]}")
+            db.add(user)
+            db.flush()
+
+            character = Character(
+                user_id=user.user_id,
+                name="小雨",
+                gender="女",
+                identity=f"{user.username}的虛擬伴侶",
+                nickname="雨雨",
+                detail_setting="小雨性格溫柔體貼，情感細膩。",
+                other_setting={"interests": ["音樂", "閱讀"], "background_story": "小雨喜歡在雨天看書。"}
+            )
+            db.add(character)
+            db.flush()
+
+            db.add(FavorabilityTracking(
+                user_id=user.user_id,
+                character_id=character.character_id,
+                current_level=1,
+                message_count=0
+            ))
+
+            line_user_id = "U" + uuid.uuid4().hex
+            db.add(LineUserMapping(
+                line_user_id=line_user_id,
+                user_id=user.user_id,
+                character_id=character.character_id,
+                line_display_name=user.username,
+                is_premium=True  # Keep the daily limit out of the measurement
+            ))
+            line_user_ids.append(line_user_id)
+
+        db.commit()
+    finally:
+        db.close()
+
+    return line_user_ids
+
+
+class QueryCounter:
+    """Counts SQL statements executed by the app's engine"""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+
+        self.count = 0
+        self._lock = threading.Lock()
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        with self._lock:
+            self.count += 1
+
+
+def start_app_server():
+    """Run the FastAPI app with uvicorn in a background thread"""
+    import uvicorn
+    from backend.main import app
+
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+
+    while not server.started:
+        time.sleep(0.05)
+
+    return server, f"http://127.0.0.1:{port}"
+
+
+def build_webhook_body(line_user_id: str, reply_token: str, text: str) -> bytes:
+    """Build a LINE webhook payload with a single text message event"""
+    return json.dumps({
+        "destination": "Uloadtestbot",
+        "events": [{
+            "type": "message",
+            "mode": "active",
+            "timestamp": int(time.time() * 1000),
+            "source": {"type": "user", "userId": line_user_id},
+            "webhookEventId": uuid.uuid4().hex,
+            "deliveryContext": {"isRedelivery": False},
+            "replyToken": reply_token,
+            "message": {"type": "text", "id": uuid.uuid4().hex[:16], "text": text}
+        }]
+    }, ensure_ascii=False).encode("utf-8")
+
+
+def sign(body: bytes) -> str:
+    digest = hmac.new(CHANNEL_SECRET.encode("utf-8"), body, hashlib.sha256).digest()
+    return base64.b64encode(digest).decode("utf-8")
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_load(args, app_url, line_user_ids, line: FakeLineServer):
+    """Send webhook requests at the target rate and collect per-turn timings"""
+    import requests
+
+    workers = max(8, int(args.rps * 4))
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=workers))
+    results = []
+    results_lock = threading.Lock()
+
+    def one_turn(i):
+        line_user_id = line_user_ids[i % len(line_user_ids)]
+        reply_token = uuid.uuid4().hex
+        body = build_webhook_body(line_user_id, reply_token, SAMPLE_MESSAGES[i % len(SAMPLE_MESSAGES)])
+        replied = line.expect_reply(reply_token)
+
+        start = time.perf_counter()
+        try:
+            response = session.post(
+                f"{app_url}/webhook/line",
+                data=body,
+                headers={"Content-Type": "application/json", "X-Line-Signature": sign(body)},
+                timeout=args.reply_timeout
+            )
+            ack = time.perf_counter() - start
+            ok = response.status_code == 200 and replied.wait(args.reply_timeout)
+        except requests.RequestException:
+            ack, ok = time.perf_counter() - start, False
+
+        latency = (line.replies[reply_token]["time"] - start) if ok else None
+        with results_lock:
+            results.append({"ack": ack, "latency": latency})
+
+    total = int(args.rps * args.duration)
+    interval = 1.0 / args.rps
+    begin = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for i in range(total):
+            delay = begin + i * interval - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(one_turn, i)
+
+    return results, time.perf_counter() - begin
+
+
+def report(args, results, elapsed, queries, sensechat, line):
+    completed = [r["latency"] for r in results if r["latency"] is not None]
+    acks = [r["ack"] for r in results]
+
+    print("\n" + "=" * 60)
+    print("📈 LOAD TEST REPORT")
+    print("=" * 60)
+    print(f"Target rate:        {args.rps:.1f} req/s for {args.duration:.0f}s")
+    print(f"Requests sent:      {len(results)}")
+    print(f"Turns completed:    {len(completed)} ({len(results) - len(completed)} failed/timed out)")
+    print(f"Throughput:         {len(completed) / elapsed:.2f} turns/s")
+    print(f"\nEnd-to-end latency (webhook -> LINE reply):")
+    for pct in (50, 95, 99):
+        print(f"   p{pct}: {percentile(completed, pct) * 1000:8.1f} ms")
+    print(f"\nWebhook ack latency:")
+    for pct in (50, 95, 99):
+        print(f"   p{pct}: {percentile(acks, pct) * 1000:8.1f} ms")
+    print(f"\nDB queries:         {queries} total, {queries / max(1, len(completed)):.1f} per turn")
+    print(f"SenseChat calls:    {sensechat.request_count} ({sensechat.error_count} injected errors)")
+    print(f"LINE API calls:     {line.request_count} ({line.error_count} injected errors)")
+    print("=" * 60)
+
+
+def main():
+    args = parse_args()
+
+    sensechat = FakeSenseChatServer(FaultProfile(
+        latency_median_ms=args.sensechat_latency_ms,
+        latency_sigma=args.sensechat_sigma,
+        error_rate=args.sensechat_error_rate
+    )).start()
+    line = FakeLineServer(FaultProfile(
+        latency_median_ms=args.line_latency_ms,
+        latency_sigma=args.line_sigma,
+        error_rate=args.line_error_rate
+    )).start()
+
+    database_url = configure_environment(args, sensechat, line)
+    print(f"🔧 Fake SenseChat: {sensechat.base_url}")
+    print(f"🔧 Fake LINE:      {line.base_url}")
+    print(f"🔧 Database:       {database_url}")
+
+    from backend.database import init_db, engine
+
+    init_db()
+    line_user_ids = seed_users(args.users)
+    print(f"✓ Seeded {len(line_user_ids)} LINE users")
+
+    server, app_url = start_app_server()
+    counter = QueryCounter(engine)
+
+    try:
+        results, elapsed = run_load(args, app_url, line_user_ids, line)
+        report(args, results, elapsed, counter.count, sensechat, line)
+    finally:
+        server.should_exit = True
+        sensechat.stop()
+        line.stop()
+
+
+if __name__ == "__main__":
+    main()
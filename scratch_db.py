@@ -0,0 +1,44 @@
+"""
+Scratch Databases - Throwaway SQLite databases for the test scripts
+Every table is created up front. In memory by default; on_disk=True puts the
+database in a temporary file, for tests where several threads or sessions
+need their own connections.
+"""
+import os
+import tempfile
+from typing import Tuple
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from backend.database import Base
+
+
+def make_engine(on_disk: bool = False, **connect_args) -> Engine:
+    """
+    Engine on a new, empty database with every table created
+
+    Args:
+        on_disk: Use a temporary file shared across threads instead of memory
+        connect_args: Extra sqlite3.connect arguments (e.g. timeout)
+    """
+    if on_disk:
+        path = os.path.join(tempfile.mkdtemp(), "test.db")
+        engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False, **connect_args})
+    else:
+        engine = create_engine("sqlite://", connect_args=connect_args)
+    Base.metadata.create_all(bind=engine)
+    return engine
+
+
+def make_session_factory(on_disk: bool = False, **connect_args) -> Tuple[Engine, sessionmaker]:
+    """(engine, session factory) for a scratch database"""
+    engine = make_engine(on_disk, **connect_args)
+    return engine, sessionmaker(bind=engine, autoflush=False)
+
+
+def make_session(on_disk: bool = False, **connect_args) -> Tuple[Engine, Session]:
+    """(engine, open session) for a scratch database"""
+    engine, session_factory = make_session_factory(on_disk, **connect_args)
+    return engine, session_factory()
@@ -0,0 +1,210 @@
+"""
+Test script for off-request AI background stories
+Ensures that:
+1. Character creation makes no SenseChat call and saves the template story
+2. The enrichment job stores the AI story, bumps settings_version and refreshes cached payloads
+3. An edit made while the story was generating is kept and the AI story dropped
+4. SenseChat failures leave the template story in place
+5. Swapping in a story that is too long shortens a copy, never the caller's dict
+"""
+import sys
+import os
+import asyncio
+import json
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend.database import SessionLocal, init_db, User, Character
+from backend.models import UserProfile, DreamType, CustomMemory
+from backend.api_client import SenseChatClient
+from backend.character_generator import CharacterGenerator
+from backend.fake_services import FakeSenseChatServer, FaultProfile
+from backend import background_enrichment, character_payload
+
+AI_STORY = "小雨是一位熱愛攝影的設計師，週末總會帶著相機到處走走。"
+
+
+def make_profile():
+    return UserProfile(
+        user_name=f"背景測試_{uuid.uuid4().hex[:8]}",
+        user_gender="男",
+        user_preference="女",
+        preferred_character_name="小雨",
+        dream_type=DreamType(personality_traits=["溫柔"], interests=["攝影"], occupation="設計師", talking_style="溫柔體貼"),
+        custom_memory=CustomMemory()
+    )
+
+
+def create_character(profile):
+    """Run create_character_v2 against the app database"""
+    from backend import main
+
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        result = asyncio.run(main.create_character_v2(profile, db=db))
+        return result, time.perf_counter() - started
+    finally:
+        db.close()
+
+
+def add_character(db, other_setting):
+    user = User(username=f"背景測試_{uuid.uuid4().hex[:8]}")
+    db.add(user)
+    db.commit()
+    character = Character(user_id=user.user_id, name="小雨", gender="女", other_setting=other_setting)
+    db.add(character)
+    db.commit()
+    return character
+
+
+def wait_for_story(character_id, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        db = SessionLocal()
+        character = db.get(Character, character_id)
+        db.close()
+        if character.other_setting["background_story"] == AI_STORY:
+            return character
+        time.sleep(0.05)
+    raise AssertionError("AI background story was not stored")
+
+
+def test_creation_skips_sensechat():
+    """Test that creation persists at once and the story arrives later"""
+    print("\n=== Testing creation without SenseChat ===")
+    from backend import main
+
+    init_db()
+    profile = make_profile()
+    base_url = main.api_client.base_url
+    with FakeSenseChatServer(FaultProfile(latency_median_ms=500), replies=[AI_STORY]) as server:
+        main.api_client.base_url = server.base_url
+        try:
+            result, elapsed = create_character(profile)
+
+            print(f"Creation took {elapsed * 1000:.0f} ms")
+            assert result["success"]
+            assert elapsed < 0.5  # the 500 ms story call runs after the response
+            simple = CharacterGenerator()._generate_simple_background_story("小雨", profile.dream_type)
+            assert result["character"]["other_setting"]["background_story"] == simple
+
+            character = wait_for_story(result["character_id"])
+        finally:
+            main.api_client.base_url = base_url
+        assert character.settings_version == 1
+        assert character.other_setting["interests"] == ["攝影"]
+    print("✅ AI story stored after creation")
+
+
+def test_enrichment_keeps_concurrent_edits():
+    """Test that a user edit made while the story was generating wins over the AI story"""
+    print("\n=== Testing enrichment after an edit ===")
+    init_db()
+    profile = make_profile()
+    with FakeSenseChatServer(replies=[AI_STORY]) as server:
+        client = SenseChatClient()
+        client.base_url = server.base_url
+        generator = CharacterGenerator(api_client=client)
+
+        db = SessionLocal()
+        character = add_character(db, {"interests": ["攝影"], "background_story": "舊故事"})
+        created_version = character.settings_version or 0
+
+        # User rewrites the story while the AI one is being generated
+        character.other_setting = {"interests": ["攝影", "登山"], "background_story": "自己寫的故事"}
+        character_payload.bump_version(character)
+        db.commit()
+        character_id = character.character_id
+        db.close()
+
+        assert not background_enrichment.enrich_character(generator, character_id, profile, created_version)
+
+    db = SessionLocal()
+    character = db.get(Character, character_id)
+    assert character.other_setting == {"interests": ["攝影", "登山"], "background_story": "自己寫的故事"}
+    assert character.settings_version == 1
+    db.delete(character)
+    db.commit()
+    db.close()
+    print("✅ User edit kept, AI story dropped")
+
+
+def test_enrichment_parses_string_settings():
+    """Test that a JSON-string other_setting keeps its other fields and refreshes payloads"""
+    print("\n=== Testing enrichment of a string other_setting ===")
+    init_db()
+    profile = make_profile()
+    with FakeSenseChatServer(replies=[AI_STORY]) as server:
+        client = SenseChatClient()
+        client.base_url = server.base_url
+        generator = CharacterGenerator(api_client=client)
+
+        db = SessionLocal()
+        character = add_character(db, json.dumps({"interests": ["攝影"], "background_story": "舊故事"}, ensure_ascii=False))
+        stale_payload = character_payload.build_character_settings(character, "小明", 1)
+        character_id = character.character_id
+        db.close()
+
+        assert background_enrichment.enrich_character(generator, character_id, profile)
+
+    db = SessionLocal()
+    character = db.get(Character, character_id)
+    assert character.other_setting == {"interests": ["攝影"], "background_story": AI_STORY}
+    assert character.settings_version == 1
+    payload = character_payload.build_character_settings(character, "小明", 1)
+    assert AI_STORY in payload[1]["other_setting"] and AI_STORY not in stale_payload[1]["other_setting"]
+    db.delete(character)
+    db.commit()
+    db.close()
+    print("✅ Story merged into the parsed settings")
+
+
+def test_enrichment_failure_keeps_template():
+    """Test that a failing SenseChat call changes nothing"""
+    print("\n=== Testing enrichment failure ===")
+    init_db()
+    profile = make_profile()
+    with FakeSenseChatServer(FaultProfile(error_rate=1.0, error_status=400)) as server:
+        client = SenseChatClient()
+        client.base_url = server.base_url
+        generator = CharacterGenerator(api_client=client)
+
+        db = SessionLocal()
+        character = add_character(db, {"background_story": "模板故事"})
+        character_id = character.character_id
+        db.close()
+
+        assert not background_enrichment.enrich_character(generator, character_id, profile)
+
+    db = SessionLocal()
+    character = db.get(Character, character_id)
+    assert character.other_setting == {"background_story": "模板故事"}
+    assert not character.settings_version
+    db.delete(character)
+    db.commit()
+    db.close()
+    print("✅ Template story kept")
+
+
+def test_with_background_story_is_pure():
+    """Test that the 2000 char limit is applied to a new dict"""
+    print("\n=== Testing story swap limit ===")
+    original = {"interests": ["攝影"], "values": "長" * 1900, "background_story": "舊故事"}
+
+    swapped = CharacterGenerator.with_background_story(original, AI_STORY * 10)
+    assert swapped["background_story"] == (AI_STORY * 10)[:100] + "..."
+    assert original["background_story"] == "舊故事"
+    assert CharacterGenerator.with_background_story(original, AI_STORY)["background_story"] == AI_STORY
+    print("✅ Story shortened on a copy")
+
+
+if __name__ == "__main__":
+    test_creation_skips_sensechat()
+    test_enrichment_keeps_concurrent_edits()
+    test_enrichment_parses_string_settings()
+    test_enrichment_failure_keeps_template()
+    test_with_background_story_is_pure()
+    print("\n✅ All background enrichment tests passed!")
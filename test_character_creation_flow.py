@@ -0,0 +1,104 @@
+"""
+Test script for the concurrent character creation flow
+Ensures that:
+1. The LINE profile fetch overlaps the database work and the first message is pushed
+2. A slow LINE profile call times out and falls back to the entered name
+3. Critical path timings are exported per stage
+"""
+import sys
+import os
+import asyncio
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend.config import settings
+from backend.database import SessionLocal, init_db, LineUserMapping
+from backend.models import UserProfile, DreamType, CustomMemory
+from backend.fake_services import FakeLineServer, FakeSenseChatServer, FaultProfile
+from backend.line_client import line_client
+from backend import metrics
+
+
+def make_profile():
+    suffix = uuid.uuid4().hex[:8]
+    return UserProfile(
+        user_name=f"建立流程_{suffix}",
+        user_gender="男",
+        user_preference="女",
+        dream_type=DreamType(personality_traits=["溫柔"], interests=["音樂"], talking_style="溫柔體貼"),
+        custom_memory=CustomMemory(),
+        line_user_id=f"Ucreate{suffix}"
+    )
+
+
+def create_with_line(profile, line_profile: FaultProfile):
+    """Run create_character_v2 with LINE calls going to a fake server"""
+    from backend import main
+
+    endpoint, base_url = line_client.line_bot_api.endpoint, main.api_client.base_url
+    with FakeLineServer(line_profile) as server, FakeSenseChatServer() as sensechat:
+        line_client.line_bot_api.endpoint = server.base_url
+        main.api_client.base_url = sensechat.base_url  # background story job
+        db = SessionLocal()
+        try:
+            result = asyncio.run(main.create_character_v2(profile, db=db))
+            mapping = db.query(LineUserMapping).filter(LineUserMapping.line_user_id == profile.line_user_id).first()
+            return result, mapping.line_display_name, list(server.pushes)
+        finally:
+            db.close()
+            line_client.line_bot_api.endpoint = endpoint
+            main.api_client.base_url = base_url
+
+
+def stage_seconds(stage):
+    return metrics.get("critical_path_seconds_total", flow="create_character", stage=stage)
+
+
+def test_profile_fetch_overlaps_db_work():
+    """Test the happy path and the exported stage timings"""
+    print("\n=== Testing concurrent creation flow ===")
+    init_db()
+    metrics.reset()
+    profile = make_profile()
+    result, display_name, pushes = create_with_line(profile, FaultProfile(latency_median_ms=200))
+
+    assert result["success"]
+    assert display_name == f"測試用戶{profile.line_user_id[-4:]}"
+    assert len(pushes) == 1 and pushes[0]["to"] == profile.line_user_id
+
+    stages = {name: stage_seconds(name) for name in ("line_profile", "generate", "db", "picture", "mapping", "line_push")}
+    total = stage_seconds("total")
+    print("Stages (ms): " + ", ".join(f"{k}={v * 1000:.0f}" for k, v in stages.items()) + f", total={total * 1000:.0f}")
+    assert all(seconds > 0 for seconds in stages.values())
+    assert total < sum(stages.values())  # profile fetch and picture pick overlapped other work
+    assert metrics.get("critical_path_runs_total", flow="create_character") == 1
+    print("✅ Branches overlapped and timings exported")
+
+
+def test_profile_timeout_falls_back():
+    """Test that a slow LINE profile call doesn't hold up creation"""
+    print("\n=== Testing LINE profile timeout ===")
+    init_db()
+    metrics.reset()
+    profile = make_profile()
+    timeout = settings.CHARACTER_CREATE_PROFILE_TIMEOUT_SECONDS
+    settings.CHARACTER_CREATE_PROFILE_TIMEOUT_SECONDS = 0.1
+    try:
+        result, display_name, pushes = create_with_line(profile, FaultProfile(latency_median_ms=600))
+    finally:
+        settings.CHARACTER_CREATE_PROFILE_TIMEOUT_SECONDS = timeout
+
+    assert result["success"]
+    assert display_name == profile.user_name
+    assert len(pushes) == 1
+    assert metrics.get("critical_path_fallbacks_total", flow="create_character",
+                       stage="line_profile", reason="timeout") == 1
+    assert stage_seconds("line_profile") < 0.5
+    print("✅ Fell back to the entered name after the timeout")
+
+
+if __name__ == "__main__":
+    test_profile_fetch_overlaps_db_work()
+    test_profile_timeout_falls_back()
+    print("\n✅ All character creation flow tests passed!")
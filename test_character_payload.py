@@ -0,0 +1,123 @@
+"""
+Test script for the cached character_settings payload
+Ensures that:
+1. The payload matches what send_message used to build inline
+2. Only feeling_toward changes between turns, without touching the cache
+3. Bumping settings_version rebuilds the payload after an edit
+4. A new character reusing a deleted one's id never gets the old payload
+"""
+import sys
+import os
+import json
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend.database import User, Character
+from backend import character_payload
+from scratch_db import make_session
+
+
+def make_character():
+    _, db = make_session()
+    user = User(username="payload_user")
+    db.add(user)
+    db.commit()
+    character = Character(
+        user_id=user.user_id, name="小雨", gender="女", identity="設計師", nickname="雨雨",
+        detail_setting="溫柔體貼", other_setting={"興趣": ["音樂", "旅行"]}
+    )
+    db.add(character)
+    db.commit()
+    character_payload.invalidate(character.character_id)  # each test is a fresh database
+    return db, character
+
+
+def test_payload_matches_inline_build():
+    """Test the payload layout sent to SenseChat"""
+    print("\n=== Testing payload layout ===")
+    db, character = make_character()
+    payload = character_payload.build_character_settings(character, "小明", 3)
+
+    assert payload[0] == {"name": "小明", "gender": "男", "detail_setting": "用戶"}
+    assert payload[1] == {
+        "name": "小雨",
+        "gender": "女",
+        "identity": "設計師",
+        "nickname": "雨雨",
+        "detail_setting": "溫柔體貼",
+        "other_setting": json.dumps({"興趣": ["音樂", "旅行"]}, ensure_ascii=False),
+        "feeling_toward": [{"name": "小明", "level": 3}]
+    }
+    db.close()
+    print("✅ Payload matches the inline layout")
+
+
+def test_level_changes_do_not_leak_into_cache():
+    """Test that per-turn levels are independent"""
+    print("\n=== Testing per-turn feeling_toward ===")
+    db, character = make_character()
+    first = character_payload.build_character_settings(character, "小明", 1)
+    second = character_payload.build_character_settings(character, "小明", 4)
+
+    assert first[1]["feeling_toward"][0]["level"] == 1
+    assert second[1]["feeling_toward"][0]["level"] == 4
+    assert "feeling_toward" not in character_payload.get_character_entry(character)
+    assert first[1]["other_setting"] is second[1]["other_setting"]  # serialized once
+    db.close()
+    print("✅ Only feeling_toward varies per turn")
+
+
+def test_version_bump_rebuilds():
+    """Test that editing a character refreshes its payload"""
+    print("\n=== Testing settings_version invalidation ===")
+    db, character = make_character()
+    before = character_payload.build_character_settings(character, "小明", 2)
+
+    character.nickname = "小雨點"
+    stale = character_payload.build_character_settings(character, "小明", 2)
+    assert stale[1]["nickname"] == "雨雨"  # unchanged version -> cached entry
+
+    character_payload.bump_version(character)
+    db.commit()
+    after = character_payload.build_character_settings(character, "小明", 2)
+    assert character.settings_version == 1
+    assert before[1]["nickname"] == "雨雨"
+    assert after[1]["nickname"] == "小雨點"
+    db.close()
+    print("✅ Version bump rebuilds the payload")
+
+
+def test_reused_id_gets_fresh_payload():
+    """Test deletion and id reuse, in this worker and in one that missed the delete"""
+    print("\n=== Testing reused character ids ===")
+    from datetime import timedelta
+    from backend.conversation_manager import ConversationManager
+
+    db, character = make_character()
+    character_id = character.character_id
+    character_payload.build_character_settings(character, "小明", 1)
+    cached = dict(character_payload._cache)
+
+    assert ConversationManager(db, api_client=None).delete_character(character_id)
+    assert not [key for key in character_payload._cache if key[0] == character_id]
+
+    replacement = Character(user_id=character.user_id, name="小晴", gender="女", identity="護理師",
+                            created_at=character.created_at + timedelta(seconds=1))
+    db.add(replacement)
+    db.commit()
+    assert replacement.character_id == character_id  # SQLite reuses the highest id
+
+    # Another worker still holds the deleted character's entry
+    character_payload._cache.update(cached)
+    payload = character_payload.build_character_settings(replacement, "小明", 1)
+    assert (payload[1]["name"], payload[1]["identity"]) == ("小晴", "護理師")
+    db.close()
+    print("✅ Reused id rebuilt, not served from the old entry")
+
+
+if __name__ == "__main__":
+    test_payload_matches_inline_build()
+    test_level_changes_do_not_leak_into_cache()
+    test_version_bump_rebuilds()
+    test_reused_id_gets_fresh_payload()
+    print("\n✅ All character payload tests passed!")
@@ -0,0 +1,121 @@
+"""
+Test script for streaming conversation export
+Ensures JSON, TXT and NDJSON exports contain the full history in
+chronological order and are produced in bounded chunks
+"""
+import sys
+import os
+import json
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend.database import User, Character, Message, FavorabilityTracking
+from backend import conversation_export, conversation_stats
+from scratch_db import make_session
+
+MESSAGE_COUNT = 2500
+
+
+def make_character():
+    """In-memory database with one character and MESSAGE_COUNT messages"""
+    _, db = make_session()
+
+    user = User(username="匯出測試")
+    db.add(user)
+    db.commit()
+    character = Character(
+        user_id=user.user_id, name="小雨", nickname="雨雨", gender="女",
+        other_setting=json.dumps({"background_story": "在咖啡店打工的大學生"}, ensure_ascii=False)
+    )
+    db.add(character)
+    db.commit()
+    favorability = FavorabilityTracking(user_id=user.user_id, character_id=character.character_id,
+                                        current_level=3, message_count=MESSAGE_COUNT)
+    db.add(favorability)
+
+    start = datetime(2025, 3, 1, 12, 0)
+    db.execute(Message.__table__.insert(), [
+        {
+            "user_id": user.user_id,
+            "character_id": character.character_id,
+            "speaker_name": "小雨" if i % 2 else user.username,
+            "message_content": f"第 {i} 則訊息",
+            "timestamp": start + timedelta(minutes=i),
+            "favorability_level": 3
+        }
+        for i in range(MESSAGE_COUNT)
+    ])
+    db.commit()
+
+    header = conversation_export.build_header(
+        character, favorability, conversation_stats.get_stats(db, character.character_id)
+    )
+    return db, header
+
+
+def export_text(db, header, export_format, chunk_size=64 * 1024):
+    chunks = list(conversation_export.stream_export(db, header, export_format, chunk_size=chunk_size))
+    return chunks, b"".join(chunks).decode("utf-8")
+
+
+def test_json_export():
+    """Test that the streamed JSON parses and holds every message in order"""
+    print("\n=== Testing JSON export ===")
+    db, header = make_character()
+    _, text = export_text(db, header, "json")
+    data = json.loads(text)
+
+    assert data["export_info"]["total_messages"] == MESSAGE_COUNT
+    assert data["character"]["background_story"] == "在咖啡店打工的大學生"
+    assert data["favorability"]["level_name"] == "親密期"
+    assert len(data["messages"]) == MESSAGE_COUNT
+    assert data["messages"][0]["content"] == "第 0 則訊息"
+    assert data["messages"][-1]["content"] == f"第 {MESSAGE_COUNT - 1} 則訊息"
+    print(f"✅ JSON export: {len(data['messages'])} messages, {len(text):,} chars")
+
+
+def test_json_export_empty():
+    """Test that an empty history is still valid JSON"""
+    print("\n=== Testing empty JSON export ===")
+    db, header = make_character()
+    db.query(Message).delete()
+    db.commit()
+    _, text = export_text(db, header, "json")
+    assert json.loads(text)["messages"] == []
+    print("✅ Empty export is valid JSON")
+
+
+def test_txt_and_ndjson_export():
+    """Test TXT transcript and NDJSON lines"""
+    print("\n=== Testing TXT and NDJSON export ===")
+    db, header = make_character()
+
+    _, text = export_text(db, header, "txt")
+    assert "💕 小雨 的對話記錄" in text
+    assert text.index("第 0 則訊息") < text.index(f"第 {MESSAGE_COUNT - 1} 則訊息")
+    print("✅ TXT transcript in chronological order")
+
+    _, text = export_text(db, header, "ndjson")
+    lines = text.splitlines()
+    assert len(lines) == MESSAGE_COUNT
+    assert json.loads(lines[0])["character_id"] == header["character_id"]
+    print(f"✅ NDJSON: {len(lines)} lines")
+
+
+def test_chunked_output():
+    """Test that output is produced in bounded chunks rather than one blob"""
+    print("\n=== Testing chunked output ===")
+    db, header = make_character()
+    chunks, _ = export_text(db, header, "ndjson", chunk_size=4096)
+    assert len(chunks) > 10
+    assert max(len(chunk) for chunk in chunks) < 4096 + 1024
+    print(f"✅ {len(chunks)} chunks, largest {max(len(c) for c in chunks)} bytes")
+
+
+if __name__ == "__main__":
+    test_json_export()
+    test_json_export_empty()
+    test_txt_and_ndjson_export()
+    test_chunked_output()
+    print("\n✅ All conversation export tests passed!")
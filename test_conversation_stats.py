@@ -0,0 +1,118 @@
+"""
+Test script for denormalized conversation statistics
+Ensures that:
+1. save_message keeps the stats row up to date
+2. Streaks, histograms and level transitions are computed correctly
+3. Incremental updates match a full rebuild (backfill)
+"""
+import sys
+import os
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend.database import User, Character, Message, FavorabilityTracking, ConversationStats
+from backend.conversation_manager import ConversationManager
+from backend import conversation_stats
+from scratch_db import make_session
+
+
+def create_character(db):
+    user = User(username="統計測試用戶")
+    db.add(user)
+    db.commit()
+    character = Character(user_id=user.user_id, name="小雨", gender="女")
+    db.add(character)
+    db.commit()
+    db.add(FavorabilityTracking(user_id=user.user_id, character_id=character.character_id))
+    db.commit()
+    return user, character
+
+
+def test_save_message_updates_stats():
+    """Test that each saved message updates the counters"""
+    print("\n=== Testing incremental stats on save_message ===")
+    _, db = make_session()
+    user, character = create_character(db)
+    conv_manager = ConversationManager(db, api_client=None)
+
+    for i in range(5):
+        conv_manager.save_message(user.user_id, character.character_id, user.username, f"訊息 {i}", 1)
+        conv_manager.save_message(user.user_id, character.character_id, character.name, f"回覆 {i}", 1)
+
+    stats = conversation_stats.get_stats(db, character.character_id)
+    print(f"Total: {stats.total_messages}, user: {stats.user_messages}, character: {stats.character_messages}")
+    assert stats.total_messages == 10
+    assert stats.user_messages == 5
+    assert stats.character_messages == 5
+    assert stats.first_message_at <= stats.last_message_at
+    assert sum(stats.messages_by_hour) == 10
+    assert stats.current_streak == 1
+    print("✅ Counters updated on every save")
+
+
+def test_streaks_and_progression():
+    """Test streaks, per-day histogram and level transitions from a backfill"""
+    print("\n=== Testing streaks and level progression ===")
+    _, db = make_session()
+    user, character = create_character(db)
+
+    start = datetime(2025, 1, 1, 9, 0)
+    # Active on Jan 1-3, gap, then Jan 6-10 (longest streak = 5)
+    days = [0, 1, 2, 5, 6, 7, 8, 9]
+    for day in days:
+        for i in range(7):
+            speaker = character.name if i % 2 else user.username
+            db.add(Message(
+                user_id=user.user_id,
+                character_id=character.character_id,
+                speaker_name=speaker,
+                message_content="hi",
+                timestamp=start + timedelta(days=day, minutes=i)
+            ))
+    db.commit()
+
+    stats = conversation_stats.rebuild_stats(db, character.character_id)
+    db.commit()
+
+    print(f"Longest streak: {stats.longest_streak}, current: {stats.current_streak}")
+    print(f"Level progression: {[(p['message_count'], p['level']) for p in stats.level_progression]}")
+    assert stats.total_messages == 56
+    assert stats.longest_streak == 5
+    assert stats.current_streak == 5
+    assert len(stats.messages_by_day) == 8
+    assert stats.messages_by_hour[9] == 56
+    assert [(p["message_count"], p["level"]) for p in stats.level_progression] == [(20, 2), (50, 3)]
+    assert conversation_stats.conversation_days(stats) == 10
+    print("✅ Streaks, histograms and transitions correct")
+
+
+def test_incremental_matches_backfill():
+    """Test that incremental updates equal a full rebuild"""
+    print("\n=== Testing incremental == backfill ===")
+    _, db = make_session()
+    user, character = create_character(db)
+    conv_manager = ConversationManager(db, api_client=None)
+
+    for i in range(25):
+        speaker = character.name if i % 3 == 0 else user.username
+        conv_manager.save_message(user.user_id, character.character_id, speaker, f"m{i}", 1)
+
+    stats = db.get(ConversationStats, character.character_id)
+    incremental = (stats.total_messages, stats.user_messages, stats.character_messages,
+                   stats.messages_by_hour, stats.level_progression, stats.longest_streak)
+
+    conversation_stats.backfill_all(db)
+    stats = db.get(ConversationStats, character.character_id)
+    rebuilt = (stats.total_messages, stats.user_messages, stats.character_messages,
+               stats.messages_by_hour, stats.level_progression, stats.longest_streak)
+
+    assert incremental == rebuilt
+    print("✅ Incremental stats match the backfill")
+
+
+if __name__ == "__main__":
+    test_save_message_updates_stats()
+    test_streaks_and_progression()
+    test_incremental_matches_backfill()
+    print("\n✅ All conversation stats tests passed!")
@@ -0,0 +1,132 @@
+"""
+Test script for premium entitlements
+Ensures that:
+1. Premium stops counting as unlimited once premium_expires_at passes
+2. The sweeper expires exactly the overdue rows in one UPDATE, without
+   marking those users as active
+3. The entitlement cache serves hits and honors invalidation and TTL
+4. Periodic tasks run on schedule
+"""
+import sys
+import os
+import time
+import threading
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import event
+
+from backend.database import User, LineUserMapping
+from backend import entitlements
+from backend.entitlements import Entitlement, EntitlementCache
+from backend.scheduler import PeriodicTask
+from scratch_db import make_session
+
+
+def test_expired_premium_is_not_unlimited():
+    """Test expiry is honored even before the sweeper runs"""
+    print("\n=== Testing expiry check ===")
+    now = datetime.utcnow()
+    active = Entitlement(is_premium=True, premium_expires_at=now + timedelta(days=1), referral_count=0)
+    expired = Entitlement(is_premium=True, premium_expires_at=now - timedelta(seconds=1), referral_count=0)
+    referred = Entitlement(is_premium=False, premium_expires_at=None, referral_count=5)
+
+    assert active.is_unlimited()
+    assert not expired.is_unlimited()
+    assert referred.is_unlimited()
+
+    mapping = LineUserMapping(line_user_id="U1", user_id=1, is_premium=True,
+                              premium_expires_at=now - timedelta(days=1), referral_count=0,
+                              daily_message_count=0)
+    assert not mapping.is_unlimited()
+    print("✅ Expired premium falls back to the free tier")
+
+
+def test_sweeper_expires_overdue_rows():
+    """Test the bulk expiry UPDATE"""
+    print("\n=== Testing premium sweeper ===")
+    engine, db = make_session()
+    now = datetime.utcnow()
+    for i, expires in enumerate([now - timedelta(days=2), now - timedelta(minutes=1), now + timedelta(days=3), None]):
+        user = User(username=f"premium_{i}")
+        db.add(user)
+        db.commit()
+        db.add(LineUserMapping(line_user_id=f"U{i}", user_id=user.user_id, last_interaction=now - timedelta(days=5),
+                               is_premium=expires is not None, premium_expires_at=expires))
+    db.commit()
+
+    cache = entitlements.get_cache()
+    cache.put("U0", Entitlement(True, now - timedelta(days=2), 0))
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    expired = entitlements.expire_premium(db, now)
+
+    updates = [s for s in statements if s.lstrip().upper().startswith("UPDATE")]
+    print(f"Expired: {expired}")
+    assert sorted(expired) == ["U0", "U1"]
+    assert len(updates) == 1
+    assert cache.get("U0") is None
+    assert db.query(LineUserMapping).filter(LineUserMapping.is_premium.is_(True)).count() == 1
+    # Outreach reads inactivity from last_interaction - expiry isn't activity
+    assert {m.last_interaction for m in db.query(LineUserMapping)} == {now - timedelta(days=5)}
+    assert entitlements.expire_premium(db, now) == []
+    print("✅ Overdue rows expired in a single UPDATE")
+
+
+def test_entitlement_cache():
+    """Test cache hits, invalidation and TTL"""
+    print("\n=== Testing entitlement cache ===")
+    _, db = make_session()
+    user = User(username="cache_user")
+    db.add(user)
+    db.commit()
+    mapping = LineUserMapping(line_user_id="Ucache", user_id=user.user_id, is_premium=True,
+                              premium_expires_at=datetime.utcnow() + timedelta(days=1))
+    db.add(mapping)
+    db.commit()
+
+    entitlements.get_cache().clear()
+    first = entitlements.get_entitlement(db, "Ucache")
+    mapping.is_premium = False
+    db.commit()
+    assert entitlements.get_entitlement(db, "Ucache") is first  # served from cache
+
+    entitlements.invalidate("Ucache")
+    assert not entitlements.get_entitlement(db, "Ucache").is_premium
+
+    short = EntitlementCache(ttl_seconds=0.05)
+    short.put("U", first)
+    assert short.get("U") is first
+    time.sleep(0.06)
+    assert short.get("U") is None
+    print("✅ Cache hit, invalidation and TTL behave")
+
+
+def test_periodic_task():
+    """Test the periodic task runner"""
+    print("\n=== Testing periodic task ===")
+    runs = []
+    done = threading.Event()
+
+    def tick():
+        runs.append(1)
+        if len(runs) >= 3:
+            done.set()
+        if len(runs) == 2:
+            raise RuntimeError("errors are logged, not fatal")
+
+    task = PeriodicTask("test", 0.01, tick)
+    task.start()
+    assert done.wait(2)
+    task.stop()
+    print(f"✅ Ran {len(runs)} times")
+
+
+if __name__ == "__main__":
+    test_expired_premium_is_not_unlimited()
+    test_sweeper_expires_overdue_rows()
+    test_entitlement_cache()
+    test_periodic_task()
+    print("\n✅ All entitlement tests passed!")
@@ -0,0 +1,116 @@
+"""
+Test script for the table-driven special event engine
+Ensures that:
+1. Milestones and anniversaries fire from the favorability row alone
+2. send_message no longer queries for the first message each turn
+3. Each anniversary fires once, from a turn or from the outreach sweep
+4. Sweep claims only cover LINE users' active characters
+"""
+import sys
+import os
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import event
+
+from backend.database import User, Character, Message, FavorabilityTracking, LineUserMapping
+from backend.conversation_manager import ConversationManager
+from backend.api_client import SenseChatClient
+from backend.fake_services import FakeSenseChatServer
+from backend import special_events
+from scratch_db import make_session
+
+TODAY = date(2025, 3, 10)
+
+
+def add_character(db, name, message_count=0, first_message_at=None, line_user_id=None):
+    user = User(username=f"user_{name}")
+    db.add(user)
+    db.commit()
+    character = Character(user_id=user.user_id, name=name, gender="女")
+    db.add(character)
+    db.commit()
+    db.add(FavorabilityTracking(user_id=user.user_id, character_id=character.character_id,
+                                message_count=message_count, first_message_at=first_message_at))
+    if line_user_id:
+        db.add(LineUserMapping(line_user_id=line_user_id, user_id=user.user_id, character_id=character.character_id))
+    db.commit()
+    return user, character
+
+
+def test_turn_events_from_row():
+    """Test milestone/anniversary detection without queries"""
+    print("\n=== Testing per-turn detection ===")
+    _, db = make_session()
+    _, character = add_character(db, "小雨", message_count=50,
+                                 first_message_at=datetime(2025, 3, 3, 2, 0))
+    favorability = character.favorability
+
+    events = special_events.detect_turn_events(favorability, level_increased=False, today=TODAY)
+    assert [e["type"] for e in events] == ["milestone", "anniversary"]
+    assert events[0]["data"] == {"count": 50} and "50" in events[0]["message"]
+    assert events[1]["data"] == {"days": 7}
+    assert favorability.last_anniversary_days == 7
+
+    again = special_events.detect_turn_events(favorability, level_increased=False, today=TODAY)
+    assert [e["type"] for e in again] == ["milestone"]  # anniversary already celebrated
+    assert special_events.render("milestone", 51) == ""
+    db.close()
+    print("✅ Events detected from the stored counters")
+
+
+def test_send_message_queries():
+    """Test that send_message fires events without a first-message query"""
+    print("\n=== Testing send_message event queries ===")
+    engine, db = make_session()
+    user, character = add_character(db, "小雨", message_count=49)
+    for i in range(3):
+        db.add(Message(user_id=user.user_id, character_id=character.character_id, speaker_name="小雨",
+                       message_content=f"舊訊息 {i}", timestamp=datetime.utcnow() - timedelta(days=2, minutes=i)))
+    db.commit()
+
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(engine, "before_cursor_execute", listener)
+    with FakeSenseChatServer() as server:
+        client = SenseChatClient()
+        client.base_url = server.base_url
+        result = ConversationManager(db, client).send_message(user.user_id, character.character_id, "你好")
+    event.remove(engine, "before_cursor_execute", listener)
+
+    assert result["success"], result.get("error")
+    assert result["milestone_reached"] and result["milestone_number"] == 50
+    assert result["message_count"] == 50
+    favorability = db.query(FavorabilityTracking).first()
+    assert favorability.first_message_at < datetime.utcnow() - timedelta(days=1)  # backfilled from history
+
+    favorability_reads = [s for s in statements if s.lstrip().startswith("SELECT") and "FROM favorability_tracking" in s]
+    print(f"Favorability reads in one turn: {len(favorability_reads)}")
+    assert len(favorability_reads) <= 2
+    db.close()
+    print("✅ Events fired with the favorability row already loaded")
+
+
+def test_anniversary_claims():
+    """Test that silent LINE users' anniversaries are claimed once"""
+    print("\n=== Testing anniversary claims ===")
+    _, db = make_session()
+    week_ago = datetime(2025, 3, 3, 2, 0)  # 10:00 Taipei, seven local days before TODAY
+    add_character(db, "一週", first_message_at=week_ago, line_user_id="Uweek")
+    add_character(db, "網頁", first_message_at=week_ago)  # web-only, celebrated on its next turn
+    add_character(db, "六天", first_message_at=week_ago + timedelta(days=1), line_user_id="Usix")
+
+    assert special_events.claim_due_anniversaries(db, TODAY, 7, limit=100) == ["Uweek"]
+    db.commit()
+    assert special_events.claim_due_anniversaries(db, TODAY, 7, limit=100) == []
+    assert special_events.claim_due_anniversaries(db, TODAY, 30, limit=100) == []
+    db.close()
+    print("✅ Anniversary claimed once, only for the LINE user")
+
+
+if __name__ == "__main__":
+    test_turn_events_from_row()
+    test_send_message_queries()
+    test_anniversary_claims()
+    print("\n✅ All event engine tests passed!")
@@ -0,0 +1,73 @@
+"""
+Test script for the local fake SenseChat and LINE servers
+Ensures the real SenseChatClient and LineClient work unchanged against them
+"""
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend.fake_services import FakeSenseChatServer, FakeLineServer, FaultProfile
+from backend.api_client import SenseChatClient
+from backend.line_client import LineClient
+
+
+def test_sensechat_client_against_fake():
+    """Test chat and knowledge base calls through SenseChatClient"""
+    print("\n=== Testing SenseChatClient against fake server ===")
+    import io
+
+    with FakeSenseChatServer() as server:
+        client = SenseChatClient()
+        client.base_url = server.base_url
+
+        response = client.create_character_chat(
+            character_settings=[{"name": "用戶", "gender": "男"}, {"name": "小雨", "gender": "女"}],
+            role_setting={"user_name": "用戶", "primary_bot_name": "小雨"},
+            messages=[{"name": "用戶", "content": "你好"}]
+        )
+        assert response["data"]["reply"]
+        print(f"✅ Chat reply: {response['data']['reply']}")
+
+        file_result = client.create_knowledge_file(io.StringIO('{"text_lst": []}'))
+        assert file_result["success"]
+        kb_result = client.create_knowledge_base([file_result["file_id"]])
+        assert kb_result["success"]
+        assert client.update_knowledge_base(kb_result["knowledge_base_id"], [file_result["file_id"]])["success"]
+        print(f"✅ Knowledge base {kb_result['knowledge_base_id']} created and updated")
+
+
+def test_injected_errors():
+    """Test that the error distribution is honored"""
+    print("\n=== Testing injected errors ===")
+    with FakeSenseChatServer(FaultProfile(error_rate=1.0, error_status=429)) as server:
+        client = SenseChatClient()
+        client.base_url = server.base_url
+        result = client.create_knowledge_base(["file-1"])
+        assert not result["success"]
+        assert server.error_count == 1
+        print(f"✅ Request failed as configured: {result['error']}")
+
+
+def test_line_client_against_fake():
+    """Test reply, push and profile calls through LineClient"""
+    print("\n=== Testing LineClient against fake server ===")
+    with FakeLineServer() as server:
+        client = LineClient()
+        client.line_bot_api.endpoint = server.base_url
+
+        replied = server.expect_reply("token-1")
+        assert client.reply_message("token-1", "嗨～")
+        assert replied.is_set()
+        assert client.push_message("U123", "推播訊息")
+        assert server.pushes[0]["to"] == "U123"
+        profile = client.get_profile("Uabcd1234")
+        assert profile["display_name"]
+        print(f"✅ Reply, push and profile OK ({profile['display_name']})")
+
+
+if __name__ == "__main__":
+    test_sensechat_client_against_fake()
+    test_injected_errors()
+    test_line_client_against_fake()
+    print("\n✅ All fake service tests passed!")
@@ -0,0 +1,126 @@
+"""
+Test script for keyset-paginated conversation history
+Ensures that:
+1. Scrolling back page by page visits every message exactly once, in order
+2. Paging forward from a cursor returns newer messages
+3. Every page costs one query regardless of depth
+4. Cursors round-trip and reject garbage
+"""
+import sys
+import os
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import event
+
+from backend.database import User, Character, Message
+from backend.conversation_manager import ConversationManager
+from scratch_db import make_session
+
+MESSAGE_COUNT = 1234
+
+
+def make_history():
+    engine, db = make_session()
+
+    user = User(username="分頁測試")
+    db.add(user)
+    db.commit()
+    character = Character(user_id=user.user_id, name="小雨", gender="女")
+    db.add(character)
+    db.commit()
+
+    start = datetime(2025, 1, 1)
+    db.execute(Message.__table__.insert(), [
+        {
+            "user_id": user.user_id,
+            "character_id": character.character_id,
+            "speaker_name": user.username,
+            "message_content": f"m{i}",
+            "timestamp": start + timedelta(seconds=i),
+            "favorability_level": 1
+        }
+        for i in range(MESSAGE_COUNT)
+    ])
+    db.commit()
+    return engine, db, character.character_id
+
+
+def test_scroll_back_through_history():
+    """Test infinite scroll to the beginning"""
+    print("\n=== Testing scroll back ===")
+    engine, db, character_id = make_history()
+    conv_manager = ConversationManager(db, api_client=None)
+
+    queries = []
+    event.listen(engine, "before_cursor_execute", lambda *args: queries.append(1))
+
+    seen = []
+    before = None
+    pages = 0
+    while True:
+        queries.clear()
+        page, has_more = conv_manager.get_conversation_page(character_id, before_message_id=before, page_size=100)
+        assert len(queries) == 1, f"Page {pages} took {len(queries)} queries"
+        assert [m.message_id for m in page] == sorted(m.message_id for m in page)
+        seen = [m.message_content for m in page] + seen
+        pages += 1
+        if not has_more:
+            break
+        before = page[0].message_id
+
+    assert seen == [f"m{i}" for i in range(MESSAGE_COUNT)]
+    print(f"✅ {pages} pages, one query each, every message seen once")
+
+
+def test_page_forward():
+    """Test fetching newer messages after a cursor"""
+    print("\n=== Testing page forward ===")
+    _, db, character_id = make_history()
+    conv_manager = ConversationManager(db, api_client=None)
+
+    first, _ = conv_manager.get_conversation_page(character_id, before_message_id=11, page_size=10)
+    newer, has_more = conv_manager.get_conversation_page(character_id, after_message_id=first[-1].message_id, page_size=10)
+    assert [m.message_content for m in first] == [f"m{i}" for i in range(10)]
+    assert [m.message_content for m in newer] == [f"m{i}" for i in range(10, 20)]
+    assert has_more
+
+    last, has_more = conv_manager.get_conversation_page(character_id, after_message_id=MESSAGE_COUNT - 3, page_size=10)
+    assert len(last) == 3 and not has_more
+    print("✅ Forward paging correct")
+
+
+def test_history_limit_is_latest():
+    """Test that get_conversation_history(limit) returns the latest N in order"""
+    print("\n=== Testing latest-N history ===")
+    _, db, character_id = make_history()
+    conv_manager = ConversationManager(db, api_client=None)
+    recent = conv_manager.get_conversation_history(character_id, limit=5)
+    assert [m.message_content for m in recent] == [f"m{i}" for i in range(MESSAGE_COUNT - 5, MESSAGE_COUNT)]
+    print("✅ Latest messages in chronological order")
+
+
+def test_cursor_round_trip():
+    """Test opaque cursor encoding"""
+    print("\n=== Testing cursors ===")
+    from backend.main import _encode_history_cursor, _decode_history_cursor
+
+    cursor = _encode_history_cursor("before", 123456)
+    assert "123456" not in cursor
+    assert _decode_history_cursor(cursor) == ("before", 123456)
+    for garbage in ("not-a-cursor", _encode_history_cursor("sideways", 1)):
+        try:
+            _decode_history_cursor(garbage)
+            assert False, f"Accepted {garbage}"
+        except (ValueError, UnicodeDecodeError):
+            pass
+    print("✅ Cursors round-trip and reject garbage")
+
+
+if __name__ == "__main__":
+    test_scroll_back_through_history()
+    test_page_forward()
+    test_history_limit_is_latest()
+    test_cursor_round_trip()
+    print("\n✅ All history pagination tests passed!")
@@ -0,0 +1,130 @@
+"""
+Test script for content-addressed knowledge base uploads
+Ensures that:
+1. Rebuilding a knowledge base with unchanged content makes no remote calls
+2. Changed content uploads one file and updates the knowledge base
+3. Characters with identical content share one uploaded file
+4. A cached file the remote side no longer accepts is uploaded again
+"""
+import sys
+import os
+import json
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend.database import User, Character, KnowledgeFile
+from backend.api_client import SenseChatClient
+from backend.fake_services import FakeSenseChatServer
+from backend.knowledge_base import KnowledgeBaseManager, content_hash
+from scratch_db import make_session
+
+PREFERENCES = {"likes": {"food": ["拉麵", "壽司"]}, "habits": {"sleep": "晚睡"}}
+
+
+class RecordingSenseChatServer(FakeSenseChatServer):
+    """Fake SenseChat that records knowledge base PUTs and rejects stale files"""
+
+    def __init__(self):
+        super().__init__()
+        self.updates = []
+
+    def route(self, method, path, headers, body):
+        if method == "PUT" and "/v1/knowledge-base/" in path:
+            files = json.loads(body)["files"]
+            self.updates.append(files)
+            if "file-stale" in files:
+                return 404, {"message": "file not found"}
+        return super().route(method, path, headers, body)
+
+
+def add_character(db, name="小雨"):
+    user = User(username=f"kb_{name}_{db.query(User).count()}")
+    db.add(user)
+    db.commit()
+    character = Character(user_id=user.user_id, name=name, gender="女", detail_setting="溫柔的咖啡師")
+    db.add(character)
+    db.commit()
+    return character
+
+
+def make_manager(server, db):
+    client = SenseChatClient()
+    client.base_url = server.base_url
+    return KnowledgeBaseManager(client, db)
+
+
+def test_unchanged_rebuild_is_noop():
+    """Test create, no-op rebuild and update"""
+    print("\n=== Testing knowledge base sync ===")
+    _, db = make_session()
+    character = add_character(db)
+    with RecordingSenseChatServer() as server:
+        manager = make_manager(server, db)
+
+        assert manager.sync_character_knowledge(character, PREFERENCES) == "created"
+        db.commit()
+        assert server.request_count == 2  # file upload + knowledge base
+        assert character.knowledge_base_id.startswith("kb-")
+
+        # Same content with keys in another order hashes the same
+        reordered = {"habits": {"sleep": "晚睡"}, "likes": {"food": ["拉麵", "壽司"]}}
+        assert manager.sync_character_knowledge(character, reordered) == "unchanged"
+        assert server.request_count == 2
+
+        knowledge_base_id = character.knowledge_base_id
+        changed = dict(PREFERENCES, dislikes={"food": ["香菜"]})
+        assert manager.sync_character_knowledge(character, changed) == "updated"
+        db.commit()
+        assert server.request_count == 4  # file upload + PUT
+        assert character.knowledge_base_id == knowledge_base_id
+
+    content = manager._build_knowledge_content(character.name, changed, character.detail_setting)
+    assert character.knowledge_hash == content_hash(content)
+    db.close()
+    print("✅ Unchanged rebuild made no remote calls")
+
+
+def test_identical_content_shares_file():
+    """Test that a second character with the same content reuses the upload"""
+    print("\n=== Testing shared knowledge files ===")
+    _, db = make_session()
+    first, second = add_character(db), add_character(db)
+    with RecordingSenseChatServer() as server:
+        manager = make_manager(server, db)
+        assert manager.sync_character_knowledge(first, PREFERENCES) == "created"
+        assert manager.sync_character_knowledge(second, PREFERENCES) == "created"
+        db.commit()
+        assert server.request_count == 3  # one upload, two knowledge bases
+        assert first.knowledge_base_id != second.knowledge_base_id
+
+    assert db.query(KnowledgeFile).count() == 1
+    db.close()
+    print("✅ One file uploaded for both characters")
+
+
+def test_stale_file_is_uploaded_again():
+    """Test that a rejected cached file is forgotten and re-uploaded"""
+    print("\n=== Testing stale cached file ===")
+    _, db = make_session()
+    character = add_character(db)
+    character.knowledge_base_id = "kb-existing"
+    content = KnowledgeBaseManager(None)._build_knowledge_content(character.name, PREFERENCES, character.detail_setting)
+    db.add(KnowledgeFile(content_hash=content_hash(content), file_id="file-stale"))
+    db.commit()
+
+    with RecordingSenseChatServer() as server:
+        manager = make_manager(server, db)
+        assert manager.sync_character_knowledge(character, PREFERENCES) == "updated"
+        db.commit()
+        assert server.updates[0] == ["file-stale"] and server.updates[1] != ["file-stale"]
+
+    assert db.get(KnowledgeFile, content_hash(content)).file_id == server.updates[1][0]
+    db.close()
+    print("✅ Stale file replaced")
+
+
+if __name__ == "__main__":
+    test_unchanged_rebuild_is_noop()
+    test_identical_content_shares_file()
+    test_stale_file_is_uploaded_again()
+    print("\n✅ All knowledge base tests passed!")
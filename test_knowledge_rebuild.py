@@ -0,0 +1,168 @@
+"""
+Test script for batch knowledge base rebuild jobs
+Ensures that:
+1. Every character is synced, with preferences read in grouped page queries
+2. A second run is a no-op for unchanged characters
+3. Transient SenseChat failures are retried; persistent ones are counted
+4. A job resumes after its checkpoint
+"""
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import event
+
+from backend.config import settings
+from backend.database import User, Character, UserPreference, KnowledgeRebuildJob
+from backend.api_client import SenseChatClient
+from backend.fake_services import FakeSenseChatServer, FaultProfile
+from backend.rate_limiter import RateLimiter, InMemoryTokenBucket
+from backend import knowledge_rebuild
+from scratch_db import make_session_factory
+
+
+class FlakySenseChatServer(FakeSenseChatServer):
+    """Fake SenseChat whose first few file uploads fail"""
+
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    def route(self, method, path, headers, body):
+        if method == "POST" and path.endswith("/v1/files"):
+            with self._lock:
+                self.failures -= 1
+                if self.failures >= 0:
+                    return 503, {"message": "busy"}
+        return super().route(method, path, headers, body)
+
+
+def make_database(characters=25):
+    """Users with two characters each; even users have preferences"""
+    engine, session_factory = make_session_factory(on_disk=True)
+
+    db = session_factory()
+    for n in range(0, characters, 2):
+        user = User(username=f"rebuild_{n}")
+        db.add(user)
+        db.commit()
+        if n % 4 == 0:
+            db.add(UserPreference(user_id=user.user_id, category="likes", content={"food": [f"料理{n}"]}))
+            db.add(UserPreference(user_id=user.user_id, category="habits", content={"sleep": "早睡"}))
+        for k in range(min(2, characters - n)):
+            db.add(Character(user_id=user.user_id, name=f"角色{n + k}", gender="女", detail_setting="設定"))
+        db.commit()
+    db.close()
+    return engine, session_factory
+
+
+def make_client(server):
+    client = SenseChatClient()
+    client.base_url = server.base_url
+    client.rate_limiter = RateLimiter(InMemoryTokenBucket(60000, 100))
+    return client
+
+
+def run(session_factory, client, job_id=None, workers=4):
+    if job_id is None:
+        db = session_factory()
+        job_id = knowledge_rebuild.create_job(db).job_id
+        db.close()
+    return knowledge_rebuild.run_job(job_id, api_client=client, session_factory=session_factory, workers=workers)
+
+
+def test_rebuild_all_characters():
+    """Test a full rebuild and an unchanged re-run"""
+    print("\n=== Testing batch rebuild ===")
+    engine, session_factory = make_database(characters=25)
+    page_size = settings.KNOWLEDGE_REBUILD_PAGE_SIZE
+    settings.KNOWLEDGE_REBUILD_PAGE_SIZE = 10
+
+    selects = []
+    event.listen(engine, "before_cursor_execute",
+                 lambda conn, cursor, statement, *args: selects.append(statement) if "user_preferences" in statement else None)
+    try:
+        with FakeSenseChatServer() as server:
+            client = make_client(server)
+            summary = run(session_factory, client)
+            print(f"Report: {summary}")
+            assert summary["status"] == "completed"
+            assert summary["processed"] == 25 and summary["created"] == 25 and summary["failed"] == 0
+            assert summary["per_second"] > 0
+            assert len(selects) == 3  # one grouped query per page of 10
+            requests_made = server.request_count
+
+            again = run(session_factory, client)
+            assert again["unchanged"] == 25
+            assert server.request_count == requests_made
+    finally:
+        settings.KNOWLEDGE_REBUILD_PAGE_SIZE = page_size
+
+    db = session_factory()
+    characters = db.query(Character).all()
+    assert all(c.knowledge_base_id and c.knowledge_hash for c in characters)
+    # Characters of a user without preferences share identical content only if the name matches
+    assert len({c.knowledge_hash for c in characters}) == 25
+    db.close()
+    print("✅ Rebuilt every character, re-run was a no-op")
+
+
+def test_retries_and_failures():
+    """Test retried uploads and characters that keep failing"""
+    print("\n=== Testing retries ===")
+    backoff = knowledge_rebuild.RETRY_BACKOFF_SECONDS
+    knowledge_rebuild.RETRY_BACKOFF_SECONDS = 0.01
+    try:
+        engine, session_factory = make_database(characters=6)
+        with FlakySenseChatServer(failures=2) as server:
+            summary = run(session_factory, make_client(server), workers=1)
+            assert summary["created"] == 6 and summary["failed"] == 0
+
+        engine, session_factory = make_database(characters=4)
+        with FakeSenseChatServer(FaultProfile(error_rate=1.0, error_status=400)) as server:
+            summary = run(session_factory, make_client(server))
+            assert summary["status"] == "completed" and summary["failed"] == 4
+            assert server.request_count == 4 * settings.KNOWLEDGE_REBUILD_MAX_ATTEMPTS
+    finally:
+        knowledge_rebuild.RETRY_BACKOFF_SECONDS = backoff
+    print("✅ Transient failures retried, persistent ones counted")
+
+
+def test_resume_from_checkpoint():
+    """Test that a resumed job skips characters before its checkpoint"""
+    print("\n=== Testing resume ===")
+    engine, session_factory = make_database(characters=10)
+    db = session_factory()
+    job = knowledge_rebuild.create_job(db)
+    job.status = knowledge_rebuild.STATUS_FAILED
+    job.last_character_id = 6
+    job.created = 6
+    job.processed = 6
+    job.elapsed_seconds = 1.0
+    db.commit()
+    job_id = job.job_id
+    db.close()
+
+    with FakeSenseChatServer() as server:
+        summary = run(session_factory, make_client(server), job_id=job_id)
+        assert server.request_count == 4 * 2
+
+    assert summary["status"] == "completed"
+    assert summary["processed"] == 10 and summary["created"] == 10
+    assert summary["seconds"] > 1.0
+    assert run(session_factory, None, job_id=job_id) is None  # already completed
+
+    db = session_factory()
+    job = db.get(KnowledgeRebuildJob, job_id)
+    assert job.last_character_id == 10 and job.completed_at is not None
+    assert db.query(Character).filter(Character.knowledge_base_id.is_(None)).count() == 6
+    db.close()
+    print("✅ Resumed after the checkpoint")
+
+
+if __name__ == "__main__":
+    test_rebuild_all_characters()
+    test_retries_and_failures()
+    test_resume_from_checkpoint()
+    print("\n✅ All knowledge rebuild tests passed!")
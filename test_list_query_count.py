@@ -0,0 +1,92 @@
+"""
+Test script for character list endpoints
+Ensures /api/v2/user-characters and /api/v2/characters run a constant
+number of queries no matter how many characters a user owns
+"""
+import sys
+import os
+import asyncio
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import event
+
+from backend.database import User, Character, Message, FavorabilityTracking, LineUserMapping
+from backend.main import get_user_characters, get_characters
+from backend import mapping_cache
+from scratch_db import make_session
+
+
+def make_user(character_count: int):
+    """In-memory database with a LINE user owning character_count characters"""
+    engine, db = make_session()
+
+    user = User(username="列表測試")
+    db.add(user)
+    db.commit()
+    for n in range(character_count):
+        character = Character(user_id=user.user_id, name=f"角色{n}", gender="女" if n % 2 else "男")
+        db.add(character)
+        db.commit()
+        # Leave every third character without favorability or messages
+        if n % 3:
+            db.add(FavorabilityTracking(user_id=user.user_id, character_id=character.character_id, current_level=2))
+            for i in range(3):
+                db.add(Message(user_id=user.user_id, character_id=character.character_id,
+                               speaker_name=character.name, message_content=f"{character.name} 的第 {i} 則訊息"))
+    db.add(LineUserMapping(line_user_id="Ulisttest", user_id=user.user_id))
+    db.commit()
+    return engine, db, user.user_id
+
+
+def count_queries(engine, call):
+    queries = []
+    listener = lambda *args: queries.append(args[2])
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        result = asyncio.run(call())
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    return result, len(queries)
+
+
+def test_user_characters_query_count():
+    """Test that /api/v2/user-characters is not N+1"""
+    print("\n=== Testing /api/v2/user-characters query count ===")
+    counts = {}
+    for n in (1, 5, 30):
+        engine, db, user_id = make_user(n)
+        result, counts[n] = count_queries(engine, lambda: get_user_characters(user_id, db=db))
+        assert result["character_count"] == n
+
+        by_name = {c["name"]: c for c in result["characters"]}
+        if n >= 3:
+            assert by_name["角色1"]["favorability"] == 2
+            assert by_name["角色1"]["last_message"]["preview"] == "角色1 的第 2 則訊息"
+            assert by_name["角色0"]["favorability"] == 1
+            assert by_name["角色0"]["last_message"] is None
+
+    print(f"Queries by character count: {counts}")
+    assert len(set(counts.values())) == 1
+    print("✅ Constant query count")
+
+
+def test_characters_query_count():
+    """Test that /api/v2/characters is not N+1"""
+    print("\n=== Testing /api/v2/characters query count ===")
+    counts = {}
+    for n in (1, 5, 30):
+        engine, db, _ = make_user(n)
+        mapping_cache.get_cache().clear()  # each iteration is a fresh database
+        result, counts[n] = count_queries(engine, lambda: get_characters("Ulisttest", db=db))
+        assert len(result["characters"]) == n
+
+    print(f"Queries by character count: {counts}")
+    assert len(set(counts.values())) == 1
+    print("✅ Constant query count")
+
+
+if __name__ == "__main__":
+    test_user_characters_query_count()
+    test_characters_query_count()
+    print("\n✅ All list query count tests passed!")
@@ -0,0 +1,128 @@
+"""
+Test script for the LineUserMapping read-through cache
+Ensures that:
+1. A miss loads mapping and active character in one query
+2. A hit issues no SQL, including for mapping.character
+3. Objects from a hit can still be updated through the session
+4. Invalidation and TTL expire stale entries
+"""
+import sys
+import os
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import event
+
+from backend.database import User, Character, LineUserMapping
+from backend import mapping_cache
+from backend.mapping_cache import MappingCache
+from scratch_db import make_session_factory
+
+
+def make_database():
+    engine, Session = make_session_factory()
+
+    db = Session()
+    user = User(username="cache_user")
+    db.add(user)
+    db.commit()
+    character = Character(user_id=user.user_id, name="小雨", gender="女", other_setting={"interests": ["咖啡"]})
+    db.add(character)
+    db.commit()
+    db.add(LineUserMapping(line_user_id="Ucache", user_id=user.user_id, character_id=character.character_id))
+    db.commit()
+    db.close()
+
+    queries = []
+    event.listen(engine, "before_cursor_execute", lambda *args: queries.append(args[2]))
+    return Session, queries
+
+
+def test_miss_then_hit():
+    """Test query counts on miss and hit"""
+    print("\n=== Testing cache miss and hit ===")
+    mapping_cache.get_cache().clear()
+    Session, queries = make_database()
+
+    db = Session()
+    mapping = mapping_cache.get_mapping(db, "Ucache")
+    assert mapping.character.name == "小雨"
+    print(f"Miss: {len(queries)} queries")
+    assert len(queries) == 1
+    db.close()
+
+    queries.clear()
+    db = Session()
+    mapping = mapping_cache.get_mapping(db, "Ucache")
+    assert mapping.user_id and mapping.character_id
+    assert mapping.character.name == "小雨"
+    assert db.get(Character, mapping.character_id) is mapping.character
+    print(f"Hit: {len(queries)} queries")
+    assert queries == []
+    db.close()
+    print("✅ Hit served without SQL")
+
+
+def test_hit_objects_are_writable():
+    """Test updating a cached mapping through the session"""
+    print("\n=== Testing writes through cached objects ===")
+    mapping_cache.get_cache().clear()
+    Session, _ = make_database()
+
+    db = Session()
+    mapping_cache.get_mapping(db, "Ucache")
+    db.close()
+
+    db = Session()
+    mapping = mapping_cache.get_mapping(db, "Ucache")
+    mapping.line_display_name = "新名字"
+    mapping.character.other_setting["interests"].append("貓")  # must not leak into the cache
+    db.commit()
+    db.close()
+
+    db = Session()
+    fresh = db.query(LineUserMapping).filter(LineUserMapping.line_user_id == "Ucache").first()
+    assert fresh.line_display_name == "新名字"
+    cached = mapping_cache.get_mapping(db, "Ucache")
+    assert cached.character.other_setting == {"interests": ["咖啡"]}
+    db.close()
+    print("✅ Updates persisted, cache not mutated")
+
+
+def test_invalidation():
+    """Test explicit invalidation and TTL"""
+    print("\n=== Testing invalidation ===")
+    mapping_cache.get_cache().clear()
+    Session, _ = make_database()
+
+    db = Session()
+    mapping = mapping_cache.get_mapping(db, "Ucache")
+    character_id = mapping.character_id
+    mapping.character_id = None
+    db.commit()
+    db.close()
+
+    db = Session()
+    assert mapping_cache.get_mapping(db, "Ucache").character_id == character_id  # stale
+    db.close()
+
+    mapping_cache.invalidate_character(character_id)
+    db = Session()
+    assert mapping_cache.get_mapping(db, "Ucache").character_id is None
+    db.close()
+
+    short = MappingCache(ttl_seconds=0.05)
+    short.put("U", {"character_id": 1}, None)
+    assert short.get("U") is not None
+    time.sleep(0.06)
+    assert short.get("U") is None
+    print("✅ Invalidation and TTL behave")
+
+
+if __name__ == "__main__":
+    test_miss_then_hit()
+    test_hit_objects_are_writable()
+    test_invalidation()
+    print("\n✅ All mapping cache tests passed!")
@@ -0,0 +1,114 @@
+"""
+Test script for projection-based message reads
+Ensures that:
+1. History and pages come back as immutable records matching the stored messages
+2. Reads add nothing to the session's identity map
+3. The characters overview previews the latest message, or None without one
+4. Streaming reads honour their bounds and order, one query per call
+"""
+import sys
+import os
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import event
+
+from backend.database import User, Character, Message, SPEAKER_USER, SPEAKER_CHARACTER
+from backend.conversation_manager import ConversationManager
+from backend.message_reads import MessageRecord
+from backend import message_reads, conversation_export
+from scratch_db import make_session
+
+START = datetime(2025, 1, 1, 12, 0)
+
+
+def make_database(message_count=30):
+    engine, db = make_session()
+
+    user = User(username="小明")
+    db.add(user)
+    db.commit()
+    characters = [Character(user_id=user.user_id, name=name, gender="女") for name in ("小雨", "小晴")]
+    db.add_all(characters)
+    db.commit()
+    for n in range(message_count):
+        db.add(Message(user_id=user.user_id, character_id=characters[0].character_id,
+                       speaker_name="小明" if n % 2 == 0 else "小雨",
+                       speaker_role=SPEAKER_USER if n % 2 == 0 else SPEAKER_CHARACTER,
+                       message_content=f"m{n}", timestamp=START + timedelta(minutes=n), favorability_level=1))
+    db.commit()
+    # Keep the fixtures readable, but start every test with an empty identity map
+    for instance in [user, *characters]:
+        db.refresh(instance)
+    db.expunge_all()
+    return engine, db, user, characters
+
+
+def test_records_match_messages():
+    """Test that records carry the same values as the ORM rows and can't be changed"""
+    print("\n=== Testing records ===")
+    engine, db, user, (rain, sunny) = make_database()
+    manager = ConversationManager(db, api_client=None)
+
+    history = manager.get_conversation_history(rain.character_id, limit=5)
+    assert all(type(m) is MessageRecord for m in history)
+    assert [m.message_content for m in history] == [f"m{n}" for n in range(25, 30)]
+    assert len(db.identity_map) == 0
+
+    stored = db.get(Message, history[-1].message_id)
+    assert tuple(history[-1]) == tuple(getattr(stored, field) for field in MessageRecord._fields)
+    try:
+        history[-1].message_content = "changed"
+        assert False, "record was mutable"
+    except AttributeError:
+        pass
+    assert not hasattr(history[-1], "__dict__")
+
+    page, has_more = manager.get_conversation_page(rain.character_id, before_message_id=history[0].message_id, page_size=10)
+    assert [m.message_content for m in page] == [f"m{n}" for n in range(15, 25)] and has_more
+    names = [m["name"] for m in manager.format_messages_for_api(page[:2], "阿明", "小雨")]
+    assert names == ["小雨", "阿明"]
+    db.close()
+    print("✅ Immutable records, identity map untouched")
+
+
+def test_overview_preview():
+    """Test the latest message of each character in the overview"""
+    print("\n=== Testing overview ===")
+    engine, db, user, (rain, sunny) = make_database()
+    manager = ConversationManager(db, api_client=None)
+
+    overview = {character.name: last for character, _, last in manager.get_user_characters_overview(user.user_id)}
+    assert overview["小晴"] is None
+    assert type(overview["小雨"]) is MessageRecord and overview["小雨"].message_content == "m29"
+    assert manager.get_conversation_summary(rain.character_id)["message_count"] == 30
+    db.close()
+    print("✅ Latest message projected")
+
+
+def test_streaming_bounds():
+    """Test iter_history ranges and order, and export streaming through it"""
+    print("\n=== Testing streaming ===")
+    engine, db, user, (rain, sunny) = make_database()
+    queries = []
+    event.listen(engine, "before_cursor_execute", lambda *args: queries.append(1))
+
+    ids = [m.message_id for m in message_reads.iter_history(db, rain.character_id, 5, 12, batch_size=3)]
+    assert ids == list(range(6, 12)) and len(queries) == 1
+
+    # Export order is by time, even if ids disagree
+    db.query(Message).filter(Message.message_id == 1).update({"timestamp": START + timedelta(days=1)})
+    db.commit()
+    contents = [m.message_content for m in conversation_export.iter_messages(db, rain.character_id, batch_size=7)]
+    assert contents == [f"m{n}" for n in range(1, 30)] + ["m0"]
+    assert len(db.identity_map) == 0
+    db.close()
+    print("✅ Bounded, ordered streams")
+
+
+if __name__ == "__main__":
+    test_records_match_messages()
+    test_overview_preview()
+    test_streaming_bounds()
+    print("\n✅ All message read tests passed!")
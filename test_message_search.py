@@ -0,0 +1,160 @@
+"""
+Test script for conversation history search
+Ensures that:
+1. Chinese substrings are found, ranked, highlighted and paginated per character
+2. The FTS5 index follows inserts, edits and deletes without a rebuild
+3. Terms shorter than three characters fall back to a newest-first scan
+4. The index is built for existing messages, and the endpoint validates input
+"""
+import sys
+import os
+import asyncio
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi import HTTPException
+
+from backend.database import User, Character, Message
+from backend import message_search, metrics
+from scratch_db import make_session_factory
+
+START = datetime(2025, 1, 1, 12, 0)
+
+
+def make_database(index=True):
+    engine, session_factory = make_session_factory()
+    if index:
+        message_search.ensure_index(engine)
+    db = session_factory()
+
+    user = User(username="小明")
+    db.add(user)
+    db.commit()
+    characters = [Character(user_id=user.user_id, name=name, gender="女") for name in ("小雨", "小晴")]
+    db.add_all(characters)
+    db.commit()
+    return engine, db, user, characters
+
+
+def add_messages(db, user, character, contents):
+    for n, content in enumerate(contents):
+        db.add(Message(user_id=user.user_id, character_id=character.character_id, speaker_name=user.username,
+                       message_content=content, timestamp=START + timedelta(minutes=n)))
+    db.commit()
+
+
+def search(db, character, query, **kwargs):
+    rows, has_more = message_search.search_messages(db, character.character_id, query, **kwargs)
+    return [row.message_content for row in rows], has_more
+
+
+def test_ranked_highlighted_pages():
+    """Test substring matching, ranking, isolation, highlighting and paging"""
+    print("\n=== Testing search ===")
+    engine, db, user, (rain, sunny) = make_database()
+    add_messages(db, user, rain, [
+        "我們去淡水看夕陽吧",
+        "淡水的夕陽，淡水的海風，淡水的一切都好",
+        "今天加班好累",
+        "<b>淡水</b>老街的阿給",
+    ])
+    add_messages(db, user, sunny, ["淡水的夕陽也很美"])
+
+    metrics.reset()
+    results, has_more = search(db, rain, "淡水的")
+    assert results[0] == "淡水的夕陽，淡水的海風，淡水的一切都好" and len(results) == 1 and not has_more
+    assert metrics.get("message_search_queries_total", backend="fts5") == 1
+
+    # Every term must match; the other character's messages never show up
+    assert sorted(search(db, rain, "夕陽 淡水")[0]) == ["我們去淡水看夕陽吧", "淡水的夕陽，淡水的海風，淡水的一切都好"]
+    assert search(db, rain, "淡水看夕陽")[0] == ["我們去淡水看夕陽吧"]
+    assert search(db, rain, "海邊散步")[0] == []
+
+    page1, more1 = search(db, rain, "淡水", page=1, page_size=2)
+    page2, more2 = search(db, rain, "淡水", page=2, page_size=2)
+    assert more1 and not more2 and len(page1) == 2 and len(page2) == 1
+    assert not set(page1) & set(page2)
+
+    rows, _ = message_search.search_messages(db, rain.character_id, "<b>淡水")
+    hit = message_search.hit_dict(rows[0], message_search.parse_terms("<b>淡水"))
+    print(f"Highlighted: {hit['highlighted']}")
+    assert hit["highlighted"] == "<mark>&lt;b&gt;淡水</mark>&lt;/b&gt;老街的阿給"
+    assert hit["score"] > 0
+    db.close()
+    print("✅ Ranked, highlighted and paginated")
+
+
+def test_index_follows_writes():
+    """Test that inserts, edits and deletes are reflected immediately"""
+    print("\n=== Testing incremental index ===")
+    engine, db, user, (rain, sunny) = make_database()
+    add_messages(db, user, rain, ["我喜歡抹茶拿鐵"])
+    assert search(db, rain, "抹茶拿")[0] == ["我喜歡抹茶拿鐵"]
+
+    message = db.query(Message).first()
+    message.message_content = "我改喝黑咖啡了"
+    db.commit()
+    assert search(db, rain, "抹茶拿")[0] == []
+    assert search(db, rain, "黑咖啡")[0] == ["我改喝黑咖啡了"]
+
+    db.delete(message)
+    db.commit()
+    assert search(db, rain, "黑咖啡")[0] == []
+    db.close()
+    print("✅ Index follows inserts, edits and deletes")
+
+
+def test_short_terms_and_escaping():
+    """Test the scan fallback for one- and two-character terms, and LIKE escaping"""
+    print("\n=== Testing short terms ===")
+    engine, db, user, (rain, sunny) = make_database()
+    add_messages(db, user, rain, ["拉麵好吃", "晚餐吃拉麵嗎", "100%同意", "100個讚", "想吃拉麵配煎餃"])
+
+    metrics.reset()
+    results, _ = search(db, rain, "拉麵")
+    assert results == ["想吃拉麵配煎餃", "晚餐吃拉麵嗎", "拉麵好吃"]  # newest first
+    assert metrics.get("message_search_queries_total", backend="like") == 1
+    # A short term filters the indexed term's hits
+    assert search(db, rain, "拉麵 配煎餃")[0] == ["想吃拉麵配煎餃"]
+    assert search(db, rain, "0%")[0] == ["100%同意"]
+    assert search(db, rain, '"')[0] == []
+    db.close()
+    print("✅ Short terms scanned, wildcards escaped")
+
+
+def test_backfill_and_endpoint():
+    """Test building the index over existing messages and the endpoint"""
+    print("\n=== Testing backfill and endpoint ===")
+    from backend import main
+
+    engine, db, user, (rain, sunny) = make_database(index=False)
+    add_messages(db, user, rain, [f"第{n}次去淡水" for n in range(30)])
+    metrics.reset()
+    assert len(search(db, rain, "去淡水", page_size=50)[0]) == 30
+    assert metrics.get("message_search_queries_total", backend="like") == 1
+
+    message_search.ensure_index(engine)
+    result = asyncio.run(main.search_conversation(rain.character_id, q="去淡水", page=2, page_size=20, db=db))
+    assert result["success"] and not result["has_more"] and len(result["results"]) == 10
+    assert metrics.get("message_search_queries_total", backend="fts5") == 1
+    assert all("<mark>去淡水</mark>" in hit["highlighted"] for hit in result["results"])
+
+    result = asyncio.run(main.search_conversation(rain.character_id, q="淡水", page=1, page_size=500, db=db))
+    assert result["page_size"] == main.SEARCH_MAX_PAGE_SIZE
+
+    try:
+        asyncio.run(main.search_conversation(rain.character_id, q="   ", db=db))
+        assert False, "blank query accepted"
+    except HTTPException as e:
+        assert e.status_code == 400
+    db.close()
+    print("✅ Existing messages indexed, endpoint works")
+
+
+if __name__ == "__main__":
+    test_ranked_highlighted_pages()
+    test_index_follows_writes()
+    test_short_terms_and_escaping()
+    test_backfill_and_endpoint()
+    print("\n✅ All message search tests passed!")
@@ -0,0 +1,95 @@
+"""
+Test script for database migrations
+Ensures that:
+1. Indexes missing from an existing table are created
+2. Running the migration again, or alongside another process, is harmless
+3. A speaker_role backfill cut off mid-way is finished by the next migration
+"""
+import sys
+import os
+import threading
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import inspect, text
+
+from backend import database
+from backend.database import User, Character, Message, SPEAKER_USER, SPEAKER_CHARACTER
+from scratch_db import make_engine
+
+
+@contextmanager
+def migrating(engine):
+    """Point the migration helpers at a scratch engine"""
+    original = database.engine
+    database.engine = engine
+    try:
+        yield
+    finally:
+        database.engine = original
+
+
+def index_names(engine, table):
+    return {index["name"] for index in inspect(engine).get_indexes(table)}
+
+
+def test_missing_indexes_created():
+    """Test that indexes create_all skipped are added, repeatably and concurrently"""
+    print("\n=== Testing missing indexes ===")
+    engine = make_engine(on_disk=True)
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX ix_messages_character_role"))
+        conn.execute(text("DROP INDEX ix_export_jobs_created_at"))
+
+    errors = []
+
+    def run():
+        try:
+            database._create_missing_indexes()
+        except Exception as e:
+            errors.append(e)
+
+    with migrating(engine):
+        threads = [threading.Thread(target=run) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        database._create_missing_indexes()
+
+    assert not errors, errors
+    assert "ix_messages_character_role" in index_names(engine, "messages")
+    assert "ix_export_jobs_created_at" in index_names(engine, "export_jobs")
+    print("✅ Indexes added once, re-runs are no-ops")
+
+
+def test_interrupted_backfill_resumes():
+    """Test that migrate labels NULL speaker roles even though the column already exists"""
+    print("\n=== Testing backfill resume ===")
+    engine = make_engine(on_disk=True)
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert(), {"user_id": 1, "username": "小明"})
+        conn.execute(Character.__table__.insert(), {"character_id": 1, "user_id": 1, "name": "小雨", "gender": "女"})
+        # First half labeled by an earlier, interrupted run
+        conn.execute(Message.__table__.insert(), [
+            {"user_id": 1, "character_id": 1, "speaker_name": "小明" if n % 2 == 0 else "小雨",
+             "speaker_role": (SPEAKER_USER if n % 2 == 0 else SPEAKER_CHARACTER) if n < 10 else None,
+             "message_content": f"m{n}"}
+            for n in range(20)
+        ])
+
+    with migrating(engine):
+        database.migrate()
+        assert database.backfill_speaker_roles() == 0
+
+    with engine.connect() as conn:
+        roles = [role for (role,) in conn.execute(text("SELECT speaker_role FROM messages ORDER BY message_id"))]
+    assert roles == [SPEAKER_USER, SPEAKER_CHARACTER] * 10
+    print("✅ Remaining rows labeled")
+
+
+if __name__ == "__main__":
+    test_missing_indexes_created()
+    test_interrupted_backfill_resumes()
+    print("\n✅ All migration tests passed!")
@@ -0,0 +1,154 @@
+"""
+Test script for proactive outreach
+Ensures that:
+1. Anniversaries and inactivity nudges go out through LINE multicast in batches
+2. Every user gets at most one proactive message per day, only in push hours
+3. A failed push leaves its users for the next sweep
+4. Dry runs against the fake LINE server leave the database untouched
+5. Candidate scans use indexes instead of scanning line_user_mappings
+"""
+import sys
+import os
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import text
+
+from backend.database import User, Character, FavorabilityTracking, LineUserMapping
+from backend.line_client import LineClient
+from backend.fake_services import FakeLineServer, FaultProfile
+from backend.rate_limiter import RateLimiter, InMemoryTokenBucket
+from backend import outreach
+from scratch_db import make_session
+
+NOON = datetime(2025, 3, 10, 4, 0)  # 12:00 in Taipei
+
+
+def make_database(inactive_users=7):
+    """Three anniversary users, inactive_users silent for 3 days, one active user"""
+    engine, db = make_session(on_disk=True)
+
+    def add(n, first_message_at, last_interaction):
+        user = User(username=f"outreach_{n}")
+        db.add(user)
+        db.commit()
+        character = Character(user_id=user.user_id, name=f"角色{n}", gender="女")
+        db.add(character)
+        db.commit()
+        db.add(FavorabilityTracking(user_id=user.user_id, character_id=character.character_id,
+                                    first_message_at=first_message_at))
+        db.add(LineUserMapping(line_user_id=f"U{n:04d}", user_id=user.user_id, character_id=character.character_id,
+                               last_interaction=last_interaction))
+        db.commit()
+
+    month_ago = NOON - timedelta(days=30)
+    for n in range(3):
+        add(n, month_ago, NOON - timedelta(hours=1))
+    for n in range(3, 3 + inactive_users):
+        add(n, month_ago + timedelta(days=2), NOON - timedelta(days=3))
+    add(99, month_ago + timedelta(days=5), NOON - timedelta(hours=2))
+    return engine, db
+
+
+def fast_limiter():
+    return RateLimiter(InMemoryTokenBucket(60000, 100))
+
+
+def test_outreach_batches():
+    """Test multicast fan-out in batches and once-a-day delivery"""
+    print("\n=== Testing outreach fan-out ===")
+    engine, db = make_database(inactive_users=7)
+    with FakeLineServer() as server:
+        client = LineClient()
+        client.line_bot_api.endpoint = server.base_url
+
+        sent = outreach.run_outreach(db, client.multicast_message, now=NOON, limiter=fast_limiter(), batch_size=3)
+        assert sent == {"anniversary": 3, "inactive": 7}
+        sizes = [len(push["to"]) for push in server.pushes]
+        print(f"Multicast batch sizes: {sizes}")
+        assert sizes == [3, 3, 3, 1]
+        assert server.pushes[0]["messages"][0]["text"].startswith("午安～一個月了呢")
+
+        again = outreach.run_outreach(db, client.multicast_message, now=NOON + timedelta(hours=1),
+                                      limiter=fast_limiter(), batch_size=3)
+        assert again == {"anniversary": 0, "inactive": 0}
+
+        night = outreach.run_outreach(db, client.multicast_message, now=NOON + timedelta(hours=11),
+                                      limiter=fast_limiter())
+        assert night == {"anniversary": 0, "inactive": 0}
+        assert len(server.pushes) == 4
+
+    mapping = db.query(LineUserMapping).filter(LineUserMapping.line_user_id == "U0003").first()
+    assert mapping.last_outreach_at == NOON
+    assert mapping.last_interaction == NOON - timedelta(days=3)  # not bumped by the claim
+    db.close()
+    print("✅ Batched, once per day, inside push hours")
+
+
+def test_failed_push_retries():
+    """Test that users of a failed multicast are claimed again later"""
+    print("\n=== Testing failed pushes ===")
+    engine, db = make_database(inactive_users=2)
+    with FakeLineServer(FaultProfile(error_rate=1.0)) as server:
+        client = LineClient()
+        client.line_bot_api.endpoint = server.base_url
+        sent = outreach.run_outreach(db, client.multicast_message, now=NOON, limiter=fast_limiter())
+        assert sent == {"anniversary": 0, "inactive": 0}
+
+    with FakeLineServer() as server:
+        client = LineClient()
+        client.line_bot_api.endpoint = server.base_url
+        sent = outreach.run_outreach(db, client.multicast_message, now=NOON, limiter=fast_limiter())
+        assert sent == {"anniversary": 3, "inactive": 2}
+    db.close()
+    print("✅ Failed batches retried on the next sweep")
+
+
+def test_dry_run():
+    """Test that a dry run pushes to the fake server but claims nothing"""
+    print("\n=== Testing dry run ===")
+    engine, db = make_database()
+    with FakeLineServer() as server:
+        client = LineClient()
+        client.line_bot_api.endpoint = server.base_url
+        sent = outreach.run_outreach(db, client.multicast_message, now=NOON, limiter=fast_limiter(), dry_run=True)
+        assert sent == {"anniversary": 3, "inactive": 7}
+        assert len(server.pushes) == 2
+
+    assert db.query(LineUserMapping).filter(LineUserMapping.last_outreach_at.isnot(None)).count() == 0
+    assert db.query(FavorabilityTracking).filter(FavorabilityTracking.last_anniversary_days.isnot(None)).count() == 0
+    db.close()
+    print("✅ Dry run rolled back")
+
+
+def test_candidate_scans_use_indexes():
+    """Test that SQLite plans the candidate queries on indexes"""
+    print("\n=== Testing candidate query plans ===")
+    engine, db = make_database()
+    with engine.connect() as conn:
+        inactive_plan = " ".join(row[-1] for row in conn.execute(text(
+            "EXPLAIN QUERY PLAN SELECT mapping_id FROM line_user_mappings "
+            "WHERE last_interaction >= '2025-03-06' AND last_interaction < '2025-03-07' "
+            "AND character_id IS NOT NULL LIMIT 500"
+        )))
+        anniversary_plan = " ".join(row[-1] for row in conn.execute(text(
+            "EXPLAIN QUERY PLAN SELECT favorability_tracking.tracking_id FROM favorability_tracking "
+            "JOIN line_user_mappings ON line_user_mappings.character_id = favorability_tracking.character_id "
+            "WHERE first_message_at >= '2025-02-08' AND first_message_at < '2025-02-09' LIMIT 500"
+        )))
+    print(f"Inactivity plan: {inactive_plan}")
+    print(f"Anniversary plan: {anniversary_plan}")
+    assert "ix_line_user_mappings_last_interaction" in inactive_plan
+    assert "ix_favorability_tracking_first_message_at" in anniversary_plan
+    assert "SCAN line_user_mappings" not in anniversary_plan
+    db.close()
+    print("✅ Both scans are index range lookups")
+
+
+if __name__ == "__main__":
+    test_outreach_batches()
+    test_failed_push_retries()
+    test_dry_run()
+    test_candidate_scans_use_indexes()
+    print("\n✅ All outreach tests passed!")
@@ -0,0 +1,126 @@
+"""
+Test script for the atomic daily message quota
+Ensures that:
+1. Concurrent messages never exceed the daily limit
+2. The counter rolls over on a new local day
+3. Refunds return a slot, and unlimited users are counted but never rejected
+4. Day boundaries follow the user's timezone
+5. Rejections show up in /metrics output
+"""
+import sys
+import os
+import threading
+from datetime import date, datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend.database import User, LineUserMapping
+from backend import quota, metrics
+from scratch_db import make_session_factory
+
+LIMIT = 5
+
+
+def make_database():
+    """File-backed SQLite so several threads can hold their own connections"""
+    _, Session = make_session_factory(on_disk=True, timeout=30)
+
+    db = Session()
+    user = User(username="quota_user")
+    db.add(user)
+    db.commit()
+    db.add(LineUserMapping(line_user_id="Uquota", user_id=user.user_id,
+                           daily_message_count=0, last_message_date=date(2025, 1, 1)))
+    db.commit()
+    db.close()
+    return Session
+
+
+def test_concurrent_consume_never_overshoots():
+    """Test 20 simultaneous messages against a limit of 5"""
+    print("\n=== Testing concurrent quota ===")
+    Session = make_database()
+    today = date(2025, 1, 2)
+    results = []
+    start = threading.Barrier(20)
+
+    def send():
+        db = Session()
+        try:
+            start.wait()
+            results.append(quota.try_consume(db, "Uquota", today, limit=LIMIT))
+        finally:
+            db.close()
+
+    threads = [threading.Thread(target=send) for _ in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    accepted = sorted(r for r in results if r is not None)
+    print(f"Accepted counts: {accepted}, rejected: {results.count(None)}")
+    assert accepted == [1, 2, 3, 4, 5]
+    db = Session()
+    assert db.query(LineUserMapping).first().daily_message_count == LIMIT
+    db.close()
+    print("✅ Exactly the limit was granted")
+
+
+def test_rollover_and_refund():
+    """Test day rollover, refunds and unlimited users"""
+    print("\n=== Testing rollover and refund ===")
+    Session = make_database()
+    db = Session()
+    day1, day2 = date(2025, 1, 2), date(2025, 1, 3)
+
+    for _ in range(LIMIT):
+        assert quota.try_consume(db, "Uquota", day1, limit=LIMIT) is not None
+    assert quota.try_consume(db, "Uquota", day1, limit=LIMIT) is None
+
+    quota.refund(db, "Uquota", day1)
+    assert quota.try_consume(db, "Uquota", day1, limit=LIMIT) == LIMIT
+
+    assert quota.try_consume(db, "Uquota", day2, limit=LIMIT) == 1
+    assert quota.try_consume(db, "Uquota", day2, limit=None) == 2
+    for _ in range(10):
+        assert quota.try_consume(db, "Uquota", day2, limit=None) is not None
+    assert quota.try_consume(db, "Unknown", day2, limit=LIMIT) is None
+    db.close()
+    print("✅ Rollover, refunds and unlimited users behave")
+
+
+def test_local_day_boundary():
+    """Test that the quota day follows the user's timezone"""
+    print("\n=== Testing timezone day boundary ===")
+    utc_evening = datetime(2025, 1, 1, 17, 30)  # 01:30 on Jan 2 in Taipei
+    assert quota.local_today("Asia/Taipei", utc_evening) == date(2025, 1, 2)
+    assert quota.local_today("America/Los_Angeles", utc_evening) == date(2025, 1, 1)
+    assert quota.local_today("Not/AZone", utc_evening) == quota.local_today(None, utc_evening)
+    print("✅ Local dates computed per timezone")
+
+
+def test_rejection_metrics():
+    """Test that rejections are exported"""
+    print("\n=== Testing quota metrics ===")
+    metrics.reset()
+    Session = make_database()
+    db = Session()
+    day = date(2025, 2, 1)
+    for _ in range(LIMIT + 3):
+        quota.try_consume(db, "Uquota", day, limit=LIMIT)
+    db.close()
+
+    assert metrics.get("quota_rejections_total") == 3
+    text = metrics.render()
+    assert "quota_rejections_total 3" in text
+    assert "quota_checks_total 8" in text
+    print("✅ Metrics rendered:\n" + text)
+
+
+if __name__ == "__main__":
+    test_concurrent_consume_never_overshoots()
+    test_rollover_and_refund()
+    test_local_day_boundary()
+    test_rejection_metrics()
+    print("\n✅ All quota tests passed!")
@@ -0,0 +1,166 @@
+"""
+Test script for the SenseChat client-side rate limiter
+Ensures that:
+1. The in-process token bucket allows a burst, then paces requests
+2. Waiting premium requests are served before waiting free requests
+3. A slow backend call doesn't block other waiters from queuing or timing out
+4. The database (GCRA) backend shares one budget between limiter instances
+"""
+import sys
+import os
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend.rate_limiter import (
+    InMemoryTokenBucket,
+    DatabaseGCRA,
+    RateLimiter,
+    RateLimitExceeded,
+    PRIORITY_PREMIUM,
+    PRIORITY_FREE,
+)
+
+
+class GateBackend:
+    """Backend that only admits requests when the test hands out a slot"""
+
+    def __init__(self):
+        self.slots = 0
+        self.lock = threading.Lock()
+
+    def release(self):
+        with self.lock:
+            self.slots += 1
+
+    def try_acquire(self):
+        with self.lock:
+            if self.slots > 0:
+                self.slots -= 1
+                return 0.0
+        return 0.01
+
+
+def test_token_bucket_burst_then_pacing():
+    """Test that the bucket admits `burst` requests immediately, then refuses"""
+    print("\n=== Testing Token Bucket Burst ===")
+    bucket = InMemoryTokenBucket(rate_per_minute=60, burst=3)
+
+    results = [bucket.try_acquire() for _ in range(4)]
+    print(f"Wait times: {[round(r, 2) for r in results]}")
+
+    assert results[:3] == [0.0, 0.0, 0.0]
+    assert 0 < results[3] <= 1.0
+    print("✅ Burst admitted, 4th request must wait ~1s")
+
+
+def test_limiter_timeout():
+    """Test that the limiter gives up after the maximum wait"""
+    print("\n=== Testing Limiter Timeout ===")
+    limiter = RateLimiter(GateBackend(), max_wait_seconds=0.1)
+
+    start = time.monotonic()
+    try:
+        limiter.acquire()
+        raise AssertionError("acquire() should have timed out")
+    except RateLimitExceeded as e:
+        print(f"✅ Timed out after {time.monotonic() - start:.2f}s: {e}")
+
+
+def test_premium_served_first():
+    """Test that a premium request overtakes free requests already waiting"""
+    print("\n=== Testing Priority Queue ===")
+    backend = GateBackend()
+    limiter = RateLimiter(backend, max_wait_seconds=5)
+    order = []
+
+    def worker(name, priority):
+        limiter.acquire(priority)
+        order.append(name)
+
+    threads = []
+    for name, priority in [("free-1", PRIORITY_FREE), ("free-2", PRIORITY_FREE), ("premium", PRIORITY_PREMIUM)]:
+        t = threading.Thread(target=worker, args=(name, priority))
+        t.start()
+        threads.append(t)
+        time.sleep(0.05)  # Make arrival order deterministic
+
+    for _ in threads:
+        backend.release()
+        time.sleep(0.05)
+
+    for t in threads:
+        t.join(timeout=5)
+
+    print(f"Service order: {order}")
+    assert order == ["premium", "free-1", "free-2"]
+    print("✅ Premium user served ahead of free users")
+
+
+class SlowBackend:
+    """Backend whose every call takes a while, like a slow database round trip"""
+
+    def try_acquire(self):
+        time.sleep(0.3)
+        return 1.0
+
+
+def test_slow_backend_does_not_block_queue():
+    """Test that a waiter times out on schedule while the head is inside the backend"""
+    print("\n=== Testing Slow Backend ===")
+    limiter = RateLimiter(SlowBackend(), max_wait_seconds=0.5)
+
+    head = threading.Thread(target=lambda: _expect_timeout(limiter, 0.5))
+    head.start()
+    time.sleep(0.05)  # head is now inside try_acquire
+
+    start = time.monotonic()
+    _expect_timeout(limiter, 0.1)
+    elapsed = time.monotonic() - start
+    head.join(timeout=5)
+
+    print(f"Second waiter gave up after {elapsed:.2f}s")
+    assert elapsed < 0.25
+    print("✅ Backend call made outside the queue lock")
+
+
+def _expect_timeout(limiter, timeout):
+    try:
+        limiter.acquire(timeout=timeout)
+        raise AssertionError("acquire() should have timed out")
+    except RateLimitExceeded:
+        pass
+
+
+def test_database_backend_shared_budget():
+    """Test that two GCRA instances (e.g. two workers) share one budget"""
+    print("\n=== Testing Shared Database Backend ===")
+    from backend.database import init_db, engine, RateLimitState
+
+    init_db()
+    key = f"test-{os.getpid()}-{time.time()}"
+    worker_a = DatabaseGCRA(rate_per_minute=60, burst=2, bucket_key=key)
+    worker_b = DatabaseGCRA(rate_per_minute=60, burst=2, bucket_key=key)
+
+    results = [worker_a.try_acquire(), worker_b.try_acquire(), worker_a.try_acquire()]
+    print(f"Wait times: {[round(r, 2) for r in results]}")
+
+    with engine.begin() as conn:
+        conn.execute(RateLimitState.__table__.delete().where(RateLimitState.bucket_key == key))
+
+    assert results[0] == 0.0 and results[1] == 0.0
+    assert results[2] > 0
+    print("✅ Third request refused across workers")
+
+
+if __name__ == "__main__":
+    print("\n" + "=" * 60)
+    print("🚦 RATE LIMITER TEST SUITE")
+    print("=" * 60)
+    test_token_bucket_burst_then_pacing()
+    test_limiter_timeout()
+    test_premium_served_first()
+    test_slow_backend_does_not_block_queue()
+    test_database_backend_shared_budget()
+    print("\n✅ All rate limiter tests passed!")
@@ -0,0 +1,170 @@
+"""
+Test script for the local retrieval memory
+Ensures that:
+1. Chinese text is tokenized into bigrams and BM25 ranks the matching memory first
+2. Each turn injects relevant preferences and older messages instead of know_ids
+3. Messages are indexed incrementally, including ones another worker saved
+4. Snapshots let a restarted worker skip rebuilding, and are ignored for a reused character_id
+"""
+import sys
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import event
+
+from backend.config import settings
+from backend.database import User, Character, Message, UserPreference, FavorabilityTracking
+from backend.conversation_manager import ConversationManager
+from backend.api_client import SenseChatClient
+from backend.fake_services import FakeSenseChatServer
+from backend import retrieval, metrics
+from scratch_db import make_session
+
+START = datetime(2025, 1, 1, 12, 0)
+
+
+def make_database(old_messages=150):
+    """A character whose oldest message (outside the 100-message window) mentions 淡水"""
+    engine, db = make_session()
+
+    user = User(username="小明")
+    db.add(user)
+    db.commit()
+    character = Character(user_id=user.user_id, name="小雨", gender="女", knowledge_base_id="kb-remote")
+    db.add(character)
+    db.commit()
+    db.add(FavorabilityTracking(user_id=user.user_id, character_id=character.character_id))
+    db.add(UserPreference(user_id=user.user_id, category="likes", content={"food": ["拉麵", "抹茶"]}))
+
+    db.add(Message(user_id=user.user_id, character_id=character.character_id, speaker_name="小明",
+                   message_content="上次我們去淡水看夕陽，真的好美", timestamp=START))
+    for n in range(1, old_messages):
+        speaker = "小明" if n % 2 else "小雨"
+        db.add(Message(user_id=user.user_id, character_id=character.character_id, speaker_name=speaker,
+                       message_content=f"今天天氣不錯，第{n}句閒聊", timestamp=START + timedelta(minutes=n)))
+    db.commit()
+    retrieval.forget(character.character_id)
+    return engine, db, user, character
+
+
+def test_tokenize_and_rank():
+    """Test bigram tokenization and BM25 ordering"""
+    print("\n=== Testing tokenizer and ranking ===")
+    assert retrieval.tokenize("我喜歡拉麵 and Jazz!") == ["我喜", "喜歡", "歡拉", "拉麵", "and", "jazz"]
+    assert retrieval.tokenize("雨") == ["雨"]
+
+    index = retrieval.RetrievalIndex(1, 1, "")
+    index.add("m1", "小明: 我最喜歡吃拉麵了")
+    index.add("m2", "小雨: 今天下雨了，記得帶傘")
+    index.add("m3", "小明: 週末想去看電影")
+    index.add("pfood", "用戶likes - food: 拉麵、抹茶")
+
+    results = index.search("晚餐吃拉麵好嗎", k=2)
+    assert len(results) == 2 and all("拉麵" in text for _, text in results)
+    # Messages from the history window on are skipped, preferences never are
+    assert [text for _, text in index.search("拉麵", k=5, before_message_id=1)] == ["用戶likes - food: 拉麵、抹茶"]
+
+    index.remove("m1")
+    assert all("我最喜歡" not in text for _, text in index.search("拉麵", k=5))
+    assert "拉麵" in index.postings and "我最" not in index.postings
+    print("✅ Ranked by BM25")
+
+
+def test_turn_injects_memories():
+    """Test that send_message sends retrieved memories and no know_ids"""
+    print("\n=== Testing memory injection ===")
+    engine, db, user, character = make_database()
+    with FakeSenseChatServer(replies=["(小雨笑了)當然記得呀"]) as server:
+        client = SenseChatClient()
+        client.base_url = server.base_url
+        manager = ConversationManager(db, client)
+
+        result = manager.send_message(user.user_id, character.character_id, "你還記得淡水的夕陽嗎？")
+        assert result["success"]
+        payload = server.chat_requests[-1]
+        memory = payload["character_settings"][0]["detail_setting"]
+        print(f"Injected: {memory!r}")
+        assert memory.startswith("用戶\n相關記憶：")
+        assert "淡水看夕陽" in memory
+        assert "know_ids" not in payload
+
+        result = manager.send_message(user.user_id, character.character_id, "晚餐想吃拉麵")
+        memory = server.chat_requests[-1]["character_settings"][0]["detail_setting"]
+        assert "拉麵、抹茶" in memory
+
+    # The reply was indexed as it was saved
+    index = retrieval.get_index(db, character)
+    assert any(text == "小雨: (小雨笑了)當然記得呀" for text in index.docs.values())
+    db.close()
+    print("✅ Preferences and old messages injected")
+
+
+def test_gap_from_other_worker():
+    """Test that messages saved elsewhere, older than the window, are caught up"""
+    print("\n=== Testing catch-up ===")
+    engine, db, user, character = make_database(old_messages=10)
+    manager = ConversationManager(db, None)
+    history = manager.get_conversation_history(character.character_id, limit=100)
+    retrieval.relevant_memories(db, character, "你好", history)
+    index = retrieval.get_index(db, character)
+    assert index.last_message_id == history[-1].message_id
+
+    # Another worker saves 120 messages; this worker only sees the last 100 in its history
+    for n in range(120):
+        db.add(Message(user_id=user.user_id, character_id=character.character_id, speaker_name="小明",
+                       message_content="我在學吉他" if n == 0 else f"第{n}則",
+                       timestamp=START + timedelta(days=1, minutes=n)))
+    db.commit()
+    history = manager.get_conversation_history(character.character_id, limit=100)
+    memories = retrieval.relevant_memories(db, character, "吉他學得怎樣", history)
+    assert memories and memories[0] == "小明: 我在學吉他"
+    assert index.last_message_id == history[-1].message_id
+    db.close()
+    print("✅ Gap older than the window indexed")
+
+
+def test_snapshot_warm_start():
+    """Test flush, warm load without a history scan, and the reused-id guard"""
+    print("\n=== Testing snapshots ===")
+    index_dir = settings.RETRIEVAL_INDEX_DIR
+    settings.RETRIEVAL_INDEX_DIR = tempfile.mkdtemp()
+    try:
+        engine, db, user, character = make_database()
+        manager = ConversationManager(db, None)
+        history = manager.get_conversation_history(character.character_id, limit=100)
+        before = retrieval.relevant_memories(db, character, "淡水", history)
+        assert retrieval.flush() >= 1
+        assert retrieval.flush() == 0  # nothing changed since
+
+        # Simulate a restart
+        retrieval._cache.clear()
+        metrics.reset()
+        statements = []
+        event.listen(engine, "before_cursor_execute", lambda conn, cursor, statement, *args: statements.append(statement))
+        after = retrieval.relevant_memories(db, character, "淡水", history)
+        assert after == before
+        assert metrics.get("retrieval_index_loads_total", source="snapshot") == 1
+        assert not any("FROM messages" in statement for statement in statements)
+
+        # A new character that got the same id must not see the old memories
+        retrieval._cache.clear()
+        character.created_at = character.created_at + timedelta(days=1)
+        db.query(Message).delete()
+        db.commit()
+        assert retrieval.relevant_memories(db, character, "淡水", []) == []
+        assert metrics.get("retrieval_index_loads_total", source="rebuild") == 1
+        db.close()
+    finally:
+        settings.RETRIEVAL_INDEX_DIR = index_dir
+    print("✅ Warm start from snapshot")
+
+
+if __name__ == "__main__":
+    test_tokenize_and_rank()
+    test_turn_injects_memories()
+    test_gap_from_other_worker()
+    test_snapshot_warm_start()
+    print("\n✅ All retrieval tests passed!")
@@ -0,0 +1,231 @@
+"""
+Test script for the optional semantic memory
+Ensures that:
+1. Without numpy (or with the setting off) turns work and nothing is injected
+2. The hashing embedder ranks overlapping wording first and excludes the history window
+3. Turns append incrementally, catch up an older gap and inject the old exchange;
+   a gap too long to embed on the turn path is left to compaction
+4. Compaction fills holes, drops deleted messages and guards a reused character_id
+"""
+import sys
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy.orm import sessionmaker
+
+from backend.config import settings
+from backend.database import User, Character, Message, FavorabilityTracking
+from backend.conversation_manager import ConversationManager
+from backend.api_client import SenseChatClient
+from backend.fake_services import FakeSenseChatServer
+from backend import semantic_memory, retrieval, metrics
+from scratch_db import make_session
+
+START = datetime(2025, 1, 1, 12, 0)
+
+
+def make_database(old_messages=150):
+    """A character whose first exchange (outside the 100-message window) is about 淡水"""
+    engine, db = make_session()
+
+    user = User(username="小明")
+    db.add(user)
+    db.commit()
+    character = Character(user_id=user.user_id, name="小雨", gender="女")
+    db.add(character)
+    db.commit()
+    db.add(FavorabilityTracking(user_id=user.user_id, character_id=character.character_id))
+
+    db.add(Message(user_id=user.user_id, character_id=character.character_id, speaker_name="小明",
+                   message_content="上次我們去淡水看夕陽，真的好美", timestamp=START))
+    db.add(Message(user_id=user.user_id, character_id=character.character_id, speaker_name="小雨",
+                   message_content="嗯！那天的晚霞我一直記得", timestamp=START + timedelta(seconds=1)))
+    for n in range(2, old_messages):
+        speaker = "小明" if n % 2 else "小雨"
+        db.add(Message(user_id=user.user_id, character_id=character.character_id, speaker_name=speaker,
+                       message_content=f"第{n}句閒聊，今天天氣不錯", timestamp=START + timedelta(minutes=n)))
+    db.commit()
+    retrieval.forget(character.character_id)
+    semantic_memory.forget(character.character_id)
+    return engine, db, user, character
+
+
+class SemanticSettings:
+    """Enable semantic memory in a scratch directory for the duration of a test"""
+
+    def __enter__(self):
+        self.saved = (settings.SEMANTIC_MEMORY_ENABLED, settings.SEMANTIC_MEMORY_DIR, settings.RETRIEVAL_ENABLED)
+        settings.SEMANTIC_MEMORY_ENABLED = True
+        settings.SEMANTIC_MEMORY_DIR = tempfile.mkdtemp()
+        settings.RETRIEVAL_ENABLED = False  # isolate the semantic snippets
+        semantic_memory._cache.clear()
+        return self
+
+    def __exit__(self, *exc):
+        settings.SEMANTIC_MEMORY_ENABLED, settings.SEMANTIC_MEMORY_DIR, settings.RETRIEVAL_ENABLED = self.saved
+        semantic_memory._cache.clear()
+
+
+def test_disabled_without_numpy():
+    """Test that a missing numpy turns the feature off instead of failing turns"""
+    print("\n=== Testing without numpy ===")
+    numpy = semantic_memory.np
+    semantic_memory.np = None
+    try:
+        with SemanticSettings():
+            engine, db, user, character = make_database(old_messages=10)
+            assert not semantic_memory.enabled()
+            with FakeSenseChatServer(replies=["好呀"]) as server:
+                client = SenseChatClient()
+                client.base_url = server.base_url
+                result = ConversationManager(db, client).send_message(user.user_id, character.character_id, "淡水")
+                assert result["success"]
+                assert server.chat_requests[-1]["character_settings"][0]["detail_setting"] == "用戶"
+            assert semantic_memory.compact_all() == 0
+            db.close()
+    finally:
+        semantic_memory.np = numpy
+    print("✅ Disabled cleanly")
+
+
+def test_embed_and_search():
+    """Test embedding similarity and the before_message_id prefix"""
+    print("\n=== Testing embedder and search ===")
+    if not semantic_memory.numpy_available():
+        print("⚠️ numpy not installed - skipped")
+        return
+    np = semantic_memory.np
+    vector = semantic_memory.embed("淡水的夕陽")
+    assert vector.dtype == np.float32 and vector.shape == (semantic_memory.DIMENSIONS,)
+    assert abs(float(np.linalg.norm(vector)) - 1.0) < 1e-5
+    assert not semantic_memory.embed("!!!").any()
+
+    with SemanticSettings():
+        store = semantic_memory.VectorStore(1, 1, "")
+        assert store.append([(3, "週末想去看電影"), (1, "我最喜歡吃拉麵了"), (2, "淡水的夕陽好美")]) == 3
+        assert store.append([(2, "duplicate")]) == 0
+        assert list(store.ids) == [1, 2, 3] and store.matrix.shape == (3, semantic_memory.DIMENSIONS)
+
+        hits = store.search(semantic_memory.embed("還記得夕陽嗎"), k=2)
+        assert hits[0][1] == 1 and hits[0][0] > hits[1][0]
+        assert [row for _, row in store.search(semantic_memory.embed("夕陽"), k=3, before_message_id=2)] == [0]
+
+        # A second handle (another worker) sees the appended rows
+        other = semantic_memory.VectorStore(1, 1, "")
+        other.refresh()
+        assert other.last_message_id == 3
+    print("✅ Similar wording ranked first")
+
+
+def test_turn_recalls_old_exchange():
+    """Test incremental appends, gap catch-up and injection on the turn path"""
+    print("\n=== Testing turns ===")
+    if not semantic_memory.numpy_available():
+        print("⚠️ numpy not installed - skipped")
+        return
+    with SemanticSettings():
+        engine, db, user, character = make_database()
+        with FakeSenseChatServer(replies=["(小雨笑了)當然記得呀"]) as server:
+            client = SenseChatClient()
+            client.base_url = server.base_url
+            manager = ConversationManager(db, client)
+
+            result = manager.send_message(user.user_id, character.character_id, "還記得淡水的夕陽嗎？")
+            assert result["success"]
+            memory = server.chat_requests[-1]["character_settings"][0]["detail_setting"]
+            print(f"Injected: {memory!r}")
+            assert "小明: 上次我們去淡水看夕陽，真的好美 / 小雨: 嗯！那天的晚霞我一直記得" in memory
+
+            # Everything up to the user's message was embedded (the reply lands next turn)
+            store = semantic_memory.get_store(character)
+            total = db.query(Message).filter(Message.character_id == character.character_id).count()
+            assert len(store.ids) == total - 1
+
+            manager.send_message(user.user_id, character.character_id, "晚安")
+            assert len(store.ids) == total + 1
+        db.close()
+    print("✅ Old exchange recalled")
+
+
+def test_long_gap_left_to_compaction():
+    """Test that enabling the feature on a long history doesn't embed it on the reply path"""
+    print("\n=== Testing deferred backfill ===")
+    if not semantic_memory.numpy_available():
+        print("⚠️ numpy not installed - skipped")
+        return
+    limit = settings.SEMANTIC_MEMORY_CATCH_UP_MAX_ROWS
+    settings.SEMANTIC_MEMORY_CATCH_UP_MAX_ROWS = 10
+    try:
+        with SemanticSettings():
+            engine, db, user, character = make_database()
+            with FakeSenseChatServer(replies=["嗯嗯"]) as server:
+                client = SenseChatClient()
+                client.base_url = server.base_url
+                manager = ConversationManager(db, client)
+
+                metrics.reset()
+                manager.send_message(user.user_id, character.character_id, "還記得淡水的夕陽嗎？")
+                assert metrics.get("semantic_memory_catch_up_deferred_total") == 1
+                store = semantic_memory.get_store(character)
+                assert len(store.ids) == manager.MAX_HISTORY_MESSAGES  # only the window was embedded
+                assert server.chat_requests[-1]["character_settings"][0]["detail_setting"] == "用戶"
+
+                # The scheduled compaction fills the gap; later turns recall from it
+                assert semantic_memory.compact_all(sessionmaker(bind=engine, autoflush=False)) == 1
+                manager.send_message(user.user_id, character.character_id, "還記得淡水的夕陽嗎？")
+                assert "淡水看夕陽" in server.chat_requests[-1]["character_settings"][0]["detail_setting"]
+            db.close()
+    finally:
+        settings.SEMANTIC_MEMORY_CATCH_UP_MAX_ROWS = limit
+    print("✅ Long gap deferred, then filled by compaction")
+
+
+def test_compaction():
+    """Test hole filling, dropped rows, generations and the reused-id guard"""
+    print("\n=== Testing compaction ===")
+    if not semantic_memory.numpy_available():
+        print("⚠️ numpy not installed - skipped")
+        return
+    with SemanticSettings():
+        engine, db, user, character = make_database(old_messages=20)
+        session_factory = sessionmaker(bind=engine, autoflush=False)
+        ids = [m.message_id for m in db.query(Message).order_by(Message.message_id)]
+        store = semantic_memory.get_store(character)
+        # Message 5 was committed late and skipped; message 1 is later deleted
+        store.append([(i, "x") for i in ids if i != ids[4]])
+        db.query(Message).filter(Message.message_id == ids[0]).delete()
+        db.commit()
+
+        stats = store.compact(db)
+        assert stats == {"kept": 18, "added": 1, "dropped": 1}
+        assert list(store.ids) == ids[1:] and store.generation == 2
+        assert sorted(p.name for p in store.path.iterdir()) == ["ids.2.i64", "lock", "meta.json", "vectors.2.f32"]
+        assert store.compact(db)["added"] == 0  # nothing to do
+        assert semantic_memory.compact_all(session_factory) == 0
+
+        # A new character that got the same id starts from an empty store
+        character.created_at = character.created_at + timedelta(days=1)
+        db.commit()
+        fresh = semantic_memory.get_store(character)
+        fresh.refresh()
+        assert len(fresh.ids) == 0
+        assert semantic_memory.compact_all(session_factory) == 1 and list(fresh.ids) == ids[1:]
+
+        db.delete(character)
+        db.commit()
+        semantic_memory.compact_all(session_factory)
+        assert not semantic_memory.store_dir(character.character_id).exists()
+        db.close()
+    print("✅ Compacted")
+
+
+if __name__ == "__main__":
+    test_disabled_without_numpy()
+    test_embed_and_search()
+    test_turn_recalls_old_exchange()
+    test_long_gap_left_to_compaction()
+    test_compaction()
+    print("\n✅ All semantic memory tests passed!")
@@ -0,0 +1,116 @@
+"""
+Test script for message speaker roles
+Ensures that:
+1. Saved messages carry a speaker_role, and stats count by it
+2. Renaming a character keeps its old messages attributed to it
+3. The backfill labels legacy rows, including ones from before a rename
+4. Counting by role uses the (character_id, speaker_role) index
+"""
+import sys
+import os
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import text
+
+from backend.database import (
+    SessionLocal, init_db, backfill_speaker_roles, User, Character, Message, FavorabilityTracking,
+    SPEAKER_USER, SPEAKER_CHARACTER
+)
+from backend.conversation_manager import ConversationManager
+from backend import conversation_stats
+from scratch_db import make_session
+
+
+def create_character(db, username="小明", name="小雨"):
+    user = User(username=username)
+    db.add(user)
+    db.commit()
+    character = Character(user_id=user.user_id, name=name, gender="女")
+    db.add(character)
+    db.commit()
+    db.add(FavorabilityTracking(user_id=user.user_id, character_id=character.character_id))
+    db.commit()
+    return user, character
+
+
+def test_saved_roles_survive_rename():
+    """Test roles on save, stats after a rename, and names sent to the model"""
+    print("\n=== Testing roles and renames ===")
+    engine, db = make_session()
+    user, character = create_character(db)
+    manager = ConversationManager(db, api_client=None)
+
+    manager.save_message(user.user_id, character.character_id, user.username, "早安", 1, speaker_role=SPEAKER_USER)
+    manager.save_message(user.user_id, character.character_id, character.name, "早安呀", 1, speaker_role=SPEAKER_CHARACTER)
+    # Without an explicit role it is derived from the name, as before
+    manager.save_message(user.user_id, character.character_id, character.name, "今天想做什麼？", 1)
+    assert [m.speaker_role for m in db.query(Message).order_by(Message.message_id)] == [
+        SPEAKER_USER, SPEAKER_CHARACTER, SPEAKER_CHARACTER
+    ]
+
+    character.name = "小晴"
+    db.commit()
+    manager.save_message(user.user_id, character.character_id, character.name, "我改名了", 1, speaker_role=SPEAKER_CHARACTER)
+
+    stats = conversation_stats.rebuild_stats(db, character.character_id)
+    db.commit()
+    assert (stats.user_messages, stats.character_messages) == (1, 3)
+
+    history = manager.get_conversation_history(character.character_id)
+    names = [m["name"] for m in manager.format_messages_for_api(history, user.username, character.name)]
+    assert names == ["小明", "小晴", "小晴", "小晴"]
+    # Stored display names are kept as they were
+    assert [m.speaker_name for m in history] == ["小明", "小雨", "小雨", "小晴"]
+    db.close()
+    print("✅ Renamed character keeps its messages")
+
+
+def test_backfill_legacy_rows():
+    """Test that the backfill labels rows written before the column existed"""
+    print("\n=== Testing backfill ===")
+    init_db()
+    db = SessionLocal()
+    user, character = create_character(db, username=f"角色測試_{uuid.uuid4().hex[:8]}", name="舊名字")
+    for speaker in (user.username, "舊名字", user.username, "舊名字"):
+        db.add(Message(user_id=user.user_id, character_id=character.character_id,
+                       speaker_name=speaker, message_content="hi"))
+    character.name = "新名字"
+    db.commit()
+    assert db.query(Message).filter(Message.character_id == character.character_id,
+                                    Message.speaker_role.is_(None)).count() == 4
+
+    # Stats already count legacy rows by name until they are backfilled
+    assert conversation_stats.aggregate_stats(db, character.character_id, "舊名字")["character_messages"] == 2
+
+    assert backfill_speaker_roles(batch_size=7) >= 4
+    db.expire_all()
+    roles = [m.speaker_role for m in db.query(Message).filter(
+        Message.character_id == character.character_id
+    ).order_by(Message.message_id)]
+    assert roles == [SPEAKER_USER, SPEAKER_CHARACTER, SPEAKER_USER, SPEAKER_CHARACTER]
+    assert backfill_speaker_roles() == 0  # idempotent
+    db.close()
+    print("✅ Legacy rows backfilled")
+
+
+def test_role_count_uses_index():
+    """Test that counting one speaker's messages is an index-only lookup"""
+    print("\n=== Testing role index ===")
+    engine, db = make_session()
+    plan = db.execute(text(
+        "EXPLAIN QUERY PLAN SELECT count(*) FROM messages WHERE character_id = 1 AND speaker_role = 1"
+    )).all()
+    detail = " ".join(row[-1] for row in plan)
+    print(f"Plan: {detail}")
+    assert "ix_messages_character_role" in detail and "COVERING INDEX" in detail
+    db.close()
+    print("✅ Counted from the index")
+
+
+if __name__ == "__main__":
+    test_saved_roles_survive_rename()
+    test_backfill_legacy_rows()
+    test_role_count_uses_index()
+    print("\n✅ All speaker role tests passed!")
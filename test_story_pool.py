@@ -0,0 +1,261 @@
+"""
+Test script for the pre-generated background story pool
+Ensures that:
+1. Dream types map to (personality, age decade, occupation bucket, interest bucket) keys
+2. Pool stories are generated with a fake LLM and stored with name placeholders
+3. Taking a story claims it once, and low keys are refilled in the background
+4. Character creation uses a pooled story instead of queueing enrichment,
+   and only refills keys that are in the pool
+5. A creation that fails after taking a story puts it back
+"""
+import sys
+import os
+import asyncio
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend.config import settings
+from backend.database import SessionLocal, init_db, Character, BackgroundStory
+from backend.models import UserProfile, DreamType, CustomMemory, PersonalityType
+from backend.api_client import SenseChatClient
+from backend.character_generator import CharacterGenerator
+from backend.fake_services import FakeSenseChatServer, FaultProfile
+from backend import story_pool, metrics
+from scratch_db import make_session_factory
+
+POOL_STORY = "【角色】是一位愛彈吉他的大學生，總會把新寫的歌第一個唱給【用戶】聽。"
+
+
+def make_generator(server):
+    client = SenseChatClient()
+    client.base_url = server.base_url
+    return CharacterGenerator(api_client=client)
+
+
+def test_story_keys():
+    """Test dream type normalization into pool keys"""
+    print("\n=== Testing story keys ===")
+    generator = CharacterGenerator()
+    key = story_pool.story_key(generator, DreamType(
+        personality_traits=["活潑"], age_range="20-25", occupation="大學生",
+        interests=[" 彈吉他 ", "電影"], talking_style="活潑開朗"
+    ))
+    assert key == story_pool.StoryKey(PersonalityType.CHEERFUL, 20, "student", "music")
+    assert str(key) == "cheerful|20s|student|music"
+
+    bare = story_pool.story_key(generator, DreamType(personality_traits=["溫柔"], talking_style="溫柔體貼"))
+    assert str(bare) == "gentle|any|any|any"
+
+    assert story_pool.story_key(generator, DreamType(
+        personality_traits=["知性"], occupation="太空人", talking_style="知性優雅"
+    )) is None
+    # Free-text interests outside every bucket would make single-use keys
+    assert story_pool.story_key(generator, DreamType(
+        personality_traits=["知性"], interests=["收集古董鐘錶"], talking_style="知性優雅"
+    )) is None
+    assert story_pool.story_key(generator, DreamType(
+        personality_traits=["知性"], interests=["收集古董鐘錶", "看書"], talking_style="知性優雅"
+    )).interest == "reading"
+
+    sample = key.sample_dream_type()
+    assert generator._determine_personality_type(sample) == PersonalityType.CHEERFUL
+    assert story_pool.story_key(generator, sample) == key
+    print("✅ Keys normalized")
+
+
+def test_fill_and_take():
+    """Test generating pool stories and claiming them"""
+    print("\n=== Testing fill and take ===")
+    _, session_factory = make_session_factory(on_disk=True)
+    key = story_pool.StoryKey(PersonalityType.CHEERFUL, 20, "student", "music")
+    with FakeSenseChatServer(replies=[POOL_STORY]) as server:
+        db = session_factory()
+        assert story_pool.fill(db, make_generator(server), key, 3) == 3
+        assert story_pool.fill(db, make_generator(server), key, 3) == 0
+        prompt = server.chat_requests[0]["messages"][0]["content"]
+        assert "學生" in prompt and "音樂" in prompt and story_pool.CHARACTER_MARKER in prompt
+
+    templates = [row.template for row in db.query(BackgroundStory).filter(BackgroundStory.pool_key == str(key))]
+    assert templates == ["{character_name}是一位愛彈吉他的大學生，總會把新寫的歌第一個唱給{user_name}聽。"] * 3
+
+    template = story_pool.take(db, key)
+    story = CharacterGenerator.fill_story_template(template, "晴晴", "小明")
+    assert story == "晴晴是一位愛彈吉他的大學生，總會把新寫的歌第一個唱給小明聽。"
+    assert story_pool.take(db, key) and story_pool.take(db, key)
+    assert story_pool.take(db, key) is None
+    db.close()
+    print("✅ Stories generated, claimed once each")
+
+
+def test_failed_generation_not_pooled():
+    """Test that fallback stories and stories without the marker are dropped"""
+    print("\n=== Testing rejected stories ===")
+    _, session_factory = make_session_factory(on_disk=True)
+    key = story_pool.StoryKey(PersonalityType.GENTLE, None, None, "reading")
+    db = session_factory()
+    with FakeSenseChatServer(FaultProfile(error_rate=1.0, error_status=400)) as server:
+        assert story_pool.fill(db, make_generator(server), key, 3) == 0
+    with FakeSenseChatServer(replies=["一位喜歡閱讀的女孩。"]) as server:
+        assert story_pool.fill(db, make_generator(server), key, 3) == 0
+    assert db.query(BackgroundStory).count() == 0
+    db.close()
+    print("✅ Nothing pooled")
+
+
+def test_refill_below_watermark():
+    """Test that refills top up low keys only, one job per key at a time"""
+    print("\n=== Testing background refill ===")
+    _, session_factory = make_session_factory(on_disk=True)
+    key = story_pool.StoryKey(PersonalityType.CUTE, 30, "office", "food")
+    with FakeSenseChatServer(FaultProfile(latency_median_ms=50), replies=[POOL_STORY]) as server:
+        generator = make_generator(server)
+        future = story_pool.request_refill(generator, key, session_factory)
+        assert story_pool.request_refill(generator, key, session_factory) is None  # already queued
+        assert future.result(timeout=10) == settings.STORY_POOL_TARGET_SIZE
+
+        db = session_factory()
+        for _ in range(settings.STORY_POOL_TARGET_SIZE - settings.STORY_POOL_LOW_WATERMARK):
+            story_pool.take(db, key)
+        db.close()
+        assert story_pool.request_refill(generator, key, session_factory).result(timeout=10) == 0
+
+        db = session_factory()
+        story_pool.take(db, key)
+        db.close()
+        refilled = story_pool.request_refill(generator, key, session_factory).result(timeout=10)
+        assert refilled == settings.STORY_POOL_TARGET_SIZE - settings.STORY_POOL_LOW_WATERMARK + 1
+    print("✅ Refilled only below the low watermark")
+
+
+def make_profile(occupation, interest):
+    return UserProfile(
+        user_name=f"故事池_{uuid.uuid4().hex[:8]}",
+        user_gender="男",
+        user_preference="女",
+        preferred_character_name="晴晴",
+        dream_type=DreamType(personality_traits=["活潑"], age_range="22", occupation=occupation,
+                             interests=[interest], talking_style="活潑開朗"),
+        custom_memory=CustomMemory()
+    )
+
+
+def test_creation_uses_pool():
+    """Test that creation takes a pooled story and skips enrichment"""
+    print("\n=== Testing creation from the pool ===")
+    from backend import main
+
+    init_db()
+    metrics.reset()
+    profile = make_profile("研究生", "手作飾品")
+    key = story_pool.story_key(main.character_generator, profile.dream_type)
+    db = SessionLocal()
+    db.query(BackgroundStory).filter(BackgroundStory.pool_key == str(key)).delete()
+    db.add(BackgroundStory(pool_key=str(key), template="{character_name}每天都在實驗室等{user_name}下課。"))
+    db.commit()
+
+    base_url = main.api_client.base_url
+    with FakeSenseChatServer(replies=[POOL_STORY]) as server:
+        main.api_client.base_url = server.base_url
+        try:
+            result = asyncio.run(main.create_character_v2(profile, db=db))
+            assert result["success"]
+            story = f"晴晴每天都在實驗室等{profile.user_name}下課。"
+            assert result["character"]["other_setting"]["background_story"] == story
+            assert metrics.get("story_pool_takes_total", result="hit") == 1
+
+            # The emptied key is refilled in the background
+            deadline = time.monotonic() + 10
+            while db.query(BackgroundStory).filter(BackgroundStory.pool_key == str(key)).count() < settings.STORY_POOL_TARGET_SIZE:
+                assert time.monotonic() < deadline, "story pool was not refilled"
+                time.sleep(0.05)
+        finally:
+            main.api_client.base_url = base_url
+
+    character = db.get(Character, result["character_id"])
+    assert not character.settings_version  # no enrichment job replaced the story
+    assert all(request["messages"][0]["content"].count(story_pool.CHARACTER_MARKER) for request in server.chat_requests)
+
+    db.query(BackgroundStory).filter(BackgroundStory.pool_key == str(key)).delete()
+    db.commit()
+    db.close()
+    print("✅ Pooled story used and key refilled")
+
+
+def test_miss_does_not_refill():
+    """Test that a key with no pooled stories is not filled on a creation's behalf"""
+    print("\n=== Testing miss without refill ===")
+    from backend import main
+
+    init_db()
+    metrics.reset()
+    profile = make_profile("護士", "養貓")
+    key = story_pool.story_key(main.character_generator, profile.dream_type)
+    db = SessionLocal()
+    db.query(BackgroundStory).filter(BackgroundStory.pool_key == str(key)).delete()
+    db.commit()
+
+    base_url = main.api_client.base_url
+    with FakeSenseChatServer(replies=[POOL_STORY]) as server:
+        main.api_client.base_url = server.base_url
+        try:
+            assert asyncio.run(main.create_character_v2(profile, db=db))["success"]
+            assert metrics.get("story_pool_takes_total", result="miss") == 1
+            time.sleep(0.3)
+        finally:
+            main.api_client.base_url = base_url
+
+    assert str(key) not in story_pool._refilling
+    assert db.query(BackgroundStory).filter(BackgroundStory.pool_key == str(key)).count() == 0
+    db.close()
+    print("✅ Unpooled key left alone")
+
+
+def test_failed_creation_returns_story():
+    """Test that a story taken for a character that fails to save goes back into the pool"""
+    print("\n=== Testing failed creation ===")
+    from fastapi import HTTPException
+    from backend import main
+    from backend.conversation_manager import ConversationManager
+
+    init_db()
+    metrics.reset()
+    profile = make_profile("研究生", "手作飾品")
+    key = story_pool.story_key(main.character_generator, profile.dream_type)
+    template = "{character_name}每天都在實驗室等{user_name}下課。"
+    db = SessionLocal()
+    db.query(BackgroundStory).filter(BackgroundStory.pool_key == str(key)).delete()
+    db.add(BackgroundStory(pool_key=str(key), template=template))
+    db.commit()
+
+    def failing_save(self, user_id, character_data):
+        raise RuntimeError("database went away")
+
+    save_character = ConversationManager.save_character
+    ConversationManager.save_character = failing_save
+    try:
+        asyncio.run(main.create_character_v2(profile, db=db))
+        assert False, "creation should have failed"
+    except HTTPException as e:
+        assert e.status_code == 500
+    finally:
+        ConversationManager.save_character = save_character
+
+    assert metrics.get("story_pool_takes_total", result="returned") == 1
+    assert [t for (t,) in db.query(BackgroundStory.template).filter(BackgroundStory.pool_key == str(key))] == [template]
+    db.query(BackgroundStory).filter(BackgroundStory.pool_key == str(key)).delete()
+    db.commit()
+    db.close()
+    print("✅ Story returned to the pool")
+
+
+if __name__ == "__main__":
+    test_story_keys()
+    test_fill_and_take()
+    test_failed_generation_not_pooled()
+    test_refill_below_watermark()
+    test_creation_uses_pool()
+    test_miss_does_not_refill()
+    test_failed_creation_returns_story()
+    print("\n✅ All story pool tests passed!")